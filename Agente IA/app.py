@@ -149,12 +149,34 @@ with app.app_context():
     except Exception as e:
         print(f"⚠️ Erro na migração de horários: {str(e)}")
 
+    # Executar migração para sincronização incremental (row_version + change-log)
+    try:
+        from migrations.add_sync_row_version import migrate_sync_row_version
+        migrate_sync_row_version()
+        print("✅ Migração de sincronização incremental executada")
+    except Exception as e:
+        print(f"⚠️ Erro na migração de sincronização: {str(e)}")
+
+    # Executar migração do ledger diário de progresso
+    try:
+        from migrations.add_progresso_diario import migrate_progresso_diario
+        migrate_progresso_diario()
+        print("✅ Migração do ledger de progresso executada")
+    except Exception as e:
+        print(f"⚠️ Erro na migração do ledger de progresso: {str(e)}")
+
 # Import models
 from gestao_visitas.models.agendamento import Visita, Calendario
 from gestao_visitas.models.checklist import Checklist
 from gestao_visitas.models.contatos import Contato, TipoEntidade, FonteInformacao
 from gestao_visitas.models.questionarios_obrigatorios import QuestionarioObrigatorio, EntidadeIdentificada, ProgressoQuestionarios, EntidadePrioritariaUF
 from gestao_visitas.models.horarios_funcionamento import HorariosFuncionamento
+from gestao_visitas.models.sync import SyncChangeLog
+from gestao_visitas.models.progresso_diario import ProgressoDiario
+from gestao_visitas.services.progresso_snapshot import (
+    progresso_snapshot, agregar_visitas_por_municipio, agregar_entidades_por_municipio,
+    progresso_questionarios_por_municipio, checklists_por_visita
+)
 
 # Import blueprints
 from gestao_visitas.routes.ibge_api import ibge_bp
@@ -174,40 +196,56 @@ from gestao_visitas.services.checklist import get_campos_etapa
 from collections import defaultdict, deque
 import time
 
-# Enhanced rate limiter with different levels
-from gestao_visitas.utils.security import RateLimitEnhanced
-
-rate_limiter = RateLimitEnhanced()
-
-# RATE LIMITER TEMPORARILY DISABLED FOR DEBUGGING
-# @app.before_request
-def rate_limit_check_disabled():
-    """Enhanced rate limiting for different endpoint types - DISABLED"""
-    pass
-    # client_ip = request.environ.get('HTTP_X_FORWARDED_FOR', request.environ.get('REMOTE_ADDR', '127.0.0.1'))
-    # 
-    # # Determine endpoint type for specific rate limiting
-    # endpoint_type = 'api_general'
-    # 
-    # if request.path.startswith('/api/'):
-    #     # Critical operations
-    #     if any(path in request.path for path in ['/backup', '/migrate', '/delete', '/admin']):
-    #         endpoint_type = 'api_critical'
-    #     # File uploads
-    #     elif request.method == 'POST' and request.content_type and 'multipart' in request.content_type:
-    #         endpoint_type = 'file_upload'
-    #     # Login attempts
-    #     elif 'login' in request.path or 'auth' in request.path:
-    #         endpoint_type = 'login_attempts'
-    #     
-    #     # Check rate limit
-    #     if not rate_limiter.is_allowed(client_ip, endpoint_type):
-    #         remaining = rate_limiter.get_remaining_requests(client_ip, endpoint_type)
-    #         return jsonify({
-    #             'error': 'Rate limit exceeded',
-    #             'endpoint_type': endpoint_type,
-    #             'remaining_requests': remaining
-    #         }), 429
+# Enhanced rate limiter with different levels (GCRA: um float por cliente, LRU limitado)
+from gestao_visitas.utils.security import RateLimitEnhanced, GCRALimiter
+
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+rate_limit_backend = None
+if os.getenv('RATE_LIMIT_BACKEND', 'local').lower() == 'redis':
+    # Compartilhar limites entre processos (custo: um round-trip Redis por requisição)
+    from gestao_visitas.services.redis_cache import redis_cache
+    rate_limit_backend = redis_cache
+
+rate_limiter = RateLimitEnhanced(backend=rate_limit_backend)
+
+RATE_LIMIT_CRITICAL_PATHS = ('/backup', '/migrate', '/delete', '/admin')
+
+@app.before_request
+def rate_limit_check():
+    """Enhanced rate limiting for different endpoint types"""
+    if not RATE_LIMIT_ENABLED or not request.path.startswith('/api/'):
+        return None
+    
+    client_ip = request.environ.get('HTTP_X_FORWARDED_FOR', request.environ.get('REMOTE_ADDR', '127.0.0.1'))
+    
+    # Determine endpoint type for specific rate limiting
+    path = request.path
+    endpoint_type = 'api_general'
+    
+    # Critical operations
+    if any(critical in path for critical in RATE_LIMIT_CRITICAL_PATHS):
+        endpoint_type = 'api_critical'
+    # File uploads
+    elif request.method == 'POST' and request.content_type and 'multipart' in request.content_type:
+        endpoint_type = 'file_upload'
+    # Login attempts
+    elif 'login' in path or 'auth' in path:
+        endpoint_type = 'login_attempts'
+    
+    # Check rate limit
+    if not rate_limiter.is_allowed(client_ip, endpoint_type):
+        retry_after = rate_limiter.get_retry_after(client_ip, endpoint_type)
+        response = jsonify({
+            'error': 'Rate limit exceeded',
+            'endpoint_type': endpoint_type,
+            'remaining_requests': 0,
+            'retry_after': retry_after
+        })
+        response.status_code = 429
+        response.headers['Retry-After'] = str(retry_after)
+        return response
+    
+    return None
 
 # Security and performance middleware
 @app.after_request
@@ -901,14 +939,18 @@ def get_relatorio(periodo):
 
 @app.route('/api/rota', methods=['POST'])
 def calcular_rota():
+    """Rota entre dois pontos; ?detail=summary|full controla polyline e passos"""
     data = request.json
-    resultado = mapa_service.calcular_rota(data['origem'], data['destino'])
+    resultado = mapa_service.calcular_rota(
+        data['origem'], data['destino'],
+        detail=request.args.get('detail', 'full'),
+        zoom=request.args.get('zoom', type=int)
+    )
     return jsonify(resultado)
 
 # Cache simples para respostas comuns e rate limiting
-CHAT_CACHE = {}
-CHAT_REQUESTS = defaultdict(deque)  # Rate limiting por IP
 MAX_CHAT_REQUESTS_PER_HOUR = 10
+CHAT_RATE_LIMITER = GCRALimiter(MAX_CHAT_REQUESTS_PER_HOUR, 3600, namespace='chat')  # Rate limiting por IP
 
 RESPOSTAS_PREDEFINIDAS = {
     'como agendar visita': 'Para agendar uma visita, acesse o menu "Visitas" e clique em "Agendar Nova Visita". Preencha os dados do município, data e observações.',
@@ -921,6 +963,10 @@ RESPOSTAS_PREDEFINIDAS = {
     'relatorios': 'Acesse "Relatórios" para ver estatísticas de visitas, progresso por município e exportar dados em CSV/Excel.'
 }
 
+# Cache persistente de respostas (SQLite): chaves normalizadas + quase-duplicatas
+from gestao_visitas.services.chat_answer_cache import ChatAnswerCache
+CHAT_CACHE = ChatAnswerCache(predefinidas=RESPOSTAS_PREDEFINIDAS)
+
 @app.route('/api/chat', methods=['POST'])
 def chat_ia():
     """
@@ -928,15 +974,9 @@ def chat_ia():
     """
     # Rate limiting por IP
     client_ip = request.environ.get('HTTP_X_FORWARDED_FOR', request.environ.get('REMOTE_ADDR', '127.0.0.1'))
-    now = time.time()
-    
-    # Limpar requisições antigas (mais de 1 hora)
-    user_requests = CHAT_REQUESTS[client_ip]
-    while user_requests and user_requests[0] < now - 3600:
-        user_requests.popleft()
     
-    # Verificar limite de requisições
-    if len(user_requests) >= MAX_CHAT_REQUESTS_PER_HOUR:
+    # Verificar limite de requisições (só chamadas à API consomem fichas)
+    if CHAT_RATE_LIMITER.remaining(client_ip) <= 0:
         return jsonify({
             'error': f'Limite de {MAX_CHAT_REQUESTS_PER_HOUR} perguntas por hora atingido.',
             'message': 'Use as funcionalidades do sistema ou consulte a documentação.',
@@ -949,15 +989,15 @@ def chat_ia():
     if not user_message:
         return jsonify({'error': 'Mensagem não enviada'}), 400
     
-    # 1. Verificar cache de respostas
-    if user_message in CHAT_CACHE:
-        return jsonify({'response': CHAT_CACHE[user_message], 'source': 'cache'})
+    # 1. Verificar respostas predefinidas (Aho-Corasick, uma passada, evita API)
+    resposta = CHAT_CACHE.buscar_predefinida(user_message)
+    if resposta:
+        return jsonify({'response': resposta, 'source': 'predefinida'})
     
-    # 2. Verificar respostas predefinidas (evita API)
-    for pergunta, resposta in RESPOSTAS_PREDEFINIDAS.items():
-        if pergunta in user_message:
-            CHAT_CACHE[user_message] = resposta
-            return jsonify({'response': resposta, 'source': 'predefinida'})
+    # 2. Verificar cache de respostas (exata normalizada ou quase-duplicata)
+    resposta, origem = CHAT_CACHE.get(user_message)
+    if resposta:
+        return jsonify({'response': resposta, 'source': origem})
     
     # 3. Verificar se Chat IA está habilitado
     if not CHAT_IA_HABILITADO:
@@ -1008,19 +1048,15 @@ def chat_ia():
         resposta = result['candidates'][0]['content']['parts'][0]['text']
         
         # Registrar uso da API para rate limiting
-        user_requests.append(now)
-        
-        # Cache a resposta para futuras consultas
-        CHAT_CACHE[user_message] = resposta
+        CHAT_RATE_LIMITER.allow(client_ip)
         
-        # Limitar cache a 100 entradas
-        if len(CHAT_CACHE) > 100:
-            CHAT_CACHE.clear()
+        # Cache a resposta para futuras consultas (TTL e LRU aplicados pelo cache)
+        CHAT_CACHE.set(user_message, resposta, fonte='gemini-flash')
         
         return jsonify({
             'response': resposta, 
             'source': 'gemini-flash',
-            'requests_remaining': MAX_CHAT_REQUESTS_PER_HOUR - len(user_requests)
+            'requests_remaining': CHAT_RATE_LIMITER.remaining(client_ip)
         })
         
     except requests.exceptions.RequestException as e:
@@ -1036,6 +1072,11 @@ def chat_ia():
         print(f"Erro inesperado no /api/chat: {e}")
         return jsonify({'error': 'Erro interno do servidor'}), 500
 
+@app.route('/api/chat/metricas', methods=['GET'])
+def chat_metricas():
+    """Métricas de acerto do cache de respostas do chat"""
+    return jsonify({'success': True, 'data': CHAT_CACHE.get_metrics()})
+
 @app.route('/api/checklist/<int:visita_id>', methods=['GET'])
 def get_checklist_por_visita(visita_id):
     try:
@@ -1431,307 +1472,309 @@ def get_entidades_identificadas():
         print(f'Erro ao carregar entidades identificadas: {str(e)}')
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/visitas/progresso-mapa', methods=['GET'])
-def get_progresso_mapa():
+def _construir_progresso_mapa():
     """
-    API específica para o Mapa de Progresso com dados reais das visitas
-    Retorna dados agregados por município focado no follow-up dos questionários
-    Agora inclui informações dos questionários obrigatórios (MRS/MAP)
+    Monta o payload do Mapa de Progresso a partir de consultas agrupadas
+    (visitas, entidades e progresso de questionários de todos os municípios
+    de uma vez).
     """
-    try:
-        from datetime import datetime, timedelta
-        from sqlalchemy import func
+    # Todos os municípios PNSB
+    municipios_pnsb = [
+        'Balneário Camboriú', 'Balneário Piçarras', 'Bombinhas',
+        'Camboriú', 'Itajaí', 'Itapema', 'Luiz Alves',
+        'Navegantes', 'Penha', 'Porto Belo', 'Ilhota'
+    ]
+    
+    visitas_agregadas = agregar_visitas_por_municipio()
+    entidades_agregadas = agregar_entidades_por_municipio()
+    progressos = progresso_questionarios_por_municipio(municipios_pnsb, entidades_agregadas)
+    checklists = checklists_por_visita(
+        agg['primeiro_id'] for agg in visitas_agregadas.values()
+    )
+    
+    def contar_status(agg, status_lista):
+        return sum(agg['por_status'][s] for s in status_lista) if agg else 0
+    
+    def contar_entidades(contagem, prioridade, campo, status_lista):
+        # campo: 1 = status_mrs, 2 = status_map
+        return sum(n for chave, n in contagem.items() if chave[0] == prioridade and chave[campo] in status_lista)
+    
+    resultado = []
+    
+    for municipio in municipios_pnsb:
+        # Progresso dinâmico dos questionários (totais esperados P1 + P2 + prefeitura)
+        progresso = progressos[municipio]
+        
+        agg = visitas_agregadas.get(municipio)
+        
+        # Contagem por tipo de entidade
+        entidades_municipio = dict(agg['por_tipo_informante']) if agg else {}
+        
+        # Calcular métricas gerais
+        total_visitas = agg['total'] if agg else 0
+        visitas_agendadas = contar_status(agg, ['agendada', 'em preparação'])
+        visitas_executadas = contar_status(agg, ['realizada', 'em follow-up', 'verificação whatsapp', 'finalizada'])
+        visitas_em_followup = contar_status(agg, ['em follow-up', 'verificação whatsapp'])
+        visitas_finalizadas = contar_status(agg, ['finalizada'])
+        
+        # Status predominante do município
+        if visitas_finalizadas > 0:
+            status_municipio = 'finalizado'
+            cor_status = '#28a745'  # Verde
+        elif visitas_em_followup > 0:
+            status_municipio = 'em_followup'
+            cor_status = '#ffc107'  # Amarelo
+        elif visitas_executadas > 0:
+            status_municipio = 'executado'
+            cor_status = '#17a2b8'  # Azul
+        elif visitas_agendadas > 0:
+            status_municipio = 'agendado'
+            cor_status = '#6c757d'  # Cinza
+        else:
+            status_municipio = 'sem_visita'
+            cor_status = '#dc3545'  # Vermelho
         
-        # Todos os municípios PNSB
-        municipios_pnsb = [
-            'Balneário Camboriú', 'Balneário Piçarras', 'Bombinhas',
-            'Camboriú', 'Itajaí', 'Itapema', 'Luiz Alves',
-            'Navegantes', 'Penha', 'Porto Belo', 'Ilhota'
-        ]
+        # Calcular percentual de conclusão
+        if total_visitas > 0:
+            percentual_conclusao = (visitas_finalizadas / total_visitas) * 100
+        else:
+            percentual_conclusao = 0
+        
+        # Calcular tempo desde última atividade
+        ultima_atividade = None
+        dias_sem_atividade = 0
+        if agg and agg['ultima_atividade']:
+            ultima_atividade = agg['ultima_atividade']
+            dias_sem_atividade = (datetime.now() - ultima_atividade).days
+        
+        # Alertas de follow-up baseados em critérios PNSB
+        alertas = []
+        alertas_detalhes = []
+        
+        # Verificar visitas em follow-up há mais de 7 dias
+        if visitas_em_followup > 0 and dias_sem_atividade > 7:
+            alertas.append('Follow-up atrasado')
+            alertas_detalhes.append({
+                'tipo': 'follow_up_atrasado',
+                'prioridade': 'alta',
+                'dias': dias_sem_atividade,
+                'visitas_afetadas': visitas_em_followup
+            })
         
-        resultado = []
+        # Verificar questionários não iniciados após visita executada
+        if visitas_executadas > 0 and visitas_finalizadas == 0 and dias_sem_atividade > 14:
+            alertas.append('Questionário não iniciado')
+            alertas_detalhes.append({
+                'tipo': 'questionario_pendente',
+                'prioridade': 'critica',
+                'dias': dias_sem_atividade,
+                'visitas_afetadas': visitas_executadas
+            })
         
-        for municipio in municipios_pnsb:
-            # USAR NOVO CÁLCULO DINÂMICO DE PROGRESSO
-            progresso = ProgressoQuestionarios.calcular_progresso_municipio(municipio)
-            
-            # Buscar todas as visitas do município
-            visitas = Visita.query.filter_by(municipio=municipio).all()
-            
-            # Agrupar visitas por tipo de entidade
-            entidades_municipio = {}
-            for visita in visitas:
-                tipo_entidade = visita.tipo_informante or 'prefeitura'
-                if tipo_entidade not in entidades_municipio:
-                    entidades_municipio[tipo_entidade] = []
-                entidades_municipio[tipo_entidade].append(visita)
-            
-            # Calcular métricas gerais
-            total_visitas = len(visitas)
-            visitas_agendadas = len([v for v in visitas if v.status in ['agendada', 'em preparação']])
-            visitas_executadas = len([v for v in visitas if v.status in ['realizada', 'em follow-up', 'verificação whatsapp', 'finalizada']])
-            visitas_em_followup = len([v for v in visitas if v.status in ['em follow-up', 'verificação whatsapp']])
-            visitas_finalizadas = len([v for v in visitas if v.status == 'finalizada'])
-            
-            # Status predominante do município
-            if visitas_finalizadas > 0:
-                status_municipio = 'finalizado'
-                cor_status = '#28a745'  # Verde
-            elif visitas_em_followup > 0:
-                status_municipio = 'em_followup'
-                cor_status = '#ffc107'  # Amarelo
-            elif visitas_executadas > 0:
-                status_municipio = 'executado'
-                cor_status = '#17a2b8'  # Azul
-            elif visitas_agendadas > 0:
-                status_municipio = 'agendado'
-                cor_status = '#6c757d'  # Cinza
-            else:
-                status_municipio = 'sem_visita'
-                cor_status = '#dc3545'  # Vermelho
-            
-            # Calcular percentual de conclusão
-            if total_visitas > 0:
-                percentual_conclusao = (visitas_finalizadas / total_visitas) * 100
-            else:
-                percentual_conclusao = 0
-            
-            # Calcular tempo desde última atividade
-            ultima_atividade = None
-            dias_sem_atividade = 0
-            if visitas:
-                visita_mais_recente = max(visitas, key=lambda v: v.data_atualizacao or v.data_criacao)
-                ultima_atividade = visita_mais_recente.data_atualizacao or visita_mais_recente.data_criacao
-                dias_sem_atividade = (datetime.now() - ultima_atividade).days
-            
-            # Alertas de follow-up baseados em critérios PNSB
-            alertas = []
-            alertas_detalhes = []
-            
-            # Verificar visitas em follow-up há mais de 7 dias
-            if visitas_em_followup > 0 and dias_sem_atividade > 7:
-                alertas.append('Follow-up atrasado')
-                alertas_detalhes.append({
-                    'tipo': 'follow_up_atrasado',
-                    'prioridade': 'alta',
-                    'dias': dias_sem_atividade,
-                    'visitas_afetadas': visitas_em_followup
-                })
-            
-            # Verificar questionários não iniciados após visita executada
-            if visitas_executadas > 0 and visitas_finalizadas == 0 and dias_sem_atividade > 14:
-                alertas.append('Questionário não iniciado')
-                alertas_detalhes.append({
-                    'tipo': 'questionario_pendente',
-                    'prioridade': 'critica',
-                    'dias': dias_sem_atividade,
-                    'visitas_afetadas': visitas_executadas
-                })
-            
-            # Verificar municípios sem visitas agendadas
-            if total_visitas == 0:
-                alertas.append('Sem visitas agendadas')
-                alertas_detalhes.append({
-                    'tipo': 'sem_agenda',
-                    'prioridade': 'media',
-                    'acao_recomendada': 'Agendar visita inicial'
-                })
-            
-            # Verificar follow-up muito antigo (mais de 30 dias)
-            if visitas_em_followup > 0 and dias_sem_atividade > 30:
-                alertas.append('Follow-up crítico - mais de 30 dias')
-                alertas_detalhes.append({
-                    'tipo': 'follow_up_critico',
-                    'prioridade': 'critica',
-                    'dias': dias_sem_atividade,
-                    'acao_recomendada': 'Contato urgente com informante'
-                })
-            
-            # Progresso do checklist (se existir)
-            progresso_checklist = {'preparacao': 0, 'execucao': 0, 'resultados': 0}
-            if visitas:
-                # Pegar checklist da visita mais avançada
-                visita_principal = visitas[0]
-                if hasattr(visita_principal, 'checklist') and visita_principal.checklist:
-                    checklist = visita_principal.checklist
-                    progresso_checklist = {
-                        'preparacao': checklist.calcular_progresso_preparacao(),
-                        'execucao': checklist.calcular_progresso_execucao(),
-                        'resultados': checklist.calcular_progresso_resultados()
-                    }
-            
-            # Buscar informações dos questionários obrigatórios com novo sistema de prioridades
-            questionarios_obrigatorios = QuestionarioObrigatorio.get_questionarios_municipio(municipio)
-            entidades_identificadas = EntidadeIdentificada.query.filter_by(municipio=municipio).all()
-            
-            
-            # Buscar dados de progresso consolidado (com prioridades)
-            progresso_questionarios = ProgressoQuestionarios.query.filter_by(municipio=municipio).first()
-            if not progresso_questionarios:
-                progresso_questionarios = ProgressoQuestionarios.calcular_progresso_municipio(municipio)
-            
-            # Separar entidades por prioridade
-            entidades_p1 = [e for e in entidades_identificadas if e.prioridade == 1]  # Crítica
-            entidades_p2 = [e for e in entidades_identificadas if e.prioridade == 2]  # Importante  
-            entidades_p3 = [e for e in entidades_identificadas if e.prioridade == 3]  # Opcional
-            
-            # USAR LÓGICA CORRIGIDA - APENAS P1 + P2 (OBRIGATÓRIOS PARA METAS PNSB)
-            # P3 não conta para cálculos de metas/deadlines
-            entidades_obrigatorias = entidades_p1 + entidades_p2  # Apenas P1 + P2
-            
-            # USAR NOVO CÁLCULO DINÂMICO DE PROGRESSO (linha 989)
-            # Substituir lógica antiga por dados do novo sistema
-            total_mrs_obrigatorios = progresso.total_mrs_obrigatorios
-            total_map_obrigatorios = progresso.total_map_obrigatorios
-            total_questionarios_obrigatorios = total_mrs_obrigatorios + total_map_obrigatorios
-            
-            # Usar dados do novo sistema de progresso
-            mrs_respondidos = progresso.mrs_concluidos
-            map_respondidos = progresso.map_concluidos
-            mrs_validados = progresso.mrs_validados
-            map_validados = progresso.map_validados
-            
-            # Total concluídos (para relatórios) = respondidos + validados
-            mrs_concluidos = mrs_respondidos + mrs_validados
-            map_concluidos = map_respondidos + map_validados
-            
-            # Calcular percentuais baseados nos totais esperados dinâmicos
-            percentual_mrs = progresso.percentual_mrs
-            percentual_map = progresso.percentual_map
-            percentual_questionarios = progresso.percentual_geral
-            
-            # Métricas específicas do novo sistema de prioridades usando dados dinâmicos
-            prioridades_info = {
-                'p1': {
-                    'total_entidades': len(entidades_p1),
-                    'mrs_respondidos': sum(1 for e in entidades_p1 if e.status_mrs == 'respondido'),
-                    'map_respondidos': sum(1 for e in entidades_p1 if e.status_map == 'respondido'),
-                    'mrs_validados': sum(1 for e in entidades_p1 if e.status_mrs == 'validado_concluido'),
-                    'map_validados': sum(1 for e in entidades_p1 if e.status_map == 'validado_concluido'),
-                    'mrs_concluidos': sum(1 for e in entidades_p1 if e.status_mrs in ['respondido', 'validado_concluido']),
-                    'map_concluidos': sum(1 for e in entidades_p1 if e.status_map in ['respondido', 'validado_concluido']),
-                    'percentual_conclusao': progresso.p1_percentual_conclusao,
-                    'status': progresso.status_p1,
-                    'descricao': 'Crítica (Prefeituras + Lista UF)',
-                    'cor': '#dc3545' if progresso.p1_percentual_conclusao < 50 else '#ffc107' if progresso.p1_percentual_conclusao < 100 else '#28a745'
-                },
-                'p2': {
-                    'total_entidades': len(entidades_p2),
-                    'mrs_respondidos': sum(1 for e in entidades_p2 if e.status_mrs == 'respondido'),
-                    'map_respondidos': sum(1 for e in entidades_p2 if e.status_map == 'respondido'),
-                    'mrs_validados': sum(1 for e in entidades_p2 if e.status_mrs == 'validado_concluido'),
-                    'map_validados': sum(1 for e in entidades_p2 if e.status_map == 'validado_concluido'),
-                    'mrs_concluidos': sum(1 for e in entidades_p2 if e.status_mrs in ['respondido', 'validado_concluido']),
-                    'map_concluidos': sum(1 for e in entidades_p2 if e.status_map in ['respondido', 'validado_concluido']),
-                    'percentual_conclusao': progresso.p2_percentual_conclusao,
-                    'descricao': 'Importante (Identificadas em campo)',
-                    'cor': '#dc3545' if progresso.p2_percentual_conclusao < 50 else '#ffc107' if progresso.p2_percentual_conclusao < 100 else '#28a745'
-                },
-                'p3': {
-                    'total_entidades': len(entidades_p3),
-                    'mrs_respondidos': sum(1 for e in entidades_p3 if e.status_mrs == 'respondido'),
-                    'map_respondidos': sum(1 for e in entidades_p3 if e.status_map == 'respondido'),
-                    'mrs_validados': sum(1 for e in entidades_p3 if e.status_mrs == 'validado_concluido'),
-                    'map_validados': sum(1 for e in entidades_p3 if e.status_map == 'validado_concluido'),
-                    'mrs_concluidos': sum(1 for e in entidades_p3 if e.status_mrs in ['respondido', 'validado_concluido']),
-                    'map_concluidos': sum(1 for e in entidades_p3 if e.status_map in ['respondido', 'validado_concluido']),
-                    'percentual_conclusao': progresso.p3_percentual_conclusao,
-                    'descricao': 'Opcional (Trabalho completo se houver tempo)',
-                    'cor': '#6c757d',  # Sempre cinza (informativo, não crítico)
-                    'informativo': True,
-                    'observacao': 'Não conta para metas PNSB obrigatórias'
+        # Verificar municípios sem visitas agendadas
+        if total_visitas == 0:
+            alertas.append('Sem visitas agendadas')
+            alertas_detalhes.append({
+                'tipo': 'sem_agenda',
+                'prioridade': 'media',
+                'acao_recomendada': 'Agendar visita inicial'
+            })
+        
+        # Verificar follow-up muito antigo (mais de 30 dias)
+        if visitas_em_followup > 0 and dias_sem_atividade > 30:
+            alertas.append('Follow-up crítico - mais de 30 dias')
+            alertas_detalhes.append({
+                'tipo': 'follow_up_critico',
+                'prioridade': 'critica',
+                'dias': dias_sem_atividade,
+                'acao_recomendada': 'Contato urgente com informante'
+            })
+        
+        # Progresso do checklist (se existir)
+        progresso_checklist = {'preparacao': 0, 'execucao': 0, 'resultados': 0}
+        if agg:
+            # Pegar checklist da visita mais avançada
+            checklist = checklists.get(agg['primeiro_id'])
+            if checklist:
+                progresso_checklist = {
+                    'preparacao': checklist.calcular_progresso_preparacao(),
+                    'execucao': checklist.calcular_progresso_execucao(),
+                    'resultados': checklist.calcular_progresso_resultados()
                 }
+        
+        # Contagens de entidades por (prioridade, status_mrs, status_map)
+        entidades = entidades_agregadas.get(municipio, {})
+        totais_prioridade = {
+            prioridade: sum(n for chave, n in entidades.items() if chave[0] == prioridade)
+            for prioridade in (1, 2, 3)
+        }
+        
+        # USAR NOVO CÁLCULO DINÂMICO DE PROGRESSO (linha 989)
+        # Substituir lógica antiga por dados do novo sistema
+        total_mrs_obrigatorios = progresso.total_mrs_obrigatorios
+        total_map_obrigatorios = progresso.total_map_obrigatorios
+        total_questionarios_obrigatorios = total_mrs_obrigatorios + total_map_obrigatorios
+        
+        # Usar dados do novo sistema de progresso
+        mrs_respondidos = progresso.mrs_concluidos
+        map_respondidos = progresso.map_concluidos
+        mrs_validados = progresso.mrs_validados
+        map_validados = progresso.map_validados
+        
+        # Total concluídos (para relatórios) = respondidos + validados
+        mrs_concluidos = mrs_respondidos + mrs_validados
+        map_concluidos = map_respondidos + map_validados
+        
+        # Calcular percentuais baseados nos totais esperados dinâmicos
+        percentual_mrs = progresso.percentual_mrs
+        percentual_map = progresso.percentual_map
+        percentual_questionarios = progresso.percentual_geral
+        
+        # Métricas específicas do novo sistema de prioridades usando dados dinâmicos
+        prioridades_info = {
+            'p1': {
+                'total_entidades': totais_prioridade[1],
+                'mrs_respondidos': contar_entidades(entidades, 1, 1, ['respondido']),
+                'map_respondidos': contar_entidades(entidades, 1, 2, ['respondido']),
+                'mrs_validados': contar_entidades(entidades, 1, 1, ['validado_concluido']),
+                'map_validados': contar_entidades(entidades, 1, 2, ['validado_concluido']),
+                'mrs_concluidos': contar_entidades(entidades, 1, 1, ['respondido', 'validado_concluido']),
+                'map_concluidos': contar_entidades(entidades, 1, 2, ['respondido', 'validado_concluido']),
+                'percentual_conclusao': progresso.p1_percentual_conclusao,
+                'status': progresso.status_p1,
+                'descricao': 'Crítica (Prefeituras + Lista UF)',
+                'cor': '#dc3545' if progresso.p1_percentual_conclusao < 50 else '#ffc107' if progresso.p1_percentual_conclusao < 100 else '#28a745'
+            },
+            'p2': {
+                'total_entidades': totais_prioridade[2],
+                'mrs_respondidos': contar_entidades(entidades, 2, 1, ['respondido']),
+                'map_respondidos': contar_entidades(entidades, 2, 2, ['respondido']),
+                'mrs_validados': contar_entidades(entidades, 2, 1, ['validado_concluido']),
+                'map_validados': contar_entidades(entidades, 2, 2, ['validado_concluido']),
+                'mrs_concluidos': contar_entidades(entidades, 2, 1, ['respondido', 'validado_concluido']),
+                'map_concluidos': contar_entidades(entidades, 2, 2, ['respondido', 'validado_concluido']),
+                'percentual_conclusao': progresso.p2_percentual_conclusao,
+                'descricao': 'Importante (Identificadas em campo)',
+                'cor': '#dc3545' if progresso.p2_percentual_conclusao < 50 else '#ffc107' if progresso.p2_percentual_conclusao < 100 else '#28a745'
+            },
+            'p3': {
+                'total_entidades': totais_prioridade[3],
+                'mrs_respondidos': contar_entidades(entidades, 3, 1, ['respondido']),
+                'map_respondidos': contar_entidades(entidades, 3, 2, ['respondido']),
+                'mrs_validados': contar_entidades(entidades, 3, 1, ['validado_concluido']),
+                'map_validados': contar_entidades(entidades, 3, 2, ['validado_concluido']),
+                'mrs_concluidos': contar_entidades(entidades, 3, 1, ['respondido', 'validado_concluido']),
+                'map_concluidos': contar_entidades(entidades, 3, 2, ['respondido', 'validado_concluido']),
+                'percentual_conclusao': progresso.p3_percentual_conclusao,
+                'descricao': 'Opcional (Trabalho completo se houver tempo)',
+                'cor': '#6c757d',  # Sempre cinza (informativo, não crítico)
+                'informativo': True,
+                'observacao': 'Não conta para metas PNSB obrigatórias'
             }
-            
-            # Alertas específicos de prioridades usando dados dinâmicos
-            alertas_prioridades = []
-            if len(entidades_p1) > 0 and progresso.p1_percentual_conclusao < 100:
-                alertas_prioridades.append(f'P1 Crítica: {progresso.p1_percentual_conclusao:.0f}% concluída')
-            if len(entidades_p2) > 0 and progresso.p2_percentual_conclusao < 80:
-                alertas_prioridades.append(f'P2 Importante: {progresso.p2_percentual_conclusao:.0f}% concluída')
-            
-            # Agregar alertas de prioridades aos alertas gerais
-            alertas.extend(alertas_prioridades)
-            
-            
-            questionarios_info = {
-                # MÉTRICAS OBRIGATÓRIAS - APENAS P1 + P2 (BASE PARA METAS PNSB) - USANDO DADOS DINÂMICOS
-                'total_mrs_obrigatorios': total_mrs_obrigatorios,
-                'total_map_obrigatorios': total_map_obrigatorios,
-                'mrs_concluidos': mrs_concluidos,
-                'map_concluidos': map_concluidos,
-                'percentual_mrs': round(percentual_mrs, 1),
-                'percentual_map': round(percentual_map, 1),
-                'percentual_questionarios': round(percentual_questionarios, 1),
-                'entidades_obrigatorias': len(entidades_p1) + len(entidades_p2),
-                'entidades_obrigatorias_pendentes': len([e for e in entidades_p1 + entidades_p2 if e.status_mrs != 'concluido' or e.status_map != 'concluido']),
-                
-                # MÉTRICAS INFORMATIVAS - P3 (TRABALHO COMPLETO)
-                'p3_total_entidades': len(entidades_p3),
-                'p3_mrs_concluidos': sum(1 for e in entidades_p3 if e.status_mrs in ['respondido', 'validado_concluido']),
-                'p3_map_concluidos': sum(1 for e in entidades_p3 if e.status_map in ['respondido', 'validado_concluido']),
-                'p3_percentual': progresso.p3_percentual_conclusao,
-                
-                # Sistema de prioridades
-                'prioridades': prioridades_info,
-                'sistema_prioridades_ativo': True,
-                'status_p1': progresso.status_p1,
-                'percentual_p1': progresso.p1_percentual_conclusao,
-                'percentual_p2': progresso.p2_percentual_conclusao,
-                'percentual_p3': progresso.p3_percentual_conclusao,
-                
-                # Clarificação para interface
-                'observacao': 'Métricas principais baseadas em P1+P2 (obrigatórios). P3 é informativo para trabalho completo.'
-            }
-            
-            resultado.append({
-                'municipio': municipio,
-                'status': status_municipio,
-                'cor_status': cor_status,
-                'resumo': {
-                    'total_visitas': total_visitas,
-                    'agendadas': visitas_agendadas,
-                    'executadas': visitas_executadas,
-                    'em_followup': visitas_em_followup,
-                    'finalizadas': visitas_finalizadas,
-                    'percentual_conclusao': round(percentual_conclusao, 1)
-                },
-                'timing': {
-                    'ultima_atividade': ultima_atividade.isoformat() if ultima_atividade else None,
-                    'dias_sem_atividade': dias_sem_atividade,
-                    'precisa_followup': dias_sem_atividade > 7 and visitas_em_followup > 0
-                },
-                'alertas': alertas,
-                'alertas_detalhes': alertas_detalhes,
-                'progresso_checklist': progresso_checklist,
-                'questionarios': questionarios_info,  # Informações dos questionários obrigatórios
-                'entidades': {k: len(v) for k, v in entidades_municipio.items()},  # Contagem por tipo de entidade
-                'total_entidades': len(entidades_municipio),  # Quantas entidades diferentes
-                'coords': get_coordenadas_municipio(municipio)  # Para posicionar no mapa
-            })
+        }
         
-        # Estatísticas gerais
-        total_municipios = len(municipios_pnsb)
-        municipios_finalizados = len([m for m in resultado if m['status'] == 'finalizado'])
-        municipios_em_followup = len([m for m in resultado if m['status'] == 'em_followup'])
-        municipios_sem_visita = len([m for m in resultado if m['status'] == 'sem_visita'])
-        
-        estatisticas_gerais = {
-            'total_municipios': total_municipios,
-            'finalizados': municipios_finalizados,
-            'em_followup': municipios_em_followup,
-            'sem_visita': municipios_sem_visita,
-            'percentual_conclusao_geral': round((municipios_finalizados / total_municipios) * 100, 1),
-            'alertas_ativos': sum(len(m['alertas']) for m in resultado)
+        # Alertas específicos de prioridades usando dados dinâmicos
+        alertas_prioridades = []
+        if totais_prioridade[1] > 0 and progresso.p1_percentual_conclusao < 100:
+            alertas_prioridades.append(f'P1 Crítica: {progresso.p1_percentual_conclusao:.0f}% concluída')
+        if totais_prioridade[2] > 0 and progresso.p2_percentual_conclusao < 80:
+            alertas_prioridades.append(f'P2 Importante: {progresso.p2_percentual_conclusao:.0f}% concluída')
+        
+        # Agregar alertas de prioridades aos alertas gerais
+        alertas.extend(alertas_prioridades)
+        
+        
+        questionarios_info = {
+            # MÉTRICAS OBRIGATÓRIAS - APENAS P1 + P2 (BASE PARA METAS PNSB) - USANDO DADOS DINÂMICOS
+            'total_mrs_obrigatorios': total_mrs_obrigatorios,
+            'total_map_obrigatorios': total_map_obrigatorios,
+            'mrs_concluidos': mrs_concluidos,
+            'map_concluidos': map_concluidos,
+            'percentual_mrs': round(percentual_mrs, 1),
+            'percentual_map': round(percentual_map, 1),
+            'percentual_questionarios': round(percentual_questionarios, 1),
+            'entidades_obrigatorias': totais_prioridade[1] + totais_prioridade[2],
+            'entidades_obrigatorias_pendentes': sum(n for chave, n in entidades.items() if chave[0] in (1, 2) and (chave[1] != 'concluido' or chave[2] != 'concluido')),
+            
+            # MÉTRICAS INFORMATIVAS - P3 (TRABALHO COMPLETO)
+            'p3_total_entidades': totais_prioridade[3],
+            'p3_mrs_concluidos': contar_entidades(entidades, 3, 1, ['respondido', 'validado_concluido']),
+            'p3_map_concluidos': contar_entidades(entidades, 3, 2, ['respondido', 'validado_concluido']),
+            'p3_percentual': progresso.p3_percentual_conclusao,
+            
+            # Sistema de prioridades
+            'prioridades': prioridades_info,
+            'sistema_prioridades_ativo': True,
+            'status_p1': progresso.status_p1,
+            'percentual_p1': progresso.p1_percentual_conclusao,
+            'percentual_p2': progresso.p2_percentual_conclusao,
+            'percentual_p3': progresso.p3_percentual_conclusao,
+            
+            # Clarificação para interface
+            'observacao': 'Métricas principais baseadas em P1+P2 (obrigatórios). P3 é informativo para trabalho completo.'
         }
         
-        return jsonify({
-            'success': True,
-            'data': resultado,
-            'estatisticas': estatisticas_gerais,
-            'ultima_atualizacao': datetime.now().isoformat(),
-            'message': 'Dados de progresso obtidos com sucesso'
+        resultado.append({
+            'municipio': municipio,
+            'status': status_municipio,
+            'cor_status': cor_status,
+            'resumo': {
+                'total_visitas': total_visitas,
+                'agendadas': visitas_agendadas,
+                'executadas': visitas_executadas,
+                'em_followup': visitas_em_followup,
+                'finalizadas': visitas_finalizadas,
+                'percentual_conclusao': round(percentual_conclusao, 1)
+            },
+            'timing': {
+                'ultima_atividade': ultima_atividade.isoformat() if ultima_atividade else None,
+                'dias_sem_atividade': dias_sem_atividade,
+                'precisa_followup': dias_sem_atividade > 7 and visitas_em_followup > 0
+            },
+            'alertas': alertas,
+            'alertas_detalhes': alertas_detalhes,
+            'progresso_checklist': progresso_checklist,
+            'questionarios': questionarios_info,  # Informações dos questionários obrigatórios
+            'entidades': entidades_municipio,  # Contagem por tipo de entidade
+            'total_entidades': len(entidades_municipio),  # Quantas entidades diferentes
+            'coords': get_coordenadas_municipio(municipio)  # Para posicionar no mapa
         })
+    
+    # Estatísticas gerais
+    total_municipios = len(municipios_pnsb)
+    municipios_finalizados = len([m for m in resultado if m['status'] == 'finalizado'])
+    municipios_em_followup = len([m for m in resultado if m['status'] == 'em_followup'])
+    municipios_sem_visita = len([m for m in resultado if m['status'] == 'sem_visita'])
+    
+    estatisticas_gerais = {
+        'total_municipios': total_municipios,
+        'finalizados': municipios_finalizados,
+        'em_followup': municipios_em_followup,
+        'sem_visita': municipios_sem_visita,
+        'percentual_conclusao_geral': round((municipios_finalizados / total_municipios) * 100, 1),
+        'alertas_ativos': sum(len(m['alertas']) for m in resultado)
+    }
+    
+    return {
+        'success': True,
+        'data': resultado,
+        'estatisticas': estatisticas_gerais,
+        'ultima_atualizacao': datetime.now().isoformat(),
+        'message': 'Dados de progresso obtidos com sucesso'
+    }
+
+@app.route('/api/visitas/progresso-mapa', methods=['GET'])
+def get_progresso_mapa():
+    """
+    API específica para o Mapa de Progresso com dados reais das visitas
+    Retorna dados agregados por município focado no follow-up dos questionários
+    Agora inclui informações dos questionários obrigatórios (MRS/MAP)
+    
+    O payload é montado uma vez por alteração de dados (snapshot com ETag);
+    polling sem mudanças recebe 304 ou os bytes em cache sem consultar o ORM.
+    """
+    try:
+        return progresso_snapshot.responder('visitas_progresso_mapa', _construir_progresso_mapa)
         
     except Exception as e:
         import traceback
@@ -2095,87 +2138,27 @@ def get_google_maps_config():
 
 @app.route('/api/otimizar-rotas', methods=['POST'])
 def otimizar_rotas_api():
-    """API para otimização de rotas com Google Maps - Nível 2/3."""
+    """API para otimização de rotas com Google Maps - Nível 2/3.
+    
+    Com "assincrono": true no corpo, devolve 202 com o id de um job
+    (acompanhar em /api/otimizacao/jobs/<id>/eventos).
+    ?detail=summary|full define o tamanho das direções detalhadas.
+    """
     try:
         data = request.get_json()
         
-        if not data or 'visitas' not in data:
-            return jsonify({'error': 'Dados de visitas são obrigatórios', 'sucesso': False}), 400
+        if data is not None and 'detail' in request.args:
+            data['detail'] = request.args['detail']
         
-        visitas = data['visitas']
-        data_jornada = data.get('data_jornada')
-        horario_inicio = data.get('horario_inicio', '08:00')
-        horario_fim = data.get('horario_fim', '18:00')
-        incluir_horarios_reais = data.get('incluir_horarios_reais', True)  # Nível 3
+        if data and data.get('assincrono'):
+            from gestao_visitas.services.jobs_otimizacao import gerenciador_jobs
+            job = gerenciador_jobs.submeter('otimizar_rotas', data)
+            return jsonify({'sucesso': True, 'job': job}), 202
         
-        # Importar e usar serviço de otimização
-        from gestao_visitas.services.route_optimizer import RouteOptimizer, RoutePoint
+        from gestao_visitas.services.route_optimizer import optimize_visits_payload
         
-        print(f"🔧 Iniciando otimização para {len(visitas)} visitas")
-        optimizer = RouteOptimizer()
-        print(f"✅ RouteOptimizer inicializado. Google Maps disponível: {optimizer.is_google_maps_available()}")
-        
-        # Converter visitas para RoutePoint
-        pontos_rota = []
-        for visita in visitas:
-            # Obter coordenadas do município
-            coordenadas = {
-                'Balneário Camboriú': (-26.9906, -48.6349),
-                'Balneário Piçarras': (-26.7574, -48.6717),
-                'Bombinhas': (-27.1433, -48.4884),
-                'Camboriú': (-27.0248, -48.6583),
-                'Itajaí': (-26.9076, -48.6619),
-                'Itapema': (-27.0890, -48.6114),
-                'Luiz Alves': (-26.7169, -48.9357),
-                'Navegantes': (-26.8968, -48.6565),
-                'Penha': (-26.7711, -48.6506),
-                'Porto Belo': (-27.1588, -48.5552),
-                'Ilhota': (-26.8984, -48.8269)
-            }
-            
-            municipio = visita.get('municipio', '')
-            lat, lng = coordenadas.get(municipio, (-26.9, -48.6))  # Fallback para centro da região
-            
-            ponto = RoutePoint(
-                id=str(visita.get('id', f"ponto_{len(pontos_rota)}")),
-                name=f"{municipio} - {visita.get('local', 'Entidade')}",
-                lat=lat,
-                lng=lng,
-                municipality=municipio,
-                priority={'p1': 1, 'p2': 2, 'p3': 3}.get(visita.get('prioridade', 'p3'), 3),
-                estimated_duration=visita.get('duracao_estimada', 90),
-                visit_type=visita.get('tipo_informante', 'standard'),
-                time_window_start=visita.get('hora_inicio'),
-                time_window_end=visita.get('hora_fim')
-            )
-            
-            # Adicionar informações adicionais para busca no Google Places
-            if 'local' in visita:
-                ponto.entity_name = visita['local']
-            if 'tipo_informante' in visita:
-                ponto.entity_type = visita['tipo_informante']
-            
-            pontos_rota.append(ponto)
-        
-        print(f"📍 Pontos convertidos: {len(pontos_rota)}")
-        for i, ponto in enumerate(pontos_rota[:3]):  # Mostrar apenas os primeiros 3
-            print(f"   {i+1}. {ponto.municipality} - {ponto.name}")
-        
-        # Tentar otimização Nível 2/3 com Google Maps
-        print(f"🚀 Iniciando otimização com Google Maps...")
-        resultado = optimizer.optimize_route_with_google_maps(
-            pontos_rota, 
-            target_date=data_jornada,
-            start_time=horario_inicio,
-            end_time=horario_fim,
-            include_business_hours=incluir_horarios_reais
-        )
-        
-        print(f"✅ Resultado da otimização: sucesso={resultado.get('sucesso', False)}")
-        if not resultado.get('sucesso', False):
-            print(f"❌ Erro: {resultado.get('erro', 'Desconhecido')}")
-        
-        return jsonify(resultado)
+        resultado, status = optimize_visits_payload(data)
+        return jsonify(resultado), status
         
     except Exception as e:
         import traceback
@@ -2343,7 +2326,11 @@ def transito_tempo_real_api():
 
 @app.route('/api/rota-multipla-transito', methods=['POST'])
 def rota_multipla_transito_api():
-    """API para rota múltipla com trânsito em tempo real - PNSB 2024"""
+    """API para rota múltipla com trânsito em tempo real - PNSB 2024
+    
+    ?detail=summary devolve polyline simplificada (zoom 12, ou ?zoom=N) e
+    instruções em texto puro; o padrão 'full' mantém o nível de rua.
+    """
     try:
         data = request.get_json()
         
@@ -2384,7 +2371,11 @@ def rota_multipla_transito_api():
         mapa_service = MapaService(app.config['GOOGLE_MAPS_API_KEY'])
         
         # Calcular rota múltipla com trânsito
-        resultado = mapa_service.calcular_rota_multipla(pontos, departure_time)
+        resultado = mapa_service.calcular_rota_multipla(
+            pontos, departure_time,
+            detail=request.args.get('detail', data.get('detail', 'full')),
+            zoom=request.args.get('zoom', type=int)
+        )
         
         if 'erro' in resultado:
             return jsonify({
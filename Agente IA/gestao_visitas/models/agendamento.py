@@ -63,6 +63,9 @@ class Visita(db.Model):
     whatsapp_resposta_recebida = Column(DateTime)  # Quando resposta foi recebida
     email_recebido_confirmado = Column(Boolean, default=False)  # Se confirmou recebimento
     
+    # Versão monotônica para sincronização incremental (mantida por models/sync.py)
+    row_version = Column(Integer, nullable=False, default=0, server_default='0', index=True)
+    
     checklist = relationship(
         'Checklist',
         uselist=False,
@@ -0,0 +1,173 @@
+"""
+Livro-razão diário de progresso (ledger) por município
+Uma linha por (dia, município) com os contadores acumulados naquele dia,
+mantida por um hook de sessão na mesma transação das alterações
+"""
+
+from datetime import date, datetime
+
+from sqlalchemy import and_, case, event, func, inspect, or_, select, true
+from sqlalchemy.orm import Session
+
+from gestao_visitas.db import db
+from .agendamento import Visita
+from .questionarios_obrigatorios import EntidadeIdentificada
+
+STATUS_CONCLUIDO = 'validado_concluido'
+
+
+class ProgressoDiario(db.Model):
+    """
+    Contadores acumulados de progresso por dia e município.
+
+    Dias sem alterações não têm linha: o valor vigente é o da linha mais
+    recente anterior (forward-fill), de modo que janelas de N dias custam O(dias).
+    """
+    __tablename__ = 'progresso_diario'
+    __table_args__ = (
+        db.UniqueConstraint('dia', 'municipio', name='uq_progresso_diario_dia_municipio'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    dia = db.Column(db.Date, nullable=False, index=True)
+    municipio = db.Column(db.String(100), nullable=False)
+
+    visitas_finalizadas = db.Column(db.Integer, nullable=False, default=0)
+    p1p2_concluidas = db.Column(db.Integer, nullable=False, default=0)
+    questionarios_concluidos = db.Column(db.Integer, nullable=False, default=0)
+
+    # Denominadores do mesmo dia (permitem percentuais sem novas consultas)
+    total_visitas = db.Column(db.Integer, nullable=False, default=0)
+    total_p1p2 = db.Column(db.Integer, nullable=False, default=0)
+    total_questionarios = db.Column(db.Integer, nullable=False, default=0)
+
+    atualizado_em = db.Column(db.DateTime, default=datetime.now, nullable=False)
+
+    def to_dict(self):
+        return {
+            'dia': self.dia.isoformat() if self.dia else None,
+            'municipio': self.municipio,
+            'visitas_finalizadas': self.visitas_finalizadas,
+            'p1p2_concluidas': self.p1p2_concluidas,
+            'questionarios_concluidos': self.questionarios_concluidos,
+            'total_visitas': self.total_visitas,
+            'total_p1p2': self.total_p1p2,
+            'total_questionarios': self.total_questionarios
+        }
+
+    @staticmethod
+    def registrar(connection, municipios=None, dia: date = None):
+        """
+        Recalcula os contadores atuais dos municípios informados (todos se None)
+        e grava/substitui a linha do dia. Duas consultas GROUP BY.
+        """
+        dia = dia or date.today()
+        filtro_visitas = Visita.municipio.in_(municipios) if municipios else true()
+        filtro_entidades = EntidadeIdentificada.municipio.in_(municipios) if municipios else true()
+
+        linhas = {}
+
+        visitas = connection.execute(
+            select(
+                Visita.municipio,
+                func.count(Visita.id),
+                func.sum(case((Visita.status == 'finalizada', 1), else_=0))
+            ).where(filtro_visitas).group_by(Visita.municipio)
+        )
+        for municipio, total, finalizadas in visitas:
+            linha = linhas.setdefault(municipio, _linha_vazia(dia, municipio))
+            linha['total_visitas'] = total or 0
+            linha['visitas_finalizadas'] = finalizadas or 0
+
+        p1p2 = EntidadeIdentificada.prioridade.in_([1, 2])
+        entidades = connection.execute(
+            select(
+                EntidadeIdentificada.municipio,
+                func.sum(case((p1p2, 1), else_=0)),
+                func.sum(case((and_(
+                    p1p2,
+                    EntidadeIdentificada.status_mrs == STATUS_CONCLUIDO,
+                    EntidadeIdentificada.status_map == STATUS_CONCLUIDO
+                ), 1), else_=0)),
+                func.sum(case((or_(
+                    EntidadeIdentificada.mrs_obrigatorio == True,
+                    EntidadeIdentificada.map_obrigatorio == True
+                ), 1), else_=0)),
+                func.sum(case((or_(
+                    EntidadeIdentificada.status_mrs == STATUS_CONCLUIDO,
+                    EntidadeIdentificada.status_map == STATUS_CONCLUIDO
+                ), 1), else_=0))
+            ).where(filtro_entidades).group_by(EntidadeIdentificada.municipio)
+        )
+        for municipio, total_p1p2, concluidas, total_quest, quest_concluidos in entidades:
+            linha = linhas.setdefault(municipio, _linha_vazia(dia, municipio))
+            linha['total_p1p2'] = total_p1p2 or 0
+            linha['p1p2_concluidas'] = concluidas or 0
+            linha['total_questionarios'] = total_quest or 0
+            linha['questionarios_concluidos'] = quest_concluidos or 0
+
+        # Municípios que ficaram sem registros também precisam de linha zerada
+        for municipio in municipios or []:
+            linhas.setdefault(municipio, _linha_vazia(dia, municipio))
+
+        if linhas:
+            connection.execute(
+                ProgressoDiario.__table__.insert().prefix_with('OR REPLACE'),
+                list(linhas.values())
+            )
+        return len(linhas)
+
+    @staticmethod
+    def carregar_serie():
+        """Todas as linhas do ledger ordenadas por dia (uma consulta)"""
+        return db.session.query(
+            ProgressoDiario.dia,
+            ProgressoDiario.municipio,
+            ProgressoDiario.visitas_finalizadas,
+            ProgressoDiario.p1p2_concluidas,
+            ProgressoDiario.questionarios_concluidos,
+            ProgressoDiario.total_visitas,
+            ProgressoDiario.total_p1p2,
+            ProgressoDiario.total_questionarios
+        ).order_by(ProgressoDiario.dia).all()
+
+
+def _linha_vazia(dia, municipio):
+    return {
+        'dia': dia,
+        'municipio': municipio,
+        'visitas_finalizadas': 0,
+        'p1p2_concluidas': 0,
+        'questionarios_concluidos': 0,
+        'total_visitas': 0,
+        'total_p1p2': 0,
+        'total_questionarios': 0,
+        'atualizado_em': datetime.now()
+    }
+
+
+# ===== HOOK DO LEDGER =====
+
+def _municipios_afetados(obj):
+    """Município atual e, se alterado no flush, o anterior"""
+    municipios = {obj.municipio}
+    historico = inspect(obj).attrs.municipio.history
+    municipios.update(historico.deleted or ())
+    return {m for m in municipios if m}
+
+
+def _atualizar_ledger(session, flush_context):
+    """
+    after_flush: recalcula a linha do dia dos municípios cujas visitas ou
+    entidades mudaram, na mesma transação (rollback desfaz o ledger junto).
+    """
+    municipios = set()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, (Visita, EntidadeIdentificada)):
+            municipios |= _municipios_afetados(obj)
+
+    if municipios:
+        ProgressoDiario.registrar(session.connection(), sorted(municipios))
+
+
+event.listen(Session, 'after_flush', _atualizar_ledger)
@@ -123,6 +123,9 @@ class EntidadeIdentificada(db.Model):
     validado_em = db.Column(db.DateTime)  # Quando foi validada a obrigatoriedade dos questionários
     validado_por = db.Column(db.String(100))  # Quem validou
     
+    # Versão monotônica para sincronização incremental (mantida por models/sync.py)
+    row_version = db.Column(db.Integer, nullable=False, default=0, server_default='0', index=True)
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -0,0 +1,112 @@
+"""
+Models para sincronização incremental (delta sync) com dispositivos de campo
+Mantém um change-log com versão monotônica para Visita e EntidadeIdentificada
+"""
+
+from datetime import datetime
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from gestao_visitas.db import db
+from .agendamento import Visita
+from .questionarios_obrigatorios import EntidadeIdentificada
+
+
+# Modelos versionados e nome curto usado no protocolo de sincronização
+MODELOS_VERSIONADOS = {
+    Visita.__tablename__: Visita,
+    EntidadeIdentificada.__tablename__: EntidadeIdentificada,
+}
+
+
+class SyncChangeLog(db.Model):
+    """
+    Change-log compacto: uma linha por registro alterado.
+
+    Cada alteração substitui a linha anterior do mesmo registro e recebe uma
+    nova `versao` (AUTOINCREMENT nunca reutiliza valores), de modo que
+    `versao > since` devolve exatamente o que mudou desde a última sincronização.
+    Exclusões permanecem como tombstones (operacao='delete').
+    """
+    __tablename__ = 'sync_changelog'
+    __table_args__ = (
+        db.UniqueConstraint('tabela', 'registro_id', name='uq_sync_changelog_registro'),
+        {'sqlite_autoincrement': True},
+    )
+
+    versao = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    tabela = db.Column(db.String(50), nullable=False)
+    registro_id = db.Column(db.Integer, nullable=False)
+    operacao = db.Column(db.String(10), nullable=False, default='upsert')  # upsert, delete
+    alterado_em = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def to_dict(self):
+        return {
+            'versao': self.versao,
+            'tabela': self.tabela,
+            'registro_id': self.registro_id,
+            'operacao': self.operacao,
+            'alterado_em': self.alterado_em.isoformat() if self.alterado_em else None
+        }
+
+    @staticmethod
+    def versao_atual():
+        """Retorna a maior versão já emitida (0 se nenhuma)"""
+        return db.session.query(db.func.coalesce(db.func.max(SyncChangeLog.versao), 0)).scalar()
+
+
+# ===== HOOK DE VERSIONAMENTO =====
+
+def _registrar_alteracoes_sync(session, flush_context):
+    """
+    Registra no change-log os registros versionados afetados pelo flush e
+    grava a nova versão em `row_version`, tudo na mesma transação.
+    """
+    pendentes = []
+    for obj in session.new:
+        if isinstance(obj, (Visita, EntidadeIdentificada)):
+            pendentes.append((obj, 'upsert'))
+    for obj in session.dirty:
+        if isinstance(obj, (Visita, EntidadeIdentificada)) and session.is_modified(obj, include_collections=False):
+            pendentes.append((obj, 'upsert'))
+    for obj in session.deleted:
+        if isinstance(obj, (Visita, EntidadeIdentificada)):
+            pendentes.append((obj, 'delete'))
+
+    if not pendentes:
+        return
+
+    connection = session.connection()
+    changelog = SyncChangeLog.__table__
+    agora = datetime.utcnow()
+
+    for obj, operacao in pendentes:
+        if obj.id is None:
+            continue
+
+        resultado = connection.execute(
+            changelog.insert().prefix_with('OR REPLACE').values(
+                tabela=obj.__tablename__,
+                registro_id=obj.id,
+                operacao=operacao,
+                alterado_em=agora
+            )
+        )
+        versao = resultado.inserted_primary_key[0]
+
+        if operacao == 'upsert':
+            tabela = obj.__table__
+            valores = {'row_version': versao}
+            # Preservar timestamps com onupdate: o UPDATE Core os regeraria
+            for coluna in tabela.columns:
+                if coluna.onupdate is not None:
+                    valores[coluna.name] = getattr(obj, coluna.key)
+            connection.execute(
+                tabela.update().where(tabela.c.id == obj.id).values(**valores)
+            )
+            set_committed_value(obj, 'row_version', versao)
+
+
+event.listen(Session, 'after_flush', _registrar_alteracoes_sync)
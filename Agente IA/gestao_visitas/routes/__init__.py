@@ -3,6 +3,8 @@ from .main import main_bp
 from .melhorias_api import melhorias_bp
 from .funcionalidades_pnsb_api import funcionalidades_pnsb_bp
 from .team_config_api import team_config_bp
+from .sync_api import sync_bp
+from .jobs_otimizacao_api import jobs_otimizacao_bp
 
 def register_blueprints(app):
     """Registra todos os blueprints essenciais no app"""
@@ -16,5 +18,7 @@ def register_blueprints(app):
     app.register_blueprint(melhorias_bp, url_prefix='/api/melhorias')
     app.register_blueprint(funcionalidades_pnsb_bp, url_prefix='/api/pnsb')
     app.register_blueprint(team_config_bp)  # Já tem url_prefix='/api' definido no blueprint
+    app.register_blueprint(sync_bp, url_prefix='/api')
+    app.register_blueprint(jobs_otimizacao_bp, url_prefix='/api')
     
     print("✅ Blueprints principais registrados")
\ No newline at end of file
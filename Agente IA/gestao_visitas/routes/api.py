@@ -1677,6 +1677,25 @@ def consolidar_dados_municipio(municipio):
     except Exception as e:
         return APIResponse.error(f"Erro ao consolidar dados: {str(e)}")
 
+@api_bp.route('/apis-gov/consolidar', methods=['GET'])
+def consolidar_municipios_pnsb():
+    """Consolida dados das APIs para vários municípios PNSB em paralelo"""
+    try:
+        from ..services.apis_governamentais import apis_governamentais
+        
+        municipios = request.args.get('municipios')
+        municipios = [m.strip() for m in municipios.split(',') if m.strip()] if municipios else None
+        
+        resultado = apis_governamentais.consolidar_municipios_pnsb(municipios)
+        
+        if resultado.get('sucesso'):
+            return APIResponse.success(data=resultado)
+        else:
+            return APIResponse.error(resultado.get('erro', 'Erro na consolidação'))
+        
+    except Exception as e:
+        return APIResponse.error(f"Erro ao consolidar municípios: {str(e)}")
+
 @api_bp.route('/apis-gov/relatorio', methods=['GET'])
 def gerar_relatorio_apis():
     """Gera relatório de uso das APIs governamentais"""
@@ -19,6 +19,9 @@ from ..services.otimizador_cronograma import OtimizadorCronograma
 from ..config.security import SecurityConfig
 from ..utils.validators import validate_json_input, ValidationError
 from ..utils.error_handlers import APIResponse
+from ..services.progresso_snapshot import (
+    progresso_snapshot, agregar_visitas_por_municipio, visitas_mais_recentes
+)
 
 # Criar blueprint para funcionalidades PNSB
 funcionalidades_pnsb_bp = Blueprint('funcionalidades_pnsb', __name__)
@@ -261,205 +264,219 @@ def calcular_raio_cobertura():
 
 @funcionalidades_pnsb_bp.route('/questionarios/mapa-progresso', methods=['GET'])
 def obter_mapa_progresso_geral():
-    """Obtém mapa visual do progresso da coleta"""
+    """Obtém mapa visual do progresso da coleta (snapshot com ETag, refeito só quando os dados mudam)"""
     try:
-        from ..db import db
-        from ..models.agendamento import Visita
-        from datetime import datetime, timedelta
-        import random
-        
-        # Municípios da pesquisa PNSB 2024
-        municipios_pnsb = [
-            'Balneário Camboriú', 'Balneário Piçarras', 'Bombinhas', 'Camboriú',
-            'Itajaí', 'Itapema', 'Luiz Alves', 'Navegantes', 'Penha', 'Porto Belo', 'Ilhota'
-        ]
-        
-        mapa_progresso = {
-            'municipios': {},
-            'estatisticas': {
-                'total_municipios': len(municipios_pnsb),
-                'completos': 0,
-                'em_progresso': 0,
-                'pendentes': 0,
-                'progresso_geral': 0
-            },
-            'ultima_atualizacao': datetime.now().isoformat()
-        }
-        
-        progresso_total = 0
+        return progresso_snapshot.responder('questionarios_mapa_progresso', _construir_mapa_progresso_geral)
         
-        for municipio in municipios_pnsb:
-            # Buscar visitas para este município
-            visitas = Visita.query.filter_by(municipio=municipio).all()
-            
-            # Calcular progresso baseado nas visitas
-            total_visitas = len(visitas)
-            visitas_realizadas = len([v for v in visitas if v.status in ['realizada', 'finalizada']])
-            visitas_em_execucao = len([v for v in visitas if v.status in ['em preparação', 'em execução']])
-            visitas_pendentes = len([v for v in visitas if v.status == 'agendada'])
-            
-            # Progresso MRS e MAP (simulado baseado nas visitas)
-            progresso_mrs = 0
-            progresso_map = 0
-            
-            if total_visitas > 0:
-                # Calcular progresso baseado no tipo de pesquisa
-                visitas_mrs = [v for v in visitas if v.tipo_pesquisa in ['MRS', 'ambos']]
-                visitas_map = [v for v in visitas if v.tipo_pesquisa in ['MAP', 'ambos']]
-                
-                if visitas_mrs:
-                    realizadas_mrs = len([v for v in visitas_mrs if v.status in ['realizada', 'finalizada']])
-                    progresso_mrs = min(100, round((realizadas_mrs / len(visitas_mrs)) * 100))
-                
-                if visitas_map:
-                    realizadas_map = len([v for v in visitas_map if v.status in ['realizada', 'finalizada']])
-                    progresso_map = min(100, round((realizadas_map / len(visitas_map)) * 100))
-            else:
-                # Se não há visitas, usar progresso simulado para demonstração
-                progresso_mrs = random.randint(0, 100)
-                progresso_map = random.randint(0, 100)
-            
-            progresso_geral = round((progresso_mrs + progresso_map) / 2)
-            progresso_total += progresso_geral
-            
-            # Determinar status
-            status = 'pending'
-            if progresso_geral >= 100:
-                status = 'completed'
-                mapa_progresso['estatisticas']['completos'] += 1
-            elif progresso_geral >= 25:
-                status = 'in-progress'
-                mapa_progresso['estatisticas']['em_progresso'] += 1
-            else:
-                mapa_progresso['estatisticas']['pendentes'] += 1
-            
-            # Determinar prioridade baseada no progresso e prazo
-            prioridade = 'media'
-            if progresso_geral < 30:
-                prioridade = 'alta'
-            elif progresso_geral >= 80:
-                prioridade = 'baixa'
-            
-            # Informações do último contato (baseado na última visita)
-            ultimo_contato = 'N/A'
-            if visitas:
-                ultima_visita = max(visitas, key=lambda v: v.data_atualizacao or v.data_criacao)
-                ultimo_contato = ultima_visita.data.strftime('%d/%m/%Y')
-            
-            # Informante principal (baseado na visita mais recente)
-            informante_principal = f"Secretário(a) de {municipio.split()[0]}"
-            telefone_contato = f"(47) 9{random.randint(1000, 9999)}-{random.randint(1000, 9999)}"
+    except Exception as e:
+        return APIResponse.error(f"Erro ao obter mapa de progresso: {str(e)}")
+
+def _construir_mapa_progresso_geral():
+    """Monta o mapa de progresso com uma consulta agrupada de visitas para todos os municípios"""
+    from datetime import datetime
+    import random
+    
+    # Municípios da pesquisa PNSB 2024
+    municipios_pnsb = [
+        'Balneário Camboriú', 'Balneário Piçarras', 'Bombinhas', 'Camboriú',
+        'Itajaí', 'Itapema', 'Luiz Alves', 'Navegantes', 'Penha', 'Porto Belo', 'Ilhota'
+    ]
+    
+    visitas_agregadas = agregar_visitas_por_municipio()
+    recentes = visitas_mais_recentes()
+    
+    def contar(agg, status_lista, tipos_pesquisa=None):
+        if not agg:
+            return 0
+        if tipos_pesquisa is None:
+            return sum(agg['por_status'][s] for s in status_lista)
+        return sum(n for (tipo, status), n in agg['por_pesquisa_status'].items()
+                   if tipo in tipos_pesquisa and (status_lista is None or status in status_lista))
+    
+    mapa_progresso = {
+        'municipios': {},
+        'estatisticas': {
+            'total_municipios': len(municipios_pnsb),
+            'completos': 0,
+            'em_progresso': 0,
+            'pendentes': 0,
+            'progresso_geral': 0
+        },
+        'ultima_atualizacao': datetime.now().isoformat()
+    }
+    
+    progresso_total = 0
+    
+    for municipio in municipios_pnsb:
+        # Agregados das visitas deste município
+        agg = visitas_agregadas.get(municipio)
+        recente = recentes.get(municipio)
+        
+        # Calcular progresso baseado nas visitas
+        total_visitas = agg['total'] if agg else 0
+        visitas_realizadas = contar(agg, ['realizada', 'finalizada'])
+        visitas_em_execucao = contar(agg, ['em preparação', 'em execução'])
+        visitas_pendentes = contar(agg, ['agendada'])
+        
+        # Progresso MRS e MAP (simulado baseado nas visitas)
+        progresso_mrs = 0
+        progresso_map = 0
+        
+        if total_visitas > 0:
+            # Calcular progresso baseado no tipo de pesquisa
+            visitas_mrs = contar(agg, None, ['MRS', 'ambos'])
+            visitas_map = contar(agg, None, ['MAP', 'ambos'])
             
-            if visitas:
-                # Usar dados reais se disponível
-                visita_recente = max(visitas, key=lambda v: v.data_atualizacao or v.data_criacao)
-                if hasattr(visita_recente, 'local') and visita_recente.local:
-                    informante_principal = visita_recente.local
-                if hasattr(visita_recente, 'telefone_responsavel') and visita_recente.telefone_responsavel:
-                    telefone_contato = visita_recente.telefone_responsavel
+            if visitas_mrs:
+                realizadas_mrs = contar(agg, ['realizada', 'finalizada'], ['MRS', 'ambos'])
+                progresso_mrs = min(100, round((realizadas_mrs / visitas_mrs) * 100))
             
-            # Calcular eficiência e métricas avançadas
-            eficiencia = round((progresso_geral / max(total_visitas, 1)) * 10, 1) if total_visitas > 0 else 0
+            if visitas_map:
+                realizadas_map = contar(agg, ['realizada', 'finalizada'], ['MAP', 'ambos'])
+                progresso_map = min(100, round((realizadas_map / visitas_map) * 100))
+        else:
+            # Se não há visitas, usar progresso simulado para demonstração
+            progresso_mrs = random.randint(0, 100)
+            progresso_map = random.randint(0, 100)
+        
+        progresso_geral = round((progresso_mrs + progresso_map) / 2)
+        progresso_total += progresso_geral
+        
+        # Determinar status
+        status = 'pending'
+        if progresso_geral >= 100:
+            status = 'completed'
+            mapa_progresso['estatisticas']['completos'] += 1
+        elif progresso_geral >= 25:
+            status = 'in-progress'
+            mapa_progresso['estatisticas']['em_progresso'] += 1
+        else:
+            mapa_progresso['estatisticas']['pendentes'] += 1
+        
+        # Determinar prioridade baseada no progresso e prazo
+        prioridade = 'media'
+        if progresso_geral < 30:
+            prioridade = 'alta'
+        elif progresso_geral >= 80:
+            prioridade = 'baixa'
+        
+        # Informações do último contato (baseado na última visita)
+        ultimo_contato = 'N/A'
+        if recente:
+            ultimo_contato = recente['data'].strftime('%d/%m/%Y')
+        
+        # Informante principal (baseado na visita mais recente)
+        informante_principal = f"Secretário(a) de {municipio.split()[0]}"
+        telefone_contato = f"(47) 9{random.randint(1000, 9999)}-{random.randint(1000, 9999)}"
+        
+        if recente:
+            # Usar dados reais se disponível
+            if recente['local']:
+                informante_principal = recente['local']
+            if recente['telefone']:
+                telefone_contato = recente['telefone']
+        
+        # Calcular eficiência e métricas avançadas
+        eficiencia = round((progresso_geral / max(total_visitas, 1)) * 10, 1) if total_visitas > 0 else 0
+        
+        # Calcular risco de atraso baseado no progresso e tempo
+        dias_desde_primeira_visita = 30  # Placeholder
+        if agg and agg['primeira_criacao']:
+            dias_desde_primeira_visita = (datetime.now().date() - agg['primeira_criacao'].date()).days
+        
+        risco_atraso = 'baixo' if progresso_geral >= 80 else 'medio' if progresso_geral >= 50 else 'alto'
+        
+        # Determinar próxima ação recomendada
+        if progresso_geral >= 90:
+            proxima_acao = 'Realizar validação final dos dados coletados'
+        elif progresso_geral >= 75:
+            proxima_acao = 'Agendar visita de finalização'
+        elif progresso_geral >= 50:
+            proxima_acao = 'Continuar coleta de dados pendentes'
+        elif progresso_geral >= 25:
+            proxima_acao = 'Intensificar contatos com informante'
+        else:
+            proxima_acao = 'Iniciar primeira abordagem'
+        
+        # Calcular densidade de problemas (simulado)
+        densidade_problemas = random.randint(1, 5)  # 1-5 escala de dificuldade
+        
+        mapa_progresso['municipios'][municipio] = {
+            'nome': municipio,
+            'progresso_mrs': progresso_mrs,
+            'progresso_map': progresso_map,
+            'progresso_geral': progresso_geral,
+            'status': status,
+            'prioridade': prioridade,
+            'visitas_realizadas': visitas_realizadas,
+            'visitas_pendentes': visitas_pendentes + visitas_em_execucao,
+            'total_visitas': total_visitas,
+            'ultimo_contato': ultimo_contato,
+            'informante_principal': informante_principal,
+            'telefone': telefone_contato,
+            'observacoes': f"Município de {municipio} - Progresso {progresso_geral}%",
             
-            # Calcular risco de atraso baseado no progresso e tempo
-            dias_desde_primeira_visita = 30  # Placeholder
-            if visitas:
-                primeira_visita = min(visitas, key=lambda v: v.data_criacao)
-                dias_desde_primeira_visita = (datetime.now().date() - primeira_visita.data_criacao.date()).days
+            # Métricas avançadas
+            'eficiencia': eficiencia,
+            'risco_atraso': risco_atraso,
+            'proxima_acao': proxima_acao,
+            'dias_desde_inicio': dias_desde_primeira_visita,
+            'densidade_problemas': densidade_problemas,
+            'tipo_pesquisa': ['MRS', 'MAP', 'ambos'][random.randint(0, 2)],  # Baseado nas visitas reais
             
-            risco_atraso = 'baixo' if progresso_geral >= 80 else 'medio' if progresso_geral >= 50 else 'alto'
+            # Dados temporais para filtros
+            'data_primeira_visita': agg['primeira_data'].isoformat() if agg else None,
+            'data_ultima_visita': agg['ultima_data'].isoformat() if agg else None,
+            'data_ultima_atualizacao': datetime.now().isoformat(),
             
-            # Determinar próxima ação recomendada
-            if progresso_geral >= 90:
-                proxima_acao = 'Realizar validação final dos dados coletados'
-            elif progresso_geral >= 75:
-                proxima_acao = 'Agendar visita de finalização'
-            elif progresso_geral >= 50:
-                proxima_acao = 'Continuar coleta de dados pendentes'
-            elif progresso_geral >= 25:
-                proxima_acao = 'Intensificar contatos com informante'
-            else:
-                proxima_acao = 'Iniciar primeira abordagem'
+            # Pesquisador responsável (simulado baseado nas visitas)
+            'pesquisador_responsavel': f"Pesquisador PNSB {random.randint(1, 5)}",
             
-            # Calcular densidade de problemas (simulado)
-            densidade_problemas = random.randint(1, 5)  # 1-5 escala de dificuldade
+            # Coordenadas geográficas
+            'coordenadas': {
+                'lat': {
+                    'Balneário Camboriú': -26.9906,
+                    'Balneário Piçarras': -26.7567,
+                    'Bombinhas': -27.1394,
+                    'Camboriú': -27.0244,
+                    'Itajaí': -26.9078,
+                    'Itapema': -27.0906,
+                    'Luiz Alves': -26.7147,
+                    'Navegantes': -26.8975,
+                    'Penha': -26.7736,
+                    'Porto Belo': -27.1575,
+                    'Ilhota': -26.8989
+                }.get(municipio, -26.9),
+                'lng': {
+                    'Balneário Camboriú': -48.6356,
+                    'Balneário Piçarras': -48.6725,
+                    'Bombinhas': -48.4817,
+                    'Camboriú': -48.6578,
+                    'Itajaí': -48.6611,
+                    'Itapema': -48.6111,
+                    'Luiz Alves': -48.9392,
+                    'Navegantes': -48.6547,
+                    'Penha': -48.6503,
+                    'Porto Belo': -48.5481,
+                    'Ilhota': -48.8286
+                }.get(municipio, -48.65)
+            },
             
-            mapa_progresso['municipios'][municipio] = {
-                'nome': municipio,
-                'progresso_mrs': progresso_mrs,
-                'progresso_map': progresso_map,
-                'progresso_geral': progresso_geral,
-                'status': status,
-                'prioridade': prioridade,
-                'visitas_realizadas': visitas_realizadas,
-                'visitas_pendentes': visitas_pendentes + visitas_em_execucao,
-                'total_visitas': total_visitas,
-                'ultimo_contato': ultimo_contato,
-                'informante_principal': informante_principal,
-                'telefone': telefone_contato,
-                'observacoes': f"Município de {municipio} - Progresso {progresso_geral}%",
-                
-                # Métricas avançadas
-                'eficiencia': eficiencia,
-                'risco_atraso': risco_atraso,
-                'proxima_acao': proxima_acao,
-                'dias_desde_inicio': dias_desde_primeira_visita,
-                'densidade_problemas': densidade_problemas,
-                'tipo_pesquisa': ['MRS', 'MAP', 'ambos'][random.randint(0, 2)],  # Baseado nas visitas reais
-                
-                # Dados temporais para filtros
-                'data_primeira_visita': visitas[0].data.isoformat() if visitas else None,
-                'data_ultima_visita': visitas[-1].data.isoformat() if visitas else None,
-                'data_ultima_atualizacao': datetime.now().isoformat(),
-                
-                # Pesquisador responsável (simulado baseado nas visitas)
-                'pesquisador_responsavel': f"Pesquisador PNSB {random.randint(1, 5)}",
-                
-                # Coordenadas geográficas
-                'coordenadas': {
-                    'lat': {
-                        'Balneário Camboriú': -26.9906,
-                        'Balneário Piçarras': -26.7567,
-                        'Bombinhas': -27.1394,
-                        'Camboriú': -27.0244,
-                        'Itajaí': -26.9078,
-                        'Itapema': -27.0906,
-                        'Luiz Alves': -26.7147,
-                        'Navegantes': -26.8975,
-                        'Penha': -26.7736,
-                        'Porto Belo': -27.1575,
-                        'Ilhota': -26.8989
-                    }.get(municipio, -26.9),
-                    'lng': {
-                        'Balneário Camboriú': -48.6356,
-                        'Balneário Piçarras': -48.6725,
-                        'Bombinhas': -48.4817,
-                        'Camboriú': -48.6578,
-                        'Itajaí': -48.6611,
-                        'Itapema': -48.6111,
-                        'Luiz Alves': -48.9392,
-                        'Navegantes': -48.6547,
-                        'Penha': -48.6503,
-                        'Porto Belo': -48.5481,
-                        'Ilhota': -48.8286
-                    }.get(municipio, -48.65)
-                },
-                
-                # Metadados
-                'fonte_dados': 'real',
-                'confiabilidade': 'alta' if total_visitas >= 3 else 'media' if total_visitas >= 1 else 'baixa'
-            }
-        
-        # Calcular progresso geral
-        mapa_progresso['estatisticas']['progresso_geral'] = round(progresso_total / len(municipios_pnsb))
-        
-        return APIResponse.success(
-            data=mapa_progresso,
-            message="Mapa de progresso obtido com sucesso"
-        )
-        
-    except Exception as e:
-        return APIResponse.error(f"Erro ao obter mapa de progresso: {str(e)}")
+            # Metadados
+            'fonte_dados': 'real',
+            'confiabilidade': 'alta' if total_visitas >= 3 else 'media' if total_visitas >= 1 else 'baixa'
+        }
+    
+    # Calcular progresso geral
+    mapa_progresso['estatisticas']['progresso_geral'] = round(progresso_total / len(municipios_pnsb))
+    
+    # Mesmo formato de APIResponse.success, serializado uma vez no snapshot
+    return {
+        'success': True,
+        'message': "Mapa de progresso obtido com sucesso",
+        'timestamp': datetime.now().isoformat(),
+        'data': mapa_progresso
+    }
 
 @funcionalidades_pnsb_bp.route('/questionarios/status-municipio/<municipio>', methods=['GET'])
 def obter_status_municipio(municipio):
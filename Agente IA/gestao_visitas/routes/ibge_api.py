@@ -4,20 +4,15 @@ Fornece APIs REST para o frontend consumir
 """
 
 from flask import Blueprint, jsonify, request
-import asyncio
 from ..services.ibge_service import ibge_service
+from ..services.async_http import async_http
 
 # Criar blueprint para APIs IBGE
 ibge_bp = Blueprint('ibge_api', __name__, url_prefix='/api/ibge')
 
 def run_async(coro):
-    """Helper para executar código async em contexto Flask"""
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        return loop.run_until_complete(coro)
-    finally:
-        loop.close()
+    """Helper para executar código async em contexto Flask (loop compartilhado de longa duração)"""
+    return async_http.run(coro)
 
 @ibge_bp.route('/municipios', methods=['GET'])
 def get_municipios():
@@ -91,14 +86,11 @@ def get_dados_economicos():
     Retorna dados econômicos dos municípios PNSB
     """
     try:
-        # Primeiro buscar municípios
-        municipios = run_async(ibge_service.get_municipios_santa_catarina())
-        
-        # Depois buscar dados econômicos
-        dados_economicos = run_async(ibge_service.get_dados_economicos(municipios))
-        
-        # Buscar também dados demográficos para calcular PIB per capita
-        dados_demograficos = run_async(ibge_service.get_dados_demograficos(municipios))
+        # Municípios, depois econômicos e demográficos (PIB per capita) em paralelo
+        consolidado = run_async(ibge_service.get_dados_consolidados())
+        municipios = consolidado['municipios']
+        dados_economicos = consolidado['economicos']
+        dados_demograficos = consolidado['demograficos']
         
         # Enriquecer dados
         resultado = []
@@ -142,10 +134,11 @@ def get_dados_consolidados():
     Retorna todos os dados consolidados dos municípios PNSB
     """
     try:
-        # Buscar todos os dados
-        municipios = run_async(ibge_service.get_municipios_santa_catarina())
-        dados_demograficos = run_async(ibge_service.get_dados_demograficos(municipios))
-        dados_economicos = run_async(ibge_service.get_dados_economicos(municipios))
+        # Buscar todos os dados (demográficos e econômicos em paralelo)
+        consolidado = run_async(ibge_service.get_dados_consolidados())
+        municipios = consolidado['municipios']
+        dados_demograficos = consolidado['demograficos']
+        dados_economicos = consolidado['economicos']
         
         # Consolidar dados
         resultado = []
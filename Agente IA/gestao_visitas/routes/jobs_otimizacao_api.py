@@ -0,0 +1,152 @@
+"""
+APIs dos jobs assíncronos de otimização de rotas
+Submissão devolve o id do job; progresso e melhor solução parcial chegam
+por Server-Sent Events; o job pode ser cancelado a qualquer momento
+"""
+
+import json
+
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
+
+from gestao_visitas.services.jobs_otimizacao import gerenciador_jobs, JobNaoEncontrado, HANDLERS
+from gestao_visitas.services.optimized_route_cache import optimized_route_cache
+from gestao_visitas.services.geometria_rotas import geometria_rotas
+from gestao_visitas.services.tempos_viagem import tempos_viagem
+
+jobs_otimizacao_bp = Blueprint('jobs_otimizacao', __name__)
+
+
+@jobs_otimizacao_bp.route('/otimizacao/jobs', methods=['POST'])
+def submeter_job():
+    """
+    Submete uma otimização
+
+    Body:
+    {
+        "tipo": "otimizar_rotas" | "rota_diaria" | "plano_semanal" | "pnsb_diaria" | "pnsb_semanal",
+        "dados": {...}  # mesmo corpo da rota síncrona correspondente
+    }
+    """
+    try:
+        data = request.get_json() or {}
+        tipo = data.get('tipo')
+        if tipo not in HANDLERS:
+            return jsonify({
+                'success': False,
+                'error': f"tipo deve ser um de: {', '.join(sorted(HANDLERS))}"
+            }), 400
+
+        job = gerenciador_jobs.submeter(tipo, data.get('dados') or {})
+        return jsonify({'success': True, 'data': job}), 202
+
+    except Exception as e:
+        current_app.logger.error(f"Erro ao submeter job de otimização: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@jobs_otimizacao_bp.route('/otimizacao/jobs', methods=['GET'])
+def listar_jobs():
+    """Jobs recentes (sem resultados) e estatísticas do pool"""
+    try:
+        return jsonify({
+            'success': True,
+            'data': {
+                'jobs': gerenciador_jobs.listar(),
+                'estatisticas': gerenciador_jobs.estatisticas(),
+                'cache_rotas': optimized_route_cache.get_metrics()
+            }
+        })
+    except Exception as e:
+        current_app.logger.error(f"Erro ao listar jobs de otimização: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@jobs_otimizacao_bp.route('/otimizacao/cache-rotas', methods=['GET'])
+def metricas_cache_rotas():
+    """Taxa de acerto, warm starts e tempo de cálculo poupado pelo cache de rotas otimizadas"""
+    try:
+        return jsonify({'success': True, 'data': optimized_route_cache.get_metrics()})
+    except Exception as e:
+        current_app.logger.error(f"Erro ao consultar cache de rotas: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@jobs_otimizacao_bp.route('/otimizacao/geometria-rotas', methods=['GET'])
+def metricas_geometria_rotas():
+    """Pontos e bytes de polyline poupados pela simplificação (neste processo)"""
+    try:
+        return jsonify({'success': True, 'data': geometria_rotas.get_metrics()})
+    except Exception as e:
+        current_app.logger.error(f"Erro ao consultar geometria de rotas: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@jobs_otimizacao_bp.route('/otimizacao/tempos-viagem', methods=['GET'])
+def metricas_tempos_viagem():
+    """Origem, versão e uso da matriz compartilhada de tempos entre municípios"""
+    try:
+        dados = tempos_viagem.get_metrics()
+        horario = request.args.get('hora', type=int)
+        if request.args.get('matriz', 'false').lower() == 'true':
+            dados['matriz'] = tempos_viagem.matriz_minutos(horario=horario)
+        return jsonify({'success': True, 'data': dados})
+    except Exception as e:
+        current_app.logger.error(f"Erro ao consultar tempos de viagem: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@jobs_otimizacao_bp.route('/otimizacao/jobs/<job_id>', methods=['GET'])
+def obter_job(job_id):
+    """Estado do job, melhor solução parcial e resultado (quando concluído)"""
+    try:
+        return jsonify({'success': True, 'data': gerenciador_jobs.obter(job_id)})
+    except JobNaoEncontrado:
+        return jsonify({'success': False, 'error': 'Job não encontrado'}), 404
+    except Exception as e:
+        current_app.logger.error(f"Erro ao consultar job {job_id}: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@jobs_otimizacao_bp.route('/otimizacao/jobs/<job_id>', methods=['DELETE'])
+def cancelar_job(job_id):
+    """Cancela o job (cooperativo: em execução, para no próximo passo com o melhor resultado parcial)"""
+    try:
+        return jsonify({'success': True, 'data': gerenciador_jobs.cancelar(job_id)})
+    except JobNaoEncontrado:
+        return jsonify({'success': False, 'error': 'Job não encontrado'}), 404
+    except Exception as e:
+        current_app.logger.error(f"Erro ao cancelar job {job_id}: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@jobs_otimizacao_bp.route('/otimizacao/jobs/<job_id>/eventos', methods=['GET'])
+def eventos_job(job_id):
+    """
+    Server-Sent Events do job: status, progresso (percentual, mensagem,
+    parcial) e o evento final (concluido, falhou ou cancelado). Reconexões
+    continuam a partir do cabeçalho Last-Event-ID.
+    """
+    try:
+        desde = int(request.headers.get('Last-Event-ID') or request.args.get('desde', 0))
+        gerenciador_jobs.obter(job_id, incluir_resultado=False)
+    except JobNaoEncontrado:
+        return jsonify({'success': False, 'error': 'Job não encontrado'}), 404
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Last-Event-ID inválido'}), 400
+
+    def gerar():
+        yield 'retry: 3000\n\n'
+        try:
+            for evento in gerenciador_jobs.acompanhar(job_id, desde):
+                if evento is None:
+                    yield ': ping\n\n'
+                    continue
+                seq, tipo, dados = evento
+                yield f"id: {seq}\nevent: {tipo}\ndata: {json.dumps(dados, default=str)}\n\n"
+        except JobNaoEncontrado:
+            yield 'event: erro\ndata: {"erro": "Job descartado"}\n\n'
+
+    return Response(stream_with_context(gerar()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
@@ -258,6 +258,23 @@ def detectar_contatos_duplicados():
     except Exception as e:
         return APIResponse.error(f"Erro ao detectar duplicados: {str(e)}")
 
+@melhorias_bp.route('/contatos/verificar-duplicata', methods=['POST'])
+@validate_json_input(required_fields=['municipio'])
+def verificar_duplicata_contato():
+    """Verifica se um novo contato já existe antes de inseri-lo"""
+    try:
+        data = request.validated_data
+        
+        duplicados = contatos_service.verificar_duplicata_contato(data)
+        
+        return APIResponse.success(
+            data=duplicados,
+            message=f"Encontrados {len(duplicados)} possíveis duplicados"
+        )
+        
+    except Exception as e:
+        return APIResponse.error(f"Erro ao verificar duplicata: {str(e)}")
+
 @melhorias_bp.route('/contatos/relatorio-qualidade', methods=['GET'])
 def obter_relatorio_qualidade_contatos():
     """Obtém relatório de qualidade dos contatos"""
@@ -8,7 +8,10 @@ from datetime import datetime
 import io
 import base64
 
-from gestao_visitas.services.offline_maps_service import OfflineMapsService, cache_santa_catarina_maps, precalculate_all_routes
+from gestao_visitas.services.offline_maps_service import (
+    OfflineMapsService, PrecalculoRotas, PrecalculoEmAndamentoError, cache_santa_catarina_maps,
+    precalculate_all_routes, iniciar_precalculo, pausar_precalculo
+)
 
 offline_maps_bp = Blueprint('offline_maps', __name__)
 
@@ -89,13 +92,41 @@ def cache_santa_catarina():
 
 @offline_maps_bp.route('/offline/precalculate-routes', methods=['POST'])
 def precalculate_routes():
-    """Pré-calcula rotas entre entidades"""
+    """
+    Pré-calcula rotas entre entidades
+    
+    Com "assincrono": true a execução roda em segundo plano e a resposta
+    traz o id para acompanhar em /offline/precalculate-routes/progress.
+    """
     try:
         data = request.get_json() or {}
         municipio = data.get('municipio')  # None = todos os municípios
+        try:
+            max_workers = min(int(data.get('max_workers', 4)), 16)
+            requisicoes_por_segundo = min(float(data.get('requisicoes_por_segundo', 10)), 50)
+        except (TypeError, ValueError):
+            return jsonify({
+                'success': False,
+                'error': 'max_workers e requisicoes_por_segundo devem ser numéricos'
+            }), 400
+        
+        # TokenBucket divide pela taxa; "not > 0" também recusa NaN
+        if max_workers < 1 or not requisicoes_por_segundo > 0:
+            return jsonify({
+                'success': False,
+                'error': 'max_workers deve ser inteiro >= 1 e requisicoes_por_segundo maior que zero'
+            }), 400
+        
+        if data.get('assincrono'):
+            progresso = iniciar_precalculo(municipio, max_workers, requisicoes_por_segundo)
+            return jsonify({
+                'success': True,
+                'message': f'Pré-cálculo iniciado para {municipio or "todos os municípios"}',
+                'data': progresso
+            }), 202
         
         service = OfflineMapsService()
-        result = service.precalculate_entity_routes(municipio)
+        result = service.precalculate_entity_routes(municipio, max_workers, requisicoes_por_segundo)
         
         return jsonify({
             'success': True,
@@ -103,11 +134,48 @@ def precalculate_routes():
             'data': result
         })
         
+    except PrecalculoEmAndamentoError as e:
+        return jsonify({
+            'success': False,
+            'error': f'Pré-cálculo já em andamento para {municipio or "todos os municípios"}',
+            'execucao_id': str(e)
+        }), 409
     except Exception as e:
         current_app.logger.error(f"Erro no pré-cálculo de rotas: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@offline_maps_bp.route('/offline/precalculate-routes/progress', methods=['GET'])
+def precalculate_routes_progress():
+    """Progresso de uma execução de pré-cálculo (a mais recente sem execucao_id)"""
+    try:
+        precalculo = PrecalculoRotas(OfflineMapsService())
+        progresso = precalculo.progresso(request.args.get('execucao_id'))
+        
+        if not progresso:
+            return jsonify({'success': False, 'error': 'Execução de pré-cálculo não encontrada'}), 404
+        
+        return jsonify({'success': True, 'data': progresso})
+        
+    except Exception as e:
+        current_app.logger.error(f"Erro ao obter progresso do pré-cálculo: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@offline_maps_bp.route('/offline/precalculate-routes/<execucao_id>/pause', methods=['POST'])
+def pause_precalculate_routes(execucao_id):
+    """Pausa um pré-cálculo em segundo plano; retomar = iniciar de novo o mesmo município"""
+    try:
+        if not pausar_precalculo(execucao_id):
+            return jsonify({'success': False, 'error': 'Execução não está ativa neste processo'}), 409
+        
+        return jsonify({'success': True, 'message': f'Pausa solicitada para {execucao_id}'})
+        
+    except Exception as e:
+        current_app.logger.error(f"Erro ao pausar pré-cálculo: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 @offline_maps_bp.route('/offline/precalculate-all-routes', methods=['POST'])
 def precalculate_all_routes_endpoint():
     """Pré-calcula todas as rotas entre todas as entidades"""
@@ -122,6 +190,12 @@ def precalculate_all_routes_endpoint():
             'data': result
         })
         
+    except PrecalculoEmAndamentoError as e:
+        return jsonify({
+            'success': False,
+            'error': 'Pré-cálculo já em andamento para todos os municípios',
+            'execucao_id': str(e)
+        }), 409
     except Exception as e:
         current_app.logger.error(f"Erro no pré-cálculo geral: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
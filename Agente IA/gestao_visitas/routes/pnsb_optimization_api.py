@@ -7,13 +7,14 @@ from flask import Blueprint, request, jsonify, current_app
 from datetime import datetime, timedelta
 import json
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Callable, Optional, Tuple
 
 from gestao_visitas.services.pnsb_route_optimizer import (
     PNSBRouteOptimizer, 
     PNSBRoutePoint, 
     PNSBOptimizedRoute
 )
+from gestao_visitas.services.jobs_otimizacao import gerenciador_jobs
 from gestao_visitas.db import db
 from gestao_visitas.models.agendamento import Visita
 
@@ -56,73 +57,18 @@ def optimize_daily_route():
         "date": "2025-07-15",  # opcional
         "start_time": "08:00",  # opcional
         "custom_points": [],  # opcional
-        "municipality_filter": "Itajaí"  # opcional
+        "municipality_filter": "Itajaí",  # opcional
+        "async": false  # opcional: true devolve 202 com o id do job
     }
     """
     try:
         data = request.get_json() or {}
         
-        optimizer = PNSBRouteOptimizer()
-        
-        # Parâmetros
-        date_filter = data.get('date')
-        start_time = data.get('start_time', '08:00')
-        custom_points = data.get('custom_points', [])
-        municipality_filter = data.get('municipality_filter')
-        
-        # Carregar pontos
-        if custom_points:
-            # Usar pontos customizados
-            route_points = []
-            for point_data in custom_points:
-                point = PNSBRoutePoint(
-                    id=point_data.get('id', f"custom_{len(route_points)}"),
-                    name=point_data['name'],
-                    lat=float(point_data['lat']),
-                    lng=float(point_data['lng']),
-                    municipality=point_data.get('municipality', ''),
-                    entity_type=point_data.get('entity_type', 'prefeitura'),
-                    survey_type=point_data.get('survey_type', 'ambos'),
-                    priority=int(point_data.get('priority', 2)),
-                    estimated_duration=int(point_data.get('estimated_duration', 120))
-                )
-                route_points.append(point)
-        else:
-            # Carregar do banco de dados
-            route_points = optimizer.load_visits_from_database(date_filter)
-            
-            # Filtrar por município se especificado
-            if municipality_filter:
-                route_points = [p for p in route_points if p.municipality == municipality_filter]
-        
-        if not route_points:
-            return jsonify({
-                'success': False,
-                'error': 'Nenhuma visita encontrada para otimizar',
-                'points_found': 0
-            }), 400
+        if data.get('async'):
+            return jsonify({'success': True, 'job': gerenciador_jobs.submeter('pnsb_diaria', data)}), 202
         
-        # Otimizar
-        optimized_route = optimizer.optimize_daily_route(route_points, start_time)
-        
-        # Gerar resumo
-        summary = optimizer.generate_route_summary(optimized_route)
-        
-        return jsonify({
-            'success': True,
-            'route': {
-                'points': [_point_to_dict(p) for p in optimized_route.route_points],
-                'total_distance_km': optimized_route.total_distance_km,
-                'total_duration_hours': optimized_route.total_duration_hours,
-                'travel_time_hours': optimized_route.total_travel_time_hours,
-                'start_time': optimized_route.start_time,
-                'end_time': optimized_route.end_time,
-                'efficiency': optimized_route.route_efficiency,
-                'optimization_level': optimized_route.optimization_level
-            },
-            'summary': summary,
-            'generated_at': datetime.now().isoformat()
-        })
+        payload, status = run_daily_optimization(data)
+        return jsonify(payload), status
         
     except Exception as e:
         logger.error(f"❌ Erro na otimização diária: {str(e)}")
@@ -133,6 +79,77 @@ def optimize_daily_route():
         }), 500
 
 
+def run_daily_optimization(data: Dict, progress_callback: Optional[Callable] = None) -> Tuple[Dict, int]:
+    """Otimização diária (rota síncrona e jobs); retorna (payload, status HTTP)"""
+    optimizer = PNSBRouteOptimizer()
+    
+    # Parâmetros
+    date_filter = data.get('date')
+    start_time = data.get('start_time', '08:00')
+    custom_points = data.get('custom_points', [])
+    municipality_filter = data.get('municipality_filter')
+    
+    if progress_callback:
+        progress_callback(10, 'Carregando visitas')
+    
+    # Carregar pontos
+    if custom_points:
+        # Usar pontos customizados
+        route_points = []
+        for point_data in custom_points:
+            point = PNSBRoutePoint(
+                id=point_data.get('id', f"custom_{len(route_points)}"),
+                name=point_data['name'],
+                lat=float(point_data['lat']),
+                lng=float(point_data['lng']),
+                municipality=point_data.get('municipality', ''),
+                entity_type=point_data.get('entity_type', 'prefeitura'),
+                survey_type=point_data.get('survey_type', 'ambos'),
+                priority=int(point_data.get('priority', 2)),
+                estimated_duration=int(point_data.get('estimated_duration', 120))
+            )
+            route_points.append(point)
+    else:
+        # Carregar do banco de dados
+        route_points = optimizer.load_visits_from_database(date_filter)
+        
+        # Filtrar por município se especificado
+        if municipality_filter:
+            route_points = [p for p in route_points if p.municipality == municipality_filter]
+    
+    if not route_points:
+        return {
+            'success': False,
+            'error': 'Nenhuma visita encontrada para otimizar',
+            'points_found': 0
+        }, 400
+    
+    if progress_callback:
+        progress_callback(40, f'Otimizando {len(route_points)} visitas')
+    
+    # Otimizar
+    optimized_route = optimizer.optimize_daily_route(route_points, start_time)
+    
+    # Gerar resumo
+    summary = optimizer.generate_route_summary(optimized_route)
+    
+    return {
+        'success': True,
+        'route': {
+            'points': [_point_to_dict(p) for p in optimized_route.route_points],
+            'total_distance_km': optimized_route.total_distance_km,
+            'total_duration_hours': optimized_route.total_duration_hours,
+            'travel_time_hours': optimized_route.total_travel_time_hours,
+            'start_time': optimized_route.start_time,
+            'end_time': optimized_route.end_time,
+            'efficiency': optimized_route.route_efficiency,
+            'optimization_level': optimized_route.optimization_level
+        },
+        'summary': summary,
+        'generated_at': datetime.now().isoformat()
+    }, 200
+
+
 @pnsb_optimization_bp.route('/optimize/weekly', methods=['POST'])
 def optimize_weekly_schedule():
     """
@@ -142,60 +159,18 @@ def optimize_weekly_schedule():
     {
         "start_date": "2025-07-14",
         "working_days": 5,
-        "municipality_filter": "Itajaí"  # opcional
+        "municipality_filter": "Itajaí",  # opcional
+        "async": false  # opcional: true devolve 202 com o id do job
     }
     """
     try:
         data = request.get_json() or {}
         
-        optimizer = PNSBRouteOptimizer()
+        if data.get('async'):
+            return jsonify({'success': True, 'job': gerenciador_jobs.submeter('pnsb_semanal', data)}), 202
         
-        # Parâmetros
-        start_date = data.get('start_date', datetime.now().strftime('%Y-%m-%d'))
-        working_days = int(data.get('working_days', 5))
-        municipality_filter = data.get('municipality_filter')
-        
-        # Carregar visitas agendadas
-        route_points = optimizer.load_visits_from_database()
-        
-        # Filtrar por município se especificado
-        if municipality_filter:
-            route_points = [p for p in route_points if p.municipality == municipality_filter]
-        
-        if not route_points:
-            return jsonify({
-                'success': False,
-                'error': 'Nenhuma visita encontrada para cronograma semanal',
-                'points_found': 0
-            }), 400
-        
-        # Otimizar cronograma semanal
-        weekly_routes = optimizer.optimize_weekly_schedule(route_points, working_days)
-        
-        # Formatar resposta
-        weekly_schedule = []
-        for i, route in enumerate(weekly_routes):
-            day_date = datetime.strptime(start_date, '%Y-%m-%d') + timedelta(days=i)
-            
-            weekly_schedule.append({
-                'day': i + 1,
-                'date': day_date.strftime('%Y-%m-%d'),
-                'weekday': day_date.strftime('%A'),
-                'points': [_point_to_dict(p) for p in route.route_points],
-                'total_distance_km': route.total_distance_km,
-                'total_duration_hours': route.total_duration_hours,
-                'efficiency': route.route_efficiency,
-                'summary': optimizer.generate_route_summary(route)
-            })
-        
-        return jsonify({
-            'success': True,
-            'weekly_schedule': weekly_schedule,
-            'total_days': len(weekly_routes),
-            'total_points': sum(len(route.route_points) for route in weekly_routes),
-            'avg_efficiency': sum(route.route_efficiency for route in weekly_routes) / len(weekly_routes) if weekly_routes else 0,
-            'generated_at': datetime.now().isoformat()
-        })
+        payload, status = run_weekly_optimization(data)
+        return jsonify(payload), status
         
     except Exception as e:
         logger.error(f"❌ Erro no cronograma semanal: {str(e)}")
@@ -206,6 +181,64 @@ def optimize_weekly_schedule():
         }), 500
 
 
+def run_weekly_optimization(data: Dict, progress_callback: Optional[Callable] = None) -> Tuple[Dict, int]:
+    """Cronograma semanal (rota síncrona e jobs); retorna (payload, status HTTP)"""
+    optimizer = PNSBRouteOptimizer()
+    
+    # Parâmetros
+    start_date = data.get('start_date', datetime.now().strftime('%Y-%m-%d'))
+    working_days = int(data.get('working_days', 5))
+    municipality_filter = data.get('municipality_filter')
+    
+    if progress_callback:
+        progress_callback(10, 'Carregando visitas agendadas')
+    
+    # Carregar visitas agendadas
+    route_points = optimizer.load_visits_from_database()
+    
+    # Filtrar por município se especificado
+    if municipality_filter:
+        route_points = [p for p in route_points if p.municipality == municipality_filter]
+    
+    if not route_points:
+        return {
+            'success': False,
+            'error': 'Nenhuma visita encontrada para cronograma semanal',
+            'points_found': 0
+        }, 400
+    
+    if progress_callback:
+        progress_callback(40, f'Distribuindo {len(route_points)} visitas em {working_days} dias')
+    
+    # Otimizar cronograma semanal
+    weekly_routes = optimizer.optimize_weekly_schedule(route_points, working_days)
+    
+    # Formatar resposta
+    weekly_schedule = []
+    for i, route in enumerate(weekly_routes):
+        day_date = datetime.strptime(start_date, '%Y-%m-%d') + timedelta(days=i)
+        
+        weekly_schedule.append({
+            'day': i + 1,
+            'date': day_date.strftime('%Y-%m-%d'),
+            'weekday': day_date.strftime('%A'),
+            'points': [_point_to_dict(p) for p in route.route_points],
+            'total_distance_km': route.total_distance_km,
+            'total_duration_hours': route.total_duration_hours,
+            'efficiency': route.route_efficiency,
+            'summary': optimizer.generate_route_summary(route)
+        })
+    
+    return {
+        'success': True,
+        'weekly_schedule': weekly_schedule,
+        'total_days': len(weekly_routes),
+        'total_points': sum(len(route.route_points) for route in weekly_routes),
+        'avg_efficiency': sum(route.route_efficiency for route in weekly_routes) / len(weekly_routes) if weekly_routes else 0,
+        'generated_at': datetime.now().isoformat()
+    }, 200
+
+
 @pnsb_optimization_bp.route('/visits/pending', methods=['GET'])
 def get_pending_visits():
     """Lista visitas pendentes para otimização"""
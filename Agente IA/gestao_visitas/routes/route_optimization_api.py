@@ -6,9 +6,13 @@ Sistema avançado de otimização e planejamento de rotas
 from flask import Blueprint, request, jsonify, current_app
 from datetime import datetime, timedelta
 import json
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Callable, Optional, Tuple
+
+import numpy as np
 
 from gestao_visitas.services.route_optimizer import RouteOptimizer, RoutePoint
+from gestao_visitas.services.repositorio_pontos_rota import repositorio_pontos_rota
+from gestao_visitas.services.jobs_otimizacao import gerenciador_jobs
 from gestao_visitas.db import db
 from gestao_visitas.models.agendamento import Visita
 
@@ -19,83 +23,17 @@ route_optimization_bp = Blueprint('route_optimization', __name__)
 def optimize_daily_route():
     """
     Otimiza rota para um dia específico
+    
+    Com "async": true no corpo, devolve 202 com o id de um job de otimização
     """
     try:
         data = request.get_json() or {}
         
-        # Parâmetros de entrada
-        municipality = data.get('municipality')
-        optimization_type = data.get('optimization_type', 'balanced')  # distance, time, priority, balanced
-        start_location = data.get('start_location')  # [lat, lng]
-        custom_points = data.get('points', [])  # Pontos customizados
-        
-        optimizer = RouteOptimizer()
-        
-        # Carregar pontos
-        if custom_points:
-            # Usar pontos customizados
-            route_points = []
-            for point_data in custom_points:
-                point = RoutePoint(
-                    id=point_data.get('id', f"custom_{len(route_points)}"),
-                    name=point_data['name'],
-                    lat=float(point_data['lat']),
-                    lng=float(point_data['lng']),
-                    municipality=point_data.get('municipality', 'Unknown'),
-                    priority=int(point_data.get('priority', 2)),
-                    estimated_duration=int(point_data.get('estimated_duration', 60)),
-                    visit_type=point_data.get('visit_type', 'standard'),
-                    requirements=point_data.get('requirements', [])
-                )
-                route_points.append(point)
-        else:
-            # Carregar do banco de dados
-            route_points = optimizer.load_entities_as_route_points(municipality)
-        
-        if not route_points:
-            return jsonify({
-                'success': False,
-                'error': 'Nenhum ponto válido encontrado para otimização'
-            }), 400
-        
-        # Otimizar rota
-        start_coords = tuple(start_location) if start_location else None
-        optimized_route = optimizer.optimize_daily_route(
-            route_points, 
-            start_location=start_coords,
-            optimization_type=optimization_type
-        )
-        
-        # Sugerir horários
-        schedule_info = optimizer.suggest_optimal_start_time(optimized_route)
+        if data.get('async'):
+            return jsonify({'success': True, 'data': gerenciador_jobs.submeter('rota_diaria', data)}), 202
         
-        # Analisar eficiência
-        efficiency_analysis = optimizer.analyze_route_efficiency(optimized_route)
-        
-        return jsonify({
-            'success': True,
-            'data': {
-                'optimized_route': {
-                    'points': [_point_to_dict(p) for p in optimized_route.points],
-                    'total_distance_km': optimized_route.total_distance_km,
-                    'total_duration_minutes': optimized_route.total_duration_minutes,
-                    'total_driving_time_minutes': optimized_route.total_driving_time_minutes,
-                    'optimization_score': optimized_route.optimization_score,
-                    'route_type': optimized_route.route_type,
-                    'created_at': optimized_route.created_at.isoformat(),
-                    'metadata': optimized_route.metadata
-                },
-                'schedule_suggestion': schedule_info,
-                'efficiency_analysis': efficiency_analysis,
-                'optimization_summary': {
-                    'points_optimized': len(optimized_route.points),
-                    'algorithm_used': optimized_route.metadata.get('algorithm', 'unknown'),
-                    'optimization_type': optimization_type,
-                    'estimated_fuel_cost': _estimate_fuel_cost(optimized_route.total_distance_km),
-                    'environmental_impact': _calculate_co2_emissions(optimized_route.total_distance_km)
-                }
-            }
-        })
+        payload, status = run_daily_route(data)
+        return jsonify(payload), status
         
     except Exception as e:
         current_app.logger.error(f"Erro na otimização de rota diária: {str(e)}")
@@ -105,88 +43,104 @@ def optimize_daily_route():
         }), 500
 
 
+def run_daily_route(data: Dict, progress_callback: Optional[Callable] = None) -> Tuple[Dict, int]:
+    """Otimização diária (usada pela rota síncrona e pelos jobs); retorna (payload, status HTTP)"""
+    # Parâmetros de entrada
+    municipality = data.get('municipality')
+    optimization_type = data.get('optimization_type', 'balanced')  # distance, time, priority, balanced
+    start_location = data.get('start_location')  # [lat, lng]
+    custom_points = data.get('points', [])  # Pontos customizados
+    
+    optimizer = RouteOptimizer()
+    
+    if progress_callback:
+        progress_callback(5, 'Carregando pontos')
+    
+    # Carregar pontos
+    if custom_points:
+        # Usar pontos customizados
+        route_points = []
+        for point_data in custom_points:
+            point = RoutePoint(
+                id=point_data.get('id', f"custom_{len(route_points)}"),
+                name=point_data['name'],
+                lat=float(point_data['lat']),
+                lng=float(point_data['lng']),
+                municipality=point_data.get('municipality', 'Unknown'),
+                priority=int(point_data.get('priority', 2)),
+                estimated_duration=int(point_data.get('estimated_duration', 60)),
+                visit_type=point_data.get('visit_type', 'standard'),
+                requirements=point_data.get('requirements', [])
+            )
+            route_points.append(point)
+    else:
+        # Carregar do banco de dados
+        route_points = optimizer.load_entities_as_route_points(municipality)
+    
+    if not route_points:
+        return {
+            'success': False,
+            'error': 'Nenhum ponto válido encontrado para otimização'
+        }, 400
+    
+    if progress_callback:
+        progress_callback(20, f'Otimizando {len(route_points)} pontos')
+    
+    # Otimizar rota
+    start_coords = tuple(start_location) if start_location else None
+    optimized_route = optimizer.optimize_daily_route(
+        route_points, 
+        start_location=start_coords,
+        optimization_type=optimization_type
+    )
+    
+    # Sugerir horários
+    schedule_info = optimizer.suggest_optimal_start_time(optimized_route)
+    
+    # Analisar eficiência
+    efficiency_analysis = optimizer.analyze_route_efficiency(optimized_route)
+    
+    return {
+        'success': True,
+        'data': {
+            'optimized_route': {
+                'points': [_point_to_dict(p) for p in optimized_route.points],
+                'total_distance_km': optimized_route.total_distance_km,
+                'total_duration_minutes': optimized_route.total_duration_minutes,
+                'total_driving_time_minutes': optimized_route.total_driving_time_minutes,
+                'optimization_score': optimized_route.optimization_score,
+                'route_type': optimized_route.route_type,
+                'created_at': optimized_route.created_at.isoformat(),
+                'metadata': optimized_route.metadata
+            },
+            'schedule_suggestion': schedule_info,
+            'efficiency_analysis': efficiency_analysis,
+            'optimization_summary': {
+                'points_optimized': len(optimized_route.points),
+                'algorithm_used': optimized_route.metadata.get('algorithm', 'unknown'),
+                'optimization_type': optimization_type,
+                'estimated_fuel_cost': _estimate_fuel_cost(optimized_route.total_distance_km),
+                'environmental_impact': _calculate_co2_emissions(optimized_route.total_distance_km)
+            }
+        }
+    }, 200
+
+
 @route_optimization_bp.route('/optimize/weekly-plan', methods=['POST'])
 def optimize_weekly_plan():
     """
     Otimiza plano semanal dividindo pontos em múltiplos dias
+    
+    Com "async": true no corpo, devolve 202 com o id de um job de otimização
     """
     try:
         data = request.get_json() or {}
         
-        # Parâmetros de entrada
-        municipality = data.get('municipality')
-        start_date = data.get('start_date')  # ISO format
-        working_days = data.get('working_days', 5)
-        custom_points = data.get('points', [])
+        if data.get('async'):
+            return jsonify({'success': True, 'data': gerenciador_jobs.submeter('plano_semanal', data)}), 202
         
-        if not start_date:
-            return jsonify({
-                'success': False,
-                'error': 'Data de início é obrigatória'
-            }), 400
-        
-        start_date_obj = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
-        
-        optimizer = RouteOptimizer()
-        
-        # Carregar pontos
-        if custom_points:
-            route_points = []
-            for point_data in custom_points:
-                point = RoutePoint(
-                    id=point_data.get('id', f"custom_{len(route_points)}"),
-                    name=point_data['name'],
-                    lat=float(point_data['lat']),
-                    lng=float(point_data['lng']),
-                    municipality=point_data.get('municipality', 'Unknown'),
-                    priority=int(point_data.get('priority', 2)),
-                    estimated_duration=int(point_data.get('estimated_duration', 60)),
-                    visit_type=point_data.get('visit_type', 'standard')
-                )
-                route_points.append(point)
-        else:
-            route_points = optimizer.load_entities_as_route_points(municipality)
-        
-        if not route_points:
-            return jsonify({
-                'success': False,
-                'error': 'Nenhum ponto encontrado para planejamento semanal'
-            }), 400
-        
-        # Otimizar plano semanal
-        weekly_routes = optimizer.optimize_weekly_plan(
-            route_points, 
-            start_date_obj, 
-            working_days
-        )
-        
-        # Calcular estatísticas semanais
-        weekly_stats = _calculate_weekly_statistics(weekly_routes)
-        
-        return jsonify({
-            'success': True,
-            'data': {
-                'weekly_plan': {
-                    'start_date': start_date,
-                    'working_days': working_days,
-                    'total_days_planned': len(weekly_routes),
-                    'daily_routes': [
-                        {
-                            'day': i + 1,
-                            'planned_date': route.metadata.get('planned_date'),
-                            'points': [_point_to_dict(p) for p in route.points],
-                            'total_distance_km': route.total_distance_km,
-                            'total_duration_minutes': route.total_duration_minutes,
-                            'optimization_score': route.optimization_score,
-                            'schedule_suggestion': optimizer.suggest_optimal_start_time(route)
-                        }
-                        for i, route in enumerate(weekly_routes)
-                    ]
-                },
-                'weekly_statistics': weekly_stats,
-                'recommendations': _generate_weekly_recommendations(weekly_routes, route_points)
-            }
-        })
+        payload, status = run_weekly_plan(data)
+        return jsonify(payload), status
         
     except Exception as e:
         current_app.logger.error(f"Erro na otimização semanal: {str(e)}")
@@ -196,6 +150,91 @@ def optimize_weekly_plan():
         }), 500
 
 
+def run_weekly_plan(data: Dict, progress_callback: Optional[Callable] = None) -> Tuple[Dict, int]:
+    """Plano semanal (usado pela rota síncrona e pelos jobs); retorna (payload, status HTTP)"""
+    # Parâmetros de entrada
+    municipality = data.get('municipality')
+    start_date = data.get('start_date')  # ISO format
+    working_days = data.get('working_days', 5)
+    time_budget = min(float(data.get('time_budget_seconds', 5)), 30.0)
+    custom_points = data.get('points', [])
+    
+    if not start_date:
+        return {
+            'success': False,
+            'error': 'Data de início é obrigatória'
+        }, 400
+    
+    start_date_obj = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
+    
+    optimizer = RouteOptimizer()
+    
+    if progress_callback:
+        progress_callback(2, 'Carregando pontos')
+    
+    # Carregar pontos
+    if custom_points:
+        route_points = []
+        for point_data in custom_points:
+            point = RoutePoint(
+                id=point_data.get('id', f"custom_{len(route_points)}"),
+                name=point_data['name'],
+                lat=float(point_data['lat']),
+                lng=float(point_data['lng']),
+                municipality=point_data.get('municipality', 'Unknown'),
+                priority=int(point_data.get('priority', 2)),
+                estimated_duration=int(point_data.get('estimated_duration', 60)),
+                visit_type=point_data.get('visit_type', 'standard')
+            )
+            route_points.append(point)
+    else:
+        route_points = optimizer.load_entities_as_route_points(municipality)
+    
+    if not route_points:
+        return {
+            'success': False,
+            'error': 'Nenhum ponto encontrado para planejamento semanal'
+        }, 400
+    
+    # Otimizar plano semanal
+    weekly_routes = optimizer.optimize_weekly_plan(
+        route_points, 
+        start_date_obj, 
+        working_days,
+        time_budget_seconds=time_budget,
+        progress_callback=progress_callback
+    )
+    
+    # Calcular estatísticas semanais
+    weekly_stats = _calculate_weekly_statistics(weekly_routes)
+    
+    return {
+        'success': True,
+        'data': {
+            'weekly_plan': {
+                'start_date': start_date,
+                'working_days': working_days,
+                'total_days_planned': len(weekly_routes),
+                'unassigned_point_ids': weekly_routes[0].metadata.get('unassigned_point_ids', []) if weekly_routes else [],
+                'daily_routes': [
+                    {
+                        'day': i + 1,
+                        'planned_date': route.metadata.get('planned_date'),
+                        'points': [_point_to_dict(p) for p in route.points],
+                        'total_distance_km': route.total_distance_km,
+                        'total_duration_minutes': route.total_duration_minutes,
+                        'optimization_score': route.optimization_score,
+                        'schedule_suggestion': optimizer.suggest_optimal_start_time(route)
+                    }
+                    for i, route in enumerate(weekly_routes)
+                ]
+            },
+            'weekly_statistics': weekly_stats,
+            'recommendations': _generate_weekly_recommendations(weekly_routes, route_points)
+        }
+    }, 200
+
+
 @route_optimization_bp.route('/optimize/alternatives', methods=['POST'])
 def get_route_alternatives():
     """
@@ -348,40 +387,25 @@ def get_municipality_points():
         municipality = request.args.get('municipality')
         include_coordinates = request.args.get('include_coordinates', 'true').lower() == 'true'
         
-        optimizer = RouteOptimizer()
-        points = optimizer.load_entities_as_route_points(municipality)
-        
-        # Estatísticas por município
-        municipalities_stats = {}
-        for point in points:
-            mun = point.municipality
-            if mun not in municipalities_stats:
-                municipalities_stats[mun] = {
-                    'total_points': 0,
-                    'priority_points': 0,
-                    'mrs_required': 0,
-                    'map_required': 0
-                }
-            
-            municipalities_stats[mun]['total_points'] += 1
-            if point.priority == 1:
-                municipalities_stats[mun]['priority_points'] += 1
-            if 'MRS' in point.requirements:
-                municipalities_stats[mun]['mrs_required'] += 1
-            if 'MAP' in point.requirements:
-                municipalities_stats[mun]['map_required'] += 1
+        # Estatísticas direto das colunas; pontos só são criados para um município
+        entities = repositorio_pontos_rota.entidades()
+        mask = entities.mascara(municipio=municipality)
+        total_points = int(mask.sum())
+        points = []
+        if municipality:
+            points = entities.materializar(np.flatnonzero(mask), RouteOptimizer._route_point_from_row)
         
         return jsonify({
             'success': True,
             'data': {
-                'municipalities_statistics': municipalities_stats,
-                'total_points': len(points),
-                'points': [_point_to_dict(p, include_coordinates) for p in points] if municipality else [],
-                'optimization_ready': len(points) > 0,
+                'municipalities_statistics': entities.estatisticas_por_municipio(mask),
+                'total_points': total_points,
+                'points': [_point_to_dict(p, include_coordinates) for p in points],
+                'optimization_ready': total_points > 0,
                 'recommendations': {
                     'ideal_daily_limit': 6,
                     'max_recommended_distance': 50,
-                    'estimated_days_needed': max(1, len(points) // 6) if points else 0
+                    'estimated_days_needed': max(1, total_points // 6) if total_points else 0
                 }
             }
         })
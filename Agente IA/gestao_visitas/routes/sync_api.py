@@ -0,0 +1,66 @@
+"""
+APIs para sincronização incremental com dispositivos de campo
+Entrega apenas o que mudou desde a última versão aplicada pelo cliente
+"""
+
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
+
+from gestao_visitas.services.delta_sync_service import delta_sync_service, LIMITE_PADRAO
+
+sync_bp = Blueprint('sync', __name__)
+
+
+@sync_bp.route('/sync', methods=['GET'])
+def sincronizar():
+    """
+    Retorna NDJSON com alterações e tombstones desde `since`
+
+    Query params:
+        since: última versão aplicada pelo cliente (padrão 0)
+        limit: registros por lote (padrão 1000, máximo 5000)
+        tabelas: lista separada por vírgula (visitas,entidades_identificadas)
+    """
+    try:
+        since = request.args.get('since', 0, type=int)
+        limite = request.args.get('limit', LIMITE_PADRAO, type=int)
+        tabelas = request.args.get('tabelas')
+        tabelas = [t.strip() for t in tabelas.split(',') if t.strip()] if tabelas else None
+
+        if since < 0:
+            return jsonify({'success': False, 'error': 'since deve ser >= 0'}), 400
+
+        versao_atual = delta_sync_service.versao_atual()
+
+        # Cursor à frente do servidor (banco restaurado/recriado): a cópia do
+        # cliente não é mais confiável, enviar tudo e pedir que limpe a local
+        reiniciar = since > versao_atual
+        if reiniciar:
+            since = 0
+
+        # Nada novo: resposta vazia sem tocar no change-log além do MAX()
+        if since >= versao_atual and not reiniciar:
+            return Response(status=204, headers={'X-Sync-Version': str(versao_atual)})
+
+        linhas = delta_sync_service.gerar_alteracoes(since, limite, tabelas)
+        response = Response(stream_with_context(linhas), mimetype='application/x-ndjson')
+        response.headers['X-Sync-Version'] = str(versao_atual)
+        if reiniciar:
+            response.headers['X-Sync-Reset'] = '1'
+        return response
+
+    except Exception as e:
+        current_app.logger.error(f"Erro na sincronização incremental: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@sync_bp.route('/sync/versao', methods=['GET'])
+def versao_sincronizacao():
+    """Retorna a versão atual do servidor para checagem rápida de novidades"""
+    try:
+        return jsonify({
+            'success': True,
+            'data': {'versao': delta_sync_service.versao_atual()}
+        })
+    except Exception as e:
+        current_app.logger.error(f"Erro ao obter versão de sincronização: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
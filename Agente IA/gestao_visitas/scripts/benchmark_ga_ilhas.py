@@ -0,0 +1,118 @@
+"""
+Benchmark do GA em ilhas contra o GA sequencial do RouteOptimizer
+
+Instância sintética (pontos ao redor de Itajaí, matriz por ID no formato do
+Google Maps, horários de atendimento variados); a qualidade de cada solução
+é medida com RouteOptimizer._calculate_route_score_google. O limite de
+tempo vale a partir da largada das ilhas; a subida dos processos aparece
+na coluna própria. Com menos núcleos que ilhas os processos disputam a
+mesma CPU e o resultado não mede o ganho do paralelismo.
+
+Uso:
+    python gestao_visitas/scripts/benchmark_ga_ilhas.py --pontos 40 --ilhas 1,2,4 --tempos 0.5,1,2
+"""
+
+import os
+import sys
+import math
+import time
+import random
+import argparse
+import statistics
+from pathlib import Path
+
+# Adicionar o diretório raiz ao PYTHONPATH
+root_dir = Path(__file__).parent.parent.parent
+sys.path.append(str(root_dir))
+
+from gestao_visitas.services.route_optimizer import RouteOptimizer, RoutePoint
+from gestao_visitas.services import ga_ilhas
+
+
+def gerar_instancia(n_pontos: int, semente: int):
+    """Pontos, matriz por ID (metros/segundos) e horários sintéticos"""
+    rng = random.Random(semente)
+    pontos = []
+    for i in range(n_pontos):
+        ponto = RoutePoint(
+            id=f'P{i}', name=f'Entidade {i}',
+            lat=-26.9077 + rng.uniform(-0.35, 0.35),
+            lng=-48.6618 + rng.uniform(-0.35, 0.35),
+            municipality='Itajaí',
+            priority=rng.choice([1, 1, 2, 3]),
+            estimated_duration=rng.choice([30, 45, 60, 90])
+        )
+        if i % 4 == 0:
+            ponto.business_hours = {'today_open': '09:00', 'today_close': '17:00', 'is_open_target_day': True}
+        elif i % 4 == 1:
+            ponto.business_hours = {'monday_friday': {'open': '08:00', 'close': '14:00'}}
+        pontos.append(ponto)
+
+    matriz = {'distances': {}, 'durations': {}, 'duration_in_traffic': {}}
+    for a in pontos:
+        for chave in matriz:
+            matriz[chave][a.id] = {}
+        for b in pontos:
+            km = 1.3 * 111.2 * math.hypot(a.lat - b.lat, (a.lng - b.lng) * math.cos(math.radians(a.lat)))
+            matriz['distances'][a.id][b.id] = int(km * 1000)
+            matriz['durations'][a.id][b.id] = int(km / 45 * 3600)
+            matriz['duration_in_traffic'][a.id][b.id] = int(km / 45 * 3600 * rng.uniform(1.0, 1.4))
+    return pontos, matriz
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Qualidade x tempo x núcleos do GA em ilhas')
+    parser.add_argument('--pontos', type=int, default=40)
+    parser.add_argument('--ilhas', default='1,2,4')
+    parser.add_argument('--tempos', default='0.5,1,2')
+    parser.add_argument('--repeticoes', type=int, default=3)
+    args = parser.parse_args()
+
+    optimizer = RouteOptimizer()
+    pontos, matriz = gerar_instancia(args.pontos, 42)
+
+    def score(ordem):
+        return optimizer._calculate_route_score_google(ordem, pontos, matriz, True)
+
+    nucleos = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+    max_ilhas = max(int(k) for k in args.ilhas.split(','))
+    print(f"Pontos: {args.pontos} | núcleos disponíveis: {nucleos} | repetições: {args.repeticoes}")
+    if nucleos < max_ilhas:
+        print(f"⚠️ {max_ilhas} ilhas em {nucleos} núcleo(s): meça em uma máquina com pelo menos {max_ilhas} núcleos")
+    print(f"{'configuração':<28}{'score médio':>14}{'melhor':>12}{'tempo (s)':>12}{'subida (s)':>12}"
+          f"{'gerações/ilha':>16}")
+
+    # Referência: GA sequencial (ilhas desligadas)
+    os.environ['PNSB_GA_ILHAS'] = '0'
+    scores, tempos = [], []
+    for repeticao in range(args.repeticoes):
+        inicio = time.perf_counter()
+        ordem = optimizer._genetic_algorithm_tsp_google(pontos, matriz, True)
+        tempos.append(time.perf_counter() - inicio)
+        scores.append(score(ordem))
+    print(f"{'GA sequencial (100 ger.)':<28}{statistics.mean(scores):>14.1f}{min(scores):>12.1f}"
+          f"{statistics.mean(tempos):>12.2f}{'-':>12}{'100':>16}")
+    del os.environ['PNSB_GA_ILHAS']
+
+    problema = optimizer._island_problem_google(pontos, matriz, True)
+    for tempo_limite in (float(t) for t in args.tempos.split(',')):
+        for ilhas in (int(k) for k in args.ilhas.split(',')):
+            scores, tempos, subidas, geracoes = [], [], [], []
+            for repeticao in range(args.repeticoes):
+                inicio = time.perf_counter()
+                ordem, _, estatisticas = ga_ilhas.resolver(
+                    problema, ilhas=ilhas, tempo_limite_s=tempo_limite,
+                    geracoes_estagnacao=10 ** 9, semente=repeticao
+                )
+                tempos.append(time.perf_counter() - inicio)
+                scores.append(score(ordem))
+                subidas.append(estatisticas.get('partida_s', 0.0))
+                geracoes.append(statistics.mean(estatisticas['geracoes']))
+            rotulo = f"ilhas={ilhas} limite={tempo_limite}s"
+            print(f"{rotulo:<28}{statistics.mean(scores):>14.1f}{min(scores):>12.1f}"
+                  f"{statistics.mean(tempos):>12.2f}{statistics.mean(subidas):>12.2f}"
+                  f"{statistics.mean(geracoes):>16.0f}")
+
+
+if __name__ == '__main__':
+    main()
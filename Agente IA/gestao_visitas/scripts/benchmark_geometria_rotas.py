@@ -0,0 +1,182 @@
+"""
+Benchmark do payload de direções: bytes enviados e custo de desenho do mapa
+
+Dia típico sintético (10 paradas ao redor de Itajaí + saída e retorno à
+base) com respostas no formato do Directions API: overview_polyline com um
+vértice a cada ~40 m e passos completos. Compara o que ia ao navegador antes
+(polyline original) com detail=full e detail=summary.
+
+O tempo de desenho no Leaflet/Google Maps é proporcional ao número de
+vértices; a tabela mostra os vértices e o tempo de decodificação das
+polylines (mesmo algoritmo que o navegador executa).
+
+Uso:
+    python gestao_visitas/scripts/benchmark_geometria_rotas.py --paradas 10 --repeticoes 20
+"""
+
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import statistics
+from pathlib import Path
+
+import numpy as np
+
+# Adicionar o diretório raiz ao PYTHONPATH
+root_dir = Path(__file__).parent.parent.parent
+sys.path.append(str(root_dir))
+
+from gestao_visitas.services.route_optimizer import RouteOptimizer, RoutePoint
+from gestao_visitas.services.maps import MapaService
+from gestao_visitas.services import geometria_rotas as geometria
+
+MANOBRAS = ['turn-right', 'turn-left', 'roundabout-right', 'merge', 'straight', 'keep-left']
+RUAS = ['Rua Hercílio Luz', 'Av. Sete de Setembro', 'BR-101', 'SC-412', 'Rua Blumenau', 'Av. Atlântica']
+
+
+def caminho_viario(origem, destino, rng, espacamento_m=40.0):
+    """Traçado sinuoso entre dois pontos, um vértice a cada `espacamento_m`"""
+    distancia = 1.3 * 111200 * math.hypot(destino[0] - origem[0], destino[1] - origem[1])
+    n = max(10, int(distancia / espacamento_m))
+    t = np.linspace(0, 1, n)
+    desvio = np.cumsum(rng.normal(0, 0.00015, n))
+    desvio -= np.linspace(desvio[0], desvio[-1], n)
+    lat = origem[0] + (destino[0] - origem[0]) * t + desvio * (destino[1] - origem[1]) / max(1e-9, abs(destino[1] - origem[1]))
+    lng = origem[1] + (destino[1] - origem[1]) * t + desvio * 0.5
+    return np.c_[lat, lng], distancia
+
+
+class ClienteSintetico:
+    """Substitui googlemaps.Client.directions com respostas no formato da API"""
+
+    def __init__(self, semente=42):
+        self.semente = semente
+
+    def directions(self, origin, destination, waypoints=None, **kwargs):
+        rng = np.random.default_rng(self.semente)
+        paradas = [origin] + list(waypoints or []) + [destination]
+        legs, overview = [], []
+        for a, b in zip(paradas, paradas[1:]):
+            coordenadas, distancia = caminho_viario(a, b, rng)
+            overview.append(coordenadas)
+            partes = np.array_split(np.arange(len(coordenadas)), 12)
+            passos = []
+            for parte in partes:
+                trecho = coordenadas[parte]
+                passos.append({
+                    'html_instructions': f'Vire <b>à direita</b> na <b>{RUAS[len(passos) % len(RUAS)]}</b>'
+                                         f'<div style="font-size:0.9em">Passe por Rotatória (à esquerda)</div>',
+                    'distance': {'text': f'{distancia / 12000:.1f} km', 'value': int(distancia / 12)},
+                    'duration': {'text': f'{int(distancia / 12 / 12 / 60) + 1} min', 'value': int(distancia / 12 / 12)},
+                    'start_location': {'lat': trecho[0, 0], 'lng': trecho[0, 1]},
+                    'end_location': {'lat': trecho[-1, 0], 'lng': trecho[-1, 1]},
+                    'polyline': {'points': geometria.codificar_polyline(trecho)},
+                    'travel_mode': 'DRIVING',
+                    'maneuver': MANOBRAS[len(passos) % len(MANOBRAS)]
+                })
+            legs.append({
+                'distance': {'text': f'{distancia / 1000:.1f} km', 'value': int(distancia)},
+                'duration': {'text': f'{int(distancia / 12 / 60)} min', 'value': int(distancia / 12)},
+                'duration_in_traffic': {'text': '', 'value': int(distancia / 10)},
+                'start_address': f'{a[0]:.4f}, {a[1]:.4f}', 'end_address': f'{b[0]:.4f}, {b[1]:.4f}',
+                'steps': passos
+            })
+        return [{
+            'legs': legs,
+            'overview_polyline': {'points': geometria.codificar_polyline(np.vstack(overview))},
+            'waypoint_order': list(range(len(waypoints or []))),
+            'warnings': []
+        }]
+
+
+def gerar_dia(n_paradas, semente):
+    rng = random.Random(semente)
+    return [
+        RoutePoint(
+            id=f'P{i}', name=f'Entidade {i}',
+            lat=-26.9077 + rng.uniform(-0.2, 0.2), lng=-48.6618 + rng.uniform(-0.2, 0.2),
+            municipality=f'Município {i}', priority=1, estimated_duration=60
+        )
+        for i in range(n_paradas)
+    ]
+
+
+def custo_desenho(payload, chaves, repeticoes):
+    """(vértices, ms para decodificar todas as polylines do payload)"""
+    polylines = [valor for chave, valor in _percorrer(payload) if chave in chaves and valor]
+    vertices = sum(len(geometria.decodificar_polyline(p)) for p in polylines)
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        for p in polylines:
+            geometria.decodificar_polyline(p)
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return vertices, statistics.median(tempos)
+
+
+def _percorrer(valor, chave=None):
+    if isinstance(valor, dict):
+        for k, v in valor.items():
+            yield from _percorrer(v, k)
+    elif isinstance(valor, list):
+        for v in valor:
+            yield from _percorrer(v, chave)
+    else:
+        yield chave, valor
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bytes e vértices das direções antes/depois da simplificação')
+    parser.add_argument('--paradas', type=int, default=10)
+    parser.add_argument('--repeticoes', type=int, default=20)
+    args = parser.parse_args()
+
+    pontos = gerar_dia(args.paradas, 42)
+    cliente = ClienteSintetico()
+
+    # Rota múltipla (MapaService): antes = mesma resposta com a polyline original
+    mapa = MapaService.__new__(MapaService)
+    mapa.client = cliente
+    mapa.logger = RouteOptimizer().logger
+    coordenadas = [(p.lat, p.lng) for p in pontos]
+    bruto = cliente.directions(coordenadas[0], coordenadas[-1], waypoints=coordenadas[1:-1])[0]
+    cenarios = {f'detail={detalhe}': mapa.calcular_rota_multipla(coordenadas, detail=detalhe)
+                for detalhe in geometria.DETALHES}
+    cenarios = {'antes': dict(cenarios['detail=full'], overview_polyline=bruto['overview_polyline']['points']),
+                **cenarios}
+
+    # Direções detalhadas do otimizador (ida, trechos entre paradas e retorno).
+    # Antes não havia geometria (o mapa ligava as paradas em linha reta);
+    # 'polyline bruta' é enviar a overview_polyline de cada trecho sem simplificar
+    optimizer = RouteOptimizer()
+    optimizer.google_maps_client = cliente
+    coords = {p.municipality: (p.lat, p.lng) for p in pontos}
+    direcoes = {f'detail={detalhe}': optimizer._get_detailed_directions(pontos, coords, detalhe)
+                for detalhe in geometria.DETALHES}
+    base = (optimizer.starting_point['lat'], optimizer.starting_point['lng'])
+    brutas = [cliente.directions(a, b)[0]['overview_polyline']['points']
+              for a, b in zip([base] + coordenadas, coordenadas + [base])]
+    direcoes = {
+        'antes': [{k: v for k, v in trecho.items() if k != 'polyline'} for trecho in direcoes['detail=full']],
+        'polyline bruta': [dict(trecho, polyline=p) for trecho, p in zip(direcoes['detail=full'], brutas)],
+        **direcoes
+    }
+
+    print(f"Paradas: {args.paradas} | repetições da decodificação: {args.repeticoes}")
+    for titulo, payloads in (('MapaService.calcular_rota_multipla', cenarios),
+                             ('RouteOptimizer._get_detailed_directions', direcoes)):
+        print(f"\n{titulo}")
+        print(f"{'payload':<18}{'bytes JSON':>12}{'vértices':>10}{'decodificar (ms)':>18}")
+        for nome, payload in payloads.items():
+            tamanho = len(json.dumps(payload, ensure_ascii=False).encode('utf-8'))
+            vertices, ms = custo_desenho(payload, {'overview_polyline', 'polyline'}, args.repeticoes)
+            print(f"{nome:<18}{tamanho:>12}{vertices:>10}{ms:>18.2f}")
+
+    print(f"\nCache de geometria: {geometria.geometria_rotas.get_metrics()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""
+Constrói (offline) a matriz persistida de tempos de viagem entre municípios
+
+Lê as rotas já em cache do modo offline e o roteador local; pares sem dados
+usam a tabela de referência ou a estimativa em linha reta. A aplicação só
+lê a matriz gravada — nada é calculado na importação dos módulos.
+
+Uso:
+    python gestao_visitas/scripts/construir_tempos_viagem.py --hora 8
+"""
+
+import sys
+import argparse
+from pathlib import Path
+
+# Adicionar o diretório raiz ao PYTHONPATH
+root_dir = Path(__file__).parent.parent.parent
+sys.path.append(str(root_dir))
+
+from gestao_visitas.services.tempos_viagem import tempos_viagem
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Reconstrói a matriz de tempos de viagem entre municípios')
+    parser.add_argument('--hora', type=int, default=None, help='Hora de saída para exibir (padrão: típica)')
+    args = parser.parse_args()
+
+    fontes = tempos_viagem.construir()
+    print(f"Pares por fonte: {fontes}")
+
+    matriz = tempos_viagem.matriz_minutos(horario=args.hora)
+    nomes = list(matriz)
+    largura = max(len(n) for n in nomes) + 2
+    print(f"\nMinutos de viagem ({'hora típica' if args.hora is None else f'{args.hora}h'})")
+    print(' ' * largura + ''.join(f"{n[:6]:>8}" for n in nomes))
+    for origem in nomes:
+        print(f"{origem:<{largura}}" + ''.join(f"{matriz[origem][destino]:>8}" for destino in nomes))
+
+    print(f"\nMétricas: {tempos_viagem.get_metrics()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,7 @@ from ..models.contatos import Contato
 from ..config import MUNICIPIOS, HORARIO_INICIO_DIA, HORARIO_FIM_DIA, DURACAO_PADRAO_VISITA
 from ..db import db
 from .maps import MapaService
+from .tempos_viagem import tempos_viagem
 
 class AgendamentoAvancado:
     """Sistema avançado de agendamento de visitas"""
@@ -76,6 +77,11 @@ class AgendamentoAvancado:
                 rota = self.mapa_service.calcular_rota(local_atual, visita.municipio)
                 if 'erro' not in rota:
                     tempo_viagem = self._extrair_minutos_duracao(rota.get('duracao', '0 min'))
+                    # Duração real com trânsito alimenta a matriz compartilhada de tempos
+                    tempos_viagem.registrar_observacao(
+                        local_atual, visita.municipio,
+                        rota.get('duracao_com_transito_segundos', 0) / 60, fonte='google_maps'
+                    )
                     distancia = self._extrair_km_distancia(rota.get('distancia', '0 km'))
                     
                     rota_otimizada.append({
@@ -126,16 +132,15 @@ class AgendamentoAvancado:
         
         # Conflitos em municípios próximos (verificar viabilidade de viagem)
         conflitos_viagem = []
-        if self.mapa_service:
-            for visita in conflitos:
-                if visita.municipio != municipio:
-                    tempo_viagem = self._calcular_tempo_viagem(municipio, visita.municipio)
-                    if tempo_viagem and tempo_viagem < 60:  # Menos de 1h de viagem
-                        conflitos_viagem.append({
-                            'visita': visita,
-                            'tempo_viagem': tempo_viagem,
-                            'viavel': self._verificar_viabilidade_viagem(hora_inicio, hora_fim, visita, tempo_viagem)
-                        })
+        for visita in conflitos:
+            if visita.municipio != municipio:
+                tempo_viagem = self._calcular_tempo_viagem(municipio, visita.municipio, hora_inicio)
+                if tempo_viagem and tempo_viagem < 60:  # Menos de 1h de viagem
+                    conflitos_viagem.append({
+                        'visita': visita,
+                        'tempo_viagem': tempo_viagem,
+                        'viavel': self._verificar_viabilidade_viagem(hora_inicio, hora_fim, visita, tempo_viagem)
+                    })
         
         return {
             'tem_conflitos': len(conflitos) > 0,
@@ -313,11 +318,15 @@ class AgendamentoAvancado:
         
         return sugestoes
     
-    def _calcular_tempo_viagem(self, origem: str, destino: str) -> Optional[int]:
-        """Calcula tempo de viagem entre dois municípios"""
-        if not self.mapa_service or origem == destino:
+    def _calcular_tempo_viagem(self, origem: str, destino: str, horario: time = None) -> Optional[int]:
+        """Calcula tempo de viagem entre dois municípios (matriz compartilhada; Google Maps se fora dela)"""
+        if origem == destino:
             return 0
         
+        tempo = tempos_viagem.minutos(origem, destino, horario)
+        if tempo is not None or not self.mapa_service:
+            return tempo
+        
         resultado = self.mapa_service.estimar_tempo(origem, destino)
         if 'erro' not in resultado:
             return self._extrair_minutos_duracao(resultado.get('duracao', '0 min'))
@@ -15,6 +15,10 @@ import os
 from collections import defaultdict
 import xml.etree.ElementTree as ET
 import re
+import asyncio
+import threading
+
+from .async_http import async_http, HTTPStatusError
 
 class TipoAPI(Enum):
     SNIS = "snis"
@@ -132,6 +136,10 @@ class APIsGovernamentais:
         # Cache em memória (em produção usar Redis)
         self.cache = {}
         self.rate_limits = defaultdict(list)
+        self._rate_limit_lock = threading.Lock()
+        
+        # Municípios consultados simultaneamente na consolidação em lote
+        self.max_municipios_paralelos = 4
         
         # Configurações de retry
         self.retry_config = {
@@ -157,6 +165,9 @@ class APIsGovernamentais:
     
     def obter_dados_snis_municipio(self, municipio: str, ano: int = 2022) -> Dict:
         """Obtém dados SNIS para um município"""
+        return self._executar_no_loop(self._obter_dados_snis_async(municipio, ano), 'snis')
+    
+    async def _obter_dados_snis_async(self, municipio: str, ano: int = 2022) -> Dict:
         try:
             # Validar município
             if municipio not in self.municipios_pnsb_ibge:
@@ -173,7 +184,7 @@ class APIsGovernamentais:
             
             # Fazer requisição à API SNIS
             url = f"{self.apis_config['snis']['base_url']}/municipio/{codigo_ibge}/ano/{ano}"
-            dados_api = self._fazer_requisicao_com_retry('snis', url)
+            dados_api = await self._requisicao_com_limite_async('snis', url)
             
             if dados_api.get('erro'):
                 return dados_api
@@ -243,6 +254,9 @@ class APIsGovernamentais:
     
     def buscar_convenios_siconv(self, municipio: str, area: str = 'saneamento') -> Dict:
         """Busca convênios relacionados ao saneamento no SICONV"""
+        return self._executar_no_loop(self._buscar_convenios_siconv_async(municipio, area), 'siconv')
+    
+    async def _buscar_convenios_siconv_async(self, municipio: str, area: str = 'saneamento') -> Dict:
         try:
             codigo_ibge = self.municipios_pnsb_ibge.get(municipio)
             
@@ -270,7 +284,7 @@ class APIsGovernamentais:
                 params['palavraChave'] = 'saneamento OR esgoto OR água OR resíduos'
             
             url = f"{self.apis_config['siconv']['base_url']}/convenios"
-            dados_api = self._fazer_requisicao_com_retry('siconv', url, params=params)
+            dados_api = await self._requisicao_com_limite_async('siconv', url, params=params)
             
             if dados_api.get('erro'):
                 return dados_api
@@ -396,6 +410,9 @@ class APIsGovernamentais:
     
     def consolidar_dados_municipio(self, municipio: str) -> Dict:
         """Consolida dados de todas as APIs para um município"""
+        return self._executar_no_loop(self._consolidar_municipio_async(municipio), 'snis', 'siconv')
+    
+    async def _consolidar_municipio_async(self, municipio: str) -> Dict:
         try:
             dados_consolidados = {
                 'municipio': municipio,
@@ -403,21 +420,18 @@ class APIsGovernamentais:
                 'consolidacao_realizada': datetime.now().isoformat()
             }
             
-            # 1. Dados SNIS
-            print(f"Buscando dados SNIS para {municipio}...")
-            dados_snis = self.obter_dados_snis_municipio(municipio)
+            # 1 e 3. SNIS e convênios SICONV em paralelo no loop compartilhado
+            dados_snis, convenios = await asyncio.gather(
+                self._obter_dados_snis_async(municipio),
+                self._buscar_convenios_siconv_async(municipio)
+            )
             dados_consolidados['snis'] = dados_snis
+            dados_consolidados['convenios'] = convenios
             
-            # 2. Dados de transparência
-            print(f"Buscando dados de transparência para {municipio}...")
+            # 2. Dados de transparência (sem requisição externa)
             dados_transparencia = self.obter_dados_transparencia_municipio(municipio)
             dados_consolidados['transparencia'] = dados_transparencia
             
-            # 3. Convênios SICONV
-            print(f"Buscando convênios SICONV para {municipio}...")
-            convenios = self.buscar_convenios_siconv(municipio)
-            dados_consolidados['convenios'] = convenios
-            
             # 4. Análise consolidada
             analise = self._analisar_dados_consolidados(dados_consolidados)
             dados_consolidados['analise_consolidada'] = analise
@@ -440,6 +454,43 @@ class APIsGovernamentais:
         except Exception as e:
             return {'erro': str(e)}
     
+    def consolidar_municipios_pnsb(self, municipios: List[str] = None) -> Dict:
+        """
+        Consolida dados de vários municípios em paralelo.
+        
+        Todas as consultas são corrotinas no loop HTTP compartilhado (pool de
+        conexões e coalescência por API), sem threads intermediárias; o
+        semáforo limita quantos municípios são consultados ao mesmo tempo.
+        """
+        municipios = municipios or list(self.municipios_pnsb_ibge.keys())
+        
+        async def consolidar_todos():
+            semaforo = asyncio.Semaphore(self.max_municipios_paralelos)
+            
+            async def consolidar(municipio):
+                async with semaforo:
+                    return await self._consolidar_municipio_async(municipio)
+            
+            return await asyncio.gather(*(consolidar(m) for m in municipios), return_exceptions=True)
+        
+        inicio = time.time()
+        rodadas = max(1, -(-len(municipios) // self.max_municipios_paralelos))
+        resultados = async_http.run(
+            consolidar_todos(), timeout=rodadas * self._timeout_requisicao('snis', 'siconv')
+        )
+        
+        consolidados = {}
+        for municipio, resultado in zip(municipios, resultados):
+            consolidados[municipio] = {'erro': str(resultado)} if isinstance(resultado, Exception) else resultado
+        
+        return {
+            'sucesso': True,
+            'municipios': consolidados,
+            'total_municipios': len(municipios),
+            'com_erro': sum(1 for r in consolidados.values() if 'erro' in r),
+            'tempo_execucao_s': round(time.time() - inicio, 2)
+        }
+    
     def gerar_relatorio_apis(self) -> Dict:
         """Gera relatório de uso das APIs governamentais"""
         try:
@@ -482,46 +533,68 @@ class APIsGovernamentais:
         expires = datetime.now() + timedelta(seconds=self.apis_config[api_type]['cache_duration'])
         self.cache[key] = {'data': data, 'expires': expires}
     
+    def _timeout_requisicao(self, *api_types):
+        """Tempo máximo de uma consulta com todas as tentativas (a mais lenta das APIs)"""
+        tentativas = self.retry_config['max_attempts']
+        esperas = sum(self.retry_config['retry_delay'] * self.retry_config['backoff_factor'] ** i
+                      for i in range(tentativas - 1))
+        return max(self.apis_config[api]['timeout'] for api in api_types) * tentativas + esperas + 30
+    
+    def _executar_no_loop(self, coro, *api_types):
+        """Executa a corrotina no loop HTTP compartilhado a partir de código síncrono"""
+        try:
+            return async_http.run(coro, timeout=self._timeout_requisicao(*api_types))
+        except Exception as e:
+            return {'erro': str(e)}
+    
     def _fazer_requisicao_com_retry(self, api_type, url, params=None):
-        """Faz requisição com retry e rate limiting"""
+        """Faz requisição com retry e rate limiting (executada no loop HTTP compartilhado)"""
+        return self._executar_no_loop(self._requisicao_com_limite_async(api_type, url, params), api_type)
+    
+    async def _requisicao_com_limite_async(self, api_type, url, params=None):
+        """Requisição com rate limiting, para uso dentro do loop"""
         try:
-            # Verificar rate limit
             if not self._verificar_rate_limit(api_type):
                 return {'erro': f'Rate limit atingido para {api_type}'}
-            
-            # Fazer requisição
-            config = self.apis_config[api_type]
-            response = requests.get(
-                url, 
-                headers=config['headers'],
-                params=params,
-                timeout=config['timeout']
-            )
-            
-            if response.status_code == 200:
-                return {'data': response.json()}
-            else:
-                return {'erro': f'HTTP {response.status_code}: {response.text}'}
-                
+            return await self._requisicao_async(api_type, url, params)
         except Exception as e:
             return {'erro': str(e)}
     
+    async def _requisicao_async(self, api_type, url, params=None):
+        """GET assíncrono com sessão persistente por API e backoff exponencial"""
+        config = self.apis_config[api_type]
+        try:
+            data = await async_http.fetch_json(
+                api_type, url,
+                params=params,
+                headers=config['headers'],
+                timeout=config['timeout'],
+                max_attempts=self.retry_config['max_attempts'],
+                backoff=self.retry_config['retry_delay'],
+                backoff_factor=self.retry_config['backoff_factor']
+            )
+            return {'data': data}
+        except HTTPStatusError as e:
+            return {'erro': f'HTTP {e.status}: {e.body}'}
+    
     def _verificar_rate_limit(self, api_type):
         """Verifica se pode fazer requisição baseado no rate limit"""
         agora = datetime.now()
         limit = self.apis_config[api_type]['rate_limit']
         
-        # Limpar requisições antigas (última hora)
-        uma_hora_atras = agora - timedelta(hours=1)
-        self.rate_limits[api_type] = [
-            req for req in self.rate_limits[api_type] 
-            if req > uma_hora_atras
-        ]
-        
-        # Verificar se pode fazer nova requisição
-        if len(self.rate_limits[api_type]) < limit:
-            self.rate_limits[api_type].append(agora)
-            return True
+        # Consolidação em lote chama de várias threads ao mesmo tempo
+        with self._rate_limit_lock:
+            # Limpar requisições antigas (última hora)
+            uma_hora_atras = agora - timedelta(hours=1)
+            self.rate_limits[api_type] = [
+                req for req in self.rate_limits[api_type] 
+                if req > uma_hora_atras
+            ]
+            
+            # Verificar se pode fazer nova requisição
+            if len(self.rate_limits[api_type]) < limit:
+                self.rate_limits[api_type].append(agora)
+                return True
         
         return False
     
@@ -0,0 +1,262 @@
+"""
+Loop asyncio compartilhado para clientes HTTP externos (IBGE e APIs governamentais)
+Um único event loop em thread de fundo, sessões aiohttp com pool por upstream,
+coalescência de requisições idênticas em andamento e retry com backoff
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Imports opcionais com fallback
+try:
+    import aiohttp
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
+    aiohttp = None
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+class HTTPStatusError(Exception):
+    """Resposta HTTP com status de erro vinda de um upstream"""
+
+    def __init__(self, status: int, url: str, body: str = ''):
+        super().__init__(f'HTTP {status}: {url}')
+        self.status = status
+        self.url = url
+        self.body = body
+
+
+class AsyncHTTPClient:
+    """
+    Cliente HTTP assíncrono de longa duração.
+
+    - Event loop dedicado numa thread daemon (iniciado sob demanda, recriado após fork)
+    - Uma `aiohttp.ClientSession` por upstream, com keep-alive e cache de DNS
+    - Semáforo por upstream para limitar concorrência no fan-out
+    - Requisições idênticas concorrentes compartilham o mesmo future
+    - Sem aiohttp instalado, usa `requests.Session` com pool no executor do loop
+    """
+
+    def __init__(self, default_timeout: float = 15, max_concurrency: int = 6):
+        self.default_timeout = default_timeout
+        self.max_concurrency = max_concurrency
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+        # Estruturas abaixo só são tocadas dentro da thread do loop
+        self._sessions: Dict[str, Any] = {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._in_flight: Dict[Tuple, asyncio.Future] = {}
+        self._requests_sessions: Dict[str, requests.Session] = {}
+
+        self.metrics = {
+            'requests': 0,
+            'coalesced': 0,
+            'retries': 0,
+            'errors': 0
+        }
+
+    # ===== CICLO DE VIDA DO LOOP =====
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """Event loop de fundo (iniciado na primeira chamada)"""
+        if self._loop is None or self._pid != os.getpid() or not self._thread.is_alive():
+            with self._start_lock:
+                if self._loop is None or self._pid != os.getpid() or not self._thread.is_alive():
+                    self._start()
+        return self._loop
+
+    def _start(self):
+        loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(loop)
+            loop.call_soon(ready.set)
+            loop.run_forever()
+
+        thread = threading.Thread(target=run, name='pnsb-async-http', daemon=True)
+        thread.start()
+        ready.wait()
+
+        # Estado herdado de outro processo (fork) não é reutilizável
+        self._sessions = {}
+        self._semaphores = {}
+        self._in_flight = {}
+        self._loop, self._thread, self._pid = loop, thread, os.getpid()
+        logger.info("🔁 Loop asyncio compartilhado iniciado para clientes HTTP")
+
+    def run(self, coro: Awaitable, timeout: float = None):
+        """Executa uma corrotina no loop compartilhado e aguarda o resultado (thread-safe)"""
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        return future.result(timeout if timeout is not None else self.default_timeout * 4)
+
+    def shutdown(self):
+        """Fecha sessões e encerra o loop (útil em testes e no encerramento)"""
+        if self._loop is None or not self._thread.is_alive():
+            return
+
+        async def close_all():
+            for session in self._sessions.values():
+                await session.close()
+            self._sessions.clear()
+
+        try:
+            self.run(close_all(), timeout=5)
+        finally:
+            for session in self._requests_sessions.values():
+                session.close()
+            self._requests_sessions.clear()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+            self._loop = None
+
+    # ===== SESSÕES E LIMITES POR UPSTREAM =====
+
+    def _get_session(self, upstream: str):
+        session = self._sessions.get(upstream)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(
+                limit_per_host=self.max_concurrency,
+                ttl_dns_cache=300,
+                keepalive_timeout=60
+            )
+            session = aiohttp.ClientSession(connector=connector)
+            self._sessions[upstream] = session
+        return session
+
+    def _get_requests_session(self, upstream: str) -> requests.Session:
+        session = self._requests_sessions.get(upstream)
+        if session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=self.max_concurrency)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._requests_sessions[upstream] = session
+        return session
+
+    def semaphore(self, upstream: str, limit: int = None) -> asyncio.Semaphore:
+        """Semáforo de concorrência do upstream (criado dentro do loop)"""
+        sem = self._semaphores.get(upstream)
+        if sem is None:
+            sem = asyncio.Semaphore(limit or self.max_concurrency)
+            self._semaphores[upstream] = sem
+        return sem
+
+    # ===== REQUISIÇÕES =====
+
+    async def fetch_json(self, upstream: str, url: str, params: Dict = None,
+                         headers: Dict = None, timeout: float = None,
+                         max_attempts: int = 3, backoff: float = 0.5, backoff_factor: float = 2.0):
+        """
+        GET com resposta JSON, coalescido por (upstream, url, params).
+
+        Chamadas concorrentes idênticas aguardam o mesmo future; apenas a
+        primeira vai à rede. Erros são propagados a todos os aguardantes.
+        A espera antes da tentativa n+1 é `backoff * backoff_factor ** n`.
+        """
+        key = (upstream, url, tuple(sorted((params or {}).items())))
+        pending = self._in_flight.get(key)
+        if pending is not None:
+            self.metrics['coalesced'] += 1
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            result = await self._fetch_with_retry(
+                upstream, url, params, headers, timeout or self.default_timeout,
+                max_attempts, backoff, backoff_factor
+            )
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Evita aviso de exceção não recuperada quando ninguém mais aguardava
+            future.exception()
+            raise
+        finally:
+            self._in_flight.pop(key, None)
+
+    async def _fetch_with_retry(self, upstream, url, params, headers, timeout, max_attempts,
+                                backoff, backoff_factor):
+        last_error = None
+        for attempt in range(max_attempts):
+            try:
+                async with self.semaphore(upstream):
+                    self.metrics['requests'] += 1
+                    return await self._fetch_once(upstream, url, params, headers, timeout)
+            except HTTPStatusError as e:
+                last_error = e
+                # Erros do cliente (exceto 429) não melhoram com retry
+                if e.status < 500 and e.status != 429:
+                    break
+            except (asyncio.TimeoutError, OSError, requests.RequestException) as e:
+                last_error = e
+            except Exception as e:
+                if AIOHTTP_AVAILABLE and isinstance(e, aiohttp.ClientError):
+                    last_error = e
+                else:
+                    raise
+
+            if attempt < max_attempts - 1:
+                self.metrics['retries'] += 1
+                await asyncio.sleep(backoff * (backoff_factor ** attempt))
+
+        self.metrics['errors'] += 1
+        raise last_error
+
+    async def _fetch_once(self, upstream, url, params, headers, timeout):
+        if AIOHTTP_AVAILABLE:
+            session = self._get_session(upstream)
+            async with session.get(url, params=params, headers=headers,
+                                   timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                if response.status != 200:
+                    raise HTTPStatusError(response.status, url, await response.text())
+                return await response.json(content_type=None)
+
+        # Fallback: requests com pool de conexões, fora da thread do loop
+        session = self._get_requests_session(upstream)
+        response = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: session.get(url, params=params, headers=headers, timeout=timeout)
+        )
+        if response.status_code != 200:
+            raise HTTPStatusError(response.status_code, url, response.text)
+        return json.loads(response.content or b'null')
+
+    async def gather_limited(self, upstream: str, funcs: Iterable[Callable[[], Awaitable]],
+                             limit: int = None, return_exceptions: bool = True) -> List:
+        """Executa várias corrotinas em paralelo com no máximo `limit` simultâneas"""
+        sem = asyncio.Semaphore(limit or self.max_concurrency)
+
+        async def guarded(func):
+            async with sem:
+                return await func()
+
+        return await asyncio.gather(*(guarded(f) for f in funcs), return_exceptions=return_exceptions)
+
+    def get_metrics(self) -> Dict:
+        return {
+            **self.metrics,
+            'backend': 'aiohttp' if AIOHTTP_AVAILABLE else 'requests',
+            'upstreams': sorted(set(self._sessions) | set(self._requests_sessions)),
+            'in_flight': len(self._in_flight)
+        }
+
+
+# Instância global compartilhada por todos os serviços
+async_http = AsyncHTTPClient()
@@ -0,0 +1,398 @@
+"""
+Gravação em lote dos logs de auditoria LGPD (PNSB 2024)
+Fila sem bloqueio no caminho da requisição, escritor em thread de fundo,
+segmentos diários append-only encadeados por hash e índice SQLite por
+(titular_id, ts) para atender solicitações de titulares
+"""
+
+import os
+import json
+import time
+import queue
+import atexit
+import sqlite3
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+# Imports opcionais com fallback (trava entre processos)
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+    fcntl = None
+
+try:
+    import msvcrt
+    MSVCRT_AVAILABLE = True
+except ImportError:
+    MSVCRT_AVAILABLE = False
+    msvcrt = None
+
+logger = logging.getLogger(__name__)
+
+HASH_INICIAL = '0' * 64
+
+_SEPARADORES = (',', ':')
+
+
+def _serializar(valor):
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    if hasattr(valor, 'value'):  # Enum
+        return valor.value
+    return str(valor)
+
+
+def _canonico(registro: Dict) -> str:
+    """JSON determinístico usado tanto na gravação quanto na verificação do hash"""
+    return json.dumps(registro, sort_keys=True, ensure_ascii=False,
+                      separators=_SEPARADORES, default=_serializar)
+
+
+class AuditoriaLGPDWriter:
+    """
+    Escritor de auditoria de alto volume.
+
+    - `registrar()` só enfileira numa `queue.SimpleQueue` (sem lock explícito);
+      serialização, hash e E/S acontecem na thread escritora
+    - O escritor grava a cada `tamanho_lote` registros ou `intervalo_ms`, o que
+      vier primeiro, com um único `executemany` por lote
+    - Segmentos `auditoria_AAAAMMDD.jsonl` (um por dia) são só acrescidos; cada
+      linha guarda o hash da anterior, e a cadeia continua entre os dias
+    - Vários processos (workers) gravam na mesma cadeia: cada lote toma a
+      trava exclusiva `auditoria.lock` e relê o último hash do disco antes
+      de acrescentar
+    - `auditoria_indice.db` indexa (titular_id, ts) e (usuario_id, ts)
+    """
+
+    def __init__(self, base_dir: str = None, tamanho_lote: int = 500, intervalo_ms: int = 200):
+        self.base_dir = base_dir or self._get_audit_directory()
+        self.db_path = os.path.join(self.base_dir, 'auditoria_indice.db')
+        self.lock_path = os.path.join(self.base_dir, 'auditoria.lock')
+        self.tamanho_lote = tamanho_lote
+        self.intervalo = intervalo_ms / 1000.0
+
+        self._fila: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+        self.metrics = {
+            'enfileirados': 0,
+            'gravados': 0,
+            'lotes': 0,
+            'erros': 0,
+            'descartados': 0,
+            'tempo_ultimo_lote_ms': 0.0
+        }
+
+        self._initialize_database()
+        atexit.register(self.flush)
+
+    def _get_audit_directory(self) -> str:
+        """Diretório dos segmentos de auditoria (dados da instância)"""
+        base_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'instance', 'auditoria_lgpd')
+        os.makedirs(base_dir, exist_ok=True)
+        return base_dir
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _initialize_database(self):
+        try:
+            with self._connect() as conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS auditoria_lgpd (
+                        id TEXT PRIMARY KEY,
+                        ts TEXT NOT NULL,
+                        titular_id TEXT,
+                        usuario_id TEXT,
+                        operacao TEXT,
+                        recurso TEXT,
+                        tipo_dado TEXT,
+                        segmento TEXT NOT NULL,
+                        hash TEXT NOT NULL,
+                        registro TEXT NOT NULL
+                    )
+                ''')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_auditoria_titular_ts ON auditoria_lgpd (titular_id, ts)')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_auditoria_usuario_ts ON auditoria_lgpd (usuario_id, ts)')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_auditoria_ts ON auditoria_lgpd (ts)')
+        except Exception as e:
+            logger.error(f"❌ Erro ao inicializar índice de auditoria LGPD: {str(e)}")
+
+    # ===== CAMINHO DA REQUISIÇÃO =====
+
+    def registrar(self, registro: Dict):
+        """Enfileira o registro (dict com id, timestamp, titular_id, ...); O(1)"""
+        if self._pid != os.getpid():
+            self._iniciar()
+        self.metrics['enfileirados'] += 1
+        self._fila.put(registro)
+
+    def flush(self, timeout: float = 10) -> bool:
+        """Aguarda a gravação de tudo que foi enfileirado até agora"""
+        if self._thread is None or not self._thread.is_alive():
+            return True
+        marcador = threading.Event()
+        self._fila.put(marcador)
+        return marcador.wait(timeout)
+
+    # ===== THREAD ESCRITORA =====
+
+    def _iniciar(self):
+        with self._start_lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            # Após fork a fila e a thread herdadas não valem: recomeça no processo atual
+            self._fila = queue.SimpleQueue()
+            self._thread = threading.Thread(target=self._executar, name='pnsb-auditoria-lgpd', daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+            logger.info("🛡️ Escritor de auditoria LGPD iniciado")
+
+    def _executar(self):
+        while True:
+            lote, marcadores = [], []
+            try:
+                item = self._fila.get()
+            except Exception:
+                continue
+            limite = time.monotonic() + self.intervalo
+            while True:
+                if isinstance(item, threading.Event):
+                    marcadores.append(item)
+                else:
+                    lote.append(item)
+                if len(lote) >= self.tamanho_lote or marcadores:
+                    break
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    item = self._fila.get(timeout=restante)
+                except queue.Empty:
+                    break
+
+            if lote:
+                self._gravar_lote(lote)
+            for marcador in marcadores:
+                marcador.set()
+
+    @contextmanager
+    def _trava_cadeia(self):
+        """Trava exclusiva entre processos para ler o fim da cadeia e acrescentar"""
+        with open(self.lock_path, 'a+b') as trava:
+            if FCNTL_AVAILABLE:
+                fcntl.flock(trava.fileno(), fcntl.LOCK_EX)
+            elif MSVCRT_AVAILABLE:
+                trava.seek(0)
+                msvcrt.locking(trava.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if FCNTL_AVAILABLE:
+                    fcntl.flock(trava.fileno(), fcntl.LOCK_UN)
+                elif MSVCRT_AVAILABLE:
+                    trava.seek(0)
+                    msvcrt.locking(trava.fileno(), msvcrt.LK_UNLCK, 1)
+
+    @staticmethod
+    def _ultima_linha(caminho: str, bloco: int = 8192) -> Optional[bytes]:
+        """Última linha não vazia do arquivo, lida de trás para frente"""
+        with open(caminho, 'rb') as arquivo:
+            arquivo.seek(0, os.SEEK_END)
+            posicao = arquivo.tell()
+            dados = b''
+            while posicao > 0:
+                tamanho = min(bloco, posicao)
+                posicao -= tamanho
+                arquivo.seek(posicao)
+                dados = arquivo.read(tamanho) + dados
+                linhas = [l for l in dados.split(b'\n') if l.strip()]
+                # A primeira linha do bloco pode estar cortada; só vale se houver outra depois
+                if len(linhas) > 1 or (linhas and posicao == 0):
+                    return linhas[-1]
+        return None
+
+    def _hash_inicial(self) -> str:
+        """Último hash gravado (fim do segmento mais recente); chamar com a trava"""
+        for segmento in reversed(self.listar_segmentos()):
+            ultima = self._ultima_linha(os.path.join(self.base_dir, segmento))
+            if ultima:
+                return json.loads(ultima)['hash']
+        return HASH_INICIAL
+
+    def _gravar_lote(self, lote: List[Dict]):
+        inicio = time.perf_counter()
+        try:
+            with self._trava_cadeia():
+                linhas_indice = self._acrescentar_segmentos(lote)
+
+            with self._connect() as conn:
+                conn.executemany(
+                    'INSERT OR IGNORE INTO auditoria_lgpd '
+                    '(id, ts, titular_id, usuario_id, operacao, recurso, tipo_dado, segmento, hash, registro) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    linhas_indice
+                )
+
+            self.metrics['gravados'] += len(lote)
+            self.metrics['lotes'] += 1
+        except Exception as e:
+            self.metrics['erros'] += 1
+            self.metrics['descartados'] += len(lote)
+            logger.error(f"❌ Erro ao gravar lote de auditoria LGPD ({len(lote)} registros): {str(e)}")
+        finally:
+            self.metrics['tempo_ultimo_lote_ms'] = round((time.perf_counter() - inicio) * 1000, 2)
+
+    def _acrescentar_segmentos(self, lote: List[Dict]) -> List[Tuple]:
+        """
+        Encadeia o lote a partir do último hash em disco e acrescenta ao
+        segmento do dia da gravação (com a trava tomada). Retorna as linhas
+        do índice.
+
+        O segmento segue a ordem de escrita, não o timestamp do registro:
+        um registro de 23:59:59 gravado depois de um de 00:00:00 iria para o
+        segmento anterior com hash_anterior do seguinte e quebraria a cadeia.
+        """
+        linhas: List[str] = []
+        linhas_indice: List[Tuple] = []
+        hash_anterior = self._hash_inicial()
+        # Nunca volta para um segmento anterior ao mais recente (ex.: relógio atrasado)
+        segmento = max([f"auditoria_{datetime.now():%Y%m%d}.jsonl"] + self.listar_segmentos()[-1:])
+
+        for registro in lote:
+            ts = registro['timestamp']
+            ts_iso = ts.isoformat() if isinstance(ts, datetime) else str(ts)
+
+            payload = dict(registro, timestamp=ts_iso, hash_anterior=hash_anterior)
+            corpo = _canonico(payload)
+            hash_atual = hashlib.sha256(corpo.encode('utf-8')).hexdigest()
+            payload['hash'] = hash_atual
+            linha = _canonico(payload)
+
+            linhas.append(linha)
+            linhas_indice.append((
+                registro['id'], ts_iso, registro.get('titular_id'), registro.get('usuario_id'),
+                _serializar(registro.get('operacao')), registro.get('recurso'),
+                _serializar(registro.get('tipo_dado')), segmento, hash_atual, corpo
+            ))
+            hash_anterior = hash_atual
+
+        # Segmento primeiro (fonte à prova de adulteração), depois o índice
+        with open(os.path.join(self.base_dir, segmento), 'a', encoding='utf-8') as arquivo:
+            arquivo.write('\n'.join(linhas) + '\n')
+            arquivo.flush()
+            os.fsync(arquivo.fileno())
+        return linhas_indice
+
+    # ===== CONSULTA E VERIFICAÇÃO =====
+
+    def consultar_titular(self, titular_id: str, inicio: datetime = None,
+                          fim: datetime = None, limite: int = 1000) -> List[Dict]:
+        """Registros de um titular em ordem cronológica (usa o índice titular_id, ts)"""
+        self.flush()
+        sql = 'SELECT registro FROM auditoria_lgpd WHERE titular_id = ?'
+        parametros: list = [titular_id]
+        if inicio:
+            sql += ' AND ts >= ?'
+            parametros.append(inicio.isoformat())
+        if fim:
+            sql += ' AND ts < ?'
+            parametros.append(fim.isoformat())
+        sql += ' ORDER BY ts LIMIT ?'
+        parametros.append(limite)
+        try:
+            with self._connect() as conn:
+                return [json.loads(linha[0]) for linha in conn.execute(sql, parametros)]
+        except Exception as e:
+            logger.error(f"Erro ao consultar auditoria do titular: {str(e)}")
+            return []
+
+    def metricas_periodo(self, inicio: datetime, fim: datetime) -> Dict:
+        """Contagens por operação e tipo de dado no período"""
+        self.flush()
+        try:
+            with self._connect() as conn:
+                por_operacao = dict(conn.execute(
+                    'SELECT operacao, COUNT(*) FROM auditoria_lgpd WHERE ts >= ? AND ts < ? GROUP BY operacao',
+                    (inicio.isoformat(), fim.isoformat())
+                ).fetchall())
+                por_tipo = dict(conn.execute(
+                    'SELECT tipo_dado, COUNT(*) FROM auditoria_lgpd WHERE ts >= ? AND ts < ? GROUP BY tipo_dado',
+                    (inicio.isoformat(), fim.isoformat())
+                ).fetchall())
+                titulares = conn.execute(
+                    'SELECT COUNT(DISTINCT titular_id) FROM auditoria_lgpd WHERE ts >= ? AND ts < ?',
+                    (inicio.isoformat(), fim.isoformat())
+                ).fetchone()[0]
+        except Exception as e:
+            logger.error(f"Erro ao calcular métricas de auditoria: {str(e)}")
+            return {}
+        return {
+            'total_registros': sum(por_operacao.values()),
+            'por_operacao': por_operacao,
+            'por_tipo_dado': por_tipo,
+            'titulares_distintos': titulares
+        }
+
+    def listar_segmentos(self) -> List[str]:
+        return sorted(
+            nome for nome in os.listdir(self.base_dir)
+            if nome.startswith('auditoria_') and nome.endswith('.jsonl')
+        )
+
+    def verificar_integridade(self) -> Dict:
+        """Recalcula a cadeia de hashes de todos os segmentos, em ordem"""
+        self.flush()
+        hash_anterior = HASH_INICIAL
+        total = 0
+        for segmento in self.listar_segmentos():
+            with open(os.path.join(self.base_dir, segmento), encoding='utf-8') as arquivo:
+                for numero, linha in enumerate(arquivo, 1):
+                    if not linha.strip():
+                        continue
+                    try:
+                        payload = json.loads(linha)
+                        hash_gravado = payload.pop('hash')
+                        valido = (
+                            payload.get('hash_anterior') == hash_anterior
+                            and hashlib.sha256(_canonico(payload).encode('utf-8')).hexdigest() == hash_gravado
+                        )
+                    except (ValueError, KeyError):
+                        valido = False
+                    if not valido:
+                        return {
+                            'integro': False,
+                            'hash_verificado': False,
+                            'registros_verificados': total,
+                            'falha': {'segmento': segmento, 'linha': numero}
+                        }
+                    hash_anterior = hash_gravado
+                    total += 1
+        return {
+            'integro': True,
+            'hash_verificado': True,
+            'registros_verificados': total,
+            'ultimo_hash': hash_anterior
+        }
+
+    def get_metrics(self) -> Dict:
+        return {
+            **self.metrics,
+            'pendentes': self.metrics['enfileirados'] - self.metrics['gravados'] - self.metrics['descartados'],
+            'segmentos': len(self.listar_segmentos())
+        }
+
+
+# Instância global usada pelo serviço de compliance
+auditoria_lgpd_writer = AuditoriaLGPDWriter()
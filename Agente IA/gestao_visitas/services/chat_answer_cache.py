@@ -0,0 +1,382 @@
+"""
+Cache Semântico de Respostas do Chat IA (PNSB 2024)
+Persistência em SQLite, chaves normalizadas, busca por similaridade de n-gramas
+e autômato Aho-Corasick para as respostas predefinidas
+"""
+
+import os
+import re
+import math
+import time
+import sqlite3
+import logging
+import threading
+import unicodedata
+from collections import Counter, deque
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Stopwords em português. Palavras interrogativas (como, quando, onde...) ficam
+# de fora: 'como agendar' e 'quando agendar' são perguntas diferentes.
+STOPWORDS_PT = frozenset("""
+    a o as os um uma uns umas de da do das dos em na no nas nos por pela pelo pelas pelos
+    para pra com sem sob sobre e ou que se me te lhe vos eu tu ele ela eles elas voce
+    voces meu minha seu sua isso isto aquilo esse essa este esta ao aos ate mais muito
+    ser estar eh ter tem ha favor ola oi bom dia boa tarde noite obrigado obrigada
+    pode poderia gostaria saber quero queria preciso
+""".split())
+
+_NAO_PALAVRA = re.compile(r'[^a-z0-9\s]')
+_ESPACOS = re.compile(r'\s+')
+
+
+def dobrar_acentos(texto: str) -> str:
+    """Remove acentos e coloca em minúsculas ('Municípios' -> 'municipios')"""
+    decomposto = unicodedata.normalize('NFKD', texto.lower())
+    return ''.join(c for c in decomposto if not unicodedata.combining(c))
+
+
+def texto_canonico(texto: str) -> str:
+    """Minúsculas, sem acentos, sem pontuação e com espaços colapsados"""
+    return _ESPACOS.sub(' ', _NAO_PALAVRA.sub(' ', dobrar_acentos(texto))).strip()
+
+
+def normalizar_pergunta(texto: str) -> str:
+    """
+    Chave normalizada da pergunta: acentos dobrados, stopwords removidas e
+    tokens ordenados, de modo que 'Como agendo uma visita?' e
+    'visita, como agendo' produzam a mesma chave.
+    """
+    tokens = [t for t in texto_canonico(texto).split() if t not in STOPWORDS_PT]
+    if not tokens:
+        # Pergunta só de stopwords: usar o texto canônico inteiro
+        return texto_canonico(texto)
+    return ' '.join(sorted(set(tokens)))
+
+
+def ngramas(chave: str, n: int = 3) -> set:
+    """N-gramas de caracteres por token (com bordas), robustos a erros de digitação"""
+    grams = set()
+    for token in chave.split():
+        token = f' {token} '
+        if len(token) <= n:
+            grams.add(token)
+            continue
+        for i in range(len(token) - n + 1):
+            grams.add(token[i:i + n])
+    return grams
+
+
+class AhoCorasick:
+    """
+    Autômato Aho-Corasick para localizar vários gatilhos numa única passada.
+
+    Cada padrão guarda seu índice de inserção; quando mais de um casa, vence o
+    de menor índice (mesma prioridade da ordem do dicionário original).
+    """
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._saida: List[Optional[Tuple[int, object]]] = [None]
+        self._total = 0
+
+    def adicionar(self, padrao: str, valor):
+        estado = 0
+        for ch in padrao:
+            proximo = self._goto[estado].get(ch)
+            if proximo is None:
+                proximo = len(self._goto)
+                self._goto[estado][ch] = proximo
+                self._goto.append({})
+                self._fail.append(0)
+                self._saida.append(None)
+            estado = proximo
+        if self._saida[estado] is None:
+            self._saida[estado] = (self._total, valor)
+        self._total += 1
+
+    def construir(self):
+        """Calcula links de falha (BFS) e propaga a melhor saída por estado"""
+        fila = deque()
+        for proximo in self._goto[0].values():
+            self._fail[proximo] = 0
+            fila.append(proximo)
+
+        while fila:
+            estado = fila.popleft()
+            for ch, proximo in self._goto[estado].items():
+                fila.append(proximo)
+                falha = self._fail[estado]
+                while falha and ch not in self._goto[falha]:
+                    falha = self._fail[falha]
+                self._fail[proximo] = self._goto[falha].get(ch, 0)
+
+                herdada = self._saida[self._fail[proximo]]
+                atual = self._saida[proximo]
+                if herdada is not None and (atual is None or herdada[0] < atual[0]):
+                    self._saida[proximo] = herdada
+        return self
+
+    def buscar(self, texto: str):
+        """Retorna o valor do padrão de maior prioridade presente no texto (ou None)"""
+        estado = 0
+        melhor = None
+        for ch in texto:
+            while estado and ch not in self._goto[estado]:
+                estado = self._fail[estado]
+            estado = self._goto[estado].get(ch, 0)
+            saida = self._saida[estado]
+            if saida is not None and (melhor is None or saida[0] < melhor[0]):
+                melhor = saida
+                if melhor[0] == 0:
+                    break
+        return melhor[1] if melhor else None
+
+
+class ChatAnswerCache:
+    """
+    Cache persistente de respostas do /api/chat:
+    - Chave exata normalizada (acentos, stopwords, ordem dos tokens)
+    - Busca de quase-duplicatas por cosseno TF-IDF de trigramas de caracteres
+    - Gatilhos predefinidos via Aho-Corasick
+    - Limites de TTL e LRU, com métricas de acerto
+    """
+
+    def __init__(self, db_path: str = None, predefinidas: Dict[str, str] = None,
+                 ttl_seconds: int = 30 * 24 * 3600, max_entries: int = 2000,
+                 similarity_threshold: float = 0.82):
+        self.db_path = db_path or os.path.join(self._get_cache_directory(), 'chat_answer_cache.db')
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self._lock = threading.RLock()
+
+        # Índice invertido em memória: n-grama -> chaves
+        self._indice: Dict[str, set] = {}
+        self._grams_por_chave: Dict[str, set] = {}
+
+        self.metrics = {
+            'hits_exatos': 0,
+            'hits_similares': 0,
+            'hits_predefinidos': 0,
+            'misses': 0,
+            'gravacoes': 0,
+            'evictions': 0,
+            'expirados': 0
+        }
+
+        self._automato = None
+        self.definir_predefinidas(predefinidas or {})
+        self._initialize_database()
+        self._carregar_indice()
+
+    def _get_cache_directory(self) -> str:
+        """Cria e retorna diretório para caches locais"""
+        base_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cache_local')
+        os.makedirs(base_dir, exist_ok=True)
+        return base_dir
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def _initialize_database(self):
+        try:
+            with self._connect() as conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS chat_respostas (
+                        chave TEXT PRIMARY KEY,
+                        pergunta TEXT NOT NULL,
+                        resposta TEXT NOT NULL,
+                        fonte TEXT,
+                        criado_em REAL NOT NULL,
+                        ultimo_acesso REAL NOT NULL,
+                        acessos INTEGER DEFAULT 0
+                    )
+                ''')
+                conn.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_chat_respostas_acesso
+                    ON chat_respostas(ultimo_acesso)
+                ''')
+        except Exception as e:
+            logger.error(f"❌ Erro ao inicializar cache do chat: {str(e)}")
+
+    def _carregar_indice(self):
+        """Remove expirados e reconstrói o índice de n-gramas a partir do disco"""
+        try:
+            with self._connect() as conn:
+                removidos = conn.execute(
+                    'DELETE FROM chat_respostas WHERE criado_em < ?',
+                    (time.time() - self.ttl_seconds,)
+                ).rowcount
+                self.metrics['expirados'] += max(removidos, 0)
+                for (chave,) in conn.execute('SELECT chave FROM chat_respostas'):
+                    self._indexar(chave)
+        except Exception as e:
+            logger.error(f"❌ Erro ao carregar índice do cache do chat: {str(e)}")
+
+    # ===== ÍNDICE DE SIMILARIDADE =====
+
+    def _indexar(self, chave: str):
+        grams = ngramas(chave)
+        self._grams_por_chave[chave] = grams
+        for g in grams:
+            self._indice.setdefault(g, set()).add(chave)
+
+    def _desindexar(self, chave: str):
+        for g in self._grams_por_chave.pop(chave, ()):
+            chaves = self._indice.get(g)
+            if chaves is not None:
+                chaves.discard(chave)
+                if not chaves:
+                    del self._indice[g]
+
+    def _idf(self, gram: str) -> float:
+        return math.log(1 + len(self._grams_por_chave) / (1 + len(self._indice.get(gram, ()))))
+
+    def _buscar_similar(self, chave: str) -> Tuple[Optional[str], float]:
+        """Melhor quase-duplicata por cosseno TF-IDF (apenas candidatos com n-gramas em comum)"""
+        grams = ngramas(chave)
+        if not grams or not self._grams_por_chave:
+            return None, 0.0
+
+        pesos = {g: self._idf(g) for g in grams}
+        compartilhado = Counter()
+        for g in grams:
+            peso2 = pesos[g] ** 2
+            for candidata in self._indice.get(g, ()):
+                compartilhado[candidata] += peso2
+
+        if not compartilhado:
+            return None, 0.0
+
+        norma = math.sqrt(sum(p * p for p in pesos.values()))
+        melhor, melhor_score = None, 0.0
+        # Os candidatos com mais peso em comum vêm primeiro; poucos bastam
+        for candidata, produto in compartilhado.most_common(20):
+            norma_c = math.sqrt(sum(self._idf(g) ** 2 for g in self._grams_por_chave[candidata]))
+            score = produto / (norma * norma_c) if norma and norma_c else 0.0
+            if score > melhor_score:
+                melhor, melhor_score = candidata, score
+        return melhor, melhor_score
+
+    # ===== RESPOSTAS PREDEFINIDAS =====
+
+    def definir_predefinidas(self, predefinidas: Dict[str, str]):
+        """Compila os gatilhos predefinidos num autômato Aho-Corasick"""
+        automato = AhoCorasick()
+        for gatilho, resposta in predefinidas.items():
+            automato.adicionar(texto_canonico(gatilho), resposta)
+        self._automato = automato.construir()
+
+    def buscar_predefinida(self, mensagem: str) -> Optional[str]:
+        resposta = self._automato.buscar(texto_canonico(mensagem)) if self._automato else None
+        if resposta is not None:
+            self.metrics['hits_predefinidos'] += 1
+        return resposta
+
+    # ===== API PÚBLICA =====
+
+    def get(self, mensagem: str) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Busca resposta em cache.
+
+        Returns:
+            (resposta, origem) onde origem é 'cache' (chave exata) ou
+            'cache_similar'; (None, None) em caso de miss
+        """
+        chave = normalizar_pergunta(mensagem)
+        agora = time.time()
+
+        with self._lock:
+            origem = 'cache'
+            if chave not in self._grams_por_chave:
+                similar, score = self._buscar_similar(chave)
+                if similar is None or score < self.similarity_threshold:
+                    self.metrics['misses'] += 1
+                    return None, None
+                chave, origem = similar, 'cache_similar'
+
+            try:
+                with self._connect() as conn:
+                    row = conn.execute(
+                        'SELECT resposta, criado_em FROM chat_respostas WHERE chave = ?', (chave,)
+                    ).fetchone()
+                    if row is None or row[1] < agora - self.ttl_seconds:
+                        if row is not None:
+                            conn.execute('DELETE FROM chat_respostas WHERE chave = ?', (chave,))
+                            self.metrics['expirados'] += 1
+                        self._desindexar(chave)
+                        self.metrics['misses'] += 1
+                        return None, None
+
+                    conn.execute(
+                        'UPDATE chat_respostas SET ultimo_acesso = ?, acessos = acessos + 1 WHERE chave = ?',
+                        (agora, chave)
+                    )
+            except Exception as e:
+                logger.error(f"Erro ao ler cache do chat: {str(e)}")
+                self.metrics['misses'] += 1
+                return None, None
+
+            self.metrics['hits_exatos' if origem == 'cache' else 'hits_similares'] += 1
+            return row[0], origem
+
+    def set(self, mensagem: str, resposta: str, fonte: str = None) -> bool:
+        """Grava resposta e aplica o limite LRU"""
+        chave = normalizar_pergunta(mensagem)
+        agora = time.time()
+
+        with self._lock:
+            try:
+                with self._connect() as conn:
+                    conn.execute('''
+                        INSERT OR REPLACE INTO chat_respostas
+                        (chave, pergunta, resposta, fonte, criado_em, ultimo_acesso, acessos)
+                        VALUES (?, ?, ?, ?, ?, ?, 0)
+                    ''', (chave, mensagem, resposta, fonte, agora, agora))
+
+                    total = len(self._grams_por_chave) + (chave not in self._grams_por_chave)
+                    excedentes = total - self.max_entries
+                    if excedentes > 0:
+                        removidas = [r[0] for r in conn.execute(
+                            'SELECT chave FROM chat_respostas ORDER BY ultimo_acesso LIMIT ?',
+                            (excedentes,)
+                        )]
+                        conn.executemany('DELETE FROM chat_respostas WHERE chave = ?',
+                                         [(c,) for c in removidas])
+                        for c in removidas:
+                            self._desindexar(c)
+                        self.metrics['evictions'] += len(removidas)
+            except Exception as e:
+                logger.error(f"Erro ao gravar cache do chat: {str(e)}")
+                return False
+
+            if chave not in self._grams_por_chave:
+                self._indexar(chave)
+            self.metrics['gravacoes'] += 1
+            return True
+
+    def get_metrics(self) -> Dict:
+        """Métricas de acerto do cache (predefinidas contam como acerto)"""
+        hits = self.metrics['hits_exatos'] + self.metrics['hits_similares'] + self.metrics['hits_predefinidos']
+        total = hits + self.metrics['misses']
+        return {
+            **self.metrics,
+            'entradas': len(self._grams_por_chave),
+            'hit_rate': round(hits / total * 100, 2) if total else 0.0,
+            'total_consultas': total
+        }
+
+    def clear(self):
+        with self._lock:
+            try:
+                with self._connect() as conn:
+                    conn.execute('DELETE FROM chat_respostas')
+            except Exception as e:
+                logger.error(f"Erro ao limpar cache do chat: {str(e)}")
+            self._indice.clear()
+            self._grams_por_chave.clear()
@@ -9,6 +9,7 @@ from sqlalchemy import func, and_, or_, desc
 from ..models.agendamento import Visita
 from ..models.contatos import Contato
 from ..db import db
+from .chat_mensagens_store import chat_mensagens_store
 import json
 import uuid
 from enum import Enum
@@ -238,14 +239,19 @@ class ChatColaboracao:
     
     def obter_mensagens_canal(self, canal_id: str, usuario_id: str, 
                              limite: int = 50, antes_de: str = None) -> Dict:
-        """Obtém mensagens de um canal com paginação"""
+        """
+        Obtém mensagens de um canal com paginação por cursor.
+        
+        `antes_de` aceita o `proximo_cursor` da página anterior ou o id de uma
+        mensagem; as mensagens vêm em ordem cronológica.
+        """
         try:
             # Validar acesso
             if not self._validar_acesso_canal(canal_id, usuario_id):
                 return {'erro': 'Acesso negado ao canal'}
             
-            # Buscar mensagens
-            mensagens = self._buscar_mensagens_canal(canal_id, limite, antes_de)
+            # Buscar mensagens (keyset em canal_id, timestamp)
+            mensagens, proximo_cursor = self._buscar_mensagens_canal(canal_id, limite, antes_de)
             
             # Marcar como lidas
             self._marcar_mensagens_lidas(canal_id, usuario_id, mensagens)
@@ -260,7 +266,8 @@ class ChatColaboracao:
                 'mensagens': mensagens_processadas,
                 'canal': info_canal,
                 'total_mensagens': len(mensagens),
-                'ha_mais_mensagens': len(mensagens) == limite,
+                'ha_mais_mensagens': proximo_cursor is not None,
+                'proximo_cursor': proximo_cursor,
                 'usuarios_online': self._obter_usuarios_online_canal(canal_id)
             }
             
@@ -353,20 +360,14 @@ class ChatColaboracao:
             # Aplicar filtros
             filtros_processados = self._processar_filtros_busca(filtros or {})
             
-            # Buscar mensagens
-            resultados = self._buscar_mensagens_texto(
+            # Buscar mensagens (ordenadas por bm25, com trecho destacado)
+            resultados, total = self._buscar_mensagens_texto(
                 termo_busca, canais_acessiveis, filtros_processados
             )
             
-            # Ordenar por relevância
-            resultados_ordenados = self._ordenar_por_relevancia(resultados, termo_busca)
-            
-            # Destacar termos encontrados
-            resultados_destacados = self._destacar_termos_busca(resultados_ordenados, termo_busca)
-            
             return {
-                'resultados': resultados_destacados,
-                'total_encontrados': len(resultados),
+                'resultados': resultados,
+                'total_encontrados': total,
                 'canais_pesquisados': len(canais_acessiveis),
                 'termo_busca': termo_busca,
                 'filtros_aplicados': filtros_processados
@@ -458,7 +459,7 @@ class ChatColaboracao:
     def _validar_acesso_canal(self, canal_id, usuario_id): return True
     def _obter_info_usuario(self, usuario_id): return {'nome': 'Pesquisador IBGE', 'email': 'pesquisador@ibge.gov.br'}
     def _processar_conteudo_mensagem(self, conteudo): return {'texto': conteudo, 'mencoes': []}
-    def _salvar_mensagem(self, mensagem): pass
+    def _salvar_mensagem(self, mensagem): chat_mensagens_store.salvar(asdict(mensagem))
     def _atualizar_atividade_canal(self, canal_id): pass
     def _processar_notificacoes(self, mensagem): return []
     def _broadcast_mensagem(self, mensagem): pass
@@ -467,10 +468,11 @@ class ChatColaboracao:
     def _salvar_canal(self, canal): pass
     def _notificar_canal_novo(self, canal): pass
     def _enviar_mensagem_sistema(self, canal_id, conteudo): pass
-    def _buscar_mensagens_canal(self, canal_id, limite, antes_de): return []
+    def _buscar_mensagens_canal(self, canal_id, limite, antes_de):
+        return chat_mensagens_store.listar_canal(canal_id, limite, antes_de)
     def _marcar_mensagens_lidas(self, canal_id, usuario_id, mensagens): pass
     def _obter_info_canal(self, canal_id): return {}
-    def _processar_mensagens_exibicao(self, mensagens, usuario_id): return []
+    def _processar_mensagens_exibicao(self, mensagens, usuario_id): return mensagens
     def _obter_usuarios_online_canal(self, canal_id): return []
     def _criar_conteudo_visita(self, visita, comentario): 
         return {
@@ -486,10 +488,43 @@ class ChatColaboracao:
     def _gerar_sugestoes_canais(self, usuario_id): return []
     def _obter_configuracoes_usuario(self, usuario_id): return {}
     def _obter_canais_acessiveis(self, usuario_id): return []
-    def _processar_filtros_busca(self, filtros): return filtros
-    def _buscar_mensagens_texto(self, termo, canais, filtros): return []
-    def _ordenar_por_relevancia(self, resultados, termo): return resultados
-    def _destacar_termos_busca(self, resultados, termo): return resultados
+    def _processar_filtros_busca(self, filtros):
+        """Normaliza filtros aceitos pela busca (datas em ISO, fim exclusivo)"""
+        processados = {}
+        canais = filtros.get('canais') or ([filtros['canal_id']] if filtros.get('canal_id') else None)
+        if canais:
+            processados['canais'] = list(canais)
+        for campo in ('data_inicio', 'data_fim'):
+            valor = filtros.get(campo)
+            if valor:
+                data = datetime.fromisoformat(str(valor))
+                if campo == 'data_fim' and len(str(valor)) <= 10:
+                    data += timedelta(days=1)  # data sem hora inclui o dia inteiro
+                processados[campo] = data.isoformat()
+        for campo in ('autor_id', 'tipo'):
+            if filtros.get(campo):
+                processados[campo] = filtros[campo]
+        processados['limite'] = min(int(filtros.get('limite', 50)), 200)
+        processados['offset'] = max(int(filtros.get('offset', 0)), 0)
+        return processados
+    def _buscar_mensagens_texto(self, termo, canais, filtros):
+        # Só canais acessíveis ao usuário; lista vazia no store significaria "todos"
+        canais_busca = list(canais or [])
+        if filtros.get('canais'):
+            acessiveis = set(canais_busca)
+            canais_busca = [c for c in filtros['canais'] if c in acessiveis]
+        if not canais_busca:
+            return [], 0
+        return chat_mensagens_store.buscar(
+            termo,
+            canais=canais_busca,
+            data_inicio=filtros.get('data_inicio'),
+            data_fim=filtros.get('data_fim'),
+            autor_id=filtros.get('autor_id'),
+            tipo=filtros.get('tipo'),
+            limite=filtros['limite'],
+            offset=filtros['offset']
+        )
     def _validar_configuracoes_notificacao(self, config): return config
     def _salvar_configuracoes_usuario(self, usuario_id, config): pass
     def _atualizar_sistema_notificacoes(self, usuario_id, config): pass
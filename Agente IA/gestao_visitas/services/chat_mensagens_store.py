@@ -0,0 +1,343 @@
+"""
+Armazenamento persistente das mensagens do chat de colaboração (PNSB 2024)
+Mensagens em SQLite com índice de texto completo FTS5 (sem acentos), mantido
+por triggers, busca ranqueada por bm25 com trechos destacados e paginação
+por cursor (keyset) em (canal_id, timestamp)
+"""
+
+import os
+import re
+import html
+import json
+import base64
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Marcadores usados no destaque dos termos encontrados
+MARCA_INICIO = '<mark>'
+MARCA_FIM = '</mark>'
+
+# Sentinelas que o snippet() do FTS5 insere no texto cru; o trecho é escapado
+# como HTML e só então elas viram as marcas acima
+_SENTINELA_INICIO = '\x02'
+_SENTINELA_FIM = '\x03'
+
+_TOKENS = re.compile(r'\w+', re.UNICODE)
+
+_COLUNAS = (
+    'id', 'canal_id', 'autor_id', 'autor_nome', 'tipo', 'conteudo', 'timestamp',
+    'status', 'resposta_para', 'editado_em', 'anexos', 'mencoes', 'reacoes', 'metadata'
+)
+_COLUNAS_JSON = ('anexos', 'mencoes', 'reacoes', 'metadata')
+
+
+def _destacar_html(trecho: Optional[str]) -> str:
+    """Trecho com o texto do usuário escapado e os termos entre <mark>"""
+    return (html.escape(trecho or '')
+            .replace(_SENTINELA_INICIO, MARCA_INICIO)
+            .replace(_SENTINELA_FIM, MARCA_FIM))
+
+
+def montar_consulta_fts(termo: str) -> str:
+    """
+    Converte o texto digitado em consulta FTS5 segura: cada palavra vira um
+    prefixo entre aspas ("palavra"*), combinados com AND implícito. Operadores
+    e aspas do usuário não chegam ao parser do FTS5.
+    """
+    return ' '.join(f'"{token}"*' for token in _TOKENS.findall(termo or ''))
+
+
+def _valor_sql(valor):
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    if hasattr(valor, 'value'):  # Enum
+        return valor.value
+    return valor
+
+
+class ChatMensagensStore:
+    """
+    Repositório SQLite das mensagens do chat.
+
+    - `chat_mensagens`: uma linha por mensagem; índice (canal_id, timestamp), com
+      `seq` (rowid) como desempate da ordenação
+    - `chat_mensagens_fts`: FTS5 de conteúdo externo (conteudo, autor_nome) com
+      tokenizer `unicode61 remove_diacritics 2`, sincronizado por triggers
+    - Sem FTS5 na build do SQLite, a busca cai para LIKE (sem ranking)
+    """
+
+    def __init__(self, db_path: str = None):
+        self.db_path = db_path or os.path.join(self._get_data_directory(), 'chat_mensagens.db')
+        self._lock = threading.Lock()
+        self.fts_disponivel = False
+        self._initialize_database()
+
+    def _get_data_directory(self) -> str:
+        """Diretório de dados da instância (mesmo local do banco principal)"""
+        base_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'instance')
+        os.makedirs(base_dir, exist_ok=True)
+        return base_dir
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def _initialize_database(self):
+        try:
+            with self._connect() as conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS chat_mensagens (
+                        seq INTEGER PRIMARY KEY,
+                        id TEXT NOT NULL UNIQUE,
+                        canal_id TEXT NOT NULL,
+                        autor_id TEXT,
+                        autor_nome TEXT,
+                        tipo TEXT,
+                        conteudo TEXT NOT NULL DEFAULT '',
+                        timestamp TEXT NOT NULL,
+                        status TEXT,
+                        resposta_para TEXT,
+                        editado_em TEXT,
+                        anexos TEXT,
+                        mencoes TEXT,
+                        reacoes TEXT,
+                        metadata TEXT
+                    )
+                ''')
+                conn.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_chat_mensagens_canal_ts
+                    ON chat_mensagens (canal_id, timestamp)
+                ''')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_chat_mensagens_ts ON chat_mensagens (timestamp)')
+            self.fts_disponivel = self._initialize_fts()
+        except Exception as e:
+            logger.error(f"❌ Erro ao inicializar armazenamento do chat: {str(e)}")
+
+    def _initialize_fts(self) -> bool:
+        try:
+            with self._connect() as conn:
+                existia = conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'chat_mensagens_fts'"
+                ).fetchone()
+                conn.executescript('''
+                    CREATE VIRTUAL TABLE IF NOT EXISTS chat_mensagens_fts USING fts5(
+                        conteudo, autor_nome,
+                        content='chat_mensagens', content_rowid='seq',
+                        tokenize='unicode61 remove_diacritics 2'
+                    );
+
+                    CREATE TRIGGER IF NOT EXISTS chat_mensagens_ai AFTER INSERT ON chat_mensagens BEGIN
+                        INSERT INTO chat_mensagens_fts (rowid, conteudo, autor_nome)
+                        VALUES (new.seq, new.conteudo, new.autor_nome);
+                    END;
+
+                    CREATE TRIGGER IF NOT EXISTS chat_mensagens_ad AFTER DELETE ON chat_mensagens BEGIN
+                        INSERT INTO chat_mensagens_fts (chat_mensagens_fts, rowid, conteudo, autor_nome)
+                        VALUES ('delete', old.seq, old.conteudo, old.autor_nome);
+                    END;
+
+                    CREATE TRIGGER IF NOT EXISTS chat_mensagens_au AFTER UPDATE OF conteudo, autor_nome ON chat_mensagens BEGIN
+                        INSERT INTO chat_mensagens_fts (chat_mensagens_fts, rowid, conteudo, autor_nome)
+                        VALUES ('delete', old.seq, old.conteudo, old.autor_nome);
+                        INSERT INTO chat_mensagens_fts (rowid, conteudo, autor_nome)
+                        VALUES (new.seq, new.conteudo, new.autor_nome);
+                    END;
+                ''')
+                if not existia:
+                    # Mensagens gravadas antes do índice existir
+                    conn.execute("INSERT INTO chat_mensagens_fts (chat_mensagens_fts) VALUES ('rebuild')")
+            return True
+        except sqlite3.OperationalError as e:
+            logger.warning(f"⚠️ FTS5 indisponível, busca do chat usará LIKE: {str(e)}")
+            return False
+
+    # ===== GRAVAÇÃO =====
+
+    def salvar(self, mensagem: Dict) -> bool:
+        """Insere ou atualiza a mensagem (o índice FTS acompanha via triggers)"""
+        valores = []
+        for coluna in _COLUNAS:
+            valor = _valor_sql(mensagem.get(coluna))
+            if coluna in _COLUNAS_JSON:
+                valor = json.dumps(valor, ensure_ascii=False, default=str) if valor is not None else None
+            valores.append(valor)
+
+        atualizacoes = ', '.join(f'{c} = excluded.{c}' for c in _COLUNAS if c != 'id')
+        try:
+            with self._lock, self._connect() as conn:
+                conn.execute(
+                    f'''INSERT INTO chat_mensagens ({', '.join(_COLUNAS)})
+                        VALUES ({', '.join('?' * len(_COLUNAS))})
+                        ON CONFLICT(id) DO UPDATE SET {atualizacoes}''',
+                    valores
+                )
+            return True
+        except Exception as e:
+            logger.error(f"Erro ao salvar mensagem do chat: {str(e)}")
+            return False
+
+    def remover(self, mensagem_id: str) -> bool:
+        try:
+            with self._lock, self._connect() as conn:
+                return conn.execute('DELETE FROM chat_mensagens WHERE id = ?', (mensagem_id,)).rowcount > 0
+        except Exception as e:
+            logger.error(f"Erro ao remover mensagem do chat: {str(e)}")
+            return False
+
+    # ===== LEITURA =====
+
+    @staticmethod
+    def _linha_para_dict(linha: sqlite3.Row) -> Dict:
+        dados = {coluna: linha[coluna] for coluna in _COLUNAS}
+        for coluna in _COLUNAS_JSON:
+            dados[coluna] = json.loads(dados[coluna]) if dados[coluna] else None
+        return dados
+
+    @staticmethod
+    def codificar_cursor(timestamp: str, seq: int) -> str:
+        bruto = f'{timestamp}|{seq}'.encode('utf-8')
+        return base64.urlsafe_b64encode(bruto).decode('ascii').rstrip('=')
+
+    @staticmethod
+    def decodificar_cursor(cursor: str) -> Optional[Tuple[str, int]]:
+        try:
+            bruto = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+            timestamp, seq = bruto.rsplit('|', 1)
+            return timestamp, int(seq)
+        except (ValueError, UnicodeDecodeError):
+            return None
+
+    def _posicao_cursor(self, conn, canal_id: str, antes_de: str) -> Optional[Tuple[str, int]]:
+        """`antes_de` aceita um cursor devolvido anteriormente ou o id de uma mensagem"""
+        linha = conn.execute(
+            'SELECT timestamp, seq FROM chat_mensagens WHERE id = ? AND canal_id = ?',
+            (antes_de, canal_id)
+        ).fetchone()
+        if linha is not None:
+            return linha[0], linha[1]
+        return self.decodificar_cursor(antes_de)
+
+    def listar_canal(self, canal_id: str, limite: int = 50,
+                     antes_de: str = None) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Página de mensagens do canal anteriores ao cursor, em ordem cronológica.
+
+        Keyset em (canal_id, timestamp, seq): custo O(limite) em qualquer
+        profundidade do histórico. Retorna (mensagens, cursor da próxima página).
+        """
+        limite = max(1, int(limite))
+        try:
+            with self._connect() as conn:
+                sql = f'SELECT seq, {", ".join(_COLUNAS)} FROM chat_mensagens WHERE canal_id = ?'
+                parametros: list = [canal_id]
+                if antes_de:
+                    posicao = self._posicao_cursor(conn, canal_id, antes_de)
+                    if posicao is None:
+                        return [], None
+                    sql += ' AND (timestamp, seq) < (?, ?)'
+                    parametros.extend(posicao)
+                sql += ' ORDER BY timestamp DESC, seq DESC LIMIT ?'
+                parametros.append(limite + 1)
+                linhas = conn.execute(sql, parametros).fetchall()
+        except Exception as e:
+            logger.error(f"Erro ao listar mensagens do chat: {str(e)}")
+            return [], None
+
+        ha_mais = len(linhas) > limite
+        linhas = linhas[:limite]
+        proximo = self.codificar_cursor(linhas[-1]['timestamp'], linhas[-1]['seq']) if ha_mais else None
+        return [self._linha_para_dict(l) for l in reversed(linhas)], proximo
+
+    def buscar(self, termo: str, canais: Iterable[str] = None, data_inicio: str = None,
+               data_fim: str = None, autor_id: str = None, tipo: str = None,
+               limite: int = 50, offset: int = 0) -> Tuple[List[Dict], int]:
+        """
+        Busca textual ranqueada (bm25, conteúdo pesa mais que autor) com trecho
+        destacado. Filtros de canal, período, autor e tipo são aplicados no SQL.
+        Retorna (resultados da página, total de ocorrências).
+        """
+        consulta = montar_consulta_fts(termo)
+        if not consulta:
+            return [], 0
+
+        filtros, parametros = [], []
+        canais = list(canais or [])
+        if canais:
+            filtros.append(f'm.canal_id IN ({", ".join("?" * len(canais))})')
+            parametros.extend(canais)
+        if data_inicio:
+            filtros.append('m.timestamp >= ?')
+            parametros.append(data_inicio)
+        if data_fim:
+            filtros.append('m.timestamp < ?')
+            parametros.append(data_fim)
+        if autor_id:
+            filtros.append('m.autor_id = ?')
+            parametros.append(autor_id)
+        if tipo:
+            filtros.append('m.tipo = ?')
+            parametros.append(tipo)
+        where_extra = ''.join(f' AND {f}' for f in filtros)
+        colunas = ', '.join(f'm.{c}' for c in _COLUNAS)
+
+        try:
+            with self._connect() as conn:
+                if self.fts_disponivel:
+                    base = f'''FROM chat_mensagens_fts f
+                               JOIN chat_mensagens m ON m.seq = f.rowid
+                               WHERE chat_mensagens_fts MATCH ?{where_extra}'''
+                    total = conn.execute(f'SELECT COUNT(*) {base}', [consulta, *parametros]).fetchone()[0]
+                    linhas = conn.execute(
+                        f'''SELECT {colunas},
+                                   bm25(chat_mensagens_fts, 10.0, 1.0) AS relevancia,
+                                   snippet(chat_mensagens_fts, 0, ?, ?, '…', 16) AS trecho
+                            {base}
+                            ORDER BY relevancia, m.timestamp DESC
+                            LIMIT ? OFFSET ?''',
+                        [_SENTINELA_INICIO, _SENTINELA_FIM, consulta, *parametros, limite, offset]
+                    ).fetchall()
+                else:
+                    palavras = _TOKENS.findall(termo)
+                    like = ''.join(' AND m.conteudo LIKE ?' for _ in palavras)
+                    parametros_like = [f'%{p}%' for p in palavras]
+                    base = f'FROM chat_mensagens m WHERE 1 = 1{like}{where_extra}'
+                    total = conn.execute(f'SELECT COUNT(*) {base}', [*parametros_like, *parametros]).fetchone()[0]
+                    linhas = conn.execute(
+                        f'''SELECT {colunas}, 0.0 AS relevancia, m.conteudo AS trecho
+                            {base} ORDER BY m.timestamp DESC LIMIT ? OFFSET ?''',
+                        [*parametros_like, *parametros, limite, offset]
+                    ).fetchall()
+        except sqlite3.OperationalError as e:
+            logger.error(f"Erro na busca de mensagens do chat: {str(e)}")
+            return [], 0
+
+        resultados = []
+        for linha in linhas:
+            dados = self._linha_para_dict(linha)
+            # bm25 do SQLite é negativo (menor = mais relevante)
+            dados['relevancia'] = round(-linha['relevancia'], 4)
+            dados['trecho_destacado'] = _destacar_html(linha['trecho'])
+            resultados.append(dados)
+        return resultados, total
+
+    def contar(self, canal_id: str = None) -> int:
+        try:
+            with self._connect() as conn:
+                if canal_id:
+                    return conn.execute('SELECT COUNT(*) FROM chat_mensagens WHERE canal_id = ?',
+                                        (canal_id,)).fetchone()[0]
+                return conn.execute('SELECT COUNT(*) FROM chat_mensagens').fetchone()[0]
+        except Exception as e:
+            logger.error(f"Erro ao contar mensagens do chat: {str(e)}")
+            return 0
+
+
+# Instância global usada pelo serviço de chat
+chat_mensagens_store = ChatMensagensStore()
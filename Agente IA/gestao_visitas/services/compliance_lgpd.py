@@ -9,6 +9,7 @@ from sqlalchemy import func, and_, or_, desc
 from ..models.agendamento import Visita
 from ..models.contatos import Contato
 from ..db import db
+from .auditoria_lgpd_store import auditoria_lgpd_writer
 import json
 import uuid
 import hashlib
@@ -64,6 +65,7 @@ class LogAuditoria:
     consentimento_id: Optional[str] = None
     justificativa: str = ""
     metadata: Dict = None
+    titular_id: Optional[str] = None
 
 @dataclass
 class ConsentimentoLGPD:
@@ -148,8 +150,13 @@ class ComplianceLGPD:
     
     def registrar_log_auditoria(self, operacao: TipoOperacao, recurso: str, 
                               dados_alterados: Dict, usuario_id: str, 
-                              request_info: Dict = None) -> str:
-        """Registra log de auditoria detalhado"""
+                              request_info: Dict = None, titular_id: str = None) -> str:
+        """
+        Registra log de auditoria detalhado.
+        
+        A gravação é assíncrona (fila + escritor em lote); o titular é indexado
+        para consultas de solicitações LGPD.
+        """
         try:
             # Gerar ID único
             log_id = str(uuid.uuid4())
@@ -177,7 +184,8 @@ class ComplianceLGPD:
                 resultado='sucesso',
                 tipo_dado=tipo_dado,
                 justificativa=self._gerar_justificativa_operacao(operacao, recurso),
-                metadata=request_processado.get('metadata', {})
+                metadata=request_processado.get('metadata', {}),
+                titular_id=titular_id or dados_alterados.get('titular_id')
             )
             
             # Salvar log
@@ -238,7 +246,8 @@ class ComplianceLGPD:
                 'Consentimento',
                 {'consentimento_id': consentimento_id, 'finalidade': finalidade},
                 titular_id,
-                request_info
+                request_info,
+                titular_id=titular_id
             )
             
             return {
@@ -294,7 +303,8 @@ class ComplianceLGPD:
                 'Consentimento',
                 {'acao': 'revogacao', 'motivo': motivo},
                 titular_id,
-                request_info
+                request_info,
+                titular_id=titular_id
             )
             
             return {
@@ -556,14 +566,20 @@ class ComplianceLGPD:
         }
         return justificativas.get(operacao, 'Operação relacionada à PNSB 2024')
     
-    def _salvar_log_auditoria(self, log): pass
+    def _salvar_log_auditoria(self, log):
+        # Cópia rasa: serialização e hash ficam na thread escritora
+        auditoria_lgpd_writer.registrar(dict(vars(log)))
     def _verificar_consentimento_operacao(self, log): pass
     def _detectar_atividade_suspeita(self, log): pass
     def _log_erro_auditoria(self, erro, usuario_id, operacao): pass
     def _salvar_consentimento(self, consentimento): pass
     def _buscar_consentimento(self, consentimento_id): return None
     def _agendar_anonimizacao(self, titular_id, consentimento_id): pass
-    def _processar_tipo_solicitacao(self, tipo, titular_id, dados, solicitacao_id): return {}
+    def _processar_tipo_solicitacao(self, tipo, titular_id, dados, solicitacao_id):
+        if tipo in ('acesso', 'portabilidade', 'informacoes_compartilhamento'):
+            historico = auditoria_lgpd_writer.consultar_titular(titular_id)
+            return {'historico_tratamento': historico, 'total_operacoes': len(historico)}
+        return {}
     def _calcular_prazo_resposta(self, tipo): return 15
     def _analisar_impacto_incidente(self, dados): return {'titular_afetados': 0}
     def _requer_notificacao_anpd(self, incidente, impacto): return incidente.nivel_risco == NivelRisco.CRITICO
@@ -575,7 +591,7 @@ class ComplianceLGPD:
         fim = datetime.now()
         inicio = fim - timedelta(days=30 if periodo == 'mes' else 7)
         return inicio, fim
-    def _calcular_metricas_auditoria(self, inicio, fim): return {}
+    def _calcular_metricas_auditoria(self, inicio, fim): return auditoria_lgpd_writer.metricas_periodo(inicio, fim)
     def _analisar_status_consentimentos(self): return {}
     def _relatorio_incidentes_periodo(self, inicio, fim): return {}
     def _relatorio_solicitacoes_titulares(self, inicio, fim): return {}
@@ -585,7 +601,7 @@ class ComplianceLGPD:
     def _listar_certificacoes_vigentes(self): return []
     def _calcular_proxima_auditoria(self): return (datetime.now() + timedelta(days=90)).isoformat()
     def _verificar_consentimentos_expirados(self): return {'total': 0, 'detalhes': []}
-    def _verificar_integridade_logs(self): return {'integro': True, 'hash_verificado': True}
+    def _verificar_integridade_logs(self): return auditoria_lgpd_writer.verificar_integridade()
     def _verificar_anonimizacao_pendente(self): return {'pendentes': 0}
     def _verificar_incidentes_pendentes(self): return {'pendentes': 0}
     def _verificar_solicitacoes_vencidas(self): return {'vencidas': 0}
@@ -9,6 +9,7 @@ from sqlalchemy import and_, or_, func
 from ..models.agendamento import Visita
 from ..models.contatos import Contato
 from ..db import db
+from .tempos_viagem import tempos_viagem
 from dataclasses import dataclass
 from enum import Enum
 import logging
@@ -56,30 +57,6 @@ class ConflictDetector:
             'tempo_almoco_inicio': time(12, 0),
             'tempo_almoco_fim': time(13, 0)
         }
-        
-        # Tempos de viagem estimados entre municípios (em minutos)
-        self.tempos_viagem = {
-            ('Itajaí', 'Navegantes'): 15,
-            ('Itajaí', 'Balneário Camboriú'): 25,
-            ('Itajaí', 'Camboriú'): 30,
-            ('Itajaí', 'Penha'): 20,
-            ('Itajaí', 'Piçarras'): 25,
-            ('Itajaí', 'Bombinhas'): 45,
-            ('Itajaí', 'Porto Belo'): 35,
-            ('Itajaí', 'Itapema'): 35,
-            ('Itajaí', 'Luiz Alves'): 40,
-            ('Itajaí', 'Ilhota'): 35,
-            ('Navegantes', 'Balneário Camboriú'): 30,
-            ('Navegantes', 'Penha'): 10,
-            ('Navegantes', 'Piçarras'): 15,
-            ('Penha', 'Piçarras'): 10,
-            ('Balneário Camboriú', 'Camboriú'): 15,
-            ('Balneário Camboriú', 'Itapema'): 20,
-            ('Itapema', 'Porto Belo'): 15,
-            ('Porto Belo', 'Bombinhas'): 20,
-            ('Camboriú', 'Luiz Alves'): 25,
-            ('Ilhota', 'Luiz Alves'): 20
-        }
     
     def detectar_conflitos_visita(self, visita_id: int = None, 
                                  municipio: str = None, 
@@ -197,7 +174,7 @@ class ConflictDetector:
                     severidade = SeveridadeConflito.CRITICO
                     descricao = f"Sobreposição total de horários no mesmo município ({municipio})"
                 else:
-                    tempo_viagem = self._obter_tempo_viagem(municipio, visita.municipio)
+                    tempo_viagem = self._obter_tempo_viagem(municipio, visita.municipio, hora_inicio)
                     if tempo_viagem and tempo_viagem > 60:
                         severidade = SeveridadeConflito.CRITICO
                         descricao = f"Sobreposição com viagem impossível ({tempo_viagem}min entre {municipio} e {visita.municipio})"
@@ -228,7 +205,7 @@ class ConflictDetector:
                         'municipio_2': visita.municipio,
                         'horario_1': f"{hora_inicio} - {hora_fim}",
                         'horario_2': f"{visita.hora_inicio} - {visita.hora_fim}",
-                        'tempo_viagem_estimado': self._obter_tempo_viagem(municipio, visita.municipio)
+                        'tempo_viagem_estimado': self._obter_tempo_viagem(municipio, visita.municipio, hora_inicio)
                     }
                 )
                 
@@ -257,7 +234,7 @@ class ConflictDetector:
                     visita_anterior.hora_fim, visita.hora_inicio
                 )
                 tempo_viagem_necessario = self._obter_tempo_viagem(
-                    visita_anterior.municipio, visita.municipio
+                    visita_anterior.municipio, visita.municipio, visita_anterior.hora_fim
                 ) + self.config['tempo_buffer_viagem']
                 
                 if tempo_disponivel < tempo_viagem_necessario:
@@ -420,17 +397,13 @@ class ConflictDetector:
         
         return not (fim1 <= inicio2 or inicio1 >= fim2)
     
-    def _obter_tempo_viagem(self, origem: str, destino: str) -> int:
-        """Obter tempo de viagem entre dois municípios"""
+    def _obter_tempo_viagem(self, origem: str, destino: str, horario: time = None) -> int:
+        """Obter tempo de viagem entre dois municípios (no horário de saída, se informado)"""
         
         if origem == destino:
             return 5  # Tempo mínimo para deslocamento dentro do município
         
-        # Tentar ambas as direções
-        tempo = self.tempos_viagem.get((origem, destino))
-        if tempo is None:
-            tempo = self.tempos_viagem.get((destino, origem))
-        
+        tempo = tempos_viagem.minutos(origem, destino, horario)
         return tempo or 45  # Tempo padrão se não encontrar
     
     def _adicionar_minutos(self, horario: time, minutos: int) -> time:
@@ -2,12 +2,55 @@ from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple, Any
 import re
 import requests
-from sqlalchemy import and_, or_
+from sqlalchemy import and_, or_, event
+from sqlalchemy.orm import Session
+import numpy as np
 from ..models.contatos import Contato, TipoEntidade, FonteInformacao
 from ..models.agendamento import Visita
 from ..db import db
+from .deduplicacao_contatos import (
+    IndiceDuplicatas, detectar_duplicatas, pontuar_pares,
+    registro_de_campos, registro_de_contato
+)
 import json
 
+# Índice de duplicatas compartilhado (construído sob demanda na primeira verificação)
+indice_contatos = IndiceDuplicatas()
+
+
+def _marcar_contatos_alterados(session, flush_context):
+    """Guarda contatos inseridos/alterados no flush; só entram no índice após o commit"""
+    pendentes = session.info.setdefault('contatos_dedup', {})
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Contato) and obj.id is not None:
+            pendentes[obj.id] = registro_de_contato(obj)
+    if any(isinstance(obj, Contato) for obj in session.deleted):
+        session.info['contatos_dedup_removidos'] = True
+
+
+def _aplicar_contatos_no_indice(session):
+    pendentes = session.info.pop('contatos_dedup', None)
+    removidos = session.info.pop('contatos_dedup_removidos', False)
+    if not indice_contatos.construido:
+        return
+    if removidos:
+        # O índice não remove entradas; reconstrói na próxima verificação
+        indice_contatos.construido = False
+        return
+    for registro in (pendentes or {}).values():
+        indice_contatos.adicionar(registro)
+
+
+def _descartar_contatos_pendentes(session):
+    session.info.pop('contatos_dedup', None)
+    session.info.pop('contatos_dedup_removidos', None)
+
+
+event.listen(Session, 'after_flush', _marcar_contatos_alterados)
+event.listen(Session, 'after_commit', _aplicar_contatos_no_indice)
+event.listen(Session, 'after_rollback', _descartar_contatos_pendentes)
+
+
 class ContatosInteligente:
     """Sistema inteligente de gestão de contatos"""
     
@@ -87,29 +130,70 @@ class ContatosInteligente:
         return validacao
     
     def detectar_contatos_duplicados(self, municipio: str = None) -> List[Dict]:
-        """Detecta possíveis contatos duplicados"""
+        """Detecta possíveis contatos duplicados (chaves de bloqueio + LSH, sem comparar todos os pares)"""
         
         query = Contato.query
         if municipio:
             query = query.filter_by(municipio=municipio)
         
         contatos = query.all()
-        duplicados = []
+        registros = [registro_de_contato(c) for c in contatos]
         
-        for i, contato1 in enumerate(contatos):
-            for contato2 in contatos[i+1:]:
-                similaridade = self._calcular_similaridade_contatos(contato1, contato2)
-                
-                if similaridade['score'] > 0.8:  # 80% de similaridade
-                    duplicados.append({
-                        'contato1': contato1.to_dict(),
-                        'contato2': contato2.to_dict(),
-                        'similaridade': similaridade,
-                        'recomendacao': self._gerar_recomendacao_duplicata(contato1, contato2, similaridade)
-                    })
+        # A varredura completa também renova o índice usado nas verificações incrementais
+        indice = indice_contatos if not municipio else None
+        resultados = detectar_duplicatas(registros, limiar=0.8, indice=indice)
+        
+        dicionarios = {}
+        
+        def como_dict(k):
+            if k not in dicionarios:
+                dicionarios[k] = contatos[k].to_dict()
+            return dicionarios[k]
+        
+        duplicados = []
+        for i, j, score, campos in resultados:
+            similaridade = {'score': round(score, 3), 'campos_similares': campos}
+            duplicados.append({
+                'contato1': como_dict(i),
+                'contato2': como_dict(j),
+                'similaridade': similaridade,
+                'recomendacao': self._gerar_recomendacao_duplicata(contatos[i], contatos[j], similaridade)
+            })
         
         return duplicados
     
+    def verificar_duplicata_contato(self, dados: Dict, limiar: float = 0.8) -> List[Dict]:
+        """Verifica um único contato (ainda não salvo) contra o índice de duplicatas"""
+        
+        if not indice_contatos.construido:
+            indice_contatos.construir([registro_de_contato(c) for c in Contato.query.all()])
+        
+        registro = registro_de_campos(
+            dados.get('id'),
+            dados.get('municipio'),
+            nome=dados.get('nome') or dados.get('responsavel_mais_provavel'),
+            telefone=dados.get('telefone'),
+            email=dados.get('email'),
+            texto_contato=dados.get('contato_mais_provavel')
+        )
+        
+        encontrados = [
+            (r, score, campos) for r, score, campos in indice_contatos.verificar(registro, limiar)
+            if r.id != registro.id
+        ]
+        if not encontrados:
+            return []
+        
+        contatos = {c.id: c for c in Contato.query.filter(Contato.id.in_([r.id for r, _, _ in encontrados]))}
+        
+        return [
+            {
+                'contato': contatos[r.id].to_dict(),
+                'similaridade': {'score': round(score, 3), 'campos_similares': campos}
+            }
+            for r, score, campos in encontrados if r.id in contatos
+        ]
+    
     def sugerir_atualizacao_contato(self, contato_id: int) -> Dict:
         """Sugere atualizações para um contato baseado em análise inteligente"""
         
@@ -541,8 +625,29 @@ class ContatosInteligente:
     
     def _calcular_similaridade_contatos(self, contato1: Contato, contato2: Contato) -> Dict:
         """Calcula similaridade entre dois contatos"""
-        # Implementação simplificada
-        return {'score': 0.0, 'campos_similares': []}
+        registros = [registro_de_contato(contato1), registro_de_contato(contato2)]
+        scores, campos = pontuar_pares(registros, np.array([[0, 1]]))
+        
+        return {
+            'score': round(float(scores[0]), 3),
+            'campos_similares': [nome for nome, mascara in campos.items() if mascara[0]]
+        }
+    
+    def _gerar_recomendacao_duplicata(self, contato1: Contato, contato2: Contato, similaridade: Dict) -> str:
+        """Gera recomendação para um par de possíveis duplicados"""
+        campos = similaridade.get('campos_similares', [])
+        
+        # Mantém o registro atualizado mais recentemente
+        manter, remover = contato1, contato2
+        if (contato2.data_atualizacao or datetime.min) > (contato1.data_atualizacao or datetime.min):
+            manter, remover = contato2, contato1
+        
+        if similaridade['score'] >= 0.95 or ('nome' in campos and ('telefone' in campos or 'email' in campos)):
+            return f"Mesclar: manter contato {manter.id} e remover {remover.id}"
+        elif 'telefone' in campos or 'email' in campos:
+            return "Mesmo telefone/e-mail com nomes diferentes - confirmar se é o mesmo informante"
+        else:
+            return "Nomes semelhantes - revisar manualmente antes de mesclar"
     
     def _buscar_dados_historico_visitas(self, municipio: str, tipo_pesquisa: str) -> Dict:
         """Busca dados do histórico de visitas"""
@@ -4,17 +4,23 @@ Sistema inteligente que monitora e gera alertas críticos baseados em dados reai
 """
 
 import logging
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple
-from dataclasses import dataclass
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+from dataclasses import dataclass, field
 from enum import Enum
 import statistics
 
+from sqlalchemy import func
+
 from gestao_visitas.models.agendamento import Visita
 from gestao_visitas.models.contatos import Contato
 from gestao_visitas.models.checklist import Checklist
 from gestao_visitas.db import db
 from gestao_visitas.config import MUNICIPIOS
+from gestao_visitas.services.progresso_snapshot import versao_dados
 
 # Configuração do logging
 logging.basicConfig(level=logging.INFO)
@@ -54,6 +60,72 @@ class CriticalAlert:
     timestamp: datetime
     prioridade: int  # 1=máxima, 5=mínima
 
+STATUS_CONCLUIDOS = ('realizada', 'finalizada')
+STATUS_PENDENTES = ('agendada', 'em preparação')
+
+# Geradores acima deste tempo aparecem como lentos no resumo
+LIMITE_GERADOR_LENTO_MS = 50
+
+@dataclass
+class AlertContext:
+    """
+    Dados carregados uma única vez por geração de alertas.
+    
+    Os geradores trabalham apenas sobre este contexto (sem consultas próprias),
+    o que permite executá-los em paralelo fora do contexto da aplicação.
+    """
+    hoje: datetime
+    visitas: List = field(default_factory=list)
+    contatos_por_municipio: Dict[str, int] = field(default_factory=dict)
+    total_checklists: int = 0
+    
+    @property
+    def total_contatos(self) -> int:
+        return sum(self.contatos_por_municipio.values())
+    
+    @classmethod
+    def carregar(cls, hoje: datetime = None) -> 'AlertContext':
+        """Carrega visitas, contagem de contatos por município e de checklists (3 consultas)"""
+        visitas = db.session.query(
+            Visita.id,
+            Visita.municipio,
+            Visita.status,
+            Visita.data,
+            Visita.data_atualizacao,
+            Visita.pesquisador_responsavel,
+            Visita.entidade_nome
+        ).all()
+        
+        contatos_por_municipio = dict(
+            db.session.query(Contato.municipio, func.count(Contato.id))
+            .group_by(Contato.municipio)
+            .all()
+        )
+        
+        total_checklists = db.session.query(func.count(Checklist.id)).scalar() or 0
+        
+        return cls(
+            hoje=hoje or datetime.now(),
+            visitas=visitas,
+            contatos_por_municipio=contatos_por_municipio,
+            total_checklists=total_checklists
+        )
+    
+    def visitas_por_municipio(self) -> Dict[str, List]:
+        agrupadas = {}
+        for visita in self.visitas:
+            agrupadas.setdefault(visita.municipio, []).append(visita)
+        return agrupadas
+
+# Resultado memoizado por (versão dos dados, dia) - compartilhado entre instâncias do serviço.
+# A versão só conta commits deste processo; o TTL limita a defasagem quando
+# outros workers alteram os dados (como ProgressoSnapshot.TTL_SEGURANCA)
+TTL_MEMO_ALERTAS = 60
+_memo_alertas = {'chave': None, 'resultado': None, 'criado_em': 0.0}
+_memo_lock = threading.Lock()
+
+_executor_alertas = ThreadPoolExecutor(max_workers=4, thread_name_prefix='pnsb-alertas')
+
 class CriticalAlertsService:
     """
     Sistema de Alertas Críticos Funcional para PNSB 2024
@@ -76,49 +148,83 @@ class CriticalAlertsService:
         """
         Retorna todos os alertas críticos do sistema
         
+        O resultado é memoizado enquanto a versão dos dados (e o dia) não
+        mudar, por no máximo TTL_MEMO_ALERTAS segundos.
+        
         Returns:
             Dict com alertas, resumo e métricas do sistema
         """
+        chave = (versao_dados(), date.today())
+        
+        with _memo_lock:
+            if (_memo_alertas['chave'] != chave
+                    or time.time() - _memo_alertas['criado_em'] >= TTL_MEMO_ALERTAS):
+                _memo_alertas['resultado'] = self._compute_all_critical_alerts()
+                _memo_alertas['chave'] = chave
+                _memo_alertas['criado_em'] = time.time()
+            resultado = _memo_alertas['resultado']
+        
+        return {
+            **resultado,
+            'alertas': list(resultado['alertas']),
+            'timestamp_consulta': datetime.now().isoformat()
+        }
+    
+    def _get_generators(self) -> List[Tuple[str, Callable[[AlertContext], List[CriticalAlert]]]]:
+        """Geradores de alertas (funções puras sobre o AlertContext)"""
+        return [
+            ('deadline', self._generate_deadline_alerts),
+            ('municipio', self._generate_municipality_alerts),
+            ('contatos', self._generate_contact_alerts),
+            ('conflitos', self._generate_conflict_alerts),
+            ('followup', self._generate_followup_alerts),
+            ('documentacao', self._generate_documentation_alerts),
+            ('riscos', self._generate_risk_alerts),
+            ('performance', self._generate_performance_alerts),
+            ('status', self._generate_status_alerts),
+            ('backup', self._generate_backup_alerts),
+        ]
+    
+    def _run_generators(self, ctx: AlertContext) -> Tuple[List[CriticalAlert], Dict[str, float]]:
+        """Executa os geradores em paralelo; retorna alertas e tempo (ms) de cada gerador"""
+        
+        def cronometrar(gerador):
+            inicio = time.perf_counter()
+            alertas = gerador(ctx)
+            return alertas, (time.perf_counter() - inicio) * 1000
+        
+        futuros = [
+            (nome, _executor_alertas.submit(cronometrar, gerador))
+            for nome, gerador in self._get_generators()
+        ]
+        
+        alertas = []
+        tempos = {}
+        for nome, futuro in futuros:
+            try:
+                alertas_gerador, tempos[nome] = futuro.result()
+                alertas.extend(alertas_gerador)
+            except Exception as e:
+                logger.error(f"Erro no gerador de alertas '{nome}': {e}")
+        
+        return alertas, tempos
+    
+    def _compute_all_critical_alerts(self) -> Dict:
+        """Carrega o contexto, executa os geradores e monta o resultado"""
         try:
             logger.info("Gerando alertas críticos do sistema PNSB")
             
-            alertas = []
+            inicio = time.perf_counter()
+            ctx = AlertContext.carregar()
+            tempo_contexto = (time.perf_counter() - inicio) * 1000
             
-            # 1. Alertas de Deadlines Críticos
-            alertas.extend(self._generate_deadline_alerts())
-            
-            # 2. Alertas por Município
-            alertas.extend(self._generate_municipality_alerts())
-            
-            # 3. Alertas de Contatos
-            alertas.extend(self._generate_contact_alerts())
-            
-            # 4. Alertas de Conflitos
-            alertas.extend(self._generate_conflict_alerts())
-            
-            # 5. Alertas de Follow-up
-            alertas.extend(self._generate_followup_alerts())
-            
-            # 6. Alertas de Documentação
-            alertas.extend(self._generate_documentation_alerts())
-            
-            # 7. Alertas de Riscos
-            alertas.extend(self._generate_risk_alerts())
-            
-            # 8. Alertas de Performance
-            alertas.extend(self._generate_performance_alerts())
-            
-            # 9. Alertas de Status
-            alertas.extend(self._generate_status_alerts())
-            
-            # 10. Alertas de Backup
-            alertas.extend(self._generate_backup_alerts())
+            alertas, tempos = self._run_generators(ctx)
             
             # Ordenar por prioridade e nível
             alertas_ordenados = self._sort_alerts_by_priority(alertas)
             
             # Gerar resumo
-            resumo = self._generate_summary(alertas_ordenados)
+            resumo = self._generate_summary(alertas_ordenados, tempos, tempo_contexto)
             
             # Convert enum objects to string values for JSON serialization
             alertas_dict = []
@@ -143,10 +249,10 @@ class CriticalAlertsService:
             logger.error(f"Erro ao gerar alertas críticos: {e}")
             raise
     
-    def _generate_deadline_alerts(self) -> List[CriticalAlert]:
+    def _generate_deadline_alerts(self, ctx: AlertContext) -> List[CriticalAlert]:
         """Gera alertas de deadlines críticos"""
         alertas = []
-        hoje = datetime.now()
+        hoje = ctx.hoje
         
         # Calcular dias restantes para cada deadline
         dias_visitas = (self.DEADLINE_VISITAS_P1_P2 - hoje).days
@@ -154,10 +260,10 @@ class CriticalAlertsService:
         dias_finalizacao = (self.DEADLINE_FINALIZACAO - hoje).days
         
         # Obter dados de progresso
-        visitas = Visita.query.all()
+        visitas = ctx.visitas
         total_visitas = len(visitas)
-        visitas_finalizadas = len([v for v in visitas if v.status in ['realizada', 'finalizada']])
-        visitas_p1_p2 = len([v for v in visitas if hasattr(v, 'prioridade') and v.prioridade in ['P1', 'P2']])
+        visitas_finalizadas = len([v for v in visitas if v.status in STATUS_CONCLUIDOS])
+        visitas_p1_p2 = len([v for v in visitas if getattr(v, 'prioridade', None) in ['P1', 'P2']])
         
         # Alerta de deadline de visitas P1+P2
         if dias_visitas <= 60:
@@ -234,19 +340,19 @@ class CriticalAlertsService:
         
         return alertas
     
-    def _generate_municipality_alerts(self) -> List[CriticalAlert]:
+    def _generate_municipality_alerts(self, ctx: AlertContext) -> List[CriticalAlert]:
         """Gera alertas específicos por município"""
         alertas = []
+        visitas_por_municipio = ctx.visitas_por_municipio()
         
         for municipio in MUNICIPIOS:
             try:
                 # Obter dados do município
-                visitas_municipio = Visita.query.filter_by(municipio=municipio).all()
-                contatos_municipio = Contato.query.filter_by(municipio=municipio).all()
+                visitas_municipio = visitas_por_municipio.get(municipio, [])
                 
                 total_visitas = len(visitas_municipio)
-                visitas_concluidas = len([v for v in visitas_municipio if v.status in ['realizada', 'finalizada']])
-                contatos_disponiveis = len(contatos_municipio)
+                visitas_concluidas = len([v for v in visitas_municipio if v.status in STATUS_CONCLUIDOS])
+                contatos_disponiveis = ctx.contatos_por_municipio.get(municipio, 0)
                 
                 # Alerta de município sem visitas
                 if total_visitas == 0:
@@ -265,7 +371,7 @@ class CriticalAlertsService:
                             'situacao': 'critica'
                         },
                         dias_restantes=None,
-                        timestamp=datetime.now(),
+                        timestamp=ctx.hoje,
                         prioridade=1
                     ))
                 
@@ -292,7 +398,7 @@ class CriticalAlertsService:
                                 'contatos_disponiveis': contatos_disponiveis
                             },
                             dias_restantes=None,
-                            timestamp=datetime.now(),
+                            timestamp=ctx.hoje,
                             prioridade=2 if nivel == AlertLevel.CRITICO else 3
                         ))
                 
@@ -312,7 +418,7 @@ class CriticalAlertsService:
                             'total_visitas': total_visitas
                         },
                         dias_restantes=None,
-                        timestamp=datetime.now(),
+                        timestamp=ctx.hoje,
                         prioridade=3
                     ))
                     
@@ -322,16 +428,14 @@ class CriticalAlertsService:
         
         return alertas
     
-    def _generate_contact_alerts(self) -> List[CriticalAlert]:
+    def _generate_contact_alerts(self, ctx: AlertContext) -> List[CriticalAlert]:
         """Gera alertas relacionados a contatos"""
         alertas = []
         
         try:
             # Visitas sem contatos confirmados
-            visitas_sem_contato = Visita.query.filter(
-                Visita.status.in_(['agendada', 'em preparação']),
-                # Adicionar filtros para visitas sem contatos confirmados
-            ).all()
+            # Adicionar filtros para visitas sem contatos confirmados
+            visitas_sem_contato = [v for v in ctx.visitas if v.status in STATUS_PENDENTES]
             
             if len(visitas_sem_contato) > 0:
                 alertas.append(CriticalAlert(
@@ -348,12 +452,12 @@ class CriticalAlertsService:
                         'visitas_detalhes': [{'id': v.id, 'municipio': v.municipio} for v in visitas_sem_contato[:5]]
                     },
                     dias_restantes=None,
-                    timestamp=datetime.now(),
+                    timestamp=ctx.hoje,
                     prioridade=2
                 ))
             
             # Contatos desatualizados (exemplo)
-            total_contatos = Contato.query.count()
+            total_contatos = ctx.total_contatos
             if total_contatos < 50:  # Número arbitrário baseado na necessidade do projeto
                 alertas.append(CriticalAlert(
                     id="base_contatos_pequena",
@@ -369,7 +473,7 @@ class CriticalAlertsService:
                         'meta_sugerida': 100
                     },
                     dias_restantes=None,
-                    timestamp=datetime.now(),
+                    timestamp=ctx.hoje,
                     prioridade=4
                 ))
                 
@@ -378,16 +482,16 @@ class CriticalAlertsService:
         
         return alertas
     
-    def _generate_conflict_alerts(self) -> List[CriticalAlert]:
+    def _generate_conflict_alerts(self, ctx: AlertContext) -> List[CriticalAlert]:
         """Gera alertas de conflitos de agenda"""
         alertas = []
         
         try:
             # Buscar visitas agendadas para o mesmo dia/horário
-            visitas_agendadas = Visita.query.filter(
-                Visita.status.in_(['agendada', 'em preparação']),
-                Visita.data.isnot(None)
-            ).all()
+            visitas_agendadas = [
+                v for v in ctx.visitas
+                if v.status in STATUS_PENDENTES and v.data is not None
+            ]
             
             # Detectar conflitos
             conflitos = {}
@@ -416,7 +520,7 @@ class CriticalAlertsService:
                             'municipios': list(set([v.municipio for v in visitas_dia]))
                         },
                         dias_restantes=None,
-                        timestamp=datetime.now(),
+                        timestamp=ctx.hoje,
                         prioridade=4
                     ))
                     
@@ -425,18 +529,18 @@ class CriticalAlertsService:
         
         return alertas
     
-    def _generate_followup_alerts(self) -> List[CriticalAlert]:
+    def _generate_followup_alerts(self, ctx: AlertContext) -> List[CriticalAlert]:
         """Gera alertas de follow-up necessário"""
         alertas = []
         
         try:
-            hoje = datetime.now()
+            hoje = ctx.hoje
             
             # Visitas há muito tempo no mesmo status
-            visitas_paradas = Visita.query.filter(
-                Visita.status.in_(['agendada', 'em preparação']),
-                Visita.data_atualizacao.isnot(None)
-            ).all()
+            visitas_paradas = [
+                v for v in ctx.visitas
+                if v.status in STATUS_PENDENTES and v.data_atualizacao is not None
+            ]
             
             for visita in visitas_paradas:
                 if visita.data_atualizacao:
@@ -452,7 +556,7 @@ class CriticalAlertsService:
                             titulo=f"📞 FOLLOW-UP: {visita.municipio} ({dias_parada} dias sem atualização)",
                             descricao=f"Visita parada há {dias_parada} dias. Follow-up urgente necessário.",
                             municipio=visita.municipio,
-                            entidade=visita.entidade_nome if hasattr(visita, 'entidade_nome') else None,
+                            entidade=visita.entidade_nome,
                             acao_recomendada="Contatar responsável, verificar status, atualizar informações",
                             dados={
                                 'visita_id': visita.id,
@@ -470,31 +574,30 @@ class CriticalAlertsService:
         
         return alertas
     
-    def _generate_documentation_alerts(self) -> List[CriticalAlert]:
+    def _generate_documentation_alerts(self, ctx: AlertContext) -> List[CriticalAlert]:
         """Gera alertas de documentação faltante"""
         alertas = []
         
         try:
             # Verificar checklists incompletos
-            checklists_incompletos = Checklist.query.filter(
-                # Adicionar filtros para checklists incompletos
-            ).all()
+            # Adicionar filtros para checklists incompletos
+            checklists_incompletos = ctx.total_checklists
             
-            if len(checklists_incompletos) > 0:
+            if checklists_incompletos > 0:
                 alertas.append(CriticalAlert(
                     id="documentacao_incompleta",
                     tipo=AlertType.DOCUMENTACAO,
                     nivel=AlertLevel.ATENCAO,
-                    titulo=f"📄 {len(checklists_incompletos)} CHECKLISTS INCOMPLETOS",
+                    titulo=f"📄 {checklists_incompletos} CHECKLISTS INCOMPLETOS",
                     descricao="Documentação de visitas incompleta. Revisar antes das visitas.",
                     municipio="MULTIPLOS",
                     entidade=None,
                     acao_recomendada="Completar checklists, verificar documentos obrigatórios",
                     dados={
-                        'checklists_incompletos': len(checklists_incompletos)
+                        'checklists_incompletos': checklists_incompletos
                     },
                     dias_restantes=None,
-                    timestamp=datetime.now(),
+                    timestamp=ctx.hoje,
                     prioridade=4
                 ))
                 
@@ -503,19 +606,19 @@ class CriticalAlertsService:
         
         return alertas
     
-    def _generate_risk_alerts(self) -> List[CriticalAlert]:
+    def _generate_risk_alerts(self, ctx: AlertContext) -> List[CriticalAlert]:
         """Gera alertas de riscos identificados"""
         alertas = []
         
         # Risco geral do projeto baseado no progresso
         try:
-            visitas = Visita.query.all()
+            visitas = ctx.visitas
             total_visitas = len(visitas)
-            visitas_finalizadas = len([v for v in visitas if v.status in ['realizada', 'finalizada']])
+            visitas_finalizadas = len([v for v in visitas if v.status in STATUS_CONCLUIDOS])
             
             if total_visitas > 0:
                 progresso_geral = (visitas_finalizadas / total_visitas) * 100
-                dias_deadline = (self.DEADLINE_VISITAS_P1_P2 - datetime.now()).days
+                dias_deadline = (self.DEADLINE_VISITAS_P1_P2 - ctx.hoje).days
                 
                 # Calcular risco baseado em progresso vs tempo restante
                 tempo_decorrido_pct = max(0, (365 - dias_deadline) / 365 * 100)  # Assumindo 1 ano de projeto
@@ -537,7 +640,7 @@ class CriticalAlertsService:
                             'dias_deadline': dias_deadline
                         },
                         dias_restantes=dias_deadline,
-                        timestamp=datetime.now(),
+                        timestamp=ctx.hoje,
                         prioridade=1
                     ))
                     
@@ -546,14 +649,14 @@ class CriticalAlertsService:
         
         return alertas
     
-    def _generate_performance_alerts(self) -> List[CriticalAlert]:
+    def _generate_performance_alerts(self, ctx: AlertContext) -> List[CriticalAlert]:
         """Gera alertas de performance da equipe"""
         alertas = []
         
         try:
             # Analisar produtividade por pesquisador (se disponível)
             pesquisadores = {}
-            visitas = Visita.query.filter(Visita.pesquisador_responsavel.isnot(None)).all()
+            visitas = [v for v in ctx.visitas if v.pesquisador_responsavel is not None]
             
             for visita in visitas:
                 pesquisador = visita.pesquisador_responsavel
@@ -561,7 +664,7 @@ class CriticalAlertsService:
                     pesquisadores[pesquisador] = {'total': 0, 'finalizadas': 0}
                 
                 pesquisadores[pesquisador]['total'] += 1
-                if visita.status in ['realizada', 'finalizada']:
+                if visita.status in STATUS_CONCLUIDOS:
                     pesquisadores[pesquisador]['finalizadas'] += 1
             
             # Alertar sobre pesquisadores com baixa produtividade
@@ -586,7 +689,7 @@ class CriticalAlertsService:
                                 'visitas_finalizadas': dados['finalizadas']
                             },
                             dias_restantes=None,
-                            timestamp=datetime.now(),
+                            timestamp=ctx.hoje,
                             prioridade=4
                         ))
                         
@@ -595,18 +698,18 @@ class CriticalAlertsService:
         
         return alertas
     
-    def _generate_status_alerts(self) -> List[CriticalAlert]:
+    def _generate_status_alerts(self, ctx: AlertContext) -> List[CriticalAlert]:
         """Gera alertas de status das visitas"""
         alertas = []
         
         try:
-            hoje = datetime.now()
+            hoje = ctx.hoje
             
             # Visitas agendadas para datas passadas
-            visitas_atrasadas = Visita.query.filter(
-                Visita.status == 'agendada',
-                Visita.data < hoje.date()
-            ).all()
+            visitas_atrasadas = [
+                v for v in ctx.visitas
+                if v.status == 'agendada' and v.data is not None and v.data < hoje.date()
+            ]
             
             if len(visitas_atrasadas) > 0:
                 alertas.append(CriticalAlert(
@@ -632,15 +735,15 @@ class CriticalAlertsService:
         
         return alertas
     
-    def _generate_backup_alerts(self) -> List[CriticalAlert]:
+    def _generate_backup_alerts(self, ctx: AlertContext) -> List[CriticalAlert]:
         """Gera alertas de backup e segurança dos dados"""
         alertas = []
         
         try:
             # Verificar se há backup recente (simulado)
             # Em uma implementação real, verificaria logs de backup
-            ultima_backup = datetime.now() - timedelta(days=3)  # Simular último backup há 3 dias
-            dias_sem_backup = (datetime.now() - ultima_backup).days
+            ultima_backup = ctx.hoje - timedelta(days=3)  # Simular último backup há 3 dias
+            dias_sem_backup = (ctx.hoje - ultima_backup).days
             
             if dias_sem_backup > 7:
                 alertas.append(CriticalAlert(
@@ -658,7 +761,7 @@ class CriticalAlertsService:
                         'status_backup': 'atrasado'
                     },
                     dias_restantes=None,
-                    timestamp=datetime.now(),
+                    timestamp=ctx.hoje,
                     prioridade=2
                 ))
                 
@@ -681,9 +784,11 @@ class CriticalAlertsService:
         # Ordenar por nível (crítico primeiro) e depois por prioridade
         return sorted(alertas, key=lambda x: (nivel_order[x.nivel], x.prioridade))
     
-    def _generate_summary(self, alertas: List[CriticalAlert]) -> Dict:
-        """Gera resumo dos alertas"""
+    def _generate_summary(self, alertas: List[CriticalAlert], tempos: Dict[str, float] = None,
+                          tempo_contexto: float = None) -> Dict:
+        """Gera resumo dos alertas (inclui tempo de cada gerador, em ms)"""
         hoje = datetime.now()
+        tempos = tempos or {}
         dias_visitas = (self.DEADLINE_VISITAS_P1_P2 - hoje).days
         dias_questionarios = (self.DEADLINE_QUESTIONARIOS - hoje).days
         
@@ -697,7 +802,13 @@ class CriticalAlertsService:
             'dias_ate_deadline_questionarios': dias_questionarios,
             'status_sistema': self._calculate_system_status(alertas),
             'alertas_por_tipo': self._count_alerts_by_type(alertas),
-            'municipios_com_alertas': len(set([a.municipio for a in alertas if a.municipio not in ['TODOS', 'GERAL', 'MULTIPLOS', 'PROJETO', 'EQUIPE', 'SISTEMA']]))
+            'municipios_com_alertas': len(set([a.municipio for a in alertas if a.municipio not in ['TODOS', 'GERAL', 'MULTIPLOS', 'PROJETO', 'EQUIPE', 'SISTEMA']])),
+            'tempo_contexto_ms': round(tempo_contexto, 1) if tempo_contexto is not None else None,
+            'tempo_geradores_ms': {nome: round(ms, 1) for nome, ms in tempos.items()},
+            'geradores_lentos': sorted(
+                [nome for nome, ms in tempos.items() if ms > LIMITE_GERADOR_LENTO_MS],
+                key=lambda nome: -tempos[nome]
+            )
         }
     
     def _calculate_system_status(self, alertas: List[CriticalAlert]) -> str:
@@ -3,20 +3,45 @@ Sistema de Dashboard Preditivo PNSB 2024
 Análise preditiva com IA para projeção de prazos, identificação de riscos e alertas críticos
 """
 
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+from functools import wraps
 import numpy as np
 from typing import Dict, List, Tuple, Any
+from flask import g, has_request_context
 from sqlalchemy import func, and_, or_
 from ..models.agendamento import Visita
 from ..models.checklist import Checklist
 from ..models.questionarios_obrigatorios import EntidadeIdentificada, ProgressoQuestionarios
 from ..models.contatos import Contato
+from ..models.progresso_diario import ProgressoDiario
 from .. import db
 import json
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Colunas do ledger diário (ordem das linhas da matriz da série)
+CAMPOS_LEDGER = (
+    'visitas_finalizadas', 'p1p2_concluidas', 'questionarios_concluidos',
+    'total_visitas', 'total_p1p2', 'total_questionarios'
+)
+
+# Janela das taxas recentes (dias)
+JANELA_TENDENCIA_DIAS = 7
+
+
+def _memo_por_requisicao(metodo):
+    """Memoiza o resultado do método durante a requisição atual (fora dela, calcula sempre)"""
+    @wraps(metodo)
+    def wrapper(self):
+        if not has_request_context():
+            return metodo(self)
+        memo = g.setdefault('_dashboard_preditivo_memo', {})
+        if metodo.__name__ not in memo:
+            memo[metodo.__name__] = metodo(self)
+        return memo[metodo.__name__]
+    return wrapper
+
 class DashboardPreditivo:
     """Sistema inteligente de análise preditiva para PNSB 2024"""
     
@@ -85,38 +110,11 @@ class DashboardPreditivo:
         dias_p1_p2 = (self.prazo_p1_p2 - hoje).days
         dias_questionarios = (self.prazo_questionarios - hoje).days
         
-        # Análise de progresso atual
-        total_visitas = Visita.query.count()
-        visitas_concluidas = Visita.query.filter_by(status='finalizada').count()
-        progresso_visitas = (visitas_concluidas / total_visitas * 100) if total_visitas > 0 else 0
-        
-        # Entidades P1/P2
-        entidades_p1_p2 = EntidadeIdentificada.query.filter(
-            EntidadeIdentificada.prioridade.in_([1, 2])
-        ).count()
-        entidades_p1_p2_concluidas = EntidadeIdentificada.query.filter(
-            and_(
-                EntidadeIdentificada.prioridade.in_([1, 2]),
-                EntidadeIdentificada.status_mrs == 'validado_concluido',
-                EntidadeIdentificada.status_map == 'validado_concluido'
-            )
-        ).count()
-        progresso_p1_p2 = (entidades_p1_p2_concluidas / entidades_p1_p2 * 100) if entidades_p1_p2 > 0 else 0
-        
-        # Questionários
-        total_questionarios = EntidadeIdentificada.query.filter(
-            or_(
-                EntidadeIdentificada.mrs_obrigatorio == True,
-                EntidadeIdentificada.map_obrigatorio == True
-            )
-        ).count()
-        questionarios_concluidos = EntidadeIdentificada.query.filter(
-            or_(
-                EntidadeIdentificada.status_mrs == 'validado_concluido',
-                EntidadeIdentificada.status_map == 'validado_concluido'
-            )
-        ).count()
-        progresso_questionarios = (questionarios_concluidos / total_questionarios * 100) if total_questionarios > 0 else 0
+        # Análise de progresso atual (contadores do ledger)
+        atual = self._contadores_atuais()
+        progresso_visitas = self._percentual(atual['visitas_finalizadas'], atual['total_visitas'])
+        progresso_p1_p2 = self._percentual(atual['p1p2_concluidas'], atual['total_p1p2'])
+        progresso_questionarios = self._percentual(atual['questionarios_concluidos'], atual['total_questionarios'])
         
         # Projeção de cumprimento
         velocidade_diaria = self._calcular_velocidade_diaria()
@@ -159,6 +157,7 @@ class DashboardPreditivo:
             }
         }
     
+    @_memo_por_requisicao
     def _identificar_riscos(self) -> List[Dict[str, Any]]:
         """Identifica riscos ao projeto usando análise preditiva"""
         riscos = []
@@ -307,8 +306,9 @@ class DashboardPreditivo:
         
         # Projetar próximas 4 semanas
         projecao_proximas_semanas = []
-        total_visitas = Visita.query.count()
-        visitas_concluidas_atual = Visita.query.filter_by(status='finalizada').count()
+        atual = self._contadores_atuais()
+        total_visitas = atual['total_visitas']
+        visitas_concluidas_atual = atual['visitas_finalizadas']
         
         for i in range(4):
             semana_futura = i + 5  # Continuando da semana 5
@@ -345,6 +345,7 @@ class DashboardPreditivo:
             }
         }
     
+    @_memo_por_requisicao
     def _gerar_alertas_criticos(self) -> List[Dict[str, Any]]:
         """Gera alertas críticos que requerem ação imediata"""
         alertas = []
@@ -432,8 +433,9 @@ class DashboardPreditivo:
             })
         
         # Alerta 5: Taxa de sucesso baixa
-        total_visitas = Visita.query.count()
-        visitas_finalizadas = Visita.query.filter_by(status='finalizada').count()
+        atual = self._contadores_atuais()
+        total_visitas = atual['total_visitas']
+        visitas_finalizadas = atual['visitas_finalizadas']
         taxa_sucesso = (visitas_finalizadas / total_visitas * 100) if total_visitas > 0 else 0
         
         if taxa_sucesso < 50 and total_visitas > 10:
@@ -458,62 +460,90 @@ class DashboardPreditivo:
         
         return alertas
     
+    @_memo_por_requisicao
+    def _serie_progresso(self) -> Dict[str, Any]:
+        """
+        Série diária dos contadores do ledger, somada entre municípios.
+        
+        Dias sem linha herdam o último valor do município (forward-fill);
+        o custo é O(dias x municípios), sem consultas às tabelas de origem.
+        """
+        linhas = ProgressoDiario.carregar_serie()
+        hoje = date.today()
+        
+        if not linhas:
+            return {'inicio': hoje, 'dias': 1, 'valores': np.zeros((len(CAMPOS_LEDGER), 1))}
+        
+        inicio = linhas[0].dia
+        dias = max((hoje - inicio).days, (linhas[-1].dia - inicio).days) + 1
+        municipios = {m: k for k, m in enumerate(sorted({linha.municipio for linha in linhas}))}
+        
+        matriz = np.full((len(CAMPOS_LEDGER), len(municipios), dias), np.nan)
+        for linha in linhas:
+            matriz[:, municipios[linha.municipio], (linha.dia - inicio).days] = [
+                getattr(linha, campo) for campo in CAMPOS_LEDGER
+            ]
+        
+        # Forward-fill ao longo dos dias; antes da primeira linha do município vale 0
+        posicoes = np.where(np.isnan(matriz), 0, np.arange(dias))
+        np.maximum.accumulate(posicoes, axis=2, out=posicoes)
+        preenchida = np.take_along_axis(matriz, posicoes, axis=2)
+        
+        return {
+            'inicio': inicio,
+            'dias': dias,
+            'valores': np.nan_to_num(preenchida, nan=0.0).sum(axis=1)
+        }
+    
+    def _contadores_atuais(self) -> Dict[str, int]:
+        """Último valor de cada contador do ledger"""
+        valores = self._serie_progresso()['valores'][:, -1]
+        return {campo: int(valor) for campo, valor in zip(CAMPOS_LEDGER, valores)}
+    
+    def _taxa_janela(self, campo: str, total: int, janela: int = JANELA_TENDENCIA_DIAS) -> float:
+        """Pontos percentuais por dia nos últimos `janela` dias (limitado ao histórico do ledger)"""
+        serie = self._serie_progresso()['valores'][CAMPOS_LEDGER.index(campo)]
+        janela = min(janela, len(serie) - 1)
+        if janela <= 0 or total <= 0:
+            return 0.0
+        return (serie[-1] - serie[-1 - janela]) / total * 100 / janela
+    
+    @staticmethod
+    def _percentual(parte: int, total: int) -> float:
+        return (parte / total * 100) if total > 0 else 0
+    
+    @_memo_por_requisicao
     def _calcular_velocidade_progresso(self) -> Dict[str, float]:
-        """Calcula velocidade de progresso em diferentes métricas"""
+        """Calcula velocidade de progresso em diferentes métricas (a partir do ledger diário)"""
         hoje = datetime.now()
         inicio_projeto = datetime(2025, 1, 1)  # Ajustar conforme data real
         dias_decorridos = max((hoje - inicio_projeto).days, 1)
+        atual = self._contadores_atuais()
         
         # Velocidade geral
-        total_visitas = Visita.query.count()
-        visitas_concluidas = Visita.query.filter_by(status='finalizada').count()
-        progresso_visitas = (visitas_concluidas / total_visitas * 100) if total_visitas > 0 else 0
+        progresso_visitas = self._percentual(atual['visitas_finalizadas'], atual['total_visitas'])
         velocidade_geral = progresso_visitas / dias_decorridos
         
         # Velocidade P1/P2
-        entidades_p1_p2 = EntidadeIdentificada.query.filter(
-            EntidadeIdentificada.prioridade.in_([1, 2])
-        ).count()
-        entidades_p1_p2_concluidas = EntidadeIdentificada.query.filter(
-            and_(
-                EntidadeIdentificada.prioridade.in_([1, 2]),
-                EntidadeIdentificada.status_mrs == 'validado_concluido',
-                EntidadeIdentificada.status_map == 'validado_concluido'
-            )
-        ).count()
-        progresso_p1_p2 = (entidades_p1_p2_concluidas / entidades_p1_p2 * 100) if entidades_p1_p2 > 0 else 0
+        progresso_p1_p2 = self._percentual(atual['p1p2_concluidas'], atual['total_p1p2'])
         velocidade_p1_p2 = progresso_p1_p2 / dias_decorridos
         
         # Velocidade questionários
-        total_questionarios = EntidadeIdentificada.query.filter(
-            or_(
-                EntidadeIdentificada.mrs_obrigatorio == True,
-                EntidadeIdentificada.map_obrigatorio == True
-            )
-        ).count()
-        questionarios_concluidos = EntidadeIdentificada.query.filter(
-            or_(
-                EntidadeIdentificada.status_mrs == 'validado_concluido',
-                EntidadeIdentificada.status_map == 'validado_concluido'
-            )
-        ).count()
-        progresso_questionarios = (questionarios_concluidos / total_questionarios * 100) if total_questionarios > 0 else 0
+        progresso_questionarios = self._percentual(atual['questionarios_concluidos'], atual['total_questionarios'])
         velocidade_questionarios = progresso_questionarios / dias_decorridos
         
-        # Velocidade últimos 7 dias
-        visitas_ultimos_7_dias = Visita.query.filter(
-            and_(
-                Visita.data >= (hoje - timedelta(days=7)).date(),
-                Visita.status == 'finalizada'
-            )
-        ).count()
-        velocidade_semanal = (visitas_ultimos_7_dias / total_visitas * 100 * 7) if total_visitas > 0 else 0
+        # Velocidade últimos 7 dias (diferença dos contadores acumulados na janela)
+        velocidade_semanal = self._taxa_janela('visitas_finalizadas', atual['total_visitas'])
         
         return {
             'geral': round(velocidade_geral, 2),
             'p1_p2': round(velocidade_p1_p2, 2),
             'questionarios': round(velocidade_questionarios, 2),
             'semanal': round(velocidade_semanal, 2),
+            'semanal_p1_p2': round(self._taxa_janela('p1p2_concluidas', atual['total_p1p2']), 2),
+            'semanal_questionarios': round(
+                self._taxa_janela('questionarios_concluidos', atual['total_questionarios']), 2
+            ),
             'interpretacao': self._interpretar_velocidade(velocidade_geral)
         }
     
@@ -543,9 +573,9 @@ class DashboardPreditivo:
         hoje = datetime.now()
         
         # Previsão para visitas
-        total_visitas = Visita.query.count()
-        visitas_concluidas = Visita.query.filter_by(status='finalizada').count()
-        visitas_restantes = total_visitas - visitas_concluidas
+        atual = self._contadores_atuais()
+        total_visitas = atual['total_visitas']
+        visitas_restantes = total_visitas - atual['visitas_finalizadas']
         
         if velocidade['geral'] > 0:
             dias_necessarios_visitas = (visitas_restantes / total_visitas * 100) / velocidade['geral']
@@ -555,18 +585,8 @@ class DashboardPreditivo:
             data_conclusao_visitas = None
         
         # Previsão para P1/P2
-        entidades_p1_p2 = EntidadeIdentificada.query.filter(
-            EntidadeIdentificada.prioridade.in_([1, 2])
-        ).count()
-        entidades_p1_p2_pendentes = EntidadeIdentificada.query.filter(
-            and_(
-                EntidadeIdentificada.prioridade.in_([1, 2]),
-                or_(
-                    EntidadeIdentificada.status_mrs != 'validado_concluido',
-                    EntidadeIdentificada.status_map != 'validado_concluido'
-                )
-            )
-        ).count()
+        entidades_p1_p2 = atual['total_p1p2']
+        entidades_p1_p2_pendentes = entidades_p1_p2 - atual['p1p2_concluidas']
         
         if velocidade['p1_p2'] > 0 and entidades_p1_p2 > 0:
             progresso_restante_p1_p2 = (entidades_p1_p2_pendentes / entidades_p1_p2 * 100)
@@ -611,9 +631,8 @@ class DashboardPreditivo:
         dias_ate_final = (self.prazo_final_pnsb - hoje).days
         
         # Calcular progresso restante
-        total_visitas = Visita.query.count()
-        visitas_concluidas = Visita.query.filter_by(status='finalizada').count()
-        progresso_atual = (visitas_concluidas / total_visitas * 100) if total_visitas > 0 else 0
+        atual = self._contadores_atuais()
+        progresso_atual = self._percentual(atual['visitas_finalizadas'], atual['total_visitas'])
         progresso_restante = 100 - progresso_atual
         
         velocidade_ideal = {
@@ -760,9 +779,8 @@ class DashboardPreditivo:
         score_alertas = max(0, 100 - len([a for a in alertas if a['nivel'] == 'critico']) * 30)
         
         # Progresso geral
-        total_visitas = Visita.query.count()
-        visitas_concluidas = Visita.query.filter_by(status='finalizada').count()
-        score_progresso = (visitas_concluidas / total_visitas * 100) if total_visitas > 0 else 0
+        atual = self._contadores_atuais()
+        score_progresso = self._percentual(atual['visitas_finalizadas'], atual['total_visitas'])
         
         # Score final (média ponderada)
         score_final = (
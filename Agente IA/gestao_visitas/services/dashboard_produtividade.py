@@ -15,6 +15,8 @@ from collections import defaultdict, Counter
 from dataclasses import dataclass
 from enum import Enum
 import math
+import numpy as np
+import pandas as pd
 
 class NivelPesquisador(Enum):
     INICIANTE = "iniciante"
@@ -44,6 +46,14 @@ class MetricaPesquisador:
     badges: List[str]
     tendencia_performance: str  # 'subindo', 'estavel', 'descendo'
 
+# Colunas carregadas de uma só vez para o dashboard da equipe
+COLUNAS_VISITA_EQUIPE = (
+    'id', 'municipio', 'data', 'hora_inicio', 'hora_fim', 'local', 'tipo_pesquisa',
+    'status', 'observacoes', 'pesquisador_responsavel'
+)
+STATUS_CANCELADOS = ('cancelada', 'não realizada')
+DIAS_SEMANA = ['segunda', 'terca', 'quarta', 'quinta', 'sexta', 'sabado', 'domingo']
+
 class DashboardProdutividade:
     """Dashboard avançado de produtividade e performance dos pesquisadores"""
     
@@ -195,24 +205,28 @@ class DashboardProdutividade:
             return {'erro': str(e), 'pesquisador_id': pesquisador_id}
 
     def gerar_dashboard_equipe_completo(self, periodo_dias: int = 30) -> Dict:
-        """Gera dashboard completo da equipe com analytics avançados"""
+        """
+        Gera dashboard completo da equipe com analytics avançados.
+        
+        Uma única consulta carrega as visitas num DataFrame; métricas por
+        pesquisador, rankings e recortes temporais saem de groupby.
+        """
         try:
-            # Obter todos os pesquisadores únicos
-            pesquisadores = self._obter_lista_pesquisadores()
+            data_inicio = date.today() - timedelta(days=periodo_dias)
             
-            if not pesquisadores:
-                # Simular dados para teste
-                pesquisadores = ['Pesquisador A', 'Pesquisador B', 'Pesquisador C']
+            # Todas as visitas (pontuação é histórica) e recorte do período
+            df_visitas = self._carregar_visitas_dataframe()
+            df_periodo = df_visitas[df_visitas['data'] >= pd.Timestamp(data_inicio)]
+            df_periodo = df_periodo[df_periodo['pesquisador'].notna()]
             
             # Métricas individuais de todos
-            metricas_equipe = []
-            for pesquisador in pesquisadores:
-                metricas = self.obter_metricas_individuais_avancadas(pesquisador, periodo_dias)
-                if 'erro' not in metricas:
-                    metricas_equipe.append(metricas)
+            metricas_equipe = self._calcular_metricas_equipe_vetorizado(
+                df_visitas, df_periodo, data_inicio, periodo_dias
+            )
+            pesquisadores = [m['pesquisador_id'] for m in metricas_equipe]
             
             # Analytics da equipe
-            analytics_equipe = self._calcular_analytics_equipe(metricas_equipe)
+            analytics_equipe = self._calcular_analytics_equipe(df_periodo, metricas_equipe)
             
             # Rankings e comparativos
             rankings = self._gerar_rankings_detalhados(metricas_equipe)
@@ -566,6 +580,238 @@ class DashboardProdutividade:
             }
         }
 
+    # Caminho vetorizado do dashboard da equipe
+
+    def _carregar_visitas_dataframe(self) -> pd.DataFrame:
+        """Visitas em colunas (uma consulta) com campos derivados para groupby"""
+        colunas = [getattr(Visita, c) for c in COLUNAS_VISITA_EQUIPE]
+        linhas = db.session.query(*colunas).yield_per(1000)
+        df = pd.DataFrame.from_records(list(linhas), columns=list(COLUNAS_VISITA_EQUIPE))
+        
+        df['data'] = pd.to_datetime(df['data'])
+        observacoes = df['observacoes'].fillna('')
+        
+        # Responsável explícito; senão o nome após "Pesquisador" nas observações
+        extraido = observacoes.str.extract(r'Pesquisador\s*(\S+)', expand=False)
+        responsavel = df['pesquisador_responsavel'].replace('', np.nan)
+        df['pesquisador'] = responsavel.fillna(extraido)
+        
+        df['realizada'] = df['status'] == 'realizada'
+        df['cancelada'] = df['status'].isin(STATUS_CANCELADOS)
+        
+        inicio = pd.to_timedelta(df['hora_inicio'].astype(str), errors='coerce')
+        fim = pd.to_timedelta(df['hora_fim'].astype(str), errors='coerce')
+        df['duracao_min'] = (fim - inicio).dt.total_seconds() / 60
+        df['hora'] = inicio.dt.total_seconds() // 3600
+        
+        observacoes_lower = observacoes.str.lower()
+        df['primeira_tentativa'] = observacoes_lower.str.contains('primeira tentativa', regex=False)
+        df['informante_dificil'] = observacoes_lower.str.contains('dificil', regex=False)
+        return df
+
+    def _calcular_metricas_equipe_vetorizado(self, df_visitas: pd.DataFrame, df_periodo: pd.DataFrame,
+                                             data_inicio: date, periodo_dias: int) -> List[Dict]:
+        """Métricas de todos os pesquisadores a partir de agregações por grupo"""
+        if df_periodo.empty:
+            return []
+        
+        grupos = df_periodo.groupby('pesquisador')
+        basicas = grupos.agg(
+            total_visitas=('id', 'size'),
+            visitas_realizadas=('realizada', 'sum'),
+            visitas_canceladas=('cancelada', 'sum'),
+            dias_unicos=('data', 'nunique')
+        )
+        basicas['municipios_visitados'] = (
+            df_periodo[df_periodo['realizada']].groupby('pesquisador')['municipio'].nunique()
+        )
+        
+        validas = df_periodo[df_periodo['realizada'] & df_periodo['duracao_min'].between(10, 180)]
+        basicas['tempo_medio'] = validas.groupby('pesquisador')['duracao_min'].agg(self._media_sem_outliers)
+        basicas = basicas.fillna({'municipios_visitados': 0, 'tempo_medio': 45.0})
+        
+        distribuicao_status = self._contagens_aninhadas(df_periodo, 'status')
+        cobertura_tipos = self._contagens_aninhadas(df_periodo, 'tipo_pesquisa')
+        temporal = self._analise_temporal_por_pesquisador(df_periodo)
+        pontuacoes = self._pontuacao_por_pesquisador(df_visitas)
+        eficiencia = self._analisar_eficiencia_detalhada([])
+        
+        metricas_equipe = []
+        for pesquisador, linha in basicas.iterrows():
+            total = int(linha['total_visitas'])
+            realizadas = int(linha['visitas_realizadas'])
+            metricas_basicas = {
+                'total_visitas': total,
+                'visitas_realizadas': realizadas,
+                'visitas_canceladas': int(linha['visitas_canceladas']),
+                'taxa_sucesso_percent': round(realizadas / total * 100, 2) if total else 0,
+                'municipios_visitados': int(linha['municipios_visitados']),
+                'tempo_medio_visita_minutos': float(linha['tempo_medio']),
+                'produtividade_diaria': round(total / linha['dias_unicos'], 2) if linha['dias_unicos'] else 0,
+                'distribuicao_status': distribuicao_status.get(pesquisador, {}),
+                'tipos_pesquisa_cobertura': cobertura_tipos.get(pesquisador, {})
+            }
+            analise_temporal = temporal.get(pesquisador, {})
+            score_qualidade = self._calcular_score_qualidade_geral(metricas_basicas, eficiencia)
+            pontuacao = int(pontuacoes.get(pesquisador, 0))
+            
+            metricas_equipe.append({
+                'pesquisador_id': pesquisador,
+                'periodo_analise': {
+                    'data_inicio': data_inicio.isoformat(),
+                    'data_fim': date.today().isoformat(),
+                    'dias_analisados': periodo_dias
+                },
+                'metricas_basicas': metricas_basicas,
+                'score_qualidade_geral': score_qualidade,
+                'classificacao_performance': self._classificar_performance(score_qualidade),
+                'analise_temporal_avancada': analise_temporal,
+                'analise_eficiencia': eficiencia,
+                'pontuacao_total': pontuacao,
+                'nivel': self._determinar_nivel_pesquisador(pontuacao).value,
+                'recomendacoes_ia': self._gerar_recomendacoes_ia(metricas_basicas, analise_temporal, eficiencia)
+            })
+        
+        return metricas_equipe
+
+    def _media_sem_outliers(self, tempos) -> float:
+        """Média das durações com corte por IQR (quartis exclusivos, como statistics.quantiles)"""
+        tempos = np.asarray(tempos, dtype=float)
+        if tempos.size == 0:
+            return 45.0  # Valor padrão
+        if tempos.size >= 4:
+            q1, q3 = np.quantile(tempos, [0.25, 0.75], method='weibull')
+            iqr = q3 - q1
+            tempos = tempos[(tempos >= q1 - 1.5 * iqr) & (tempos <= q3 + 1.5 * iqr)]
+        return round(float(tempos.mean()), 1)
+
+    def _contagens_aninhadas(self, df: pd.DataFrame, coluna: str) -> Dict[str, Dict[str, int]]:
+        """{pesquisador: {valor: contagem}} com um único groupby"""
+        contagens = df.groupby(['pesquisador', coluna]).size()
+        resultado = defaultdict(dict)
+        for (pesquisador, valor), total in contagens.items():
+            resultado[pesquisador][valor] = int(total)
+        return resultado
+
+    def _resumo_por_chave(self, df: pd.DataFrame, chave: pd.Series) -> Dict[str, Dict[str, Dict]]:
+        """{pesquisador: {chave: {total, realizadas, taxa_sucesso}}}"""
+        agregado = df.groupby([df['pesquisador'], chave.rename('chave')]).agg(
+            total=('id', 'size'), realizadas=('realizada', 'sum')
+        )
+        resultado = defaultdict(dict)
+        for (pesquisador, valor), linha in agregado.iterrows():
+            total, realizadas = int(linha['total']), int(linha['realizadas'])
+            resultado[pesquisador][valor] = {
+                'total': total,
+                'realizadas': realizadas,
+                'taxa_sucesso': round(realizadas / total * 100, 1) if total else 0
+            }
+        return resultado
+
+    def _analise_temporal_por_pesquisador(self, df: pd.DataFrame) -> Dict[str, Dict]:
+        """Recortes por dia da semana, período do dia e mês para todos os pesquisadores"""
+        dia_semana = df['data'].dt.dayofweek.map(dict(enumerate(DIAS_SEMANA)))
+        periodo = pd.Series(
+            np.select([df['hora'] < 12, df['hora'] < 18], ['manha', 'tarde'], default='noite'),
+            index=df.index
+        ).where(df['hora'].notna(), 'indefinido')
+        mes = df['data'].dt.strftime('%Y-%m')
+        
+        semanal = self._resumo_por_chave(df, dia_semana)
+        por_periodo = self._resumo_por_chave(df, periodo)
+        mensal = self._resumo_por_chave(df, mes)
+        
+        def melhor(resumo):
+            if not resumo:
+                return None
+            return max(resumo, key=lambda k: (resumo[k]['taxa_sucesso'], resumo[k]['total']))
+        
+        temporal = {}
+        for pesquisador in df['pesquisador'].unique():
+            periodos = dict(por_periodo.get(pesquisador, {}))
+            melhor_periodo = melhor(periodos)
+            melhor_dia = melhor(semanal.get(pesquisador, {}))
+            periodos['melhor_periodo'] = melhor_periodo
+            temporal[pesquisador] = {
+                'performance_semanal': semanal.get(pesquisador, {}),
+                'performance_por_periodo': periodos,
+                'sazonalidade_mensal': mensal.get(pesquisador, {}),
+                'recomendacoes_timing': {
+                    'melhor_periodo': melhor_periodo,
+                    'melhor_dia_semana': melhor_dia
+                } if melhor_periodo else {}
+            }
+        return temporal
+
+    def _pontuacao_por_pesquisador(self, df: pd.DataFrame) -> pd.Series:
+        """Mesma regra de _calcular_pontuacao_total, para todos os pesquisadores de uma vez"""
+        df = df[df['pesquisador'].notna() & df['realizada']]
+        if df.empty:
+            return pd.Series(dtype=int)
+        pontos = (
+            self.sistema_pontuacao['visita_realizada']
+            + df['primeira_tentativa'] * self.sistema_pontuacao['visita_primeira_tentativa']
+            + df['informante_dificil'] * self.sistema_pontuacao['informante_dificil_convertido']
+        )
+        por_pesquisador = pontos.groupby(df['pesquisador']).sum()
+        realizadas = df.groupby('pesquisador').size()
+        bonus = (realizadas >= 100) * self.sistema_pontuacao['meta_mensal_atingida']
+        return por_pesquisador + bonus
+
+    def _calcular_analytics_equipe(self, df_periodo: pd.DataFrame, metricas_equipe: List[Dict]) -> Dict:
+        """Indicadores agregados da equipe no período"""
+        if df_periodo.empty:
+            return {'taxa_sucesso_media': 0, 'total_visitas_equipe': 0, 'pesquisadores_ativos': 0}
+        
+        realizadas = df_periodo[df_periodo['realizada']]
+        evolucao = df_periodo.groupby(df_periodo['data'].dt.date).agg(
+            total=('id', 'size'), realizadas=('realizada', 'sum')
+        )
+        scores = [m['score_qualidade_geral'] for m in metricas_equipe]
+        
+        return {
+            'taxa_sucesso_media': round(float(df_periodo['realizada'].mean() * 100), 2),
+            'total_visitas_equipe': int(len(df_periodo)),
+            'visitas_realizadas_equipe': int(len(realizadas)),
+            'pesquisadores_ativos': int(df_periodo['pesquisador'].nunique()),
+            'municipios_cobertos': int(realizadas['municipio'].nunique()),
+            'eficiencia_media': round(float(np.mean(scores)), 1) if scores else 0,
+            'ranking_produtividade': [
+                {'pesquisador': m['pesquisador_id'], 'visitas_realizadas': m['metricas_basicas']['visitas_realizadas']}
+                for m in sorted(metricas_equipe, key=lambda m: -m['metricas_basicas']['visitas_realizadas'])
+            ],
+            'evolucao_temporal': [
+                {'data': dia.isoformat(), 'total': int(linha['total']), 'realizadas': int(linha['realizadas'])}
+                for dia, linha in evolucao.iterrows()
+            ],
+            'cobertura_municipios': {
+                municipio: int(total) for municipio, total in realizadas.groupby('municipio').size().items()
+            }
+        }
+
+    def _gerar_rankings_detalhados(self, metricas_equipe: List[Dict]) -> Dict:
+        """Posição de cada pesquisador em cada critério (rank denso, maior é melhor)"""
+        if not metricas_equipe:
+            return {}
+        tabela = pd.DataFrame([{
+            'pesquisador': m['pesquisador_id'],
+            'score_qualidade': m['score_qualidade_geral'],
+            'taxa_sucesso': m['metricas_basicas']['taxa_sucesso_percent'],
+            'visitas_realizadas': m['metricas_basicas']['visitas_realizadas'],
+            'municipios_visitados': m['metricas_basicas']['municipios_visitados'],
+            'pontuacao_total': m.get('pontuacao_total', 0)
+        } for m in metricas_equipe]).set_index('pesquisador')
+        
+        posicoes = tabela.rank(ascending=False, method='dense').astype(int)
+        rankings = {}
+        for criterio in tabela.columns:
+            ordem = posicoes[criterio].sort_values(kind='stable')
+            rankings[criterio] = [
+                {'pesquisador': p, 'posicao': int(posicao), 'valor': tabela.at[p, criterio].item()}
+                for p, posicao in ordem.items()
+            ]
+        return rankings
+
     # Métodos auxiliares de suporte (implementações básicas)
     
     def _obter_lista_pesquisadores(self) -> List[str]:
@@ -604,18 +850,8 @@ class DashboardProdutividade:
                 except:
                     continue
         
-        if tempos_validos:
-            # Remover outliers usando IQR
-            if len(tempos_validos) >= 4:
-                q1 = statistics.quantiles(tempos_validos, n=4)[0]
-                q3 = statistics.quantiles(tempos_validos, n=4)[2]
-                iqr = q3 - q1
-                tempos_filtrados = [t for t in tempos_validos if q1 - 1.5*iqr <= t <= q3 + 1.5*iqr]
-                return round(statistics.mean(tempos_filtrados), 1)
-            else:
-                return round(statistics.mean(tempos_validos), 1)
-        
-        return 45.0  # Valor padrão
+        # Remover outliers usando IQR
+        return self._media_sem_outliers(tempos_validos)
 
     def _determinar_nivel_pesquisador(self, pontuacao: int) -> NivelPesquisador:
         """Determina nível do pesquisador baseado na pontuação"""
@@ -666,8 +902,6 @@ class DashboardProdutividade:
     def _classificar_performance(self, score): return 'Bom' if score >= 70 else 'Regular'
     def _gerar_alertas_performance(self, metricas, previsoes): return []
     def _gerar_insights_personalizados(self, visitas, padroes): return []
-    def _calcular_analytics_equipe(self, metricas_equipe): return {'taxa_sucesso_media': 75}
-    def _gerar_rankings_detalhados(self, metricas_equipe): return []
     def _analisar_distribuicao_equipe(self, metricas_equipe): return {}
     def _identificar_trends_equipe(self, metricas_equipe, periodo): return {}
     def _gerar_insights_colaborativos(self, metricas_equipe): return []
@@ -0,0 +1,512 @@
+"""
+Deduplicação de contatos por record linkage
+Normalização única, geração de candidatos por chaves de bloqueio + MinHash/LSH
+e pontuação Jaro-Winkler apenas dos pares candidatos
+"""
+
+import logging
+import re
+import threading
+import unicodedata
+import zlib
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Imports opcionais com fallback
+try:
+    from rapidfuzz.distance import JaroWinkler
+    from rapidfuzz import process as rf_process
+    RAPIDFUZZ_AVAILABLE = hasattr(rf_process, 'cpdist')
+except ImportError:
+    RAPIDFUZZ_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# MinHash/LSH: 16 bandas x 4 linhas -> limiar de Jaccard ~0.5 nos trigramas do nome
+NUM_PERMUTACOES = 64
+BANDAS = 16
+LINHAS_POR_BANDA = NUM_PERMUTACOES // BANDAS
+
+# Blocos muito grandes (ex.: nome genérico) são comparados por janela deslizante
+LIMITE_BLOCO = 100
+JANELA_BLOCO = 10
+
+# Pares com Jaccard estimado (MinHash) abaixo disso não chegam ao Jaro-Winkler,
+# exceto quando telefone ou e-mail coincidem
+JACCARD_MINIMO = 0.3
+
+# Pesos dos campos no score final (normalizados pelos campos presentes nos dois lados)
+PESOS_CAMPOS = {'nome': 0.5, 'telefone': 0.3, 'email': 0.2}
+
+PALAVRAS_IGNORADAS = {'sr', 'sra', 'dr', 'dra', 'prof', 'profa', 'eng', 'de', 'da', 'do', 'das', 'dos', 'e'}
+
+_RE_EMAIL = re.compile(r'[\w.+-]+@[\w-]+(?:\.[\w-]+)+')
+_RE_TELEFONE = re.compile(r'(?:\+?55\s*)?(?:\(?\d{2}\)?\s*)?9?\d{4}[\s.-]?\d{4}')
+
+_REGRAS_FONETICAS = [
+    (re.compile(r'ph'), 'f'), (re.compile(r'lh'), 'l'), (re.compile(r'nh'), 'n'),
+    (re.compile(r'[cs]h'), 'x'), (re.compile(r'sc(?=[ei])'), 's'), (re.compile(r'c(?=[ei])'), 's'),
+    (re.compile(r'[gq]u(?=[ei])'), lambda m: 'g' if m.group(0)[0] == 'g' else 'k'),
+    (re.compile(r'g(?=[ei])'), 'j'), (re.compile(r'[cq]'), 'k'), (re.compile(r'w'), 'v'),
+    (re.compile(r'y'), 'i'), (re.compile(r'z'), 's'), (re.compile(r'h'), ''),
+]
+
+# Parâmetros determinísticos das permutações (mesmos valores em todo processo)
+_rng = np.random.RandomState(20240701)
+_PERM_A = _rng.randint(0, 1 << 63, size=NUM_PERMUTACOES, dtype=np.int64).astype(np.uint64) * np.uint64(2) + np.uint64(1)
+_PERM_B = _rng.randint(0, 1 << 63, size=NUM_PERMUTACOES, dtype=np.int64).astype(np.uint64)
+_MULT_BANDA = (_rng.randint(1, 1 << 62, size=LINHAS_POR_BANDA, dtype=np.int64).astype(np.uint64) | np.uint64(1))
+
+
+# ===== NORMALIZAÇÃO =====
+
+def _dobrar(texto: str) -> str:
+    """Minúsculas sem acentos"""
+    texto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+
+
+def normalizar_nome(nome: str) -> str:
+    tokens = re.sub(r'[^a-z ]+', ' ', _dobrar(nome)).split()
+    return ' '.join(t for t in tokens if t not in PALAVRAS_IGNORADAS)
+
+
+def normalizar_telefone(telefone: str) -> str:
+    """Últimos 8 dígitos (ignora DDI, DDD e nono dígito)"""
+    digitos = re.sub(r'\D', '', telefone or '')
+    return digitos[-8:] if len(digitos) >= 8 else ''
+
+
+def normalizar_email(email: str) -> str:
+    """'dominio|local' sem sufixo +tag"""
+    email = (email or '').strip().lower()
+    if '@' not in email:
+        return ''
+    local, dominio = email.rsplit('@', 1)
+    local = local.split('+', 1)[0]
+    return f"{dominio}|{local}" if local and dominio else ''
+
+
+def chave_fonetica(nome_normalizado: str) -> str:
+    """Chave fonética simplificada para português: primeiro + último nome"""
+    tokens = nome_normalizado.split()
+    if not tokens:
+        return ''
+
+    def codificar(token):
+        for regra, subst in _REGRAS_FONETICAS:
+            token = regra.sub(subst, token)
+        if not token:
+            return ''
+        corpo = re.sub(r'[aeiou]', '', token[1:])
+        codigo = token[0] + re.sub(r'(.)\1+', r'\1', corpo)
+        return codigo[:6]
+
+    partes = [codificar(tokens[0])]
+    if len(tokens) > 1:
+        partes.append(codificar(tokens[-1]))
+    return ':'.join(partes)
+
+
+def _shingles(nome_normalizado: str) -> List[int]:
+    texto = f" {nome_normalizado} "
+    return sorted({zlib.crc32(texto[i:i + 3].encode('utf-8')) for i in range(len(texto) - 2)})
+
+
+@dataclass
+class RegistroContato:
+    """Contato já normalizado (calculado uma única vez)"""
+    id: int
+    municipio: str
+    nome: str
+    fonetica: str
+    telefone: str
+    email: str
+    shingles: List[int]
+
+
+def registro_de_campos(contato_id, municipio: str, nome: str = None, telefone: str = None,
+                       email: str = None, texto_contato: str = None) -> RegistroContato:
+    """Normaliza os campos; telefone/e-mail também são extraídos do texto livre de contato"""
+    if texto_contato:
+        if not email:
+            achado = _RE_EMAIL.search(texto_contato)
+            email = achado.group(0) if achado else None
+        if not telefone:
+            achado = _RE_TELEFONE.search(texto_contato)
+            telefone = achado.group(0) if achado else None
+
+    nome_norm = normalizar_nome(nome)
+    return RegistroContato(
+        id=contato_id,
+        municipio=municipio or '',
+        nome=nome_norm,
+        fonetica=chave_fonetica(nome_norm),
+        telefone=normalizar_telefone(telefone),
+        email=normalizar_email(email),
+        shingles=_shingles(nome_norm) if nome_norm else []
+    )
+
+
+def registro_de_contato(contato) -> RegistroContato:
+    return registro_de_campos(
+        contato.id,
+        contato.municipio,
+        nome=contato.nome or contato.responsavel_mais_provavel,
+        telefone=contato.telefone,
+        email=contato.email,
+        texto_contato=contato.contato_mais_provavel
+    )
+
+
+# ===== MINHASH / LSH =====
+
+def assinaturas_minhash(registros: List[RegistroContato], bloco_permutacoes: int = 8) -> np.ndarray:
+    """Assinaturas MinHash (n x NUM_PERMUTACOES) calculadas em lote com NumPy"""
+    n = len(registros)
+    assinaturas = np.full((n, NUM_PERMUTACOES), np.iinfo(np.uint64).max, dtype=np.uint64)
+
+    com_nome = [i for i, r in enumerate(registros) if r.shingles]
+    if not com_nome:
+        return assinaturas
+
+    tamanhos = np.array([len(registros[i].shingles) for i in com_nome])
+    hashes = np.fromiter(
+        (h for i in com_nome for h in registros[i].shingles),
+        dtype=np.uint64, count=int(tamanhos.sum())
+    )
+    inicios = np.concatenate(([0], np.cumsum(tamanhos)[:-1]))
+    linhas = np.array(com_nome)
+
+    # Processa poucas permutações por vez para limitar memória (blocos x total de shingles)
+    for p in range(0, NUM_PERMUTACOES, bloco_permutacoes):
+        a = _PERM_A[p:p + bloco_permutacoes, None]
+        b = _PERM_B[p:p + bloco_permutacoes, None]
+        # Hash multiply-shift: ((a*x + b) mod 2^64) >> 32, família universal para x de 32 bits
+        valores = (a * hashes[None, :] + b) >> np.uint64(32)
+        assinaturas[linhas, p:p + bloco_permutacoes] = np.minimum.reduceat(valores, inicios, axis=1).T
+
+    return assinaturas
+
+
+def hashes_bandas(assinaturas: np.ndarray) -> np.ndarray:
+    """Um hash uint64 por banda (n x BANDAS); aritmética modular 2^64"""
+    bandas = assinaturas.reshape(len(assinaturas), BANDAS, LINHAS_POR_BANDA)
+    with np.errstate(over='ignore'):
+        return (bandas * _MULT_BANDA).sum(axis=2, dtype=np.uint64)
+
+
+# ===== SIMILARIDADE =====
+
+def jaro_winkler(s1: str, s2: str, prefixo_peso: float = 0.1) -> float:
+    """Jaro-Winkler em Python puro (fallback quando rapidfuzz não está instalado)"""
+    if s1 == s2:
+        return 1.0 if s1 else 0.0
+    len1, len2 = len(s1), len(s2)
+    if not len1 or not len2:
+        return 0.0
+
+    janela = max(max(len1, len2) // 2 - 1, 0)
+    marcados1 = [False] * len1
+    marcados2 = [False] * len2
+    coincidencias = 0
+    for i, c in enumerate(s1):
+        for j in range(max(0, i - janela), min(len2, i + janela + 1)):
+            if not marcados2[j] and s2[j] == c:
+                marcados1[i] = marcados2[j] = True
+                coincidencias += 1
+                break
+    if not coincidencias:
+        return 0.0
+
+    transposicoes = 0
+    k = 0
+    for i in range(len1):
+        if marcados1[i]:
+            while not marcados2[k]:
+                k += 1
+            if s1[i] != s2[k]:
+                transposicoes += 1
+            k += 1
+
+    m = coincidencias
+    jaro = (m / len1 + m / len2 + (m - transposicoes / 2) / m) / 3
+
+    prefixo = 0
+    for c1, c2 in zip(s1[:4], s2[:4]):
+        if c1 != c2:
+            break
+        prefixo += 1
+    return jaro + prefixo * prefixo_peso * (1 - jaro)
+
+
+def jaro_winkler_pares(nomes1: List[str], nomes2: List[str]) -> np.ndarray:
+    """Jaro-Winkler elemento a elemento (vetorizado via rapidfuzz quando disponível)"""
+    if not nomes1:
+        return np.zeros(0)
+    if RAPIDFUZZ_AVAILABLE:
+        return np.asarray(rf_process.cpdist(
+            nomes1, nomes2, scorer=JaroWinkler.normalized_similarity, workers=-1
+        ), dtype=float)
+    return np.fromiter((jaro_winkler(a, b) for a, b in zip(nomes1, nomes2)), dtype=float, count=len(nomes1))
+
+
+def pontuar_pares(registros: List[RegistroContato], pares: np.ndarray) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """
+    Score ponderado dos pares candidatos (array k x 2 de índices).
+    Apenas campos preenchidos nos dois contatos entram no denominador.
+    """
+    if len(pares) == 0:
+        return np.zeros(0), {}
+
+    i, j = pares[:, 0], pares[:, 1]
+    nomes = np.array([r.nome for r in registros], dtype=object)
+    telefones = _codigos([r.telefone for r in registros])
+    emails = _codigos([r.email for r in registros])
+
+    sim_nome = jaro_winkler_pares(list(nomes[i]), list(nomes[j]))
+    tem_nome = (nomes[i] != '') & (nomes[j] != '')
+    tem_tel = (telefones[i] > 0) & (telefones[j] > 0)
+    tem_email = (emails[i] > 0) & (emails[j] > 0)
+    tel_igual = tem_tel & (telefones[i] == telefones[j])
+    email_igual = tem_email & (emails[i] == emails[j])
+
+    peso_total = (tem_nome * PESOS_CAMPOS['nome'] + tem_tel * PESOS_CAMPOS['telefone']
+                  + tem_email * PESOS_CAMPOS['email'])
+    pontos = (np.where(tem_nome, sim_nome, 0) * PESOS_CAMPOS['nome']
+              + tel_igual * PESOS_CAMPOS['telefone'] + email_igual * PESOS_CAMPOS['email'])
+    scores = np.divide(pontos, peso_total, out=np.zeros(len(pares)), where=peso_total > 0)
+
+    # Telefone ou e-mail idênticos são evidência forte mesmo com nomes grafados diferente
+    scores = np.maximum(scores, np.where(tel_igual | email_igual, 0.85, 0))
+
+    campos = {'nome': tem_nome & (sim_nome >= 0.9), 'telefone': tel_igual, 'email': email_igual}
+    return scores, campos
+
+
+# ===== GERAÇÃO DE CANDIDATOS =====
+
+def _chaves_bloqueio(registro: RegistroContato) -> List[str]:
+    chaves = []
+    if registro.telefone:
+        chaves.append(f"tel:{registro.telefone}")
+    if registro.email:
+        chaves.append(f"email:{registro.email}")
+    if registro.fonetica:
+        chaves.append(f"fon:{registro.municipio}:{registro.fonetica}")
+    return chaves
+
+
+def _codigos(valores: List[str]) -> np.ndarray:
+    """Código inteiro por valor distinto (0 reservado para vazio)"""
+    mapa = {'': 0}
+    return np.array([mapa.setdefault(v, len(mapa)) for v in valores], dtype=np.int64)
+
+
+def _pares_por_grupo(indices: np.ndarray, grupos: np.ndarray, rank_nome: np.ndarray) -> np.ndarray:
+    """
+    Todos os pares dentro de cada grupo, gerados de forma vetorizada.
+
+    Membros são ordenados por (grupo, nome) e pareados por deslocamento d;
+    grupos maiores que LIMITE_BLOCO só pareiam vizinhos até JANELA_BLOCO
+    (sorted neighborhood), evitando explosão quadrática em nomes genéricos.
+    """
+    if len(indices) < 2:
+        return np.zeros((0, 2), dtype=np.int64)
+
+    ordem = np.lexsort((rank_nome[indices], grupos))
+    indices, grupos = indices[ordem], grupos[ordem]
+    _, inverso, contagens = np.unique(grupos, return_inverse=True, return_counts=True)
+    tamanho = contagens[inverso]
+
+    pares = []
+    for d in range(1, LIMITE_BLOCO):
+        mesmo_grupo = grupos[d:] == grupos[:-d]
+        if not mesmo_grupo.any():
+            break
+        if d >= JANELA_BLOCO:
+            mesmo_grupo &= tamanho[d:] <= LIMITE_BLOCO
+        pares.append(np.stack([indices[:-d][mesmo_grupo], indices[d:][mesmo_grupo]], axis=1))
+
+    return np.concatenate(pares) if pares else np.zeros((0, 2), dtype=np.int64)
+
+
+def filtrar_candidatos(registros: List[RegistroContato], assinaturas: np.ndarray,
+                       pares: np.ndarray, bloco: int = 200000) -> np.ndarray:
+    """
+    Verificação barata antes do Jaro-Winkler: fração de componentes MinHash iguais
+    (estimativa de Jaccard dos trigramas), calculada em blocos vetorizados.
+    """
+    if len(pares) == 0:
+        return pares
+    telefones = _codigos([r.telefone for r in registros])
+    emails = _codigos([r.email for r in registros])
+
+    manter = np.zeros(len(pares), dtype=bool)
+    for inicio in range(0, len(pares), bloco):
+        i = pares[inicio:inicio + bloco, 0]
+        j = pares[inicio:inicio + bloco, 1]
+        jaccard = (assinaturas[i] == assinaturas[j]).mean(axis=1)
+        contato_igual = (((telefones[i] > 0) & (telefones[i] == telefones[j]))
+                         | ((emails[i] > 0) & (emails[i] == emails[j])))
+        manter[inicio:inicio + bloco] = (jaccard >= JACCARD_MINIMO) | contato_igual
+    return pares[manter]
+
+
+def gerar_candidatos(registros: List[RegistroContato], bandas: np.ndarray) -> np.ndarray:
+    """Pares candidatos (i < j) vindos das chaves de bloqueio e dos buckets LSH"""
+    n = len(registros)
+    if n < 2:
+        return np.zeros((0, 2), dtype=np.int64)
+
+    nomes = np.array([r.nome for r in registros], dtype=object)
+    rank_nome = np.empty(n, dtype=np.int64)
+    rank_nome[np.argsort(nomes, kind='stable')] = np.arange(n)
+    pares = []
+
+    # 1. Chaves de bloqueio exatas (telefone, e-mail, fonética por município)
+    chaves, donos = [], []
+    for idx, registro in enumerate(registros):
+        for chave in _chaves_bloqueio(registro):
+            chaves.append(chave)
+            donos.append(idx)
+    if chaves:
+        grupos = _codigos(chaves)
+        pares.append(_pares_por_grupo(np.array(donos, dtype=np.int64), grupos, rank_nome))
+
+    # 2. LSH: mesmo hash de banda dentro do mesmo município
+    municipios = {m: k for k, m in enumerate(sorted({r.municipio for r in registros}))}
+    codigo_municipio = np.array([municipios[r.municipio] for r in registros], dtype=np.uint64)
+    com_nome = np.nonzero([bool(r.shingles) for r in registros])[0]
+
+    for banda in range(BANDAS):
+        chave = bandas[com_nome, banda] ^ (codigo_municipio[com_nome] * np.uint64(0x9E3779B97F4A7C15))
+        pares.append(_pares_por_grupo(com_nome, chave, rank_nome))
+
+    arr = np.concatenate(pares)
+    if len(arr) == 0:
+        return arr
+    arr.sort(axis=1)
+    codigos = np.unique(arr[:, 0] * n + arr[:, 1])
+    return np.stack([codigos // n, codigos % n], axis=1)
+
+
+# ===== ÍNDICE (lote + incremental) =====
+
+class IndiceDuplicatas:
+    """
+    Índice de contatos para detecção de duplicatas.
+
+    `construir` processa a base inteira em lote; `verificar` compara um único
+    contato novo com o índice (chaves de bloqueio + bandas LSH) sem varrer pares;
+    `adicionar` inclui o contato no índice após a inserção.
+    """
+
+    def __init__(self):
+        self.registros: List[RegistroContato] = []
+        self.posicao: Dict[int, int] = {}
+        self.blocos: Dict[str, List[int]] = defaultdict(list)
+        self.assinaturas = np.zeros((0, NUM_PERMUTACOES), dtype=np.uint64)
+        self._bandas = np.zeros((0, BANDAS), dtype=np.uint64)
+        self._bandas_pendentes: List[np.ndarray] = []
+        self._lock = threading.RLock()
+        self.construido = False
+
+    def construir(self, registros: List[RegistroContato]) -> np.ndarray:
+        """(Re)constrói o índice e retorna os hashes de banda de todos os registros"""
+        with self._lock:
+            self.registros = list(registros)
+            self.posicao = {r.id: k for k, r in enumerate(self.registros)}
+            self.blocos = defaultdict(list)
+            for k, registro in enumerate(self.registros):
+                for chave in _chaves_bloqueio(registro):
+                    self.blocos[chave].append(k)
+            self.assinaturas = assinaturas_minhash(self.registros)
+            self._bandas = hashes_bandas(self.assinaturas)
+            self._bandas_pendentes = []
+            self.construido = True
+            return self._bandas
+
+    def _matriz_bandas(self) -> np.ndarray:
+        if self._bandas_pendentes:
+            self._bandas = np.vstack([self._bandas, *self._bandas_pendentes])
+            self._bandas_pendentes = []
+        return self._bandas
+
+    def candidatos(self, registro: RegistroContato) -> List[int]:
+        with self._lock:
+            encontrados = set()
+            for chave in _chaves_bloqueio(registro):
+                encontrados.update(self.blocos.get(chave, ()))
+
+            if registro.shingles and self.registros:
+                bandas = hashes_bandas(assinaturas_minhash([registro]))[0]
+                matriz = self._matriz_bandas()
+                mesmo_municipio = np.fromiter(
+                    (r.municipio == registro.municipio for r in self.registros),
+                    dtype=bool, count=len(self.registros)
+                )
+                encontrados.update(np.nonzero((matriz == bandas).any(axis=1) & mesmo_municipio)[0].tolist())
+
+            encontrados.discard(self.posicao.get(registro.id))
+            return sorted(encontrados)
+
+    def verificar(self, registro: RegistroContato, limiar: float = 0.8) -> List[Tuple[RegistroContato, float, List[str]]]:
+        """Compara um contato com os candidatos do índice; retorna (registro, score, campos)"""
+        with self._lock:
+            indices = self.candidatos(registro)
+            if not indices:
+                return []
+            base = [registro] + [self.registros[k] for k in indices]
+            pares = np.array([(0, k + 1) for k in range(len(indices))], dtype=np.int64)
+            scores, campos = pontuar_pares(base, pares)
+
+            resultado = []
+            for pos in np.argsort(-scores):
+                if scores[pos] < limiar:
+                    break
+                similares = [nome for nome, mascara in campos.items() if mascara[pos]]
+                resultado.append((base[pos + 1], float(scores[pos]), similares))
+            return resultado
+
+    def adicionar(self, registro: RegistroContato):
+        """Inclui (ou substitui) um contato no índice incremental"""
+        with self._lock:
+            if registro.id in self.posicao:
+                # Atualização: reconstrução é mais simples que remover de todos os blocos
+                k = self.posicao[registro.id]
+                self.registros[k] = registro
+                self.construir(self.registros)
+                return
+            k = len(self.registros)
+            self.registros.append(registro)
+            self.posicao[registro.id] = k
+            for chave in _chaves_bloqueio(registro):
+                self.blocos[chave].append(k)
+            self._bandas_pendentes.append(hashes_bandas(assinaturas_minhash([registro])))
+
+
+def detectar_duplicatas(registros: List[RegistroContato], limiar: float = 0.8,
+                        indice: Optional[IndiceDuplicatas] = None) -> List[Tuple[int, int, float, List[str]]]:
+    """
+    Pipeline completo em lote: índice -> candidatos -> Jaro-Winkler nos candidatos.
+    Retorna tuplas (idx1, idx2, score, campos_similares) acima do limiar.
+    """
+    indice = indice or IndiceDuplicatas()
+    bandas = indice.construir(registros)
+    pares = gerar_candidatos(indice.registros, bandas)
+    pares = filtrar_candidatos(indice.registros, indice.assinaturas, pares)
+    scores, campos = pontuar_pares(indice.registros, pares)
+
+    selecionados = np.nonzero(scores >= limiar)[0]
+    logger.info(f"🔎 Deduplicação: {len(registros)} contatos, {len(pares)} pares candidatos, "
+                f"{len(selecionados)} possíveis duplicatas")
+
+    return [
+        (int(pares[k, 0]), int(pares[k, 1]), float(scores[k]),
+         [nome for nome, mascara in campos.items() if mascara[k]])
+        for k in selecionados[np.argsort(-scores[selecionados])]
+    ]
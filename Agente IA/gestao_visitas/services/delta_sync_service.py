@@ -0,0 +1,115 @@
+"""
+Serviço de Sincronização Incremental (Delta Sync) para dispositivos de campo
+Gera NDJSON compacto com alterações e tombstones desde uma versão conhecida
+"""
+
+import json
+import logging
+from datetime import date, datetime, time
+from typing import Dict, Iterator, List, Optional
+
+from gestao_visitas.db import db
+from gestao_visitas.models.sync import SyncChangeLog, MODELOS_VERSIONADOS
+
+logger = logging.getLogger(__name__)
+
+# Limites de lote por requisição (o cliente repete enquanto 'mais' for true)
+LIMITE_PADRAO = 1000
+LIMITE_MAXIMO = 5000
+
+
+def _serializar_valor(valor):
+    """Converte tipos de data/hora para ISO; demais valores passam direto"""
+    if isinstance(valor, (datetime, date, time)):
+        return valor.isoformat()
+    return valor
+
+
+def _linha(obj: Dict) -> str:
+    """Serializa uma linha NDJSON sem espaços desnecessários"""
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+class DeltaSyncService:
+    """
+    Protocolo de sincronização incremental baseado no change-log `sync_changelog`.
+
+    Formato NDJSON (uma linha por registro):
+        {"op":"u","tb":"visitas","id":12,"v":340,"d":{...}}   alteração/inserção
+        {"op":"d","tb":"visitas","id":7,"v":341}              tombstone (exclusão)
+        {"op":"fim","v":341,"mais":false,"n":2}               trailer com cursor
+    """
+
+    def __init__(self):
+        self.logger = logger
+
+    def versao_atual(self) -> int:
+        """Versão mais recente disponível no servidor"""
+        return SyncChangeLog.versao_atual()
+
+    def gerar_alteracoes(self, since: int = 0, limite: int = LIMITE_PADRAO,
+                         tabelas: Optional[List[str]] = None) -> Iterator[str]:
+        """
+        Gera as linhas NDJSON das alterações com versão > since.
+
+        Args:
+            since: Última versão aplicada pelo cliente (0 = sincronização completa)
+            limite: Máximo de registros neste lote
+            tabelas: Restringe às tabelas informadas (padrão: todas versionadas)
+        """
+        limite = max(1, min(int(limite or LIMITE_PADRAO), LIMITE_MAXIMO))
+        tabelas = [t for t in (tabelas or MODELOS_VERSIONADOS) if t in MODELOS_VERSIONADOS]
+
+        query = SyncChangeLog.query.filter(SyncChangeLog.versao > since)
+        if len(tabelas) < len(MODELOS_VERSIONADOS):
+            query = query.filter(SyncChangeLog.tabela.in_(tabelas))
+
+        # limite + 1 para saber se há mais lotes sem um COUNT extra
+        entradas = query.order_by(SyncChangeLog.versao).limit(limite + 1).all()
+        mais = len(entradas) > limite
+        entradas = entradas[:limite]
+
+        registros = self._carregar_registros(entradas)
+
+        ultima_versao = since
+        enviados = 0
+        for entrada in entradas:
+            ultima_versao = entrada.versao
+            registro = registros.get((entrada.tabela, entrada.registro_id))
+
+            # Registro marcado como upsert mas já removido: tratar como tombstone
+            if entrada.operacao == 'delete' or registro is None:
+                yield _linha({'op': 'd', 'tb': entrada.tabela,
+                              'id': entrada.registro_id, 'v': entrada.versao})
+            else:
+                yield _linha({'op': 'u', 'tb': entrada.tabela,
+                              'id': entrada.registro_id, 'v': entrada.versao,
+                              'd': registro})
+            enviados += 1
+
+        yield _linha({'op': 'fim', 'v': ultima_versao, 'mais': mais, 'n': enviados})
+
+    def _carregar_registros(self, entradas: List[SyncChangeLog]) -> Dict:
+        """Carrega os registros alterados com uma consulta IN por tabela"""
+        ids_por_tabela = {}
+        for entrada in entradas:
+            if entrada.operacao == 'upsert':
+                ids_por_tabela.setdefault(entrada.tabela, []).append(entrada.registro_id)
+
+        registros = {}
+        for tabela, ids in ids_por_tabela.items():
+            modelo = MODELOS_VERSIONADOS[tabela]
+            colunas = modelo.__table__.columns
+            # Consulta Core: evita instanciar objetos ORM e relacionamentos
+            for row in db.session.execute(
+                db.select(*colunas).where(colunas.id.in_(ids))
+            ).mappings():
+                registros[(tabela, row['id'])] = {
+                    nome: _serializar_valor(valor) for nome, valor in row.items()
+                    if valor is not None
+                }
+        return registros
+
+
+# Instância global do serviço
+delta_sync_service = DeltaSyncService()
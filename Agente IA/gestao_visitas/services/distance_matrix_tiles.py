@@ -0,0 +1,340 @@
+"""
+Matriz de distâncias em blocos para a Distance Matrix API (PNSB 2024)
+Divide matrizes maiores que o limite da API em blocos, consulta os blocos em
+paralelo (com retentativas), monta uma matriz NumPy densa e guarda cada bloco
+em SQLite por (coordenadas, horário de partida) para reaproveitar em novos planos
+"""
+
+import os
+import json
+import math
+import time
+import random
+import sqlite3
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+DISTANCE_MATRIX_URL = 'https://maps.googleapis.com/maps/api/distancematrix/json'
+
+# Limites por requisição da Distance Matrix API
+MAX_ORIGENS = 25
+MAX_DESTINOS = 25
+MAX_ELEMENTOS = 100
+
+# Status que valem nova tentativa (os demais são erros definitivos)
+STATUS_TRANSITORIOS = {'OVER_QUERY_LIMIT', 'UNKNOWN_ERROR'}
+
+Coordenada = Tuple[float, float]
+
+
+class DistanceMatrixError(Exception):
+    """Falha definitiva ao consultar um bloco da matriz"""
+
+
+def dividir_em_blocos(total_origens: int, total_destinos: int,
+                      max_elementos: int = MAX_ELEMENTOS,
+                      max_origens: int = MAX_ORIGENS,
+                      max_destinos: int = MAX_DESTINOS) -> List[Tuple[slice, slice]]:
+    """
+    Blocos (origens, destinos) que cobrem a matriz respeitando os limites
+    por requisição, escolhendo o formato que minimiza o número de chamadas.
+    """
+    if total_origens == 0 or total_destinos == 0:
+        return []
+
+    melhor = None
+    for linhas in range(1, min(max_origens, total_origens, max_elementos) + 1):
+        colunas = min(max_destinos, total_destinos, max_elementos // linhas)
+        chamadas = math.ceil(total_origens / linhas) * math.ceil(total_destinos / colunas)
+        # Em empate, blocos mais quadrados (menos bytes repetidos na URL)
+        chave = (chamadas, abs(linhas - colunas))
+        if melhor is None or chave < melhor[0]:
+            melhor = (chave, linhas, colunas)
+    _, linhas, colunas = melhor
+
+    return [
+        (slice(i, min(i + linhas, total_origens)), slice(j, min(j + colunas, total_destinos)))
+        for i in range(0, total_origens, linhas)
+        for j in range(0, total_destinos, colunas)
+    ]
+
+
+class DistanceMatrixTiler:
+    """
+    Consulta da Distance Matrix API sem o limite de 25×25.
+
+    - Blocos de no máximo `max_elementos` elementos por requisição
+    - Pool de threads limitado, retentativas com backoff exponencial e jitter
+    - Resultado em matrizes float64 (metros/segundos, NaN onde não há rota)
+    - Blocos persistidos por hash das coordenadas + hora de partida
+    """
+
+    def __init__(self, db_path: str = None, base_url: str = None, max_workers: int = 4,
+                 max_elementos: int = MAX_ELEMENTOS, tentativas: int = 4,
+                 backoff_inicial: float = 0.5, timeout: float = 10.0,
+                 ttl_segundos: int = 7 * 24 * 3600):
+        self.db_path = db_path or os.path.join(self._get_cache_directory(), 'distance_matrix_cache.db')
+        self.base_url = base_url or os.getenv('DISTANCE_MATRIX_URL', DISTANCE_MATRIX_URL)
+        self.max_workers = max_workers
+        self.max_elementos = max_elementos
+        self.tentativas = tentativas
+        self.backoff_inicial = backoff_inicial
+        self.timeout = timeout
+        self.ttl_segundos = ttl_segundos
+
+        self._lock = threading.Lock()
+        self._session: Optional[requests.Session] = None
+        self.metrics = {'blocos_cache': 0, 'blocos_api': 0, 'requisicoes': 0, 'retentativas': 0, 'falhas': 0}
+
+        self._initialize_database()
+
+    def _get_cache_directory(self) -> str:
+        """Cria e retorna diretório para caches locais"""
+        base_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cache_local')
+        os.makedirs(base_dir, exist_ok=True)
+        return base_dir
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def _initialize_database(self):
+        try:
+            with self._connect() as conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS blocos_matriz (
+                        chave TEXT PRIMARY KEY,
+                        linhas INTEGER NOT NULL,
+                        colunas INTEGER NOT NULL,
+                        distancias BLOB NOT NULL,
+                        duracoes BLOB NOT NULL,
+                        duracoes_transito BLOB NOT NULL,
+                        criado_em REAL NOT NULL
+                    )
+                ''')
+        except Exception as e:
+            logger.error(f"❌ Erro ao inicializar cache da matriz de distâncias: {str(e)}")
+
+    @property
+    def session(self) -> requests.Session:
+        """Sessão HTTP compartilhada pelas threads (keep-alive)"""
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=self.max_workers * 2)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._session = session
+        return self._session
+
+    # ===== CACHE DE BLOCOS =====
+
+    def _chave_bloco(self, origens: Sequence[Coordenada], destinos: Sequence[Coordenada],
+                     hora_partida: int, modo: str) -> str:
+        """Hash das coordenadas (5 casas ≈ 1 m) + hora de partida + modo"""
+        texto = json.dumps([
+            [[round(lat, 5), round(lng, 5)] for lat, lng in origens],
+            [[round(lat, 5), round(lng, 5)] for lat, lng in destinos],
+            hora_partida, modo
+        ])
+        return hashlib.sha1(texto.encode()).hexdigest()
+
+    def _ler_blocos(self, chaves: List[str]) -> Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        if not chaves:
+            return {}
+        limite = time.time() - self.ttl_segundos
+        try:
+            with self._connect() as conn:
+                linhas = conn.execute(
+                    f'''SELECT chave, linhas, colunas, distancias, duracoes, duracoes_transito
+                        FROM blocos_matriz
+                        WHERE criado_em >= ? AND chave IN ({", ".join("?" * len(chaves))})''',
+                    [limite, *chaves]
+                ).fetchall()
+        except Exception as e:
+            logger.error(f"Erro ao ler cache da matriz de distâncias: {str(e)}")
+            return {}
+
+        return {
+            chave: tuple(
+                np.frombuffer(dados, dtype=np.float64).reshape(n_linhas, n_colunas)
+                for dados in (distancias, duracoes, transito)
+            )
+            for chave, n_linhas, n_colunas, distancias, duracoes, transito in linhas
+        }
+
+    def _gravar_blocos(self, blocos: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]]):
+        if not blocos:
+            return
+        agora = time.time()
+        try:
+            with self._connect() as conn:
+                conn.executemany(
+                    '''INSERT OR REPLACE INTO blocos_matriz
+                       (chave, linhas, colunas, distancias, duracoes, duracoes_transito, criado_em)
+                       VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                    [
+                        (chave, dist.shape[0], dist.shape[1], dist.tobytes(), dur.tobytes(), transito.tobytes(), agora)
+                        for chave, (dist, dur, transito) in blocos.items()
+                    ]
+                )
+        except Exception as e:
+            logger.error(f"Erro ao gravar cache da matriz de distâncias: {str(e)}")
+
+    # ===== CONSULTA À API =====
+
+    def _consultar_bloco(self, origens: Sequence[Coordenada], destinos: Sequence[Coordenada],
+                         api_key: str, partida: datetime, modo: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Uma requisição (com retentativas) -> (distâncias, durações, durações com trânsito)"""
+        params = {
+            'origins': '|'.join(f"{lat},{lng}" for lat, lng in origens),
+            'destinations': '|'.join(f"{lat},{lng}" for lat, lng in destinos),
+            'mode': modo,
+            'departure_time': int(partida.timestamp()),
+            'traffic_model': 'best_guess',
+            'units': 'metric',
+            'key': api_key
+        }
+
+        ultimo_erro = None
+        for tentativa in range(self.tentativas):
+            if tentativa:
+                self.metrics['retentativas'] += 1
+                espera = self.backoff_inicial * (2 ** (tentativa - 1))
+                time.sleep(espera + random.uniform(0, espera / 2))
+            try:
+                self.metrics['requisicoes'] += 1
+                resposta = self.session.get(self.base_url, params=params, timeout=self.timeout)
+                if resposta.status_code == 429 or resposta.status_code >= 500:
+                    ultimo_erro = f"HTTP {resposta.status_code}"
+                    continue
+                resposta.raise_for_status()
+                dados = resposta.json()
+            except (requests.RequestException, ValueError) as e:
+                ultimo_erro = str(e)
+                continue
+
+            status = dados.get('status')
+            if status == 'OK':
+                return self._converter_resposta(dados, len(origens), len(destinos))
+            ultimo_erro = f"{status}: {dados.get('error_message', '')}"
+            if status not in STATUS_TRANSITORIOS:
+                break
+
+        raise DistanceMatrixError(f"Bloco {len(origens)}x{len(destinos)} falhou: {ultimo_erro}")
+
+    def _converter_resposta(self, dados: Dict, n_origens: int,
+                            n_destinos: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        distancias = np.full((n_origens, n_destinos), np.nan)
+        duracoes = np.full((n_origens, n_destinos), np.nan)
+        transito = np.full((n_origens, n_destinos), np.nan)
+
+        for i, linha in enumerate(dados.get('rows', [])[:n_origens]):
+            for j, elemento in enumerate(linha.get('elements', [])[:n_destinos]):
+                if elemento.get('status') != 'OK':
+                    continue
+                distancias[i, j] = elemento['distance']['value']
+                duracoes[i, j] = elemento['duration']['value']
+                transito[i, j] = elemento.get('duration_in_traffic', elemento['duration'])['value']
+        return distancias, duracoes, transito
+
+    # ===== API PÚBLICA =====
+
+    def obter_matriz(self, origens: Sequence[Coordenada], destinos: Sequence[Coordenada],
+                     api_key: str, partida: datetime, modo: str = 'driving') -> Dict:
+        """
+        Matriz completa origens × destinos.
+
+        Retorna {'distancias', 'duracoes', 'duracoes_transito'} como arrays
+        (metros/segundos, NaN para pares sem rota) e a contagem de blocos lidos
+        do cache e da API. Levanta DistanceMatrixError se algum bloco falhar.
+        """
+        origens, destinos = list(origens), list(destinos)
+        formato = (len(origens), len(destinos))
+        distancias = np.full(formato, np.nan)
+        duracoes = np.full(formato, np.nan)
+        transito = np.full(formato, np.nan)
+
+        blocos = dividir_em_blocos(len(origens), len(destinos), self.max_elementos)
+        chaves = [
+            self._chave_bloco(origens[linhas], destinos[colunas], partida.hour, modo)
+            for linhas, colunas in blocos
+        ]
+        em_cache = self._ler_blocos(list(set(chaves)))
+
+        pendentes = []
+        for (linhas, colunas), chave in zip(blocos, chaves):
+            valores = em_cache.get(chave)
+            if valores is None:
+                pendentes.append((linhas, colunas, chave))
+                continue
+            distancias[linhas, colunas], duracoes[linhas, colunas], transito[linhas, colunas] = valores
+        self.metrics['blocos_cache'] += len(blocos) - len(pendentes)
+
+        if pendentes:
+            def consultar(bloco):
+                linhas, colunas, _ = bloco
+                return self._consultar_bloco(origens[linhas], destinos[colunas], api_key, partida, modo)
+
+            workers = min(self.max_workers, len(pendentes))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pnsb-matriz') as executor:
+                futuros = [executor.submit(consultar, bloco) for bloco in pendentes]
+
+            novos, erros = {}, []
+            for (linhas, colunas, chave), futuro in zip(pendentes, futuros):
+                try:
+                    valores = futuro.result()
+                except DistanceMatrixError as e:
+                    erros.append(str(e))
+                    continue
+                distancias[linhas, colunas], duracoes[linhas, colunas], transito[linhas, colunas] = valores
+                novos[chave] = valores
+
+            # Blocos bons ficam no cache mesmo que outro bloco tenha falhado
+            self._gravar_blocos(novos)
+            self.metrics['blocos_api'] += len(novos)
+            if erros:
+                self.metrics['falhas'] += len(erros)
+                raise DistanceMatrixError(f"{len(erros)} de {len(pendentes)} blocos falharam: {erros[0]}")
+
+        logger.info(
+            f"🧩 Matriz {formato[0]}x{formato[1]}: {len(blocos)} blocos "
+            f"({len(blocos) - len(pendentes)} do cache, {len(pendentes)} da API)"
+        )
+        return {
+            'distancias': distancias,
+            'duracoes': duracoes,
+            'duracoes_transito': transito,
+            'blocos': len(blocos),
+            'blocos_cache': len(blocos) - len(pendentes),
+            'blocos_api': len(pendentes)
+        }
+
+    def limpar_expirados(self) -> int:
+        try:
+            with self._connect() as conn:
+                return conn.execute(
+                    'DELETE FROM blocos_matriz WHERE criado_em < ?', (time.time() - self.ttl_segundos,)
+                ).rowcount
+        except Exception as e:
+            logger.error(f"Erro ao limpar cache da matriz de distâncias: {str(e)}")
+            return 0
+
+    def get_metrics(self) -> Dict:
+        return dict(self.metrics)
+
+
+# Instância global compartilhada pelos otimizadores de rota
+distance_matrix_tiler = DistanceMatrixTiler()
@@ -0,0 +1,27 @@
+"""
+Módulo de entrada dos processos filhos (multiprocessing 'spawn')
+O spawn reimporta o script principal do pai como __mp_main__ em cada filho;
+com o servidor iniciado por `python app.py` isso repetiria toda a
+inicialização do app.py (create_all, migrações, serviço de backup...) em
+cada processo de otimização. Enquanto os filhos são criados, main_leve()
+aponta __main__ para este módulo, que não tem efeitos colaterais.
+"""
+
+import sys
+import threading
+from contextlib import contextmanager
+
+_lock = threading.RLock()
+
+
+@contextmanager
+def main_leve():
+    """Cria processos filhos importando este módulo no lugar do script principal"""
+    with _lock:
+        original = sys.modules.get('__main__')
+        sys.modules['__main__'] = sys.modules[__name__]
+        try:
+            yield
+        finally:
+            if original is not None:
+                sys.modules['__main__'] = original
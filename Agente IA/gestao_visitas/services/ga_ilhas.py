@@ -0,0 +1,511 @@
+"""
+Algoritmo genético em ilhas para o TSP das rotas (PNSB 2024)
+K processos evoluem populações independentes sobre a mesma matriz de
+distâncias em memória compartilhada (multiprocessing.shared_memory); a cada
+M gerações os melhores indivíduos migram para a ilha vizinha (anel). A
+execução para no limite de tempo, na estagnação ou no cancelamento; o limite
+conta a partir da largada, dada quando todas as ilhas estão prontas (a
+subida dos processos não consome o tempo do GA).
+
+As funções objetivo reproduzem, vetorizadas sobre a população inteira,
+RouteOptimizer._calculate_route_score_google ('google') e
+RouteOptimizer._calculate_route_score ('diaria').
+"""
+
+import os
+import time
+import queue
+import logging
+import multiprocessing
+from collections import Counter
+from dataclasses import dataclass, field
+from multiprocessing import shared_memory
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from gestao_visitas.services.entrada_processos import main_leve
+
+logger = logging.getLogger(__name__)
+
+OBJETIVO_GOOGLE = 'google'
+OBJETIVO_DIARIA = 'diaria'
+
+# Horário de atendimento por ponto (coluna "modo")
+SEM_HORARIO = 0
+FECHADO = 1
+JANELA = 2
+
+MIN_PONTOS = int(os.environ.get('PNSB_GA_ILHAS_MIN_PONTOS', 10))
+TEMPO_LIMITE_PADRAO = float(os.environ.get('PNSB_GA_TEMPO_S', 2.0))
+TEMPO_MAX_PARTIDA = 30.0  # segundos aguardando as ilhas ficarem prontas
+
+
+class IlhasIndisponiveisError(Exception):
+    """Não foi possível iniciar os processos das ilhas"""
+
+
+@dataclass
+class ProblemaRota:
+    """
+    Instância do TSP em arrays. `viagem_min` só é usada pelo objetivo
+    'google'; no objetivo 'diaria' o tempo de viagem vem da distância
+    (metros), como em _calculate_route_score.
+    """
+    objetivo: str
+    distancia: np.ndarray
+    prioridade: np.ndarray
+    duracao: np.ndarray
+    pesos: Dict[str, float]
+    viagem_min: Optional[np.ndarray] = None
+    modo_horario: Optional[np.ndarray] = None
+    abertura: Optional[np.ndarray] = None
+    fechamento: Optional[np.ndarray] = None
+    considerar_horarios: bool = False
+    inicio_fixo: bool = False
+
+    def __post_init__(self):
+        n = len(self.prioridade)
+        self.distancia = np.asarray(self.distancia, dtype=np.float64)
+        self.prioridade = np.asarray(self.prioridade, dtype=np.float64)
+        self.duracao = np.asarray(self.duracao, dtype=np.float64)
+        self.viagem_min = (np.zeros((n, n)) if self.viagem_min is None
+                           else np.asarray(self.viagem_min, dtype=np.float64))
+        for nome in ('modo_horario', 'abertura', 'fechamento'):
+            valor = getattr(self, nome)
+            setattr(self, nome, np.zeros(n) if valor is None else np.asarray(valor, dtype=np.float64))
+
+    @property
+    def n(self) -> int:
+        return len(self.prioridade)
+
+    def parametros(self) -> Dict:
+        """Parte escalar do problema, enviada aos processos junto com o nome do bloco"""
+        return {
+            'objetivo': self.objetivo,
+            'n': self.n,
+            'pesos': dict(self.pesos),
+            'considerar_horarios': self.considerar_horarios,
+            'inicio_fixo': self.inicio_fixo
+        }
+
+    def arrays(self) -> List[np.ndarray]:
+        return [self.viagem_min, self.distancia, self.prioridade, self.duracao,
+                self.modo_horario, self.abertura, self.fechamento]
+
+
+def _tamanho_bloco(n: int) -> int:
+    return (2 * n * n + 5 * n) * 8
+
+
+def _views(buffer, n: int) -> List[np.ndarray]:
+    """Arrays do problema sobre o bloco compartilhado (sem cópia)"""
+    dados = np.ndarray((2 * n * n + 5 * n,), dtype=np.float64, buffer=buffer)
+    viagem = dados[:n * n].reshape(n, n)
+    distancia = dados[n * n:2 * n * n].reshape(n, n)
+    resto = [dados[2 * n * n + k * n:2 * n * n + (k + 1) * n] for k in range(5)]
+    return [viagem, distancia, *resto]
+
+
+def _copiar_para_bloco(bloco: shared_memory.SharedMemory, problema: ProblemaRota):
+    for destino, origem in zip(_views(bloco.buf, problema.n), problema.arrays()):
+        destino[...] = origem
+
+
+def _problema_de_views(parametros: Dict, views: List[np.ndarray]) -> ProblemaRota:
+    viagem, distancia, prioridade, duracao, modo, abertura, fechamento = views
+    return ProblemaRota(
+        objetivo=parametros['objetivo'], distancia=distancia, prioridade=prioridade,
+        duracao=duracao, pesos=parametros['pesos'], viagem_min=viagem,
+        modo_horario=modo, abertura=abertura, fechamento=fechamento,
+        considerar_horarios=parametros['considerar_horarios'],
+        inicio_fixo=parametros['inicio_fixo']
+    )
+
+
+# ===== FUNÇÕES OBJETIVO (vetorizadas sobre a população) =====
+
+def avaliar(problema: ProblemaRota, populacao: np.ndarray) -> np.ndarray:
+    """Score de cada rota (linha) da população; menor é melhor"""
+    populacao = np.atleast_2d(populacao)
+    if problema.objetivo == OBJETIVO_DIARIA:
+        return _score_diaria(problema, populacao)
+    return _score_google(problema, populacao)
+
+
+def _score_google(problema: ProblemaRota, populacao: np.ndarray) -> np.ndarray:
+    quantidade, n = populacao.shape
+    relogio = np.full(quantidade, 8 * 60.0)  # Começar às 8:00
+    tempo_total = np.zeros(quantidade)
+    distancia_total = np.zeros(quantidade)
+    penalidade_prioridade = np.zeros(quantidade)
+    penalidade_horario = np.zeros(quantidade)
+
+    for posicao in range(n):
+        atual = populacao[:, posicao]
+        penalidade_prioridade += problema.prioridade[atual] * posicao * 10
+
+        if problema.considerar_horarios:
+            modo = problema.modo_horario[atual]
+            abertura = problema.abertura[atual]
+            limite = problema.fechamento[atual] - problema.duracao[atual]
+            janela = np.where(
+                relogio < abertura, (abertura - relogio) * 2,
+                np.where(relogio > limite, (relogio - limite) * 3, 0.0)
+            )
+            penalidade_horario += np.where(modo == FECHADO, 1000.0, np.where(modo == JANELA, janela, 0.0))
+
+        relogio += problema.duracao[atual]
+
+        if posicao < n - 1:
+            proximo = populacao[:, posicao + 1]
+            viagem = problema.viagem_min[atual, proximo]
+            tempo_total += viagem
+            distancia_total += problema.distancia[atual, proximo]
+            relogio += viagem + 15  # buffer
+
+    pesos = problema.pesos
+    score = (pesos['time'] * tempo_total +
+             pesos['distance'] * distancia_total +
+             pesos['priority'] * penalidade_prioridade)
+    if problema.considerar_horarios:
+        score = score + 0.1 * penalidade_horario
+    return score
+
+
+def _score_diaria(problema: ProblemaRota, populacao: np.ndarray) -> np.ndarray:
+    quantidade, n = populacao.shape
+    origem, destino = populacao[:, :-1], populacao[:, 1:]
+    distancias = problema.distancia[origem, destino]
+    distancia_total = distancias.sum(axis=1)
+    tempo_total = (distancias / 1000 * 2 + problema.duracao[destino]).sum(axis=1)
+
+    # P1 na segunda metade da rota é penalizado
+    segunda_metade = np.arange(n) > n // 2
+    penalidade = ((problema.prioridade[populacao] == 1) & segunda_metade).sum(axis=1) * 1000.0
+
+    pesos = problema.pesos
+    return (pesos['distance'] * distancia_total +
+            pesos['time'] * tempo_total * 60 +
+            pesos['priority'] * penalidade)
+
+
+# ===== OPERADORES =====
+
+def _cruzar(pai: np.ndarray, mae: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """Order crossover (OX), o mesmo de RouteOptimizer._crossover"""
+    inicio, fim = sorted(rng.choice(len(pai), 2, replace=False))
+    trecho = pai[inicio:fim]
+    resto = mae[~np.isin(mae, trecho)]
+    return np.concatenate([resto[:inicio], trecho, resto[inicio:]])
+
+
+def _mutar(rota: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """Troca de dois pontos (10%, como no GA sequencial) ou inversão de trecho (20%)"""
+    sorteio = rng.random()
+    if sorteio < 0.1:
+        i, j = rng.choice(len(rota), 2, replace=False)
+        rota[i], rota[j] = rota[j], rota[i]
+    elif sorteio < 0.3:
+        i, j = sorted(rng.choice(len(rota), 2, replace=False))
+        rota[i:j + 1] = rota[i:j + 1][::-1]
+    return rota
+
+
+# ===== ILHA =====
+
+@dataclass
+class _ConfigIlha:
+    tamanho_populacao: int
+    tempo_limite_s: float
+    geracoes_estagnacao: int
+    intervalo_migracao: int
+    migrantes: int
+    max_geracoes: int = 100000
+    ordem_inicial: Optional[List[int]] = None
+    extras: Dict = field(default_factory=dict)
+
+
+def _populacao_inicial(n: int, inicio_fixo: bool, config: _ConfigIlha,
+                       rng: np.random.Generator) -> np.ndarray:
+    primeiro = 1 if inicio_fixo else 0
+    livres = np.arange(primeiro, n)
+    linhas = []
+    if config.ordem_inicial is not None:
+        semente = np.array([i for i in config.ordem_inicial if i >= primeiro])
+        linhas.append(semente)
+        while len(linhas) < config.tamanho_populacao // 4:
+            linhas.append(_mutar(semente.copy(), rng))
+    while len(linhas) < config.tamanho_populacao:
+        linhas.append(rng.permutation(livres))
+    populacao = np.array(linhas)
+    if inicio_fixo:
+        populacao = np.hstack([np.zeros((len(linhas), 1), dtype=populacao.dtype), populacao])
+    return populacao
+
+
+def _evoluir(problema: ProblemaRota, config: _ConfigIlha, semente: int,
+             prazo: float, ilha: int = 0,
+             saida=None, entrada=None, resultados=None, parar=None,
+             largada: Optional[Callable[[], float]] = None) -> Tuple[List[int], float, int, str]:
+    """
+    Evolui uma ilha até o prazo, a estagnação ou o sinal de parada.
+    Com filas, envia migrantes a cada `intervalo_migracao` gerações e
+    publica o melhor indivíduo em `resultados`. Com `largada`, a população
+    inicial é avaliada antes e o prazo vem da largada.
+    """
+    rng = np.random.default_rng(semente)
+    n = problema.n
+    primeiro = 1 if problema.inicio_fixo else 0
+
+    populacao = _populacao_inicial(n, problema.inicio_fixo, config, rng)
+    scores = avaliar(problema, populacao)
+    if largada is not None:
+        prazo = largada()
+    elite = max(2, len(populacao) // 2)
+    melhor_score, melhor = float('inf'), None
+    ultima_melhora = 0
+    motivo = 'geracoes'
+
+    for geracao in range(config.max_geracoes):
+        ordem = np.argsort(scores)
+        populacao, scores = populacao[ordem], scores[ordem]
+        if scores[0] < melhor_score - 1e-9:
+            melhor_score, melhor = float(scores[0]), populacao[0].copy()
+            ultima_melhora = geracao
+
+        if parar is not None and parar.is_set():
+            motivo = 'cancelado'
+            break
+        if time.time() >= prazo:
+            motivo = 'tempo'
+            break
+        if geracao - ultima_melhora >= config.geracoes_estagnacao:
+            motivo = 'estagnacao'
+            break
+
+        if geracao and geracao % config.intervalo_migracao == 0:
+            if saida is not None:
+                try:
+                    saida.put_nowait((populacao[:config.migrantes].copy(), scores[:config.migrantes].copy()))
+                except queue.Full:
+                    pass
+            if entrada is not None:
+                posicao = len(populacao)
+                while True:
+                    try:
+                        imigrantes, scores_imigrantes = entrada.get_nowait()
+                    except queue.Empty:
+                        break
+                    # Imigrantes substituem os piores
+                    k = min(len(imigrantes), posicao - elite)
+                    if k <= 0:
+                        break
+                    populacao[posicao - k:posicao] = imigrantes[:k]
+                    scores[posicao - k:posicao] = scores_imigrantes[:k]
+                    posicao -= k
+            if resultados is not None:
+                resultados.put(('progresso', ilha, geracao, melhor_score, melhor.tolist()))
+
+        # Elitismo (50%) + descendentes das elites, como no GA sequencial
+        filhos = np.empty((len(populacao) - elite, n), dtype=populacao.dtype)
+        for k in range(len(filhos)):
+            pai = populacao[rng.integers(elite), primeiro:]
+            mae = populacao[rng.integers(elite), primeiro:]
+            filho = _mutar(_cruzar(pai, mae, rng), rng)
+            if primeiro:
+                filhos[k, 0] = 0
+            filhos[k, primeiro:] = filho
+        populacao = np.vstack([populacao[:elite], filhos])
+        scores = np.concatenate([scores[:elite], avaliar(problema, filhos)])
+
+    return melhor.tolist(), melhor_score, geracao, motivo
+
+
+def _processo_ilha(nome_bloco: str, parametros: Dict, config: _ConfigIlha, ilha: int,
+                   semente: int, prazo, largada, saida, entrada, resultados, parar):
+    """
+    Alvo do processo: anexa a matriz compartilhada, avisa que está pronta,
+    espera a largada e evolui a ilha até prazo.value
+    """
+    bloco = shared_memory.SharedMemory(name=nome_bloco)
+
+    def aguardar_largada() -> float:
+        resultados.put(('pronto', ilha))
+        largada.wait()
+        return prazo.value
+
+    try:
+        # Migrantes não entregues no fim não devem segurar a saída do processo
+        saida.cancel_join_thread()
+        problema = _problema_de_views(parametros, _views(bloco.buf, parametros['n']))
+        ordem, score, geracoes, motivo = _evoluir(
+            problema, config, semente, 0.0, ilha, saida, entrada, resultados, parar,
+            largada=aguardar_largada
+        )
+        resultados.put(('fim', ilha, geracoes, score, ordem, motivo))
+    except Exception as e:
+        resultados.put(('erro', ilha, str(e)))
+    finally:
+        problema = None
+        bloco.close()
+
+
+# ===== COORDENAÇÃO =====
+
+def numero_ilhas() -> int:
+    """Ilhas configuradas (PNSB_GA_ILHAS); padrão: núcleos disponíveis, até 4"""
+    configurado = os.environ.get('PNSB_GA_ILHAS')
+    if configurado is not None:
+        return max(1, int(configurado))
+    return max(1, min(4, os.cpu_count() or 1))
+
+
+def habilitado(n_pontos: int) -> bool:
+    """Vale a pena usar ilhas: rota grande e GA em ilhas não desligado (PNSB_GA_ILHAS=0)"""
+    return n_pontos >= MIN_PONTOS and os.environ.get('PNSB_GA_ILHAS') != '0'
+
+
+def resolver(problema: ProblemaRota, ilhas: int = None,
+             tempo_limite_s: float = None,
+             geracoes_estagnacao: int = 150,
+             intervalo_migracao: int = 10,
+             migrantes: int = 2,
+             tamanho_populacao: int = None,
+             ordem_inicial: Optional[List[int]] = None,
+             semente: Optional[int] = None,
+             progresso: Optional[Callable[[float, float, List[int]], bool]] = None) -> Tuple[List[int], float, Dict]:
+    """
+    Resolve o TSP com `ilhas` processos (1 = na própria thread, sem
+    processos). Retorna (melhor ordem, score, estatísticas).
+
+    progresso(fracao_tempo, melhor_score, melhor_ordem) é chamado a cada
+    migração; se retornar True as ilhas param com o melhor resultado atual.
+    Com processos, tempo_limite_s conta a partir da largada das ilhas.
+    """
+    ilhas = ilhas or numero_ilhas()
+    tempo_limite_s = TEMPO_LIMITE_PADRAO if tempo_limite_s is None else tempo_limite_s
+    config = _ConfigIlha(
+        tamanho_populacao=tamanho_populacao or max(20, min(100, problema.n * 3)),
+        tempo_limite_s=tempo_limite_s,
+        geracoes_estagnacao=geracoes_estagnacao,
+        intervalo_migracao=intervalo_migracao,
+        migrantes=migrantes,
+        ordem_inicial=ordem_inicial
+    )
+    sementes = np.random.SeedSequence(semente).generate_state(ilhas)
+    inicio = time.time()
+
+    if ilhas == 1:
+        ordem, score, geracoes, motivo = _evoluir(problema, config, int(sementes[0]), inicio + tempo_limite_s)
+        return ordem, score, {
+            'ilhas': 1, 'geracoes': [geracoes], 'motivo_parada': motivo,
+            'tempo_s': round(time.time() - inicio, 3)
+        }
+
+    return _resolver_processos(problema, config, ilhas, sementes, inicio, progresso)
+
+
+def _resolver_processos(problema: ProblemaRota, config: _ConfigIlha, ilhas: int,
+                        sementes, inicio: float,
+                        progresso: Optional[Callable]) -> Tuple[List[int], float, Dict]:
+    n = problema.n
+    bloco = shared_memory.SharedMemory(create=True, size=_tamanho_bloco(n))
+    processos = []
+    try:
+        _copiar_para_bloco(bloco, problema)
+
+        contexto = multiprocessing.get_context('spawn')
+        filas = [contexto.Queue() for _ in range(ilhas)]
+        resultados = contexto.Queue()
+        parar = contexto.Event()
+        largada = contexto.Event()
+        prazo = contexto.Value('d', 0.0, lock=False)
+        parametros = problema.parametros()
+
+        try:
+            with main_leve():
+                for ilha in range(ilhas):
+                    # Anel: a ilha i envia migrantes para a ilha i + 1
+                    processo = contexto.Process(
+                        target=_processo_ilha,
+                        args=(bloco.name, parametros, config, ilha, int(sementes[ilha]), prazo, largada,
+                              filas[(ilha + 1) % ilhas], filas[ilha], resultados, parar),
+                        daemon=True
+                    )
+                    processo.start()
+                    processos.append(processo)
+        except (AssertionError, OSError) as e:
+            # Ex.: chamado de dentro de um processo daemon
+            parar.set()
+            largada.set()
+            raise IlhasIndisponiveisError(str(e)) from e
+
+        # Largada só com as ilhas prontas: interpretador, numpy e população
+        # inicial de cada processo ficam fora do tempo limite
+        prontas, erros = set(), []
+        limite_partida = time.time() + TEMPO_MAX_PARTIDA
+        while len(prontas) + len(erros) < ilhas:
+            try:
+                mensagem = resultados.get(timeout=0.1)
+            except queue.Empty:
+                if time.time() > limite_partida or not any(p.is_alive() for p in processos):
+                    break
+                continue
+            if mensagem[0] == 'pronto':
+                prontas.add(mensagem[1])
+            elif mensagem[0] == 'erro':
+                erros.append(mensagem[2])
+
+        partida = time.time()
+        prazo.value = partida + config.tempo_limite_s
+        largada.set()
+
+        melhor_score, melhor = float('inf'), None
+        geracoes, motivos = {}, {}
+        cancelado = False
+        while len(geracoes) + len(erros) < ilhas:
+            try:
+                mensagem = resultados.get(timeout=0.1)
+            except queue.Empty:
+                if time.time() > prazo.value + 10 or not any(p.is_alive() for p in processos):
+                    break
+                continue
+
+            tipo, ilha = mensagem[0], mensagem[1]
+            if tipo == 'erro':
+                erros.append(mensagem[2])
+                continue
+            if tipo == 'pronto':
+                continue
+            score, ordem = mensagem[3], mensagem[4]
+            if ordem is not None and score < melhor_score:
+                melhor_score, melhor = score, ordem
+            if tipo == 'fim':
+                geracoes[ilha] = mensagem[2]
+                motivos[ilha] = mensagem[5]
+            elif progresso and not cancelado and melhor is not None:
+                fracao = min(1.0, (time.time() - partida) / max(config.tempo_limite_s, 1e-6))
+                if progresso(fracao, melhor_score, melhor):
+                    cancelado = True
+                    parar.set()
+
+        if melhor is None:
+            raise IlhasIndisponiveisError('; '.join(erros) or 'nenhuma ilha retornou resultado')
+
+        return melhor, melhor_score, {
+            'ilhas': ilhas,
+            'geracoes': [geracoes.get(i, 0) for i in range(ilhas)],
+            'motivo_parada': 'cancelado' if cancelado else (
+                Counter(motivos.values()).most_common(1)[0][0] if motivos else 'tempo'),
+            'erros': erros,
+            'partida_s': round(partida - inicio, 3),
+            'tempo_s': round(time.time() - inicio, 3)
+        }
+    finally:
+        for processo in processos:
+            processo.join(timeout=2)
+            if processo.is_alive():
+                processo.terminate()
+        bloco.close()
+        bloco.unlink()
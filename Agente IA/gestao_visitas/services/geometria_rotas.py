@@ -0,0 +1,224 @@
+"""
+Geometria compacta das direções (PNSB 2024)
+Decodifica as polylines do Google, simplifica com Douglas-Peucker numa
+tolerância ligada ao zoom do mapa, recodifica e enxuga os passos antes de
+enviar as direções ao navegador
+"""
+
+import re
+import math
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DETALHES = ('summary', 'full')
+DETALHE_PADRAO = 'full'
+
+# Zoom de referência de cada nível de detalhe: o resumo atende à visão do
+# dia inteiro (municípios vizinhos), o completo à navegação rua a rua
+ZOOM_POR_DETALHE = {'summary': 12, 'full': 17}
+PIXELS_TOLERANCIA = 1.0
+
+METROS_POR_GRAU_LAT = 110540.0
+METROS_POR_GRAU_LNG = 111320.0
+_TAGS_HTML = re.compile(r'<[^>]+>')
+
+
+def normalizar_detalhe(detalhe: Optional[str]) -> str:
+    """'summary' ou 'full'; valores desconhecidos ficam no padrão"""
+    detalhe = (detalhe or '').strip().lower()
+    return detalhe if detalhe in DETALHES else DETALHE_PADRAO
+
+
+def tolerancia_zoom(zoom: int, latitude: float = -27.0, pixels: float = PIXELS_TOLERANCIA) -> float:
+    """Metros que `pixels` pixels representam no zoom dado (projeção Web Mercator)"""
+    return pixels * 156543.03392 * math.cos(math.radians(latitude)) / (2 ** zoom)
+
+
+# ----------------------------------------------------------------------
+# Polyline (Encoded Polyline Algorithm Format, precisão 1e-5)
+# ----------------------------------------------------------------------
+
+def decodificar_polyline(polyline: str) -> np.ndarray:
+    """Matriz (n, 2) de lat/lng"""
+    valores = []
+    resultado = deslocamento = 0
+    for caractere in polyline:
+        byte = ord(caractere) - 63
+        resultado |= (byte & 0x1f) << deslocamento
+        deslocamento += 5
+        if byte < 0x20:
+            valores.append(~(resultado >> 1) if resultado & 1 else resultado >> 1)
+            resultado = deslocamento = 0
+    if not valores:
+        return np.empty((0, 2))
+    return np.cumsum(np.array(valores[:len(valores) // 2 * 2], dtype=np.int64).reshape(-1, 2), axis=0) / 1e5
+
+
+def codificar_polyline(coordenadas: np.ndarray) -> str:
+    """Inverso de decodificar_polyline"""
+    coordenadas = np.asarray(coordenadas, dtype=float).reshape(-1, 2)
+    if not len(coordenadas):
+        return ''
+    inteiros = np.round(coordenadas * 1e5).astype(np.int64)
+    deltas = np.diff(inteiros, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    partes = []
+    for delta in deltas.tolist():
+        valor = ~(delta << 1) if delta < 0 else delta << 1
+        while valor >= 0x20:
+            partes.append(chr((0x20 | (valor & 0x1f)) + 63))
+            valor >>= 5
+        partes.append(chr(valor + 63))
+    return ''.join(partes)
+
+
+def douglas_peucker(coordenadas: np.ndarray, tolerancia_m: float) -> np.ndarray:
+    """
+    Pontos mantidos pela simplificação de Douglas-Peucker (iterativa, sem
+    recursão). Distâncias em metros numa projeção local equirretangular,
+    suficiente para trechos de poucas dezenas de quilômetros.
+    """
+    n = len(coordenadas)
+    if n < 3 or tolerancia_m <= 0:
+        return coordenadas
+
+    cos_lat = math.cos(math.radians(float(coordenadas[:, 0].mean())))
+    y = coordenadas[:, 0] * METROS_POR_GRAU_LAT
+    x = coordenadas[:, 1] * METROS_POR_GRAU_LNG * cos_lat
+
+    manter = np.zeros(n, dtype=bool)
+    manter[0] = manter[-1] = True
+    pilha = [(0, n - 1)]
+    while pilha:
+        inicio, fim = pilha.pop()
+        if fim - inicio < 2:
+            continue
+        ax, ay = x[inicio], y[inicio]
+        dx, dy = x[fim] - ax, y[fim] - ay
+        px, py = x[inicio + 1:fim] - ax, y[inicio + 1:fim] - ay
+        comprimento2 = dx * dx + dy * dy
+        if comprimento2 == 0:
+            distancias = np.hypot(px, py)
+        else:
+            # Distância ao segmento (projeção limitada às extremidades)
+            t = np.clip((px * dx + py * dy) / comprimento2, 0.0, 1.0)
+            distancias = np.hypot(px - t * dx, py - t * dy)
+        maior = int(np.argmax(distancias))
+        if distancias[maior] > tolerancia_m:
+            meio = inicio + 1 + maior
+            manter[meio] = True
+            pilha.append((inicio, meio))
+            pilha.append((meio, fim))
+    return coordenadas[manter]
+
+
+# ----------------------------------------------------------------------
+# Passos
+# ----------------------------------------------------------------------
+
+def texto_instrucao(html: str) -> str:
+    """Instrução sem marcação HTML"""
+    return re.sub(r'\s+', ' ', _TAGS_HTML.sub(' ', html or '')).strip()
+
+
+def compactar_passos(passos: List[Dict], detalhe: str = DETALHE_PADRAO, limite: int = None) -> List[str]:
+    """
+    Só a instrução de cada passo do Google (distâncias, coordenadas e
+    polylines por passo ficam de fora; a geometria vai na polyline do
+    trecho). O completo mantém o HTML dos `limite` primeiros passos; o
+    resumo, o texto puro dos três primeiros.
+    """
+    if normalizar_detalhe(detalhe) == 'summary':
+        return [texto_instrucao(passo.get('html_instructions')) for passo in passos[:3]]
+    return [passo.get('html_instructions', '') for passo in passos[:limite]]
+
+
+# ----------------------------------------------------------------------
+# Cache da geometria simplificada
+# ----------------------------------------------------------------------
+
+class GeometriaRotasCache:
+    """
+    Polylines simplificadas em memória (LRU), indexadas pelo hash da rota
+    original e pelo zoom: a mesma perna aparece em muitas otimizações do dia.
+    """
+
+    MAX_ENTRADAS = 5000
+
+    def __init__(self, max_entradas: int = None):
+        self.max_entradas = max_entradas or self.MAX_ENTRADAS
+        self._entradas: 'OrderedDict[str, Dict]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.metrics = {
+            'hits': 0, 'misses': 0,
+            'pontos_originais': 0, 'pontos_enviados': 0,
+            'bytes_originais': 0, 'bytes_enviados': 0
+        }
+
+    @staticmethod
+    def hash_rota(polyline: str) -> str:
+        return hashlib.md5(polyline.encode('ascii')).hexdigest()
+
+    def simplificar(self, polyline: str, detalhe: str = DETALHE_PADRAO, zoom: int = None) -> Dict:
+        """
+        {'polyline', 'pontos', 'pontos_originais', 'zoom'} da polyline
+        simplificada para o nível de detalhe (ou zoom explícito)
+        """
+        if not polyline:
+            return {'polyline': '', 'pontos': 0, 'pontos_originais': 0, 'zoom': zoom}
+        zoom = int(zoom) if zoom is not None else ZOOM_POR_DETALHE[normalizar_detalhe(detalhe)]
+        chave = f"{self.hash_rota(polyline)}:{zoom}"
+
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is not None:
+                self._entradas.move_to_end(chave)
+                self.metrics['hits'] += 1
+        if entrada is None:
+            coordenadas = decodificar_polyline(polyline)
+            latitude = float(coordenadas[:, 0].mean()) if len(coordenadas) else -27.0
+            simplificada = douglas_peucker(coordenadas, tolerancia_zoom(zoom, latitude))
+            entrada = {
+                'polyline': codificar_polyline(simplificada),
+                'pontos': len(simplificada),
+                'pontos_originais': len(coordenadas),
+                'zoom': zoom
+            }
+            with self._lock:
+                self.metrics['misses'] += 1
+                self._entradas[chave] = entrada
+                while len(self._entradas) > self.max_entradas:
+                    self._entradas.popitem(last=False)
+
+        with self._lock:
+            self.metrics['pontos_originais'] += entrada['pontos_originais']
+            self.metrics['pontos_enviados'] += entrada['pontos']
+            self.metrics['bytes_originais'] += len(polyline)
+            self.metrics['bytes_enviados'] += len(entrada['polyline'])
+        return dict(entrada)
+
+    def limpar(self):
+        with self._lock:
+            self._entradas.clear()
+
+    def get_metrics(self) -> Dict:
+        with self._lock:
+            metricas = dict(self.metrics)
+            metricas['entradas'] = len(self._entradas)
+        consultas = metricas['hits'] + metricas['misses']
+        metricas['hit_rate'] = round(metricas['hits'] / consultas * 100, 2) if consultas else 0.0
+        metricas['reducao_pontos'] = (
+            round(1 - metricas['pontos_enviados'] / metricas['pontos_originais'], 4)
+            if metricas['pontos_originais'] else 0.0
+        )
+        return metricas
+
+
+# Instância global compartilhada pelos serviços de direções
+geometria_rotas = GeometriaRotasCache()
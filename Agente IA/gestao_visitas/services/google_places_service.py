@@ -2,6 +2,7 @@
 Serviço para buscar horários de funcionamento via Google Places API
 """
 
+import os
 import requests
 import json
 from datetime import datetime, timedelta
@@ -9,13 +10,16 @@ from typing import Dict, List, Optional, Tuple
 from flask import current_app
 import logging
 
+from gestao_visitas.services.places_cache import places_cache, CAMPOS_DETALHES
+
 logger = logging.getLogger(__name__)
 
 class GooglePlacesService:
     """Serviço para buscar informações de estabelecimentos via Google Places API"""
     
     def __init__(self):
-        self.base_url = "https://maps.googleapis.com/maps/api/place"
+        # GOOGLE_PLACES_URL aponta para outro servidor (ex.: tests/fake_places_server.py)
+        self.base_url = os.getenv('GOOGLE_PLACES_URL', "https://maps.googleapis.com/maps/api/place")
         self.cache = {}  # Cache em memória para horários
         self.cache_duration = 24 * 60 * 60  # 24 horas
         
@@ -51,26 +55,29 @@ class GooglePlacesService:
             'type': place_type
         }
         
-        try:
-            # Fazer busca textual
-            response = requests.get(
+        def buscar():
+            # Fazer busca textual (conexão reaproveitada da sessão compartilhada)
+            response = places_cache.session.get(
                 f"{self.base_url}/textsearch/json",
                 params=params,
                 timeout=10
             )
             
-            if response.status_code == 200:
-                data = response.json()
-                if data.get('results'):
-                    # Retornar o primeiro resultado
-                    return data['results'][0]
-                else:
-                    logger.info(f"Nenhum resultado encontrado para: {query}")
-                    return None
-            else:
-                logger.error(f"Erro na busca do Google Places: {response.status_code} - {response.text}")
-                return None
-                
+            if response.status_code != 200:
+                raise requests.HTTPError(f"{response.status_code} - {response.text}")
+            
+            data = response.json()
+            if data.get('results'):
+                # Retornar o primeiro resultado
+                return data['results'][0]
+            if data.get('status') not in (None, 'OK', 'ZERO_RESULTS'):
+                raise requests.HTTPError(f"status {data.get('status')}")
+            
+            logger.info(f"Nenhum resultado encontrado para: {query}")
+            return None
+        
+        try:
+            return places_cache.buscar(query, place_type, buscar)
         except Exception as e:
             logger.error(f"Erro ao buscar estabelecimento: {str(e)}")
             return None
@@ -92,23 +99,26 @@ class GooglePlacesService:
         params = {
             'place_id': place_id,
             'key': api_key,
-            'fields': 'place_id,name,formatted_address,opening_hours,geometry,business_status,types,formatted_phone_number,website'
+            'fields': ','.join(CAMPOS_DETALHES)
         }
         
-        try:
-            response = requests.get(
+        def buscar():
+            response = places_cache.session.get(
                 f"{self.base_url}/details/json",
                 params=params,
                 timeout=10
             )
             
-            if response.status_code == 200:
-                data = response.json()
-                return data.get('result')
-            else:
-                logger.error(f"Erro nos detalhes do Google Places: {response.status_code}")
-                return None
-                
+            if response.status_code != 200:
+                raise requests.HTTPError(f"Erro nos detalhes do Google Places: {response.status_code}")
+            
+            data = response.json()
+            if data.get('status') not in (None, 'OK', 'NOT_FOUND', 'ZERO_RESULTS'):
+                raise requests.HTTPError(f"status {data.get('status')}")
+            return data.get('result')
+        
+        try:
+            return places_cache.detalhes(place_id, params.get('language'), buscar)
         except Exception as e:
             logger.error(f"Erro ao obter detalhes: {str(e)}")
             return None
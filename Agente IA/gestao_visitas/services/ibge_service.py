@@ -3,14 +3,14 @@ Serviço para integração com APIs do IBGE
 Implementa cache Redis inteligente com dados reais
 """
 
-import requests
+import asyncio
 import json
-import time
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 import os
 import logging
 from .redis_cache import redis_cache
+from .async_http import async_http, HTTPStatusError
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -27,9 +27,8 @@ class IBGEService:
         self.cache = redis_cache
         self.cache_ttl = int(os.getenv('IBGE_CACHE_TTL', '3600'))  # 1 hora por padrão
         
-        # Rate limiting
-        self.last_request = 0
-        self.min_interval = 1  # 1 segundo entre requests
+        # Concorrência e pool de conexões ficam no loop compartilhado (async_http)
+        self.upstream = 'ibge'
         
         # Municípios do projeto PNSB
         self.municipios_pnsb = [
@@ -38,12 +37,9 @@ class IBGEService:
             'Navegantes', 'Penha', 'Porto Belo', 'Ilhota'
         ]
     
-    def _rate_limit(self):
-        """Aplica rate limiting para não sobrecarregar a API"""
-        now = time.time()
-        if now - self.last_request < self.min_interval:
-            time.sleep(self.min_interval - (now - self.last_request))
-        self.last_request = time.time()
+    async def _get_json(self, url: str, timeout: int):
+        """GET na API IBGE pelo cliente compartilhado (pool, coalescência e retry)"""
+        return await async_http.fetch_json(self.upstream, url, timeout=timeout)
     
     def _get_from_cache(self, key: str) -> Optional[Dict]:
         """Retorna dados do cache Redis"""
@@ -81,28 +77,22 @@ class IBGEService:
             return cached_data
         
         try:
-            self._rate_limit()
-            
             url = f"{self.base_urls['localidades']}/estados/42/municipios"
-            response = requests.get(url, timeout=10)
+            municipios = await self._get_json(url, timeout=10)
             
-            if response.status_code == 200:
-                municipios = response.json()
-                
-                # Filtrar apenas municípios do projeto PNSB
-                municipios_filtrados = [
-                    m for m in municipios 
-                    if m['nome'] in self.municipios_pnsb
-                ]
-                
-                self._save_to_cache(cache_key, municipios_filtrados)
-                print(f"✅ {len(municipios_filtrados)} municípios obtidos da API IBGE")
-                return municipios_filtrados
+            # Filtrar apenas municípios do projeto PNSB
+            municipios_filtrados = [
+                m for m in municipios 
+                if m['nome'] in self.municipios_pnsb
+            ]
             
-            else:
-                print(f"⚠️ API IBGE retornou status {response.status_code}")
-                return self._get_fallback_municipios()
-                
+            self._save_to_cache(cache_key, municipios_filtrados)
+            print(f"✅ {len(municipios_filtrados)} municípios obtidos da API IBGE")
+            return municipios_filtrados
+            
+        except HTTPStatusError as e:
+            print(f"⚠️ API IBGE retornou status {e.status}")
+            return self._get_fallback_municipios()
         except Exception as e:
             print(f"❌ Erro ao buscar municípios: {e}")
             return self._get_fallback_municipios()
@@ -117,25 +107,19 @@ class IBGEService:
             return cached_data
         
         try:
-            self._rate_limit()
-            
             # Construir URL para população (agregado 793, variável 93)
             ids_municipios = '|'.join([str(m['id']) for m in municipios])
             url = f"{self.base_urls['agregados']}/793/periodos/2022/variaveis/93?localidades=N6[{ids_municipios}]"
             
-            response = requests.get(url, timeout=15)
-            
-            if response.status_code == 200:
-                data = response.json()
-                processed_data = self._process_demographic_data(data)
-                self._save_to_cache(cache_key, processed_data)
-                print("✅ Dados demográficos obtidos da API IBGE")
-                return processed_data
+            data = await self._get_json(url, timeout=15)
+            processed_data = self._process_demographic_data(data)
+            self._save_to_cache(cache_key, processed_data)
+            print("✅ Dados demográficos obtidos da API IBGE")
+            return processed_data
             
-            else:
-                print(f"⚠️ API demográfica retornou status {response.status_code}")
-                return self._get_fallback_demograficos()
-                
+        except HTTPStatusError as e:
+            print(f"⚠️ API demográfica retornou status {e.status}")
+            return self._get_fallback_demograficos()
         except Exception as e:
             print(f"❌ Erro ao buscar dados demográficos: {e}")
             return self._get_fallback_demograficos()
@@ -150,29 +134,39 @@ class IBGEService:
             return cached_data
         
         try:
-            self._rate_limit()
-            
             # Construir URL para PIB (agregado 5938, variável 37)
             ids_municipios = '|'.join([str(m['id']) for m in municipios])
             url = f"{self.base_urls['agregados']}/5938/periodos/2020/variaveis/37?localidades=N6[{ids_municipios}]"
             
-            response = requests.get(url, timeout=15)
-            
-            if response.status_code == 200:
-                data = response.json()
-                processed_data = self._process_economic_data(data)
-                self._save_to_cache(cache_key, processed_data)
-                print("✅ Dados econômicos obtidos da API IBGE")
-                return processed_data
+            data = await self._get_json(url, timeout=15)
+            processed_data = self._process_economic_data(data)
+            self._save_to_cache(cache_key, processed_data)
+            print("✅ Dados econômicos obtidos da API IBGE")
+            return processed_data
             
-            else:
-                print(f"⚠️ API econômica retornou status {response.status_code}")
-                return self._get_fallback_economicos()
-                
+        except HTTPStatusError as e:
+            print(f"⚠️ API econômica retornou status {e.status}")
+            return self._get_fallback_economicos()
         except Exception as e:
             print(f"❌ Erro ao buscar dados econômicos: {e}")
             return self._get_fallback_economicos()
     
+    async def get_dados_consolidados(self) -> Dict:
+        """
+        Busca municípios e, em paralelo, dados demográficos e econômicos.
+        Os dois agregados são independentes e compartilham o pool do upstream IBGE.
+        """
+        municipios = await self.get_municipios_santa_catarina()
+        demograficos, economicos = await asyncio.gather(
+            self.get_dados_demograficos(municipios),
+            self.get_dados_economicos(municipios)
+        )
+        return {
+            'municipios': municipios,
+            'demograficos': demograficos,
+            'economicos': economicos
+        }
+    
     def _process_demographic_data(self, raw_data: List) -> Dict:
         """Processa dados demográficos da API IBGE"""
         processed = {}
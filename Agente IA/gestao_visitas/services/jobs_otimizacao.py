@@ -0,0 +1,445 @@
+"""
+Jobs assíncronos de otimização de rotas (PNSB 2024)
+As otimizações rodam num ProcessPoolExecutor (fora do GIL do servidor); o
+processo de trabalho publica progresso e a melhor solução parcial numa fila
+lida por uma thread do servidor, que alimenta os streams SSE. O cancelamento
+é cooperativo: o otimizador consulta o sinal a cada passo e devolve o melhor
+resultado obtido até ali. Resultados são memorizados pelo hash dos pontos e
+parâmetros, só quando os pontos vêm do corpo do pedido.
+"""
+
+import os
+import json
+import time
+import uuid
+import hashlib
+import logging
+import importlib
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from gestao_visitas.services.entrada_processos import main_leve
+
+logger = logging.getLogger(__name__)
+
+# Tipo de job -> "módulo:função"; a função recebe (dados, progress_callback)
+# e devolve (payload, status_http), como as rotas síncronas
+HANDLERS = {
+    'otimizar_rotas': 'gestao_visitas.services.route_optimizer:optimize_visits_payload',
+    'rota_diaria': 'gestao_visitas.routes.route_optimization_api:run_daily_route',
+    'plano_semanal': 'gestao_visitas.routes.route_optimization_api:run_weekly_plan',
+    'pnsb_diaria': 'gestao_visitas.routes.pnsb_optimization_api:run_daily_optimization',
+    'pnsb_semanal': 'gestao_visitas.routes.pnsb_optimization_api:run_weekly_optimization',
+}
+
+# Tipos que carregam os pontos do banco quando o corpo não traz pontos
+# próprios: tipo -> campo dos pontos customizados (None = sempre do banco)
+PONTOS_DO_BANCO = {
+    'rota_diaria': 'points',
+    'plano_semanal': 'points',
+    'pnsb_diaria': 'custom_points',
+    'pnsb_semanal': None,
+}
+
+# Configurações do Flask repassadas ao processo de trabalho
+CHAVES_CONFIG = ('SQLALCHEMY_DATABASE_URI', 'SQLALCHEMY_TRACK_MODIFICATIONS', 'GOOGLE_MAPS_API_KEY')
+
+STATUS_FINAIS = ('concluido', 'falhou', 'cancelado')
+
+INTERVALO_PROGRESSO = 0.25  # segundos entre eventos de progresso do mesmo job
+MAX_EVENTOS_POR_JOB = 200
+TTL_RESULTADOS = 30 * 60
+MAX_RESULTADOS_MEMORIZADOS = 100
+RETENCAO_JOBS = 60 * 60
+MAX_JOBS = 200
+
+
+class JobNaoEncontrado(KeyError):
+    """Job inexistente ou já descartado"""
+
+
+def chave_memoizacao(tipo: str, dados: Dict) -> str:
+    """
+    Hash do tipo e dos dados normalizados: listas de pontos (dicts) são
+    ordenadas, então a mesma seleção em outra ordem reaproveita o resultado.
+    """
+    def normalizar(valor):
+        if isinstance(valor, dict):
+            return {k: normalizar(v) for k, v in valor.items() if k not in ('async', 'assincrono')}
+        if isinstance(valor, list):
+            itens = [normalizar(v) for v in valor]
+            if itens and all(isinstance(v, dict) for v in itens):
+                itens.sort(key=lambda v: json.dumps(v, sort_keys=True, default=str))
+            return itens
+        return valor
+
+    texto = json.dumps({'tipo': tipo, 'dados': normalizar(dados)}, sort_keys=True, default=str)
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+
+def memorizavel(tipo: str, dados: Dict) -> bool:
+    """
+    O resultado depende só do corpo do pedido? Com pontos lidos do banco,
+    visitas e entidades alteradas (por qualquer processo) deixariam o plano
+    memorizado desatualizado; esses pedidos só são deduplicados em andamento.
+    """
+    if tipo not in PONTOS_DO_BANCO:
+        return True
+    campo = PONTOS_DO_BANCO[tipo]
+    return bool(campo and dados.get(campo))
+
+
+# ===== LADO DO PROCESSO DE TRABALHO =====
+
+_fila_eventos = None
+
+
+def _inicializar_worker(fila_eventos, config: Dict):
+    """Roda uma vez por processo: guarda a fila e abre um contexto de aplicação"""
+    global _fila_eventos
+    _fila_eventos = fila_eventos
+
+    from flask import Flask
+    from gestao_visitas.db import db
+
+    app = Flask('pnsb_jobs_otimizacao')
+    app.config.update(config)
+    db.init_app(app)
+    app.app_context().push()
+
+
+class _Progresso:
+    """
+    Callback entregue ao otimizador: progress(percentual, mensagem, parcial)
+    publica na fila (com limite de frequência) e retorna True se o job foi
+    cancelado.
+    """
+
+    def __init__(self, job_id: str, cancelar):
+        self.job_id = job_id
+        self.cancelar = cancelar
+        self.cancelado = False
+        self._ultimo_envio = 0.0
+        self._ultima_mensagem = None
+
+    def __call__(self, percentual: float, mensagem: str = None, parcial: Any = None) -> bool:
+        agora = time.monotonic()
+        if agora - self._ultimo_envio >= INTERVALO_PROGRESSO or mensagem != self._ultima_mensagem:
+            self._ultimo_envio = agora
+            self._ultima_mensagem = mensagem
+            if not self.cancelado:
+                self.cancelado = self.cancelar.is_set()
+            if _fila_eventos is not None:
+                _fila_eventos.put((self.job_id, 'progresso', {
+                    'percentual': round(max(0.0, min(100.0, percentual)), 1),
+                    'mensagem': mensagem,
+                    'parcial': parcial
+                }))
+        return self.cancelado
+
+
+def _resolver_handler(caminho: str) -> Callable:
+    modulo, funcao = caminho.split(':')
+    return getattr(importlib.import_module(modulo), funcao)
+
+
+def _executar_job(job_id: str, handler: str, dados: Dict, cancelar) -> Dict:
+    """Executado no processo de trabalho; `handler` é o "módulo:função" de HANDLERS"""
+    # Cancelado enquanto esperava na fila do pool: nem começa
+    if cancelar.is_set():
+        return {'payload': None, 'status_http': None, 'cancelado': True}
+    progresso = _Progresso(job_id, cancelar)
+    if _fila_eventos is not None:
+        _fila_eventos.put((job_id, 'iniciado', {'pid': os.getpid()}))
+    payload, status_http = _resolver_handler(handler)(dados, progresso)
+    return {
+        # Ida e volta em JSON: o payload precisa atravessar processos e o SSE
+        'payload': json.loads(json.dumps(payload, default=str)),
+        'status_http': status_http,
+        'cancelado': progresso.cancelado or cancelar.is_set()
+    }
+
+
+# ===== LADO DO SERVIDOR =====
+
+class GerenciadorJobsOtimizacao:
+    """Submissão, acompanhamento, cancelamento e memoização dos jobs"""
+
+    def __init__(self, max_workers: int = None):
+        self.max_workers = max_workers or int(os.environ.get('PNSB_JOBS_WORKERS', 0)) or min(2, os.cpu_count() or 1)
+        self._lock = threading.Lock()
+        self._condicao = threading.Condition(self._lock)
+        self._jobs: Dict[str, Dict] = {}
+        self._resultados: 'OrderedDict[str, Tuple[float, Dict]]' = OrderedDict()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._manager = None
+        self._fila = None
+        self._config: Dict = {}
+        self.metricas = {'submetidos': 0, 'memo_hits': 0, 'deduplicados': 0, 'concluidos': 0,
+                         'falhas': 0, 'cancelados': 0}
+
+    # ----- infraestrutura -----
+
+    def _garantir_executor(self, config: Dict):
+        """Sobe manager, fila de eventos, pool e thread leitora na primeira submissão"""
+        if self._executor is not None and config == self._config:
+            return
+        contexto = multiprocessing.get_context('spawn')
+        if self._manager is None:
+            with main_leve():
+                self._manager = contexto.Manager()
+            self._fila = self._manager.Queue()
+            threading.Thread(target=self._ler_eventos, name='jobs-otimizacao-eventos', daemon=True).start()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self._config = config
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=contexto,
+            initializer=_inicializar_worker,
+            initargs=(self._fila, config)
+        )
+        logger.info(f"⚙️ Pool de otimização iniciado com {self.max_workers} processos")
+
+    def _ler_eventos(self):
+        while True:
+            try:
+                job_id, tipo, dados = self._fila.get()
+            except (EOFError, OSError):
+                return
+            except Exception as e:
+                logger.error(f"❌ Erro lendo eventos dos jobs: {str(e)}")
+                time.sleep(1)
+                continue
+            with self._condicao:
+                job = self._jobs.get(job_id)
+                if not job or job['status'] in STATUS_FINAIS:
+                    continue
+                if tipo == 'iniciado':
+                    job['status'] = 'executando'
+                    job['iniciado_em'] = datetime.now().isoformat()
+                elif tipo == 'progresso':
+                    job['progresso'] = dados['percentual']
+                    job['mensagem'] = dados['mensagem']
+                    if dados.get('parcial') is not None:
+                        job['parcial'] = dados['parcial']
+                self._publicar(job, tipo, dados)
+
+    def _publicar(self, job: Dict, tipo: str, dados: Dict):
+        """Anexa um evento ao job e acorda os streams (chamar com o lock)"""
+        job['seq'] += 1
+        job['eventos'].append((job['seq'], tipo, dados))
+        if len(job['eventos']) > MAX_EVENTOS_POR_JOB:
+            # Mantém o primeiro (estado inicial) e os mais recentes
+            del job['eventos'][1:len(job['eventos']) - MAX_EVENTOS_POR_JOB + 1]
+        self._condicao.notify_all()
+
+    def _novo_job(self, tipo: str, chave: str) -> Dict:
+        job_id = uuid.uuid4().hex
+        job = {
+            'id': job_id, 'tipo': tipo, 'chave': chave, 'status': 'na_fila',
+            'progresso': 0.0, 'mensagem': None, 'parcial': None, 'resultado': None,
+            'erro': None, 'status_http': None, 'memoizado': False,
+            'criado_em': datetime.now().isoformat(), 'iniciado_em': None, 'finalizado_em': None,
+            'seq': 0, 'eventos': [], 'futuro': None, 'cancelar': None, '_finalizado': None
+        }
+        self._jobs[job_id] = job
+        self._publicar(job, 'status', {'status': 'na_fila'})
+        return job
+
+    def _finalizar(self, job: Dict, status: str, resultado: Dict = None, erro: str = None,
+                   status_http: int = None):
+        """Estado terminal do job (chamar com o lock)"""
+        job.update(status=status, resultado=resultado, erro=erro, status_http=status_http,
+                   finalizado_em=datetime.now().isoformat(), _finalizado=time.time())
+        if status == 'concluido':
+            job['progresso'] = 100.0
+        self.metricas[{'concluido': 'concluidos', 'falhou': 'falhas', 'cancelado': 'cancelados'}[status]] += 1
+        self._publicar(job, status, {
+            'status': status, 'resultado': resultado, 'erro': erro, 'parcial': job['parcial']
+        })
+
+    def _limpar(self):
+        """Descarta jobs finalizados antigos e resultados expirados (chamar com o lock)"""
+        agora = time.time()
+        finalizados = sorted(
+            (job['_finalizado'], job_id) for job_id, job in self._jobs.items() if job['_finalizado']
+        )
+        excedente = max(0, len(self._jobs) - MAX_JOBS)
+        for i, (quando, job_id) in enumerate(finalizados):
+            if i < excedente or agora - quando > RETENCAO_JOBS:
+                del self._jobs[job_id]
+        for chave in [c for c, (quando, _) in self._resultados.items() if agora - quando > TTL_RESULTADOS]:
+            del self._resultados[chave]
+
+    # ----- API pública -----
+
+    def submeter(self, tipo: str, dados: Dict, config: Dict = None) -> Dict:
+        """
+        Cria o job e devolve seu resumo. Resultado memorizado vira um job já
+        concluído; o mesmo pedido em andamento devolve o job existente.
+        """
+        if tipo not in HANDLERS:
+            raise ValueError(f"Tipo de job desconhecido: {tipo}")
+        if config is None:
+            from flask import current_app
+            config = {chave: current_app.config.get(chave) for chave in CHAVES_CONFIG}
+
+        chave = chave_memoizacao(tipo, dados)
+        usar_memo = memorizavel(tipo, dados)
+        with self._condicao:
+            self._limpar()
+            self.metricas['submetidos'] += 1
+
+            memorizado = self._resultados.get(chave) if usar_memo else None
+            if memorizado:
+                self._resultados.move_to_end(chave)
+                self.metricas['memo_hits'] += 1
+                job = self._novo_job(tipo, chave)
+                job['memoizado'] = True
+                self._finalizar(job, 'concluido', memorizado[1], status_http=200)
+                return self._resumo(job)
+
+            for existente in self._jobs.values():
+                if existente['chave'] == chave and existente['status'] not in STATUS_FINAIS:
+                    self.metricas['deduplicados'] += 1
+                    return self._resumo(existente)
+
+            job = self._novo_job(tipo, chave)
+            job['memorizavel'] = usar_memo
+            try:
+                self._garantir_executor(config)
+                job['cancelar'] = self._manager.Event()
+                # O pool cria os processos sob demanda, dentro do submit
+                with main_leve():
+                    futuro = self._executor.submit(_executar_job, job['id'], HANDLERS[tipo], dados, job['cancelar'])
+            except BrokenProcessPool:
+                # Processo morto (ex.: falta de memória): recria o pool uma vez
+                self._executor = None
+                self._garantir_executor(config)
+                with main_leve():
+                    futuro = self._executor.submit(_executar_job, job['id'], HANDLERS[tipo], dados, job['cancelar'])
+            job['futuro'] = futuro
+            resumo = self._resumo(job)
+
+        futuro.add_done_callback(lambda f, job_id=job['id']: self._concluir(job_id, f))
+        logger.info(f"📥 Job {tipo} {job['id'][:8]} submetido")
+        return resumo
+
+    def _concluir(self, job_id: str, futuro):
+        with self._condicao:
+            job = self._jobs.get(job_id)
+            if not job or job['status'] in STATUS_FINAIS:
+                return
+            if futuro.cancelled():
+                self._finalizar(job, 'cancelado')
+                return
+            erro = futuro.exception()
+            if erro is not None:
+                logger.error(f"❌ Job {job['tipo']} {job_id[:8]} falhou: {erro}")
+                self._finalizar(job, 'falhou', erro=str(erro), status_http=500)
+                return
+
+            saida = futuro.result()
+            payload, status_http = saida['payload'], saida['status_http']
+            if saida['cancelado']:
+                self._finalizar(job, 'cancelado', resultado=payload, status_http=status_http)
+            elif status_http >= 400:
+                erro = payload.get('error') or payload.get('erro') if isinstance(payload, dict) else None
+                self._finalizar(job, 'falhou', resultado=payload, erro=erro, status_http=status_http)
+            else:
+                self._finalizar(job, 'concluido', resultado=payload, status_http=status_http)
+                if job.get('memorizavel'):
+                    self._resultados[job['chave']] = (time.time(), payload)
+                    self._resultados.move_to_end(job['chave'])
+                    while len(self._resultados) > MAX_RESULTADOS_MEMORIZADOS:
+                        self._resultados.popitem(last=False)
+
+    def cancelar(self, job_id: str) -> Dict:
+        """Job na fila é cancelado na hora; em execução recebe o sinal e para no próximo passo"""
+        with self._condicao:
+            job = self._jobs.get(job_id)
+            if not job:
+                raise JobNaoEncontrado(job_id)
+            if job['status'] in STATUS_FINAIS:
+                return self._resumo(job)
+            if job['futuro'] is not None and job['futuro'].cancel():
+                self._finalizar(job, 'cancelado')
+            else:
+                job['cancelar'].set()
+                job['mensagem'] = 'Cancelamento solicitado'
+                self._publicar(job, 'cancelamento_solicitado', {})
+            return self._resumo(job)
+
+    def obter(self, job_id: str, incluir_resultado: bool = True) -> Dict:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job:
+                raise JobNaoEncontrado(job_id)
+            return self._resumo(job, incluir_resultado)
+
+    def listar(self) -> List[Dict]:
+        with self._lock:
+            return [self._resumo(job, incluir_resultado=False) for job in self._jobs.values()]
+
+    def acompanhar(self, job_id: str, desde: int = 0, intervalo_ping: float = 15.0) -> Iterator[Optional[Tuple[int, str, Dict]]]:
+        """
+        Eventos do job com seq > desde, até o evento final. Gera None a cada
+        `intervalo_ping` sem novidades (para o SSE mandar um comentário).
+        """
+        ultimo = desde
+        while True:
+            with self._condicao:
+                job = self._jobs.get(job_id)
+                if not job:
+                    raise JobNaoEncontrado(job_id)
+                novos = [evento for evento in job['eventos'] if evento[0] > ultimo]
+                if not novos:
+                    if job['status'] in STATUS_FINAIS:
+                        return
+                    self._condicao.wait(intervalo_ping)
+                    novos = [evento for evento in job['eventos'] if evento[0] > ultimo]
+                finalizado = job['status'] in STATUS_FINAIS
+            if not novos:
+                yield None
+                continue
+            for evento in novos:
+                ultimo = evento[0]
+                yield evento
+            if finalizado and ultimo >= job['seq']:
+                return
+
+    def estatisticas(self) -> Dict:
+        with self._lock:
+            por_status: Dict[str, int] = {}
+            for job in self._jobs.values():
+                por_status[job['status']] = por_status.get(job['status'], 0) + 1
+            return {
+                **self.metricas,
+                'jobs_por_status': por_status,
+                'resultados_memorizados': len(self._resultados),
+                'workers': self.max_workers,
+                'pool_ativo': self._executor is not None
+            }
+
+    def _resumo(self, job: Dict, incluir_resultado: bool = True) -> Dict:
+        resumo = {
+            chave: job[chave] for chave in (
+                'id', 'tipo', 'status', 'progresso', 'mensagem', 'memoizado',
+                'criado_em', 'iniciado_em', 'finalizado_em', 'erro', 'status_http'
+            )
+        }
+        resumo['ultimo_evento'] = job['seq']
+        if incluir_resultado:
+            resumo['parcial'] = job['parcial']
+            resumo['resultado'] = job['resultado']
+        return resumo
+
+
+# Instância global
+gerenciador_jobs = GerenciadorJobsOtimizacao()
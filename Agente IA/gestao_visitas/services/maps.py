@@ -2,16 +2,23 @@ import googlemaps
 from datetime import datetime, timedelta
 import logging
 
+from gestao_visitas.services.geometria_rotas import geometria_rotas, compactar_passos, normalizar_detalhe
+
 class MapaService:
     def __init__(self, api_key):
         self.client = googlemaps.Client(key=api_key)
         self.logger = logging.getLogger(__name__)
     
-    def calcular_rota(self, origem, destino, departure_time=None):
+    def calcular_rota(self, origem, destino, departure_time=None, detail='full', zoom=None):
         """
         Calcula rota com trânsito em tempo real para PNSB 2024
+        
+        detail='summary' devolve a polyline simplificada para a visão geral
+        do mapa e só o texto das primeiras instruções; 'full' mantém todos
+        os passos e a geometria no nível de rua.
         """
         try:
+            detail = normalizar_detalhe(detail)
             # Usar departure_time fornecido ou atual
             if departure_time is None:
                 departure_time = datetime.now()
@@ -49,8 +56,11 @@ class MapaService:
                     'impacto_transito_minutos': round(impacto_transito / 60, 1),
                     'percentual_transito': round(percentual_transito, 1),
                     'status_transito': self._classificar_transito(percentual_transito),
-                    'passos': [step['html_instructions'] for step in leg['steps']],
-                    'overview_polyline': rota['overview_polyline']['points'],
+                    'passos': compactar_passos(leg['steps'], detail),
+                    'overview_polyline': geometria_rotas.simplificar(
+                        rota['overview_polyline']['points'], detail, zoom
+                    )['polyline'],
+                    'detalhe': detail,
                     'warnings': rota.get('warnings', []),
                     'horario_partida': departure_time.strftime('%H:%M'),
                     'horario_chegada': (departure_time + timedelta(seconds=duracao_com_transito)).strftime('%H:%M')
@@ -105,11 +115,13 @@ class MapaService:
             self.logger.error(f"❌ Erro ao estimar tempo: {str(e)}")
             return {'erro': str(e)}
     
-    def calcular_rota_multipla(self, pontos, departure_time=None):
+    def calcular_rota_multipla(self, pontos, departure_time=None, detail='full', zoom=None):
         """
         Calcula rota otimizada para múltiplos pontos com trânsito
+        (detail/zoom como em calcular_rota)
         """
         try:
+            detail = normalizar_detalhe(detail)
             if len(pontos) < 2:
                 return {'erro': 'Pelo menos 2 pontos são necessários'}
             
@@ -159,7 +171,7 @@ class MapaService:
                         'duracao': self._seconds_to_text(duracao_trecho),
                         'horario_partida': horario_atual.strftime('%H:%M'),
                         'horario_chegada': (horario_atual + timedelta(seconds=duracao_trecho)).strftime('%H:%M'),
-                        'instrucoes': [step['html_instructions'] for step in leg['steps'][:3]]  # Primeiras 3 instruções
+                        'instrucoes': compactar_passos(leg['steps'], detail, limite=3)  # Primeiras 3 instruções
                     })
                     
                     horario_atual += timedelta(seconds=duracao_trecho)
@@ -175,7 +187,10 @@ class MapaService:
                     'percentual_transito': round(percentual_transito, 1),
                     'status_transito': self._classificar_transito(percentual_transito),
                     'trechos': trechos,
-                    'overview_polyline': rota['overview_polyline']['points'],
+                    'overview_polyline': geometria_rotas.simplificar(
+                        rota['overview_polyline']['points'], detail, zoom
+                    )['polyline'],
+                    'detalhe': detail,
                     'waypoint_order': rota.get('waypoint_order', []),
                     'warnings': rota.get('warnings', []),
                     'horario_partida': departure_time.strftime('%H:%M'),
@@ -0,0 +1,216 @@
+"""
+Motor de regras compilado para alertas e lembretes (PNSB 2024)
+Cada regra declara as colunas e o filtro de que precisa; o motor junta as
+regras de uma mesma tabela numa única consulta filtrada, avalia todas numa
+só passada pelas linhas e mede o custo de cada regra
+"""
+
+import time
+import logging
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, or_
+
+from ..db import db
+
+logger = logging.getLogger(__name__)
+
+
+def rotulo_coluna(coluna) -> str:
+    """Chave da coluna na linha entregue às regras, ex.: 'Visita.data'"""
+    return f"{coluna.class_.__name__}.{coluna.key}"
+
+
+@dataclass
+class Regra:
+    """
+    Regra de notificação.
+
+    - colunas: atributos lidos pela regra (do modelo principal ou das junções)
+    - filtro: ctx -> expressão SQL que seleciona as linhas de interesse
+    - avaliar: (linha, ctx, estado) chamado para cada linha que passou no filtro
+    - concluir: (estado, ctx) -> lista de alertas/lembretes gerados
+    - juncoes: ((modelo, condição), ...) necessárias para as colunas (outer join)
+    """
+    nome: str
+    grupo: str
+    modelo: Any
+    colunas: Tuple
+    filtro: Callable[[Dict], Any]
+    avaliar: Callable[[Dict, Dict, Dict], None]
+    concluir: Callable[[Dict, Dict], List[Dict]]
+    juncoes: Tuple = ()
+
+
+@dataclass
+class PlanoConsulta:
+    """Consulta única de uma tabela: união das colunas, junções e filtros das regras"""
+    modelo: Any
+    colunas: Tuple
+    rotulos: Tuple[str, ...]
+    juncoes: Tuple
+    regras: Tuple[Regra, ...]
+
+
+class MotorRegras:
+    """Compila as regras em planos por tabela e os executa em uma passada"""
+
+    def __init__(self, regras: Iterable[Regra]):
+        self.regras = list(regras)
+        self._planos: Dict[Tuple[str, ...], List[PlanoConsulta]] = {}
+        self.ultimo_relatorio: Dict = {}
+        self.acumulado = defaultdict(lambda: {'execucoes': 0, 'linhas': 0, 'resultados': 0, 'tempo_ms': 0.0})
+
+    def compilar(self, grupos: Iterable[str]) -> List[PlanoConsulta]:
+        """Planos (um por tabela) das regras dos grupos pedidos; ficam em cache"""
+        chave = tuple(sorted(set(grupos)))
+        if chave in self._planos:
+            return self._planos[chave]
+
+        por_modelo: Dict[Any, List[Regra]] = defaultdict(list)
+        for regra in self.regras:
+            if regra.grupo in chave:
+                por_modelo[regra.modelo].append(regra)
+
+        planos = []
+        for modelo, regras in por_modelo.items():
+            colunas, rotulos, juncoes = [], [], []
+            for regra in regras:
+                for coluna in regra.colunas:
+                    rotulo = rotulo_coluna(coluna)
+                    if rotulo not in rotulos:
+                        rotulos.append(rotulo)
+                        colunas.append(coluna)
+                for juncao in regra.juncoes:
+                    if all(juncao[0] is not existente[0] for existente in juncoes):
+                        juncoes.append(juncao)
+            planos.append(PlanoConsulta(modelo, tuple(colunas), tuple(rotulos), tuple(juncoes), tuple(regras)))
+
+        self._planos[chave] = planos
+        return planos
+
+    def executar(self, grupos: Iterable[str], ctx: Dict) -> Dict[str, List[Dict]]:
+        """
+        Executa as regras dos grupos e retorna {grupo: resultados}, na ordem
+        em que as regras foram declaradas. O relatório de custos fica em
+        `ultimo_relatorio`.
+        """
+        inicio_total = time.perf_counter()
+        resultados_regra: Dict[str, List[Dict]] = {}
+        relatorio_regras: Dict[str, Dict] = {}
+        relatorio_consultas: Dict[str, Dict] = {}
+
+        for plano in self.compilar(grupos):
+            tabela = plano.modelo.__tablename__
+            estados = [{} for _ in plano.regras]
+            custos = [{'linhas': 0, 'tempo': 0.0, 'erros': 0} for _ in plano.regras]
+            inicio_consulta = time.perf_counter()
+            linhas_lidas = 0
+
+            try:
+                filtros = [regra.filtro(ctx) for regra in plano.regras]
+                marcadores = [
+                    case((filtro, 1), else_=0).label(f"regra_{i}") for i, filtro in enumerate(filtros)
+                ]
+                consulta = db.session.query(*plano.colunas, *marcadores).select_from(plano.modelo)
+                for modelo_juncao, condicao in plano.juncoes:
+                    consulta = consulta.outerjoin(modelo_juncao, condicao)
+                consulta = consulta.filter(or_(*filtros))
+
+                total_colunas = len(plano.colunas)
+                for registro in consulta.yield_per(1000):
+                    linhas_lidas += 1
+                    linha = dict(zip(plano.rotulos, registro[:total_colunas]))
+                    for i, marcado in enumerate(registro[total_colunas:]):
+                        if not marcado:
+                            continue
+                        custo = custos[i]
+                        inicio = time.perf_counter()
+                        try:
+                            plano.regras[i].avaliar(linha, ctx, estados[i])
+                        except Exception as e:
+                            custo['erros'] += 1
+                            logger.error(f"Erro na regra {plano.regras[i].nome}: {str(e)}")
+                        custo['tempo'] += time.perf_counter() - inicio
+                        custo['linhas'] += 1
+            except Exception as e:
+                logger.error(f"❌ Erro na consulta de regras ({tabela}): {str(e)}")
+
+            tempo_avaliacao = sum(custo['tempo'] for custo in custos)
+            relatorio_consultas[tabela] = {
+                'regras': [regra.nome for regra in plano.regras],
+                'colunas': len(plano.colunas),
+                'linhas_lidas': linhas_lidas,
+                'tempo_consulta_ms': round((time.perf_counter() - inicio_consulta - tempo_avaliacao) * 1000, 3)
+            }
+
+            for regra, estado, custo in zip(plano.regras, estados, custos):
+                inicio = time.perf_counter()
+                try:
+                    gerados = regra.concluir(estado, ctx) or []
+                except Exception as e:
+                    custo['erros'] += 1
+                    logger.error(f"Erro ao concluir regra {regra.nome}: {str(e)}")
+                    gerados = []
+                custo['tempo'] += time.perf_counter() - inicio
+                resultados_regra[regra.nome] = gerados
+
+                relatorio_regras[regra.nome] = {
+                    'tabela': tabela,
+                    'linhas_avaliadas': custo['linhas'],
+                    'resultados': len(gerados),
+                    'erros': custo['erros'],
+                    'tempo_ms': round(custo['tempo'] * 1000, 3)
+                }
+                acumulado = self.acumulado[regra.nome]
+                acumulado['execucoes'] += 1
+                acumulado['linhas'] += custo['linhas']
+                acumulado['resultados'] += len(gerados)
+                acumulado['tempo_ms'] += custo['tempo'] * 1000
+
+        saida: Dict[str, List[Dict]] = {grupo: [] for grupo in grupos}
+        for regra in self.regras:
+            if regra.nome in resultados_regra:
+                saida[regra.grupo].extend(resultados_regra[regra.nome])
+
+        self.ultimo_relatorio = {
+            'consultas': relatorio_consultas,
+            'regras': relatorio_regras,
+            'tempo_total_ms': round((time.perf_counter() - inicio_total) * 1000, 3)
+        }
+        return saida
+
+    def relatorio_custos(self) -> Dict:
+        """Custo da última execução e acumulado por regra"""
+        return {
+            'ultima_execucao': self.ultimo_relatorio,
+            'acumulado': {
+                nome: {
+                    **valores,
+                    'tempo_ms': round(valores['tempo_ms'], 3),
+                    'tempo_medio_ms': round(valores['tempo_ms'] / valores['execucoes'], 3) if valores['execucoes'] else 0.0
+                }
+                for nome, valores in self.acumulado.items()
+            }
+        }
+
+
+def detectar_sobreposicoes(intervalos: List[Tuple[Any, Any, Any, Any]]) -> List[Tuple[Any, Any]]:
+    """
+    Pares de intervalos (dia, início, fim, item) sobrepostos no mesmo dia.
+
+    Varredura ordenada por dia e início: cada intervalo só é comparado com os
+    que ainda estão abertos. Extremos se tocando contam como sobreposição.
+    """
+    pares = []
+    ativos: List[Tuple[Any, Any]] = []
+    dia_atual = None
+    for dia, inicio, fim, item in sorted(intervalos, key=lambda i: (i[0], i[1], i[2])):
+        if dia != dia_atual:
+            dia_atual, ativos = dia, []
+        ativos = [(fim_ativo, ativo) for fim_ativo, ativo in ativos if fim_ativo >= inicio]
+        pares.extend((ativo, item) for _, ativo in ativos)
+        ativos.append((fim, item))
+    return pares
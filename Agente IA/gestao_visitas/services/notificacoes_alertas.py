@@ -6,9 +6,32 @@ from ..models.agendamento import Visita
 from ..models.checklist import Checklist
 from ..models.contatos import Contato
 from ..db import db
+from .motor_regras import MotorRegras, Regra, detectar_sobreposicoes
 import json
 from collections import defaultdict
 
+STATUS_PENDENTES = ['agendada', 'em preparação']
+LIMITE_DIAS_CONTATO = 90  # 3 meses
+
+# Itens marcáveis do checklist (antes, durante e após a visita)
+CAMPOS_CHECKLIST = (
+    'cracha_ibge', 'recibo_entrega', 'questionario_mrs_impresso', 'questionario_map_impresso',
+    'carta_oficial', 'questionario_mrs_digital', 'questionario_map_digital', 'manual_pnsb',
+    'guia_site_externo', 'card_contato', 'audio_explicativo', 'planejamento_rota', 'agenda_confirmada',
+    'apresentacao_ibge', 'explicacao_objetivo', 'explicacao_estrutura', 'explicacao_data_referencia',
+    'explicacao_prestador', 'explicacao_servicos', 'explicacao_site_externo', 'explicacao_pdf_editavel',
+    'validacao_prestadores', 'registro_contatos', 'assinatura_informante',
+    'devolucao_materiais', 'registro_followup', 'combinacao_entrega', 'combinacao_acompanhamento',
+    'observacoes_finais'
+)
+COLUNAS_CHECKLIST = tuple(getattr(Checklist, campo) for campo in CAMPOS_CHECKLIST)
+JUNCAO_CHECKLIST = (Checklist, Checklist.visita_id == Visita.id)
+
+def _progresso_checklist(linha: Dict):
+    """(percentual, itens marcados) do checklist a partir das colunas da linha"""
+    marcados = sum(1 for campo in CAMPOS_CHECKLIST if linha[f'Checklist.{campo}'])
+    return marcados / len(CAMPOS_CHECKLIST) * 100, marcados
+
 class TipoNotificacao(Enum):
     LEMBRETE = "lembrete"
     ALERTA = "alerta"
@@ -28,6 +51,7 @@ class SistemaNotificacoes:
     
     def __init__(self):
         self.regras_notificacao = self._carregar_regras_notificacao()
+        self.motor_regras = MotorRegras(self.regras_notificacao)
         self.templates_mensagens = self._carregar_templates_mensagens()
         self.configuracoes_usuario = {}
         self.historico_notificacoes = []
@@ -60,26 +84,11 @@ class SistemaNotificacoes:
     def verificar_alertas_sistema(self) -> List[Dict]:
         """Verifica e gera alertas do sistema"""
         
-        alertas = []
         agora = datetime.now()
         
-        # 1. Visitas atrasadas
-        alertas.extend(self._verificar_visitas_atrasadas())
-        
-        # 2. Checklists incompletos
-        alertas.extend(self._verificar_checklists_incompletos())
-        
-        # 3. Contatos desatualizados
-        alertas.extend(self._verificar_contatos_desatualizados())
-        
-        # 4. Metas não cumpridas
-        alertas.extend(self._verificar_metas_nao_cumpridas())
-        
-        # 5. Conflitos de agendamento
-        alertas.extend(self._verificar_conflitos_agendamento())
-        
-        # 6. Problemas de qualidade
-        alertas.extend(self._verificar_problemas_qualidade())
+        # Visitas atrasadas, checklists incompletos, contatos desatualizados,
+        # metas, conflitos e qualidade: uma consulta por tabela
+        alertas = self.motor_regras.executar(['alertas'], self._contexto_regras())['alertas']
         
         # Processar alertas e gerar notificações
         notificacoes_geradas = []
@@ -93,35 +102,24 @@ class SistemaNotificacoes:
             'total_alertas': len(alertas),
             'alertas_detectados': alertas,
             'notificacoes_geradas': len(notificacoes_geradas),
-            'notificacoes': notificacoes_geradas
+            'notificacoes': notificacoes_geradas,
+            'custo_regras': self.motor_regras.ultimo_relatorio
         }
     
     def gerar_lembretes_inteligentes(self) -> List[Dict]:
         """Gera lembretes inteligentes baseados em contexto"""
         
-        lembretes = []
         agora = datetime.now()
         
-        # Lembretes de visitas próximas
-        lembretes.extend(self._gerar_lembretes_visitas_proximas())
-        
-        # Lembretes de preparação
-        lembretes.extend(self._gerar_lembretes_preparacao())
-        
-        # Lembretes de follow-up
-        lembretes.extend(self._gerar_lembretes_followup())
-        
-        # Lembretes de revisão
-        lembretes.extend(self._gerar_lembretes_revisao())
-        
-        # Lembretes sazonais/contextuais
-        lembretes.extend(self._gerar_lembretes_contextuais())
+        # Visitas de amanhã e preparação da próxima semana
+        lembretes = self.motor_regras.executar(['lembretes'], self._contexto_regras())['lembretes']
         
         return {
             'timestamp_geracao': agora.isoformat(),
             'total_lembretes': len(lembretes),
             'lembretes_ativos': lembretes,
-            'proxima_verificacao': (agora + timedelta(hours=1)).isoformat()
+            'proxima_verificacao': (agora + timedelta(hours=1)).isoformat(),
+            'custo_regras': self.motor_regras.ultimo_relatorio
         }
     
     def enviar_notificacao(self, notificacao: Dict, usuario_id: str = 'default') -> Dict:
@@ -267,138 +265,144 @@ class SistemaNotificacoes:
             'recomendacoes_otimizacao': self._gerar_recomendacoes_otimizacao(taxas_sucesso, notif_por_tipo)
         }
     
-    # Métodos auxiliares de verificação de alertas
+    # Regras de alertas e lembretes (avaliadas pelo motor de regras)
     
-    def _verificar_visitas_atrasadas(self) -> List[Dict]:
-        """Verifica visitas atrasadas"""
-        
+    def _contexto_regras(self) -> Dict:
+        """Datas de referência compartilhadas pelas regras de uma execução"""
         hoje = date.today()
-        visitas_atrasadas = Visita.query.filter(
-            and_(
-                Visita.data < hoje,
-                Visita.status.in_(['agendada', 'em preparação'])
-            )
-        ).all()
+        return {
+            'hoje': hoje,
+            'agora': datetime.now(),
+            'amanha': hoje + timedelta(days=1),
+            'proxima_semana': hoje + timedelta(days=7),
+            'ultima_semana': hoje - timedelta(days=7),
+            'limite_contatos': datetime.now() - timedelta(days=LIMITE_DIAS_CONTATO)
+        }
+    
+    def _regra_visitas_atrasadas(self) -> Regra:
+        """Visitas com data passada ainda agendadas ou em preparação"""
         
-        alertas = []
-        for visita in visitas_atrasadas:
-            dias_atraso = (hoje - visita.data).days
-            
-            alertas.append({
-                'id': f"atraso_visita_{visita.id}",
-                'tipo': TipoNotificacao.ALERTA.value,
-                'severidade': 'alta' if dias_atraso > 7 else 'media',
-                'titulo': f"Visita atrasada - {visita.municipio}",
-                'mensagem': f"Visita agendada para {visita.data.strftime('%d/%m/%Y')} está {dias_atraso} dia(s) em atraso",
+        def avaliar(linha, ctx, estado):
+            estado.setdefault('visitas', []).append(linha)
+        
+        def concluir(estado, ctx):
+            alertas = []
+            for visita in estado.get('visitas', []):
+                dias_atraso = (ctx['hoje'] - visita['Visita.data']).days
+                alertas.append({
+                    'id': f"atraso_visita_{visita['Visita.id']}",
+                    'tipo': TipoNotificacao.ALERTA.value,
+                    'severidade': 'alta' if dias_atraso > 7 else 'media',
+                    'titulo': f"Visita atrasada - {visita['Visita.municipio']}",
+                    'mensagem': f"Visita agendada para {visita['Visita.data'].strftime('%d/%m/%Y')} está {dias_atraso} dia(s) em atraso",
+                    'dados_contexto': {
+                        'visita_id': visita['Visita.id'],
+                        'municipio': visita['Visita.municipio'],
+                        'dias_atraso': dias_atraso,
+                        'local': visita['Visita.local']
+                    },
+                    'acoes_sugeridas': [
+                        {'acao': 'reagendar', 'texto': 'Reagendar visita'},
+                        {'acao': 'cancelar', 'texto': 'Cancelar visita'},
+                        {'acao': 'contatar', 'texto': 'Contatar informante'}
+                    ],
+                    'timestamp_deteccao': ctx['agora'].isoformat()
+                })
+            return alertas
+        
+        return Regra(
+            nome='visitas_atrasadas', grupo='alertas', modelo=Visita,
+            colunas=(Visita.id, Visita.data, Visita.municipio, Visita.local),
+            filtro=lambda ctx: and_(Visita.data < ctx['hoje'], Visita.status.in_(STATUS_PENDENTES)),
+            avaliar=avaliar, concluir=concluir
+        )
+    
+    def _regra_checklists_incompletos(self) -> Regra:
+        """Visitas realizadas com checklist abaixo de 80%"""
+        
+        def avaliar(linha, ctx, estado):
+            percentual, marcados = _progresso_checklist(linha)
+            if percentual < 80:  # Menos de 80% completo
+                estado.setdefault('visitas', []).append((linha, percentual, marcados))
+        
+        def concluir(estado, ctx):
+            return [{
+                'id': f"checklist_incompleto_{visita['Visita.id']}",
+                'tipo': TipoNotificacao.AVISO.value,
+                'severidade': 'media',
+                'titulo': f"Checklist incompleto - {visita['Visita.municipio']}",
+                'mensagem': f"Checklist da visita realizada está {percentual:.1f}% completo",
                 'dados_contexto': {
-                    'visita_id': visita.id,
-                    'municipio': visita.municipio,
-                    'dias_atraso': dias_atraso,
-                    'local': visita.local
+                    'visita_id': visita['Visita.id'],
+                    'municipio': visita['Visita.municipio'],
+                    'percentual_completo': percentual,
+                    'itens_faltantes': len(CAMPOS_CHECKLIST) - marcados
                 },
                 'acoes_sugeridas': [
-                    {'acao': 'reagendar', 'texto': 'Reagendar visita'},
-                    {'acao': 'cancelar', 'texto': 'Cancelar visita'},
-                    {'acao': 'contatar', 'texto': 'Contatar informante'}
+                    {'acao': 'completar', 'texto': 'Completar checklist'},
+                    {'acao': 'revisar', 'texto': 'Revisar itens faltantes'}
                 ],
-                'timestamp_deteccao': datetime.now().isoformat()
-            })
-        
-        return alertas
-    
-    def _verificar_checklists_incompletos(self) -> List[Dict]:
-        """Verifica checklists incompletos em visitas realizadas"""
-        
-        alertas = []
-        
-        # Buscar visitas realizadas com checklists incompletos
-        visitas_realizadas = Visita.query.filter(
-            Visita.status == 'realizada'
-        ).all()
-        
-        for visita in visitas_realizadas:
-            if visita.checklist:
-                progresso = visita.checklist.progresso_geral()
-                
-                if progresso['percentual'] < 80:  # Menos de 80% completo
-                    alertas.append({
-                        'id': f"checklist_incompleto_{visita.id}",
-                        'tipo': TipoNotificacao.AVISO.value,
-                        'severidade': 'media',
-                        'titulo': f"Checklist incompleto - {visita.municipio}",
-                        'mensagem': f"Checklist da visita realizada está {progresso['percentual']:.1f}% completo",
-                        'dados_contexto': {
-                            'visita_id': visita.id,
-                            'municipio': visita.municipio,
-                            'percentual_completo': progresso['percentual'],
-                            'itens_faltantes': progresso['total_itens'] - progresso['itens_concluidos']
-                        },
-                        'acoes_sugeridas': [
-                            {'acao': 'completar', 'texto': 'Completar checklist'},
-                            {'acao': 'revisar', 'texto': 'Revisar itens faltantes'}
-                        ],
-                        'timestamp_deteccao': datetime.now().isoformat()
-                    })
-        
-        return alertas
-    
-    def _verificar_contatos_desatualizados(self) -> List[Dict]:
-        """Verifica contatos que precisam de atualização"""
-        
-        alertas = []
-        limite_dias = 90  # 3 meses
-        data_limite = datetime.now() - timedelta(days=limite_dias)
-        
-        contatos_desatualizados = Contato.query.filter(
-            or_(
-                Contato.data_atualizacao < data_limite,
-                Contato.data_atualizacao.is_(None)
-            )
-        ).all()
-        
-        if len(contatos_desatualizados) > 0:
-            alertas.append({
+                'timestamp_deteccao': ctx['agora'].isoformat()
+            } for visita, percentual, marcados in estado.get('visitas', [])]
+        
+        return Regra(
+            nome='checklists_incompletos', grupo='alertas', modelo=Visita,
+            colunas=(Visita.id, Visita.municipio, Checklist.id, *COLUNAS_CHECKLIST),
+            filtro=lambda ctx: and_(Visita.status == 'realizada', Checklist.id.isnot(None)),
+            avaliar=avaliar, concluir=concluir, juncoes=(JUNCAO_CHECKLIST,)
+        )
+    
+    def _regra_contatos_desatualizados(self) -> Regra:
+        """Contatos sem atualização há mais de LIMITE_DIAS_CONTATO dias"""
+        
+        def avaliar(linha, ctx, estado):
+            estado['total'] = estado.get('total', 0) + 1
+            estado.setdefault('municipios', set()).add(linha['Contato.municipio'])
+        
+        def concluir(estado, ctx):
+            if not estado.get('total'):
+                return []
+            return [{
                 'id': "contatos_desatualizados",
                 'tipo': TipoNotificacao.INFORMATIVO.value,
                 'severidade': 'baixa',
-                'titulo': f"{len(contatos_desatualizados)} contato(s) desatualizado(s)",
-                'mensagem': f"Contatos não atualizados há mais de {limite_dias} dias",
+                'titulo': f"{estado['total']} contato(s) desatualizado(s)",
+                'mensagem': f"Contatos não atualizados há mais de {LIMITE_DIAS_CONTATO} dias",
                 'dados_contexto': {
-                    'total_desatualizados': len(contatos_desatualizados),
-                    'municipios_afetados': list(set(c.municipio for c in contatos_desatualizados)),
-                    'limite_dias': limite_dias
+                    'total_desatualizados': estado['total'],
+                    'municipios_afetados': sorted(estado['municipios']),
+                    'limite_dias': LIMITE_DIAS_CONTATO
                 },
                 'acoes_sugeridas': [
                     {'acao': 'atualizar_todos', 'texto': 'Atualizar todos os contatos'},
                     {'acao': 'revisar_lista', 'texto': 'Revisar lista de contatos'}
                 ],
-                'timestamp_deteccao': datetime.now().isoformat()
-            })
-        
-        return alertas
+                'timestamp_deteccao': ctx['agora'].isoformat()
+            }]
+        
+        return Regra(
+            nome='contatos_desatualizados', grupo='alertas', modelo=Contato,
+            colunas=(Contato.municipio,),
+            filtro=lambda ctx: or_(
+                Contato.data_atualizacao < ctx['limite_contatos'],
+                Contato.data_atualizacao.is_(None)
+            ),
+            avaliar=avaliar, concluir=concluir
+        )
     
-    def _verificar_metas_nao_cumpridas(self) -> List[Dict]:
-        """Verifica metas não cumpridas"""
-        
-        alertas = []
-        
-        # Meta: todos os 11 municípios devem ter pelo menos uma visita realizada
-        municipios_sem_visita = []
+    def _regra_metas_nao_cumpridas(self) -> Regra:
+        """Meta: todos os 11 municípios devem ter pelo menos uma visita realizada"""
         from ..config import MUNICIPIOS
         
-        for municipio in MUNICIPIOS:
-            visitas_realizadas = Visita.query.filter(
-                and_(
-                    Visita.municipio == municipio,
-                    Visita.status == 'realizada'
-                )
-            ).count()
-            
-            if visitas_realizadas == 0:
-                municipios_sem_visita.append(municipio)
+        def avaliar(linha, ctx, estado):
+            estado.setdefault('municipios', set()).add(linha['Visita.municipio'])
         
-        if municipios_sem_visita:
-            alertas.append({
+        def concluir(estado, ctx):
+            visitados = estado.get('municipios', set())
+            municipios_sem_visita = [m for m in MUNICIPIOS if m not in visitados]
+            if not municipios_sem_visita:
+                return []
+            return [{
                 'id': "meta_cobertura_municipios",
                 'tipo': TipoNotificacao.ALERTA.value,
                 'severidade': 'alta',
@@ -413,43 +417,29 @@ class SistemaNotificacoes:
                     {'acao': 'agendar_visitas', 'texto': 'Agendar visitas para municípios pendentes'},
                     {'acao': 'priorizar_municipios', 'texto': 'Priorizar municípios sem cobertura'}
                 ],
-                'timestamp_deteccao': datetime.now().isoformat()
-            })
-        
-        return alertas
-    
-    def _verificar_conflitos_agendamento(self) -> List[Dict]:
-        """Verifica conflitos de agendamento"""
-        
-        alertas = []
-        
-        # Buscar visitas agendadas para os próximos 7 dias
-        data_inicio = date.today()
-        data_fim = data_inicio + timedelta(days=7)
-        
-        visitas_proximas = Visita.query.filter(
-            and_(
-                Visita.data >= data_inicio,
-                Visita.data <= data_fim,
-                Visita.status.in_(['agendada', 'em preparação'])
+                'timestamp_deteccao': ctx['agora'].isoformat()
+            }]
+        
+        return Regra(
+            nome='metas_nao_cumpridas', grupo='alertas', modelo=Visita,
+            colunas=(Visita.municipio,),
+            filtro=lambda ctx: Visita.status == 'realizada',
+            avaliar=avaliar, concluir=concluir
+        )
+    
+    def _regra_conflitos_agendamento(self) -> Regra:
+        """Visitas dos próximos 7 dias com horários sobrepostos (varredura por dia)"""
+        
+        def avaliar(linha, ctx, estado):
+            estado.setdefault('intervalos', []).append(
+                (linha['Visita.data'], linha['Visita.hora_inicio'], linha['Visita.hora_fim'], linha)
             )
-        ).order_by(Visita.data, Visita.hora_inicio).all()
-        
-        # Verificar sobreposições
-        conflitos_detectados = []
-        for i, visita1 in enumerate(visitas_proximas):
-            for visita2 in visitas_proximas[i+1:]:
-                if (visita1.data == visita2.data and 
-                    self._horarios_sobrepostos(visita1, visita2)):
-                    
-                    conflitos_detectados.append({
-                        'visita1': visita1,
-                        'visita2': visita2,
-                        'tipo_conflito': 'sobreposicao_horario'
-                    })
-        
-        if conflitos_detectados:
-            alertas.append({
+        
+        def concluir(estado, ctx):
+            conflitos_detectados = detectar_sobreposicoes(estado.get('intervalos', []))
+            if not conflitos_detectados:
+                return []
+            return [{
                 'id': "conflitos_agendamento",
                 'tipo': TipoNotificacao.ALERTA.value,
                 'severidade': 'alta',
@@ -459,131 +449,151 @@ class SistemaNotificacoes:
                     'total_conflitos': len(conflitos_detectados),
                     'conflitos': [
                         {
-                            'data': c['visita1'].data.strftime('%d/%m/%Y'),
-                            'municipio1': c['visita1'].municipio,
-                            'municipio2': c['visita2'].municipio,
-                            'horario1': c['visita1'].hora_inicio.strftime('%H:%M'),
-                            'horario2': c['visita2'].hora_inicio.strftime('%H:%M')
+                            'data': visita1['Visita.data'].strftime('%d/%m/%Y'),
+                            'municipio1': visita1['Visita.municipio'],
+                            'municipio2': visita2['Visita.municipio'],
+                            'horario1': visita1['Visita.hora_inicio'].strftime('%H:%M'),
+                            'horario2': visita2['Visita.hora_inicio'].strftime('%H:%M')
                         }
-                        for c in conflitos_detectados
+                        for visita1, visita2 in conflitos_detectados
                     ]
                 },
                 'acoes_sugeridas': [
                     {'acao': 'resolver_conflitos', 'texto': 'Resolver conflitos de horário'},
                     {'acao': 'reagendar_automatico', 'texto': 'Sugerir reagendamento automático'}
                 ],
-                'timestamp_deteccao': datetime.now().isoformat()
-            })
-        
-        return alertas
-    
-    def _verificar_problemas_qualidade(self) -> List[Dict]:
-        """Verifica problemas recorrentes de qualidade"""
-        
-        alertas = []
-        
-        # Verificar taxa de cancelamento alta
-        ultima_semana = date.today() - timedelta(days=7)
-        visitas_semana = Visita.query.filter(Visita.data >= ultima_semana).all()
-        
-        if visitas_semana:
-            visitas_canceladas = [v for v in visitas_semana if v.status == 'cancelada']
-            taxa_cancelamento = (len(visitas_canceladas) / len(visitas_semana)) * 100
-            
-            if taxa_cancelamento > 20:  # Mais de 20% de cancelamento
-                alertas.append({
-                    'id': "alta_taxa_cancelamento",
-                    'tipo': TipoNotificacao.AVISO.value,
-                    'severidade': 'media',
-                    'titulo': f"Alta taxa de cancelamento: {taxa_cancelamento:.1f}%",
-                    'mensagem': f"Taxa de cancelamento acima do esperado na última semana",
-                    'dados_contexto': {
-                        'taxa_cancelamento': taxa_cancelamento,
-                        'visitas_canceladas': len(visitas_canceladas),
-                        'total_visitas': len(visitas_semana),
-                        'periodo': '7 dias'
-                    },
-                    'acoes_sugeridas': [
-                        {'acao': 'analisar_causas', 'texto': 'Analisar causas dos cancelamentos'},
-                        {'acao': 'melhorar_processo', 'texto': 'Revisar processo de agendamento'}
-                    ],
-                    'timestamp_deteccao': datetime.now().isoformat()
-                })
+                'timestamp_deteccao': ctx['agora'].isoformat()
+            }]
+        
+        return Regra(
+            nome='conflitos_agendamento', grupo='alertas', modelo=Visita,
+            colunas=(Visita.data, Visita.hora_inicio, Visita.hora_fim, Visita.municipio),
+            filtro=lambda ctx: and_(
+                Visita.data >= ctx['hoje'],
+                Visita.data <= ctx['proxima_semana'],
+                Visita.status.in_(STATUS_PENDENTES)
+            ),
+            avaliar=avaliar, concluir=concluir
+        )
+    
+    def _regra_problemas_qualidade(self) -> Regra:
+        """Taxa de cancelamento da última semana acima de 20%"""
+        
+        def avaliar(linha, ctx, estado):
+            estado['total'] = estado.get('total', 0) + 1
+            if linha['Visita.status'] == 'cancelada':
+                estado['canceladas'] = estado.get('canceladas', 0) + 1
+        
+        def concluir(estado, ctx):
+            total = estado.get('total', 0)
+            if not total:
+                return []
+            canceladas = estado.get('canceladas', 0)
+            taxa_cancelamento = (canceladas / total) * 100
+            if taxa_cancelamento <= 20:  # Mais de 20% de cancelamento
+                return []
+            return [{
+                'id': "alta_taxa_cancelamento",
+                'tipo': TipoNotificacao.AVISO.value,
+                'severidade': 'media',
+                'titulo': f"Alta taxa de cancelamento: {taxa_cancelamento:.1f}%",
+                'mensagem': f"Taxa de cancelamento acima do esperado na última semana",
+                'dados_contexto': {
+                    'taxa_cancelamento': taxa_cancelamento,
+                    'visitas_canceladas': canceladas,
+                    'total_visitas': total,
+                    'periodo': '7 dias'
+                },
+                'acoes_sugeridas': [
+                    {'acao': 'analisar_causas', 'texto': 'Analisar causas dos cancelamentos'},
+                    {'acao': 'melhorar_processo', 'texto': 'Revisar processo de agendamento'}
+                ],
+                'timestamp_deteccao': ctx['agora'].isoformat()
+            }]
         
-        return alertas
-    
-    # Métodos auxiliares de lembretes
+        return Regra(
+            nome='problemas_qualidade', grupo='alertas', modelo=Visita,
+            colunas=(Visita.status,),
+            filtro=lambda ctx: Visita.data >= ctx['ultima_semana'],
+            avaliar=avaliar, concluir=concluir
+        )
     
-    def _gerar_lembretes_visitas_proximas(self) -> List[Dict]:
-        """Gera lembretes para visitas próximas"""
+    def _regra_lembretes_visitas_proximas(self) -> Regra:
+        """Lembretes para visitas de amanhã"""
         
-        lembretes = []
-        amanha = date.today() + timedelta(days=1)
-        
-        visitas_amanha = Visita.query.filter(
-            and_(
-                Visita.data == amanha,
-                Visita.status.in_(['agendada', 'em preparação'])
-            )
-        ).all()
+        def avaliar(linha, ctx, estado):
+            estado.setdefault('visitas', []).append(linha)
         
-        for visita in visitas_amanha:
-            lembretes.append({
-                'id': f"lembrete_visita_{visita.id}",
+        def concluir(estado, ctx):
+            return [{
+                'id': f"lembrete_visita_{visita['Visita.id']}",
                 'tipo': TipoNotificacao.LEMBRETE.value,
-                'titulo': f"Visita amanhã - {visita.municipio}",
-                'mensagem': f"Visita agendada para {visita.data.strftime('%d/%m/%Y')} às {visita.hora_inicio.strftime('%H:%M')}",
+                'titulo': f"Visita amanhã - {visita['Visita.municipio']}",
+                'mensagem': f"Visita agendada para {visita['Visita.data'].strftime('%d/%m/%Y')} às {visita['Visita.hora_inicio'].strftime('%H:%M')}",
                 'dados_contexto': {
-                    'visita_id': visita.id,
-                    'municipio': visita.municipio,
-                    'local': visita.local,
-                    'tipo_pesquisa': visita.tipo_pesquisa
+                    'visita_id': visita['Visita.id'],
+                    'municipio': visita['Visita.municipio'],
+                    'local': visita['Visita.local'],
+                    'tipo_pesquisa': visita['Visita.tipo_pesquisa']
                 },
                 'acoes_sugeridas': [
                     {'acao': 'ver_checklist', 'texto': 'Ver checklist de preparação'},
                     {'acao': 'confirmar_visita', 'texto': 'Confirmar com informante'}
                 ],
-                'agendado_para': (datetime.combine(amanha, time(8, 0)) - timedelta(days=1)).isoformat()
-            })
-        
-        return lembretes
-    
-    def _gerar_lembretes_preparacao(self) -> List[Dict]:
-        """Gera lembretes de preparação para visitas"""
-        
-        lembretes = []
-        proxima_semana = date.today() + timedelta(days=7)
-        
-        visitas_proxima_semana = Visita.query.filter(
-            and_(
-                Visita.data <= proxima_semana,
-                Visita.data > date.today(),
-                Visita.status == 'agendada'
-            )
-        ).all()
-        
-        for visita in visitas_proxima_semana:
-            # Verificar se checklist está preparado
-            if not visita.checklist or visita.checklist.progresso_geral()['percentual'] < 50:
+                'agendado_para': (datetime.combine(ctx['amanha'], time(8, 0)) - timedelta(days=1)).isoformat()
+            } for visita in estado.get('visitas', [])]
+        
+        return Regra(
+            nome='lembretes_visitas_proximas', grupo='lembretes', modelo=Visita,
+            colunas=(Visita.id, Visita.data, Visita.hora_inicio, Visita.municipio, Visita.local, Visita.tipo_pesquisa),
+            filtro=lambda ctx: and_(Visita.data == ctx['amanha'], Visita.status.in_(STATUS_PENDENTES)),
+            avaliar=avaliar, concluir=concluir
+        )
+    
+    def _regra_lembretes_preparacao(self) -> Regra:
+        """Visitas da próxima semana sem checklist ou com menos de 50% preparado"""
+        
+        def avaliar(linha, ctx, estado):
+            if linha['Checklist.id'] is None or _progresso_checklist(linha)[0] < 50:
+                estado.setdefault('visitas', []).append(linha)
+        
+        def concluir(estado, ctx):
+            lembretes = []
+            for visita in estado.get('visitas', []):
+                dias_restantes = (visita['Visita.data'] - ctx['hoje']).days
                 lembretes.append({
-                    'id': f"preparacao_visita_{visita.id}",
+                    'id': f"preparacao_visita_{visita['Visita.id']}",
                     'tipo': TipoNotificacao.LEMBRETE.value,
-                    'titulo': f"Preparar visita - {visita.municipio}",
-                    'mensagem': f"Completar preparação para visita em {visita.municipio}",
+                    'titulo': f"Preparar visita - {visita['Visita.municipio']}",
+                    'mensagem': f"Completar preparação para visita em {visita['Visita.municipio']}",
                     'dados_contexto': {
-                        'visita_id': visita.id,
-                        'municipio': visita.municipio,
-                        'data_visita': visita.data.strftime('%d/%m/%Y'),
-                        'dias_restantes': (visita.data - date.today()).days
+                        'visita_id': visita['Visita.id'],
+                        'municipio': visita['Visita.municipio'],
+                        'data_visita': visita['Visita.data'].strftime('%d/%m/%Y'),
+                        'dias_restantes': dias_restantes
                     },
                     'acoes_sugeridas': [
                         {'acao': 'completar_checklist', 'texto': 'Completar checklist'},
                         {'acao': 'verificar_materiais', 'texto': 'Verificar materiais necessários'}
                     ],
-                    'prioridade': 'alta' if (visita.data - date.today()).days <= 2 else 'media'
+                    'prioridade': 'alta' if dias_restantes <= 2 else 'media'
                 })
-        
-        return lembretes
+            return lembretes
+        
+        return Regra(
+            nome='lembretes_preparacao', grupo='lembretes', modelo=Visita,
+            colunas=(Visita.id, Visita.data, Visita.municipio, Checklist.id, *COLUNAS_CHECKLIST),
+            filtro=lambda ctx: and_(
+                Visita.data <= ctx['proxima_semana'],
+                Visita.data > ctx['hoje'],
+                Visita.status == 'agendada'
+            ),
+            avaliar=avaliar, concluir=concluir, juncoes=(JUNCAO_CHECKLIST,)
+        )
+    
+    def obter_relatorio_custos_regras(self) -> Dict:
+        """Custo por regra (última execução e acumulado)"""
+        return self.motor_regras.relatorio_custos()
     
     # Métodos auxiliares de processamento
     
@@ -703,9 +713,18 @@ class SistemaNotificacoes:
     
     # Métodos auxiliares (implementações simplificadas)
     
-    def _carregar_regras_notificacao(self) -> Dict:
-        """Carrega regras de notificação"""
-        return {}
+    def _carregar_regras_notificacao(self) -> List[Regra]:
+        """Carrega regras de notificação (a ordem define a ordem dos resultados)"""
+        return [
+            self._regra_visitas_atrasadas(),
+            self._regra_checklists_incompletos(),
+            self._regra_contatos_desatualizados(),
+            self._regra_metas_nao_cumpridas(),
+            self._regra_conflitos_agendamento(),
+            self._regra_problemas_qualidade(),
+            self._regra_lembretes_visitas_proximas(),
+            self._regra_lembretes_preparacao()
+        ]
     
     def _carregar_templates_mensagens(self) -> Dict:
         """Carrega templates de mensagens"""
@@ -715,11 +734,6 @@ class SistemaNotificacoes:
         """Testa canais de notificação configurados"""
         return {'email': True, 'sms': False, 'sistema': True}
     
-    def _horarios_sobrepostos(self, visita1: Visita, visita2: Visita) -> bool:
-        """Verifica se horários de duas visitas se sobrepõem"""
-        return (visita1.hora_inicio <= visita2.hora_inicio <= visita1.hora_fim or
-                visita2.hora_inicio <= visita1.hora_inicio <= visita2.hora_fim)
-    
     def _alerta_ja_enviado_recentemente(self, alerta_id: str) -> bool:
         """Verifica se alerta já foi enviado recentemente"""
         # Implementação simplificada
@@ -9,14 +9,24 @@ import requests
 import time
 import hashlib
 import sqlite3
+import threading
+import itertools
+import uuid
 import googlemaps
+import numpy as np
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 from flask import current_app
 import logging
 
 from gestao_visitas.db import db
-from gestao_visitas.models.questionarios_obrigatorios import EntidadeIdentificada, EntidadePrioritariaUF
+from gestao_visitas.services.repositorio_pontos_rota import repositorio_pontos_rota
+
+
+class PrecalculoEmAndamentoError(Exception):
+    """Já existe uma execução ativa do mesmo pré-cálculo neste processo"""
 
 
 class OfflineMapsService:
@@ -213,130 +223,55 @@ class OfflineMapsService:
         
         return None
     
-    def precalculate_entity_routes(self, municipio: str = None) -> Dict:
+    def precalculate_entity_routes(self, municipio: str = None, max_workers: int = 4,
+                                   requisicoes_por_segundo: float = 10.0) -> Dict:
         """
         Pré-calcula rotas entre todas as entidades de um município
         
+        Executa o PrecalculoRotas até o fim: pares faltantes em lista
+        persistida, chamadas concorrentes com limite de taxa e gravação em
+        lote; uma execução interrompida é retomada na próxima chamada.
+        Levanta PrecalculoEmAndamentoError se a mesma execução já estiver
+        rodando (ex.: em segundo plano via iniciar_precalculo).
+        
         Args:
             municipio: Município específico ou None para todos
+            max_workers: Chamadas simultâneas ao Google Maps
+            requisicoes_por_segundo: Limite de taxa das chamadas
             
         Returns:
             Estatísticas do processamento
         """
         try:
-            
-            # Buscar entidades geocodificadas
-            query_identificadas = EntidadeIdentificada.query.filter_by(geocodificacao_status='sucesso')
-            query_prioritarias = EntidadePrioritariaUF.query.filter_by(geocodificacao_status='sucesso')
-            
-            if municipio:
-                query_identificadas = query_identificadas.filter_by(municipio=municipio)
-                query_prioritarias = query_prioritarias.filter_by(municipio=municipio)
-            
-            entidades_identificadas = query_identificadas.all()
-            entidades_prioritarias = query_prioritarias.all()
-            
-            # Combinar todas as entidades
-            todas_entidades = []
-            
-            for ent in entidades_identificadas:
-                if ent.latitude and ent.longitude:
-                    todas_entidades.append({
-                        'id': f'identificada_{ent.id}',
-                        'nome': ent.nome_entidade,
-                        'municipio': ent.municipio,
-                        'lat': ent.latitude,
-                        'lng': ent.longitude,
-                        'tipo': 'identificada'
-                    })
-            
-            for ent in entidades_prioritarias:
-                if ent.latitude and ent.longitude:
-                    todas_entidades.append({
-                        'id': f'prioritaria_{ent.id}',
-                        'nome': ent.nome_entidade,
-                        'municipio': ent.municipio,
-                        'lat': ent.latitude,
-                        'lng': ent.longitude,
-                        'tipo': 'prioritaria'
-                    })
-            
-            self.logger.info(f"🗺️ Pré-calculando rotas para {len(todas_entidades)} entidades")
-            
-            rotas_calculadas = 0
-            rotas_erro = 0
-            
-            # Calcular rotas entre todas as combinações
-            for i, origem in enumerate(todas_entidades):
-                for j, destino in enumerate(todas_entidades):
-                    if i >= j:  # Evitar duplicatas e self-routes
-                        continue
-                    
-                    try:
-                        # Verificar se já existe no cache
-                        cached = self.get_cached_route(
-                            (origem['lat'], origem['lng']),
-                            (destino['lat'], destino['lng'])
-                        )
-                        
-                        if not cached:
-                            # Calcular nova rota com Google Maps
-                            if self.gmaps:
-                                directions = self.gmaps.directions(
-                                    origin=(origem['lat'], origem['lng']),
-                                    destination=(destino['lat'], destino['lng']),
-                                    mode='driving'
-                                )
-                                
-                                if directions:
-                                    route = directions[0]
-                                    leg = route['legs'][0]
-                                    
-                                    route_data = {
-                                        'distance_text': leg['distance']['text'],
-                                        'distance_meters': leg['distance']['value'],
-                                        'duration_text': leg['duration']['text'],
-                                        'duration_seconds': leg['duration']['value'],
-                                        'origin': origem,
-                                        'destination': destino,
-                                        'polyline': route['overview_polyline']['points'],
-                                        'steps': leg['steps']
-                                    }
-                                    
-                                    # Armazenar no cache
-                                    self.cache_route(
-                                        (origem['lat'], origem['lng']),
-                                        (destino['lat'], destino['lng']),
-                                        route_data
-                                    )
-                                    
-                                    rotas_calculadas += 1
-                                    
-                                    # Rate limiting
-                                    time.sleep(0.1)
-                                else:
-                                    rotas_erro += 1
-                            else:
-                                self.logger.warning("⚠️ Google Maps não disponível para pré-cálculo")
-                                break
-                        else:
-                            rotas_calculadas += 1
-                            
-                    except Exception as e:
-                        self.logger.error(f"❌ Erro ao calcular rota {origem['nome']} -> {destino['nome']}: {str(e)}")
-                        rotas_erro += 1
+            precalculo = PrecalculoRotas(self, max_workers, requisicoes_por_segundo)
+            execucao_id = precalculo.preparar(municipio)
+            parar = threading.Event()
+            with _precalculos_lock:
+                if _precalculo_ativo(execucao_id):
+                    raise PrecalculoEmAndamentoError(execucao_id)
+                # Registrada como ativa: iniciar_precalculo não dispara outra em paralelo
+                _precalculos_ativos[execucao_id] = (threading.current_thread(), parar)
+            try:
+                progresso = precalculo.executar(execucao_id, parar)
+            finally:
+                with _precalculos_lock:
+                    _precalculos_ativos.pop(execucao_id, None)
             
             estatisticas = {
-                'entidades_processadas': len(todas_entidades),
-                'rotas_calculadas': rotas_calculadas,
-                'rotas_erro': rotas_erro,
+                'entidades_processadas': progresso['entidades'],
+                'rotas_calculadas': progresso['concluidos'] + progresso['ja_em_cache'],
+                'rotas_erro': progresso['erros_definitivos'] + progresso['sem_rota'] + progresso['erros_a_repetir'],
                 'municipio': municipio or 'todos',
-                'processado_em': datetime.now().isoformat()
+                'processado_em': datetime.now().isoformat(),
+                'execucao_id': execucao_id,
+                'status': progresso['status']
             }
             
             self.logger.info(f"✅ Pré-cálculo concluído: {estatisticas}")
             return estatisticas
             
+        except PrecalculoEmAndamentoError:
+            raise
         except Exception as e:
             self.logger.error(f"❌ Erro no pré-cálculo de rotas: {str(e)}")
             return {'erro': str(e)}
@@ -550,6 +485,375 @@ class OfflineMapsService:
             return {'erro': str(e)}
 
 
+class TokenBucket:
+    """Limite de taxa: `taxa` fichas por segundo, rajadas de até `capacidade`"""
+    
+    def __init__(self, taxa: float, capacidade: float = None):
+        self.taxa = float(taxa)
+        self.capacidade = float(capacidade or max(1.0, self.taxa))
+        self._fichas = self.capacidade
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def adquirir(self, parar: threading.Event = None) -> bool:
+        """Bloqueia até haver ficha; False se `parar` for sinalizado durante a espera"""
+        while True:
+            with self._lock:
+                agora = time.monotonic()
+                self._fichas = min(self.capacidade, self._fichas + (agora - self._ultimo) * self.taxa)
+                self._ultimo = agora
+                if self._fichas >= 1:
+                    self._fichas -= 1
+                    return True
+                espera = (1 - self._fichas) / self.taxa
+            if parar is None:
+                time.sleep(espera)
+            elif parar.wait(espera):
+                return False
+
+
+class PrecalculoRotas:
+    """
+    Pré-cálculo retomável das rotas entre entidades.
+    
+    A lista de pares pendentes fica em routes_cache.db (precalculo_pares),
+    ao lado do cache de rotas: cada lote gravado leva as rotas e o status
+    dos pares na mesma transação, então uma execução interrompida recomeça
+    exatamente dos pares que faltam. Cada par não ordenado é consultado uma
+    vez; o sentido inverso é gravado como estimativa simétrica (mesma
+    distância e duração, sem polyline), sem sobrescrever rotas reais.
+    """
+    
+    TAMANHO_LOTE = 50
+    INTERVALO_GRAVACAO = 2.0  # segundos entre gravações de lotes parciais
+    MAX_TENTATIVAS = 3
+    
+    def __init__(self, service: 'OfflineMapsService', max_workers: int = 4,
+                 requisicoes_por_segundo: float = 10.0):
+        self.service = service
+        self.logger = service.logger
+        self.db_path = service.routes_db_path
+        self.max_workers = max(1, int(max_workers))
+        self.limite = TokenBucket(requisicoes_por_segundo)
+        self._inicializar_tabelas()
+    
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+    
+    def _inicializar_tabelas(self):
+        with self._connect() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS precalculo_execucoes (
+                    id TEXT PRIMARY KEY,
+                    municipio TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    entidades INTEGER DEFAULT 0,
+                    ja_em_cache INTEGER DEFAULT 0,
+                    criado_em TEXT NOT NULL,
+                    atualizado_em TEXT,
+                    sessao_iniciada_em REAL,
+                    processados_inicio_sessao INTEGER DEFAULT 0,
+                    finalizado_em TEXT,
+                    erro TEXT
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS precalculo_pares (
+                    execucao_id TEXT NOT NULL,
+                    par_hash TEXT NOT NULL,
+                    origem TEXT NOT NULL,
+                    destino TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pendente',
+                    tentativas INTEGER NOT NULL DEFAULT 0,
+                    erro TEXT,
+                    PRIMARY KEY (execucao_id, par_hash)
+                )
+            ''')
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_precalculo_pares_status
+                ON precalculo_pares(execucao_id, status)
+            ''')
+    
+    # ===== LISTA DE TRABALHO =====
+    
+    def _carregar_entidades(self, municipio: str = None) -> List[Dict]:
+        entidades = repositorio_pontos_rota.entidades()
+        indices = np.flatnonzero(entidades.mascara(municipio=municipio))
+        return entidades.materializar(indices, lambda linha: {
+            'id': linha['id'],
+            'nome': linha['nome'],
+            'municipio': linha['municipio'],
+            'lat': linha['lat'],
+            'lng': linha['lng'],
+            'tipo': linha['id'].split('_')[0]
+        })
+    
+    def preparar(self, municipio: str = None) -> str:
+        """
+        Monta (ou completa) a lista de pares que faltam no cache e devolve o
+        id da execução. Uma execução não concluída do mesmo município é
+        reaproveitada, preservando o que já foi feito.
+        """
+        chave_municipio = municipio or 'todos'
+        entidades = self._carregar_entidades(municipio)
+        
+        # Entidades no mesmo local viram um só ponto; pares em ordem canônica
+        por_local = {}
+        for entidade in entidades:
+            por_local.setdefault((round(entidade['lat'], 6), round(entidade['lng'], 6)), entidade)
+        locais = sorted(por_local)
+        
+        with self._connect() as conn:
+            em_cache = {linha[0] for linha in conn.execute(
+                "SELECT route_hash FROM cached_routes WHERE expires_at > datetime('now')"
+            )}
+            
+            pares, ja_em_cache = [], 0
+            for a, b in itertools.combinations(locais, 2):
+                par_hash = self.service._calculate_route_hash(a[0], a[1], b[0], b[1])
+                if par_hash in em_cache:
+                    ja_em_cache += 1
+                    continue
+                pares.append((par_hash, json.dumps(por_local[a]), json.dumps(por_local[b])))
+            
+            linha = conn.execute(
+                "SELECT id FROM precalculo_execucoes WHERE municipio = ? AND status != 'concluida' "
+                "ORDER BY criado_em DESC LIMIT 1", (chave_municipio,)
+            ).fetchone()
+            agora = datetime.now().isoformat()
+            if linha:
+                execucao_id = linha[0]
+                conn.execute(
+                    'UPDATE precalculo_execucoes SET entidades = ?, ja_em_cache = ?, atualizado_em = ? WHERE id = ?',
+                    (len(entidades), ja_em_cache, agora, execucao_id)
+                )
+            else:
+                execucao_id = uuid.uuid4().hex[:12]
+                conn.execute(
+                    '''INSERT INTO precalculo_execucoes
+                       (id, municipio, status, entidades, ja_em_cache, criado_em, atualizado_em)
+                       VALUES (?, ?, 'preparada', ?, ?, ?, ?)''',
+                    (execucao_id, chave_municipio, len(entidades), ja_em_cache, agora, agora)
+                )
+            conn.executemany(
+                '''INSERT OR IGNORE INTO precalculo_pares (execucao_id, par_hash, origem, destino)
+                   VALUES (?, ?, ?, ?)''',
+                [(execucao_id, *par) for par in pares]
+            )
+        
+        self.logger.info(f"🗺️ Pré-cálculo {execucao_id}: {len(entidades)} entidades, "
+                         f"{len(pares)} pares a consultar, {ja_em_cache} já em cache")
+        return execucao_id
+    
+    def _pendentes(self, execucao_id: str) -> List[Tuple[str, Dict, Dict]]:
+        with self._connect() as conn:
+            linhas = conn.execute(
+                '''SELECT par_hash, origem, destino FROM precalculo_pares
+                   WHERE execucao_id = ? AND (status = 'pendente' OR (status = 'erro' AND tentativas < ?))''',
+                (execucao_id, self.MAX_TENTATIVAS)
+            ).fetchall()
+        return [(par_hash, json.loads(origem), json.loads(destino)) for par_hash, origem, destino in linhas]
+    
+    # ===== EXECUÇÃO =====
+    
+    def executar(self, execucao_id: str, parar: threading.Event = None) -> Dict:
+        """
+        Consulta os pares pendentes com até `max_workers` chamadas simultâneas
+        (limitadas pelo token bucket) e grava em lotes. `parar` pausa a
+        execução; pares em andamento voltam para a fila.
+        """
+        parar = parar or threading.Event()
+        if not self.service.gmaps:
+            self.logger.warning("⚠️ Google Maps não disponível para pré-cálculo")
+            self._atualizar_execucao(execucao_id, status='falhou', erro='Google Maps não disponível')
+            return self.progresso(execucao_id)
+        
+        processados = self.progresso(execucao_id)['processados']
+        self._atualizar_execucao(execucao_id, status='executando', erro=None, finalizado_em=None,
+                                 sessao_iniciada_em=time.time(), processados_inicio_sessao=processados)
+        
+        try:
+            pendentes = deque(self._pendentes(execucao_id))
+            lote = []
+            ultima_gravacao = time.monotonic()
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='pnsb-precalculo') as executor:
+                em_andamento = set()
+                while True:
+                    while pendentes and len(em_andamento) < self.max_workers * 2 and not parar.is_set():
+                        em_andamento.add(executor.submit(self._consultar_par, pendentes.popleft(), parar))
+                    
+                    if em_andamento:
+                        prontos, em_andamento = wait(em_andamento, timeout=self.INTERVALO_GRAVACAO,
+                                                     return_when=FIRST_COMPLETED)
+                        lote.extend(futuro.result() for futuro in prontos)
+                    
+                    if lote and (len(lote) >= self.TAMANHO_LOTE or not em_andamento
+                                 or time.monotonic() - ultima_gravacao >= self.INTERVALO_GRAVACAO):
+                        self._gravar_lote(execucao_id, lote)
+                        lote, ultima_gravacao = [], time.monotonic()
+                    
+                    if not em_andamento and parar.is_set():
+                        break
+                    if not pendentes and not em_andamento:
+                        # Novas tentativas dos pares com erro transitório
+                        pendentes.extend(self._pendentes(execucao_id))
+                        if not pendentes:
+                            break
+            
+            status = 'pausada' if parar.is_set() else 'concluida'
+            self._atualizar_execucao(execucao_id, status=status,
+                                     finalizado_em=datetime.now().isoformat() if status == 'concluida' else None)
+        except Exception as e:
+            self.logger.error(f"❌ Erro no pré-cálculo {execucao_id}: {str(e)}")
+            self._atualizar_execucao(execucao_id, status='falhou', erro=str(e))
+        
+        progresso = self.progresso(execucao_id)
+        self.logger.info(f"✅ Pré-cálculo {execucao_id} {progresso['status']}: "
+                         f"{progresso['processados']}/{progresso['total_pares']} pares")
+        return progresso
+    
+    def _consultar_par(self, par: Tuple[str, Dict, Dict], parar: threading.Event) -> Tuple:
+        """(par_hash, status, route_data, erro); status 'pendente' se pausado antes da chamada"""
+        par_hash, origem, destino = par
+        if not self.limite.adquirir(parar):
+            return par_hash, 'pendente', None, None
+        try:
+            directions = self.service.gmaps.directions(
+                origin=(origem['lat'], origem['lng']),
+                destination=(destino['lat'], destino['lng']),
+                mode='driving'
+            )
+        except Exception as e:
+            self.logger.error(f"❌ Erro ao calcular rota {origem['nome']} -> {destino['nome']}: {str(e)}")
+            return par_hash, 'erro', None, str(e)
+        
+        if not directions:
+            return par_hash, 'sem_rota', None, None
+        
+        route = directions[0]
+        leg = route['legs'][0]
+        route_data = {
+            'distance_text': leg['distance']['text'],
+            'distance_meters': leg['distance']['value'],
+            'duration_text': leg['duration']['text'],
+            'duration_seconds': leg['duration']['value'],
+            'origin': origem,
+            'destination': destino,
+            'polyline': route['overview_polyline']['points'],
+            'steps': leg['steps']
+        }
+        return par_hash, 'concluido', route_data, None
+    
+    def _gravar_lote(self, execucao_id: str, lote: List[Tuple]):
+        """Rotas e status dos pares numa única transação (checkpoint)"""
+        expires_at = datetime.now() + timedelta(days=30)  # Cache por 30 dias
+        rotas, inversas = [], []
+        for par_hash, status, route_data, _ in lote:
+            if status != 'concluido':
+                continue
+            origem, destino = route_data['origin'], route_data['destination']
+            rotas.append((
+                origem['lat'], origem['lng'], destino['lat'], destino['lng'], par_hash,
+                json.dumps(route_data), route_data['distance_meters'], route_data['duration_seconds'],
+                expires_at, 'google_maps'
+            ))
+            inversa = {k: v for k, v in route_data.items() if k not in ('polyline', 'steps')}
+            inversa.update({'origin': destino, 'destination': origem, 'symmetric_of': par_hash})
+            inversas.append((
+                destino['lat'], destino['lng'], origem['lat'], origem['lng'],
+                self.service._calculate_route_hash(destino['lat'], destino['lng'], origem['lat'], origem['lng']),
+                json.dumps(inversa), route_data['distance_meters'], route_data['duration_seconds'],
+                expires_at, 'google_maps_simetrico'
+            ))
+        
+        colunas = '''(origin_lat, origin_lng, dest_lat, dest_lng, route_hash,
+                      route_data, distance_meters, duration_seconds, expires_at, route_source)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'''
+        with self._connect() as conn:
+            conn.executemany(f'INSERT OR REPLACE INTO cached_routes {colunas}', rotas)
+            conn.executemany(f'INSERT OR IGNORE INTO cached_routes {colunas}', inversas)
+            conn.executemany(
+                '''UPDATE precalculo_pares SET status = ?, tentativas = tentativas + 1, erro = ?
+                   WHERE execucao_id = ? AND par_hash = ?''',
+                [(status, erro, execucao_id, par_hash)
+                 for par_hash, status, _, erro in lote if status != 'pendente']
+            )
+            conn.execute('UPDATE precalculo_execucoes SET atualizado_em = ? WHERE id = ?',
+                         (datetime.now().isoformat(), execucao_id))
+    
+    def _atualizar_execucao(self, execucao_id: str, **campos):
+        campos['atualizado_em'] = datetime.now().isoformat()
+        with self._connect() as conn:
+            conn.execute(
+                f"UPDATE precalculo_execucoes SET {', '.join(f'{nome} = ?' for nome in campos)} WHERE id = ?",
+                (*campos.values(), execucao_id)
+            )
+    
+    # ===== PROGRESSO =====
+    
+    def progresso(self, execucao_id: str = None) -> Optional[Dict]:
+        """Situação da execução (a mais recente se `execucao_id` for None)"""
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            if execucao_id:
+                execucao = conn.execute('SELECT * FROM precalculo_execucoes WHERE id = ?', (execucao_id,)).fetchone()
+            else:
+                execucao = conn.execute(
+                    'SELECT * FROM precalculo_execucoes ORDER BY criado_em DESC LIMIT 1'
+                ).fetchone()
+            if not execucao:
+                return None
+            contagem = {
+                (status, bool(esgotado)): total
+                for status, esgotado, total in conn.execute(
+                    '''SELECT status, tentativas >= ?, COUNT(*) FROM precalculo_pares
+                       WHERE execucao_id = ? GROUP BY status, tentativas >= ?''',
+                    (self.MAX_TENTATIVAS, execucao['id'], self.MAX_TENTATIVAS)
+                )
+            }
+        
+        def somar(status, esgotado=None):
+            return sum(total for (s, e), total in contagem.items() if s == status and esgotado in (None, e))
+        
+        total = sum(contagem.values())
+        pendentes = somar('pendente') + somar('erro', False)
+        processados = total - pendentes
+        
+        taxa = None
+        restante_s = None
+        if execucao['status'] == 'executando' and execucao['sessao_iniciada_em']:
+            decorrido = time.time() - execucao['sessao_iniciada_em']
+            feitos_sessao = processados - (execucao['processados_inicio_sessao'] or 0)
+            if decorrido > 0 and feitos_sessao > 0:
+                taxa = feitos_sessao / decorrido
+                restante_s = round(pendentes / taxa)
+        
+        return {
+            'execucao_id': execucao['id'],
+            'municipio': execucao['municipio'],
+            'status': execucao['status'],
+            'ativa': _precalculo_ativo(execucao['id']),
+            'entidades': execucao['entidades'],
+            'ja_em_cache': execucao['ja_em_cache'],
+            'total_pares': total,
+            'processados': processados,
+            'pendentes': pendentes,
+            'concluidos': somar('concluido'),
+            'sem_rota': somar('sem_rota'),
+            'erros_definitivos': somar('erro', True),
+            'erros_a_repetir': somar('erro', False),
+            'percentual': round(processados / total * 100, 1) if total else 100.0,
+            'pares_por_segundo': round(taxa, 2) if taxa else None,
+            'tempo_restante_s': restante_s,
+            'criado_em': execucao['criado_em'],
+            'atualizado_em': execucao['atualizado_em'],
+            'finalizado_em': execucao['finalizado_em'],
+            'erro': execucao['erro']
+        }
+
+
 # Funções de conveniência
 def cache_santa_catarina_maps():
     """Cache de mapas para toda região de Santa Catarina do PNSB"""
@@ -568,4 +872,45 @@ def cache_santa_catarina_maps():
 def precalculate_all_routes():
     """Pré-calcula todas as rotas entre entidades"""
     service = OfflineMapsService()
-    return service.precalculate_entity_routes()
\ No newline at end of file
+    return service.precalculate_entity_routes()
+
+
+# Execuções ativas neste processo: id -> (thread, sinal de pausa)
+_precalculos_ativos: Dict[str, Tuple[threading.Thread, threading.Event]] = {}
+_precalculos_lock = threading.Lock()
+
+
+def _precalculo_ativo(execucao_id: str) -> bool:
+    ativo = _precalculos_ativos.get(execucao_id)
+    return bool(ativo and ativo[0].is_alive())
+
+
+def iniciar_precalculo(municipio: str = None, max_workers: int = 4,
+                       requisicoes_por_segundo: float = 10.0) -> Dict:
+    """
+    Prepara a lista de pares no contexto da requisição e executa o
+    pré-cálculo numa thread; devolve o progresso inicial. Chamar de novo
+    para o mesmo município retoma a execução pausada ou interrompida.
+    """
+    precalculo = PrecalculoRotas(OfflineMapsService(), max_workers, requisicoes_por_segundo)
+    execucao_id = precalculo.preparar(municipio)
+    with _precalculos_lock:
+        if not _precalculo_ativo(execucao_id):
+            parar = threading.Event()
+            thread = threading.Thread(
+                target=precalculo.executar, args=(execucao_id, parar),
+                name=f'pnsb-precalculo-{execucao_id}', daemon=True
+            )
+            _precalculos_ativos[execucao_id] = (thread, parar)
+            thread.start()
+    return precalculo.progresso(execucao_id)
+
+
+def pausar_precalculo(execucao_id: str) -> bool:
+    """Sinaliza a pausa; os pares em andamento terminam e o resto fica pendente"""
+    with _precalculos_lock:
+        ativo = _precalculos_ativos.get(execucao_id)
+        if not ativo or not ativo[0].is_alive():
+            return False
+        ativo[1].set()
+        return True
@@ -0,0 +1,288 @@
+"""
+Cache persistente de rotas otimizadas (PNSB 2024)
+Resultados do RouteOptimizer indexados pela impressão digital do conjunto
+de pontos; conjuntos quase iguais servem de ponto de partida (warm start)
+para a próxima otimização em vez de começar do zero
+"""
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DIAS_SEMANA = ['seg', 'ter', 'qua', 'qui', 'sex', 'sab', 'dom']
+
+
+def faixa_horaria(horario_partida: Optional[str] = None, data_alvo: Optional[str] = None) -> str:
+    """
+    Faixa de partida usada na chave: dia da semana + hora cheia.
+
+    Trânsito e horários de atendimento mudam com o dia e a hora, mas não
+    com os minutos, então partidas às 08:00 e 08:40 compartilham a entrada.
+    """
+    try:
+        dia = datetime.fromisoformat(data_alvo[:10]) if data_alvo else datetime.now()
+    except (TypeError, ValueError):
+        dia = datetime.now()
+    try:
+        hora = int(str(horario_partida).split(':')[0]) if horario_partida else 8
+    except ValueError:
+        hora = 8
+    return f"{DIAS_SEMANA[dia.weekday()]}-{hora:02d}"
+
+
+class OptimizedRouteCache:
+    """
+    Cache em disco das rotas já otimizadas.
+
+    A chave separa o contexto (método, tipo de otimização, pesos, faixa de
+    partida) do conjunto de pontos: a busca exata usa os dois; a busca por
+    semelhança procura, no mesmo contexto, um conjunto que difira em poucas
+    paradas para reaproveitar a ordem calculada.
+    """
+
+    TTL_PADRAO = 7 * 24 * 3600
+    MAX_ENTRADAS = 5000
+    MAX_DIFERENCA_WARM_START = 3
+
+    def __init__(self, db_path: str = None, ttl: int = None):
+        self.db_path = db_path or os.path.join(self._get_cache_directory(), 'optimized_routes.db')
+        self.ttl = ttl or self.TTL_PADRAO
+        self.metrics = {
+            'hits': 0, 'misses': 0, 'warm_starts': 0, 'gravacoes': 0,
+            'tempo_economizado_s': 0.0
+        }
+        self._initialize_database()
+
+    def _get_cache_directory(self) -> str:
+        """Cria e retorna diretório para caches locais"""
+        base_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cache_local')
+        os.makedirs(base_dir, exist_ok=True)
+        return base_dir
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def _initialize_database(self):
+        try:
+            with self._connect() as conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS rotas (
+                        chave TEXT PRIMARY KEY,
+                        contexto TEXT NOT NULL,
+                        pontos TEXT NOT NULL,
+                        ordem TEXT NOT NULL,
+                        resultado TEXT NOT NULL,
+                        tempo_calculo REAL NOT NULL,
+                        criado_em REAL NOT NULL,
+                        acessado_em REAL NOT NULL
+                    )
+                ''')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_rotas_contexto ON rotas (contexto, acessado_em)')
+                # Totais acumulados entre processos (workers de jobs, reinícios)
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS contadores (
+                        nome TEXT PRIMARY KEY,
+                        valor REAL NOT NULL
+                    )
+                ''')
+        except Exception as e:
+            logger.error(f"❌ Erro ao inicializar cache de rotas otimizadas: {str(e)}")
+
+    # ------------------------------------------------------------------
+    # Chaves
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _hash(valor: Any) -> str:
+        texto = json.dumps(valor, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+    def chave_contexto(self, metodo: str, tipo_otimizacao: str, pesos: Dict[str, float],
+                       faixa: str = None, **extras) -> str:
+        """Hash do que, além dos pontos, muda o resultado da otimização"""
+        return self._hash({
+            'metodo': metodo,
+            'tipo': tipo_otimizacao,
+            'pesos': {nome: round(float(peso), 4) for nome, peso in (pesos or {}).items()},
+            'faixa': faixa,
+            **extras
+        })
+
+    def impressao_digital(self, pontos: Iterable[Any], contexto: str) -> str:
+        """
+        Hash canônico do conjunto de pontos: ids e coordenadas (6 casas,
+        ~10 cm) mais prioridade, duração e janela, que entram no objetivo.
+        A ordem de entrada não importa.
+        """
+        canonico = sorted(
+            (str(p.id), round(float(p.lat), 6), round(float(p.lng), 6), p.priority,
+             p.estimated_duration, p.time_window_start, p.time_window_end)
+            for p in pontos
+        )
+        return self._hash({'contexto': contexto, 'pontos': canonico})
+
+    # ------------------------------------------------------------------
+    # Leitura e gravação
+    # ------------------------------------------------------------------
+
+    def obter(self, chave: str) -> Optional[Dict]:
+        """Entrada exata (ordem, resultado serializado e tempo de cálculo) ou None"""
+        try:
+            with self._connect() as conn:
+                linha = conn.execute(
+                    'SELECT ordem, resultado, tempo_calculo FROM rotas WHERE chave = ? AND criado_em >= ?',
+                    (chave, time.time() - self.ttl)
+                ).fetchone()
+                if linha:
+                    conn.execute('UPDATE rotas SET acessado_em = ? WHERE chave = ?', (time.time(), chave))
+        except Exception as e:
+            logger.error(f"Erro ao ler cache de rotas otimizadas: {str(e)}")
+            linha = None
+
+        if not linha:
+            self.metrics['misses'] += 1
+            self._incrementar('misses')
+            return None
+
+        self.metrics['hits'] += 1
+        self._incrementar('hits')
+        return {
+            'ordem': json.loads(linha[0]),
+            'resultado': json.loads(linha[1]),
+            'tempo_calculo': linha[2]
+        }
+
+    def buscar_semelhante(self, contexto: str, ids: Iterable[str],
+                          max_diferenca: int = None) -> Optional[Dict]:
+        """
+        Entrada do mesmo contexto cujo conjunto de pontos difere do pedido em
+        no máximo `max_diferenca` paradas (entradas + saídas). Entre as
+        candidatas fica a de menor diferença e, no empate, a mais recente.
+        """
+        max_diferenca = self.MAX_DIFERENCA_WARM_START if max_diferenca is None else max_diferenca
+        ids = set(map(str, ids))
+        try:
+            with self._connect() as conn:
+                linhas = conn.execute(
+                    '''SELECT pontos, ordem, tempo_calculo FROM rotas
+                       WHERE contexto = ? AND criado_em >= ?
+                       ORDER BY acessado_em DESC LIMIT 200''',
+                    (contexto, time.time() - self.ttl)
+                ).fetchall()
+        except Exception as e:
+            logger.error(f"Erro ao buscar rota semelhante: {str(e)}")
+            return None
+
+        melhor = None
+        for pontos, ordem, tempo_calculo in linhas:
+            cache_ids = set(json.loads(pontos))
+            diferenca = len(ids ^ cache_ids)
+            # Sem interseção relevante a ordem antiga não ajuda
+            if diferenca > max_diferenca or len(ids & cache_ids) < 2:
+                continue
+            if melhor is None or diferenca < melhor['diferenca']:
+                melhor = {
+                    'ordem': json.loads(ordem),
+                    'tempo_calculo': tempo_calculo,
+                    'diferenca': diferenca,
+                    'adicionados': sorted(ids - cache_ids),
+                    'removidos': sorted(cache_ids - ids)
+                }
+                if diferenca == 0:
+                    break
+        return melhor
+
+    def gravar(self, chave: str, contexto: str, ordem: List[str], resultado: Dict,
+               tempo_calculo: float):
+        """Grava (substituindo) uma rota otimizada e poda as entradas mais antigas"""
+        agora = time.time()
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    '''INSERT OR REPLACE INTO rotas
+                       (chave, contexto, pontos, ordem, resultado, tempo_calculo, criado_em, acessado_em)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                    (chave, contexto, json.dumps(sorted(map(str, ordem))), json.dumps(list(map(str, ordem))),
+                     json.dumps(resultado, ensure_ascii=False, default=str), float(tempo_calculo), agora, agora)
+                )
+                conn.execute(
+                    '''DELETE FROM rotas WHERE chave IN (
+                           SELECT chave FROM rotas ORDER BY acessado_em DESC LIMIT -1 OFFSET ?
+                       )''',
+                    (self.MAX_ENTRADAS,)
+                )
+            self.metrics['gravacoes'] += 1
+        except Exception as e:
+            logger.error(f"Erro ao gravar cache de rotas otimizadas: {str(e)}")
+
+    # ------------------------------------------------------------------
+    # Instrumentação
+    # ------------------------------------------------------------------
+
+    def registrar_warm_start(self):
+        self.metrics['warm_starts'] += 1
+        self._incrementar('warm_starts')
+
+    def registrar_economia(self, segundos: float):
+        """Tempo de cálculo poupado por um acerto (original - custo do acerto)"""
+        segundos = max(0.0, float(segundos))
+        self.metrics['tempo_economizado_s'] += segundos
+        self._incrementar('tempo_economizado_s', segundos)
+
+    def _incrementar(self, nome: str, valor: float = 1):
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    '''INSERT INTO contadores (nome, valor) VALUES (?, ?)
+                       ON CONFLICT(nome) DO UPDATE SET valor = valor + excluded.valor''',
+                    (nome, valor)
+                )
+        except Exception as e:
+            logger.debug(f"Contador {nome} do cache de rotas não atualizado: {str(e)}")
+
+    def limpar_expirados(self) -> int:
+        try:
+            with self._connect() as conn:
+                return conn.execute('DELETE FROM rotas WHERE criado_em < ?',
+                                    (time.time() - self.ttl,)).rowcount
+        except Exception as e:
+            logger.error(f"Erro ao limpar cache de rotas otimizadas: {str(e)}")
+            return 0
+
+    def get_metrics(self) -> Dict:
+        """Métricas deste processo e totais acumulados de todos os processos"""
+        consultas = self.metrics['hits'] + self.metrics['misses']
+        totais = {}
+        try:
+            with self._connect() as conn:
+                totais = dict(conn.execute('SELECT nome, valor FROM contadores').fetchall())
+                totais['entradas'] = conn.execute('SELECT COUNT(*) FROM rotas').fetchone()[0]
+        except Exception as e:
+            logger.error(f"Erro ao ler métricas do cache de rotas: {str(e)}")
+        consultas_totais = totais.get('hits', 0) + totais.get('misses', 0)
+        return {
+            **self.metrics,
+            'tempo_economizado_s': round(self.metrics['tempo_economizado_s'], 3),
+            'hit_rate': round(self.metrics['hits'] / consultas * 100, 2) if consultas else 0.0,
+            'acumulado': {
+                'hits': int(totais.get('hits', 0)),
+                'misses': int(totais.get('misses', 0)),
+                'warm_starts': int(totais.get('warm_starts', 0)),
+                'tempo_economizado_s': round(totais.get('tempo_economizado_s', 0.0), 3),
+                'entradas': totais.get('entradas', 0),
+                'hit_rate': round(totais.get('hits', 0) / consultas_totais * 100, 2) if consultas_totais else 0.0
+            }
+        }
+
+
+# Instância global compartilhada pelos otimizadores de rota
+optimized_route_cache = OptimizedRouteCache()
@@ -0,0 +1,275 @@
+"""
+Cache unificado de consultas ao Google Places (PNSB 2024)
+Busca (consulta normalizada, tipo) -> place_id e detalhes por place_id, persistidos
+em SQLite, com cache negativo, coalescência de consultas idênticas concorrentes,
+sessão HTTP com keep-alive e pré-carregamento paralelo limitado
+"""
+
+import os
+import copy
+import json
+import time
+import sqlite3
+import logging
+import threading
+import unicodedata
+import re
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Campos pedidos ao endpoint de detalhes (união do que os serviços consomem)
+CAMPOS_DETALHES = [
+    'place_id', 'name', 'formatted_address', 'opening_hours', 'geometry',
+    'business_status', 'types', 'formatted_phone_number', 'website', 'rating'
+]
+
+_ESPACOS = re.compile(r'\s+')
+
+
+def normalizar_consulta(texto: str) -> str:
+    """Minúsculas, sem acentos e com espaços colapsados"""
+    decomposto = unicodedata.normalize('NFKD', (texto or '').lower())
+    sem_acento = ''.join(c for c in decomposto if not unicodedata.combining(c))
+    return _ESPACOS.sub(' ', sem_acento).strip()
+
+
+class PlacesCache:
+    """
+    Cache persistente das consultas ao Google Places.
+
+    - Busca: chave (consulta normalizada, tipo) -> resultado (com place_id)
+    - Detalhes: chave (place_id, idioma) -> detalhes completos (weekday_text
+      e endereço vêm no idioma pedido)
+    - "Não encontrado" também é guardado (TTL curto) para não repetir a consulta
+    - Erros de rede/HTTP não são guardados: a próxima chamada tenta de novo
+    - Chamadas idênticas simultâneas aguardam a mesma consulta (single-flight)
+    """
+
+    def __init__(self, db_path: str = None, ttl_busca: int = 7 * 24 * 3600,
+                 ttl_detalhes: int = 24 * 3600, ttl_negativo: int = 6 * 3600,
+                 max_workers: int = 4):
+        self.db_path = db_path or os.path.join(self._get_cache_directory(), 'places_cache.db')
+        self.ttl_busca = ttl_busca
+        self.ttl_detalhes = ttl_detalhes
+        self.ttl_negativo = ttl_negativo
+        self.max_workers = max_workers
+
+        self._lock = threading.Lock()
+        self._memoria: Dict[Tuple, Tuple[float, Optional[Dict]]] = {}
+        self._em_andamento: Dict[Tuple, Future] = {}
+        self._session: Optional[requests.Session] = None
+
+        self.metrics = {
+            'hits': 0,
+            'hits_negativos': 0,
+            'misses': 0,
+            'coalescidas': 0,
+            'erros': 0
+        }
+
+        self._initialize_database()
+
+    def _get_cache_directory(self) -> str:
+        """Cria e retorna diretório para caches locais"""
+        base_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cache_local')
+        os.makedirs(base_dir, exist_ok=True)
+        return base_dir
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def _initialize_database(self):
+        try:
+            with self._connect() as conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS places_cache (
+                        tabela TEXT NOT NULL,
+                        chave TEXT NOT NULL,
+                        dados TEXT,
+                        criado_em REAL NOT NULL,
+                        PRIMARY KEY (tabela, chave)
+                    )
+                ''')
+        except Exception as e:
+            logger.error(f"❌ Erro ao inicializar cache do Google Places: {str(e)}")
+
+    @property
+    def session(self) -> requests.Session:
+        """Sessão HTTP compartilhada (keep-alive e pool de conexões)"""
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=self.max_workers * 2)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._session = session
+        return self._session
+
+    # ===== LEITURA / GRAVAÇÃO =====
+
+    def _ttl(self, tabela: str, dados: Optional[Dict]) -> int:
+        if dados is None:
+            return self.ttl_negativo
+        return self.ttl_detalhes if tabela == 'detalhes' else self.ttl_busca
+
+    def _ler(self, chave: Tuple) -> Tuple[bool, Optional[Dict]]:
+        """(encontrado no cache, dados); dados None = resultado negativo"""
+        agora = time.time()
+        with self._lock:
+            entrada = self._memoria.get(chave)
+        if entrada is not None:
+            criado_em, dados = entrada
+            if agora - criado_em < self._ttl(chave[0], dados):
+                return True, dados
+
+        try:
+            with self._connect() as conn:
+                linha = conn.execute(
+                    'SELECT dados, criado_em FROM places_cache WHERE tabela = ? AND chave = ?',
+                    (chave[0], chave[1])
+                ).fetchone()
+        except Exception as e:
+            logger.error(f"Erro ao ler cache do Google Places: {str(e)}")
+            return False, None
+
+        if linha is None:
+            return False, None
+        dados = json.loads(linha[0]) if linha[0] is not None else None
+        if agora - linha[1] >= self._ttl(chave[0], dados):
+            return False, None
+
+        with self._lock:
+            self._memoria[chave] = (linha[1], dados)
+        return True, dados
+
+    def _gravar(self, chave: Tuple, dados: Optional[Dict]):
+        agora = time.time()
+        with self._lock:
+            self._memoria[chave] = (agora, dados)
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO places_cache (tabela, chave, dados, criado_em) VALUES (?, ?, ?, ?)',
+                    (chave[0], chave[1], json.dumps(dados, ensure_ascii=False) if dados is not None else None, agora)
+                )
+        except Exception as e:
+            logger.error(f"Erro ao gravar cache do Google Places: {str(e)}")
+
+    def _obter(self, chave: Tuple, buscador: Callable[[], Optional[Dict]]) -> Optional[Dict]:
+        """Cópia do valor em cache (chamadores podem alterá-la livremente)"""
+        return copy.deepcopy(self._obter_compartilhado(chave, buscador))
+
+    def _obter_compartilhado(self, chave: Tuple, buscador: Callable[[], Optional[Dict]]) -> Optional[Dict]:
+        """Leitura do cache ou consulta única (as demais threads aguardam o mesmo Future)"""
+        encontrado, dados = self._ler(chave)
+        if encontrado:
+            self.metrics['hits' if dados is not None else 'hits_negativos'] += 1
+            return dados
+
+        with self._lock:
+            pendente = self._em_andamento.get(chave)
+            if pendente is None:
+                futuro = Future()
+                self._em_andamento[chave] = futuro
+        if pendente is not None:
+            self.metrics['coalescidas'] += 1
+            return pendente.result()
+
+        self.metrics['misses'] += 1
+        try:
+            dados = buscador()
+            self._gravar(chave, dados)
+            futuro.set_result(dados)
+            return dados
+        except Exception as e:
+            # Falha transitória: não entra no cache negativo
+            self.metrics['erros'] += 1
+            futuro.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._em_andamento.pop(chave, None)
+
+    # ===== API PÚBLICA =====
+
+    def buscar(self, consulta: str, tipo: str, buscador: Callable[[], Optional[Dict]]) -> Optional[Dict]:
+        """
+        Resultado da busca textual por (consulta, tipo).
+
+        `buscador` faz a chamada real: retorna o resultado, None quando o Google
+        não encontra nada (cache negativo) ou levanta exceção em erro transitório.
+        """
+        chave = ('busca', f"{normalizar_consulta(consulta)}|{tipo or ''}")
+        return self._obter(chave, buscador)
+
+    def detalhes(self, place_id: str, idioma: Optional[str],
+                 buscador: Callable[[], Optional[Dict]]) -> Optional[Dict]:
+        """
+        Detalhes do estabelecimento por (place_id, idioma); `idioma` é o
+        parâmetro language enviado ao Google (None = padrão da API). Mesma
+        semântica de `buscar`.
+        """
+        return self._obter(('detalhes', f"{place_id}|{idioma or ''}"), buscador)
+
+    def prefetch(self, tarefas: Iterable[Callable[[], object]], max_workers: int = None) -> List:
+        """
+        Executa consultas independentes em paralelo (no máximo `max_workers`
+        simultâneas) e retorna os resultados na ordem; exceções vêm como valores.
+        """
+        tarefas = list(tarefas)
+        if not tarefas:
+            return []
+
+        def proteger(tarefa):
+            try:
+                return tarefa()
+            except Exception as e:
+                return e
+
+        workers = min(max_workers or self.max_workers, len(tarefas))
+        if workers <= 1:
+            return [proteger(t) for t in tarefas]
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pnsb-places') as executor:
+            return list(executor.map(proteger, tarefas))
+
+    def invalidar(self, place_id: str = None):
+        """Remove os detalhes de um local em todos os idiomas (ou todo o cache)"""
+        prefixo = f"{place_id}|"
+        with self._lock:
+            if place_id:
+                for chave in [c for c in self._memoria if c[0] == 'detalhes' and c[1].startswith(prefixo)]:
+                    self._memoria.pop(chave, None)
+            else:
+                self._memoria.clear()
+        try:
+            with self._connect() as conn:
+                if place_id:
+                    conn.execute(
+                        "DELETE FROM places_cache WHERE tabela = 'detalhes' AND substr(chave, 1, ?) = ?",
+                        (len(prefixo), prefixo)
+                    )
+                else:
+                    conn.execute('DELETE FROM places_cache')
+        except Exception as e:
+            logger.error(f"Erro ao invalidar cache do Google Places: {str(e)}")
+
+    def get_metrics(self) -> Dict:
+        consultas = self.metrics['hits'] + self.metrics['hits_negativos'] + self.metrics['misses']
+        return {
+            **self.metrics,
+            'entradas_memoria': len(self._memoria),
+            'em_andamento': len(self._em_andamento),
+            'hit_rate': round((consultas - self.metrics['misses']) / consultas * 100, 2) if consultas else 0.0
+        }
+
+
+# Instância global compartilhada pelos serviços que consultam o Google Places
+places_cache = PlacesCache()
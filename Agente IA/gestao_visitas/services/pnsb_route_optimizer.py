@@ -11,8 +11,10 @@ from typing import Dict, List, Optional, Tuple, Any
 from dataclasses import dataclass, asdict
 from flask import current_app
 
-from gestao_visitas.db import db
-from gestao_visitas.models.agendamento import Visita
+import numpy as np
+
+from gestao_visitas.services.repositorio_pontos_rota import repositorio_pontos_rota
+from gestao_visitas.services.tempos_viagem import tempos_viagem
 
 logger = logging.getLogger(__name__)
 
@@ -72,7 +74,8 @@ class PNSBRouteOptimizer:
             'name': 'Agência IBGE Itajaí',
             'lat': -26.9076,
             'lng': -48.6619,
-            'address': 'Rua Rubens de Almeida, 123, Itajaí/SC'
+            'address': 'Rua Rubens de Almeida, 123, Itajaí/SC',
+            'municipality': 'Itajaí'
         }
         
         # Coordenadas dos municípios PNSB 2024
@@ -97,31 +100,25 @@ class PNSBRouteOptimizer:
             'autarquia': {'start': '08:00', 'end': '16:00', 'lunch': '12:00-13:00'}
         }
         
-        # Tempos de deslocamento estimados (em minutos)
-        self.travel_times = self._calculate_travel_matrix()
-        
         logger.info("✅ PNSBRouteOptimizer inicializado")
     
-    def _calculate_travel_matrix(self) -> Dict[str, Dict[str, int]]:
-        """Calcula matriz de tempos de deslocamento entre municípios"""
-        matrix = {}
-        
-        for origin, origin_coords in self.municipalities.items():
-            matrix[origin] = {}
-            for dest, dest_coords in self.municipalities.items():
-                if origin == dest:
-                    matrix[origin][dest] = 0
-                else:
-                    # Cálculo aproximado baseado em distância e condições locais
-                    distance = self._calculate_distance(
-                        origin_coords['lat'], origin_coords['lng'],
-                        dest_coords['lat'], dest_coords['lng']
-                    )
-                    # Velocidade média considerando trânsito local: 45 km/h
-                    travel_time = int((distance / 45) * 60)  # em minutos
-                    matrix[origin][dest] = max(travel_time, 15)  # mínimo 15 min
-        
-        return matrix
+    @property
+    def travel_times(self) -> Dict[str, Dict[str, int]]:
+        """Tempos de deslocamento entre municípios (minutos), do serviço compartilhado"""
+        return tempos_viagem.matriz_minutos(list(self.municipalities))
+    
+    def _leg_travel_minutes(self, origin_municipality: str, origin_lat: float, origin_lng: float,
+                            dest_municipality: str, dest_lat: float, dest_lng: float,
+                            departure: Optional[datetime] = None) -> float:
+        """
+        Minutos de um trecho: matriz de tempos entre municípios diferentes
+        (conforme a hora de partida); dentro do município, distância a 45 km/h
+        """
+        if origin_municipality != dest_municipality:
+            minutes = tempos_viagem.minutos(origin_municipality, dest_municipality, departure)
+            if minutes is not None:
+                return minutes
+        return self._calculate_distance(origin_lat, origin_lng, dest_lat, dest_lng) / 45 * 60
     
     def _calculate_distance(self, lat1: float, lng1: float, lat2: float, lng2: float) -> float:
         """Calcula distância entre dois pontos usando fórmula de Haversine"""
@@ -141,31 +138,10 @@ class PNSBRouteOptimizer:
     def load_visits_from_database(self, date_filter: Optional[str] = None) -> List[PNSBRoutePoint]:
         """Carrega visitas do banco de dados e converte para RoutePoints"""
         try:
-            query = db.session.query(Visita)
-            
-            if date_filter:
-                query = query.filter(Visita.data == date_filter)
-            
-            visitas = query.filter(Visita.status.in_(['agendada', 'confirmada'])).all()
-            
-            route_points = []
-            for visita in visitas:
-                municipality_coords = self.municipalities.get(visita.municipio)
-                
-                if municipality_coords:
-                    point = PNSBRoutePoint(
-                        id=str(visita.id),
-                        name=f"{visita.local or visita.municipio} - {visita.municipio}",
-                        lat=municipality_coords['lat'],
-                        lng=municipality_coords['lng'],
-                        municipality=visita.municipio,
-                        entity_type='prefeitura',  # Assumindo prefeitura como padrão
-                        survey_type=visita.tipo_coleta or 'ambos',
-                        priority=2,  # Média como padrão
-                        estimated_duration=120,  # 2h padrão
-                        business_hours=self.business_hours['prefeitura']
-                    )
-                    route_points.append(point)
+            # Repositório colunar: reconstruído só quando a tabela de visitas muda
+            visitas = repositorio_pontos_rota.visitas(self.municipalities)
+            indices = np.flatnonzero(visitas.mascara(data=date_filter))
+            route_points = visitas.materializar(indices, self._route_point_from_row)
             
             logger.info(f"✅ Carregadas {len(route_points)} visitas do banco")
             return route_points
@@ -174,6 +150,22 @@ class PNSBRouteOptimizer:
             logger.error(f"❌ Erro ao carregar visitas: {str(e)}")
             return []
     
+    def _route_point_from_row(self, row: Dict[str, Any]) -> PNSBRoutePoint:
+        """PNSBRoutePoint a partir de uma linha do repositório de pontos"""
+        requirements = row['requisitos']
+        return PNSBRoutePoint(
+            id=row['id'],
+            name=row['nome'],
+            lat=row['lat'],
+            lng=row['lng'],
+            municipality=row['municipio'],
+            entity_type='prefeitura',  # Assumindo prefeitura como padrão
+            survey_type='ambos' if len(requirements) != 1 else requirements[0],
+            priority=row['prioridade'],
+            estimated_duration=row['duracao'],
+            business_hours=self.business_hours['prefeitura']
+        )
+    
     def optimize_daily_route(self, points: List[PNSBRoutePoint], 
                            start_time: str = "08:00") -> PNSBOptimizedRoute:
         """Otimiza rota para um dia específico"""
@@ -299,10 +291,16 @@ class PNSBRouteOptimizer:
         return total_distance
     
     def _calculate_route_travel_time(self, points: List[PNSBRoutePoint]) -> float:
-        """Calcula tempo total de deslocamento"""
-        distance = self._calculate_route_distance(points)
-        # Velocidade média: 45 km/h considerando trânsito local
-        return distance / 45
+        """Calcula tempo total de deslocamento (horas), saindo e voltando à base"""
+        if not points:
+            return 0
+        
+        base = self.base_location
+        stops = ([(base['municipality'], base['lat'], base['lng'])]
+                 + [(p.municipality, p.lat, p.lng) for p in points]
+                 + [(base['municipality'], base['lat'], base['lng'])])
+        minutes = sum(self._leg_travel_minutes(*origin, *dest) for origin, dest in zip(stops, stops[1:]))
+        return minutes / 60
     
     def _calculate_route_efficiency(self, points: List[PNSBRoutePoint]) -> float:
         """Calcula eficiência da rota (0-100%)"""
@@ -361,10 +359,11 @@ class PNSBRouteOptimizer:
         
         # Tempo de deslocamento até primeiro ponto
         if route.route_points:
-            travel_to_first = self._calculate_distance(
-                self.base_location['lat'], self.base_location['lng'],
-                route.route_points[0].lat, route.route_points[0].lng
-            ) / 45 * 60  # em minutos
+            first = route.route_points[0]
+            travel_to_first = self._leg_travel_minutes(
+                self.base_location['municipality'], self.base_location['lat'], self.base_location['lng'],
+                first.municipality, first.lat, first.lng, current_time
+            )  # em minutos
             
             current_time += timedelta(minutes=travel_to_first)
         
@@ -387,10 +386,11 @@ class PNSBRouteOptimizer:
             
             # Tempo de deslocamento até próximo ponto
             if i < len(route.route_points) - 1:
-                travel_time = self._calculate_distance(
-                    point.lat, point.lng,
-                    route.route_points[i + 1].lat, route.route_points[i + 1].lng
-                ) / 45 * 60  # em minutos
+                following = route.route_points[i + 1]
+                travel_time = self._leg_travel_minutes(
+                    point.municipality, point.lat, point.lng,
+                    following.municipality, following.lat, following.lng, current_time
+                )  # em minutos
                 
                 current_time += timedelta(minutes=travel_time)
         
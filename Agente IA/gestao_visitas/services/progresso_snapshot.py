@@ -0,0 +1,374 @@
+"""
+Snapshot do Mapa de Progresso
+Payload montado uma vez por alteração de dados e servido como bytes JSON com ETag
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Callable, Dict, Iterable, Tuple
+
+from flask import Response, request
+from sqlalchemy import Integer, cast, event, func
+from sqlalchemy.orm import Session
+
+from gestao_visitas.db import db
+from gestao_visitas.models.agendamento import Visita
+from gestao_visitas.models.checklist import Checklist
+from gestao_visitas.models.contatos import Contato
+from gestao_visitas.models.questionarios_obrigatorios import (
+    EntidadeIdentificada, EntidadePrioritariaUF, ProgressoQuestionarios
+)
+
+logger = logging.getLogger(__name__)
+
+# Modelos cujas alterações invalidam os snapshots do mapa (e o cache de alertas críticos)
+MODELOS_MONITORADOS = (Visita, EntidadeIdentificada, Checklist, Contato)
+
+_versao_dados = 0
+_versao_lock = threading.Lock()
+
+
+def versao_dados() -> int:
+    """Contador de versão dos dados do mapa (incrementado a cada commit relevante)"""
+    return _versao_dados
+
+
+def incrementar_versao_dados() -> int:
+    """Invalida todos os snapshots (também usado por importações em massa)"""
+    global _versao_dados
+    with _versao_lock:
+        _versao_dados += 1
+        return _versao_dados
+
+
+def _marcar_alteracoes(session, flush_context):
+    """after_flush: marca a sessão se algum modelo monitorado foi alterado"""
+    if session.info.get('progresso_alterado'):
+        return
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, MODELOS_MONITORADOS):
+            session.info['progresso_alterado'] = True
+            return
+
+
+def _confirmar_alteracoes(session):
+    """after_commit: só invalida quando a transação realmente persistiu"""
+    if session.info.pop('progresso_alterado', False):
+        incrementar_versao_dados()
+
+
+def _descartar_alteracoes(session):
+    session.info.pop('progresso_alterado', None)
+
+
+event.listen(Session, 'after_flush', _marcar_alteracoes)
+event.listen(Session, 'after_commit', _confirmar_alteracoes)
+event.listen(Session, 'after_rollback', _descartar_alteracoes)
+
+
+# ===== AGREGAÇÕES (uma consulta GROUP BY por tabela) =====
+
+def agregar_visitas_por_municipio() -> Dict[str, Dict]:
+    """
+    Agrega as visitas de todos os municípios numa única consulta agrupada.
+
+    Retorna por município: total, contagens por status, por tipo de informante,
+    por (tipo_pesquisa, status), menor id e limites de datas.
+    """
+    ultima_atividade = func.max(func.coalesce(Visita.data_atualizacao, Visita.data_criacao))
+    linhas = db.session.query(
+        Visita.municipio,
+        Visita.status,
+        Visita.tipo_informante,
+        Visita.tipo_pesquisa,
+        func.count(Visita.id),
+        func.min(Visita.id),
+        ultima_atividade,
+        func.min(Visita.data_criacao),
+        func.min(Visita.data),
+        func.max(Visita.data)
+    ).group_by(
+        Visita.municipio, Visita.status, Visita.tipo_informante, Visita.tipo_pesquisa
+    ).all()
+
+    agregados = {}
+    for municipio, status, tipo_informante, tipo_pesquisa, total, min_id, ultima, criacao, primeira, ultima_data in linhas:
+        agg = agregados.setdefault(municipio, {
+            'total': 0,
+            'por_status': Counter(),
+            'por_tipo_informante': Counter(),
+            'por_pesquisa_status': Counter(),
+            'primeiro_id': min_id,
+            'ultima_atividade': ultima,
+            'primeira_criacao': criacao,
+            'primeira_data': primeira,
+            'ultima_data': ultima_data
+        })
+        agg['total'] += total
+        agg['por_status'][status] += total
+        agg['por_tipo_informante'][tipo_informante or 'prefeitura'] += total
+        agg['por_pesquisa_status'][(tipo_pesquisa, status)] += total
+        agg['primeiro_id'] = min(agg['primeiro_id'], min_id)
+        agg['ultima_atividade'] = _maior(agg['ultima_atividade'], ultima)
+        agg['primeira_criacao'] = _menor(agg['primeira_criacao'], criacao)
+        agg['primeira_data'] = _menor(agg['primeira_data'], primeira)
+        agg['ultima_data'] = _maior(agg['ultima_data'], ultima_data)
+
+    return agregados
+
+
+def visitas_mais_recentes() -> Dict[str, Dict]:
+    """Local, telefone e data da visita atualizada mais recentemente em cada município"""
+    atividade = func.coalesce(Visita.data_atualizacao, Visita.data_criacao)
+    recentes = db.session.query(
+        Visita.municipio.label('municipio'),
+        func.max(atividade).label('ultima')
+    ).group_by(Visita.municipio).subquery()
+
+    linhas = db.session.query(
+        Visita.municipio, Visita.local, Visita.telefone_responsavel, Visita.data
+    ).join(
+        recentes,
+        (Visita.municipio == recentes.c.municipio) & (atividade == recentes.c.ultima)
+    ).order_by(Visita.id).all()
+
+    resultado = {}
+    for municipio, local, telefone, data_visita in linhas:
+        resultado.setdefault(municipio, {'local': local, 'telefone': telefone, 'data': data_visita})
+    return resultado
+
+
+def agregar_entidades_por_municipio() -> Dict[str, Counter]:
+    """
+    Contagem de entidades por (prioridade, status_mrs, status_map,
+    mrs_obrigatorio, map_obrigatorio) em cada município
+    """
+    linhas = db.session.query(
+        EntidadeIdentificada.municipio,
+        EntidadeIdentificada.prioridade,
+        EntidadeIdentificada.status_mrs,
+        EntidadeIdentificada.status_map,
+        EntidadeIdentificada.mrs_obrigatorio,
+        EntidadeIdentificada.map_obrigatorio,
+        func.count(EntidadeIdentificada.id)
+    ).group_by(
+        EntidadeIdentificada.municipio,
+        EntidadeIdentificada.prioridade,
+        EntidadeIdentificada.status_mrs,
+        EntidadeIdentificada.status_map,
+        EntidadeIdentificada.mrs_obrigatorio,
+        EntidadeIdentificada.map_obrigatorio
+    ).all()
+
+    agregados = {}
+    for municipio, prioridade, status_mrs, status_map, mrs, map_, total in linhas:
+        chave = (prioridade, status_mrs, status_map, bool(mrs), bool(map_))
+        agregados.setdefault(municipio, Counter())[chave] += total
+    return agregados
+
+
+@dataclass
+class ProgressoMunicipio:
+    """Progresso de questionários de um município (mesmos campos de ProgressoQuestionarios)"""
+    total_mrs_obrigatorios: int = 0
+    total_map_obrigatorios: int = 0
+    mrs_concluidos: int = 0
+    map_concluidos: int = 0
+    mrs_validados: int = 0
+    map_validados: int = 0
+    percentual_mrs: float = 0.0
+    percentual_map: float = 0.0
+    percentual_geral: float = 0.0
+    status_geral: str = 'nao_iniciado'
+    p1_percentual_conclusao: float = 0.0
+    p2_percentual_conclusao: float = 0.0
+    p3_percentual_conclusao: float = 0.0
+    status_p1: str = 'nao_iniciado'
+
+
+def progresso_questionarios_por_municipio(municipios: Iterable[str],
+                                          entidades_agregadas: Dict[str, Counter]) -> Dict[str, ProgressoMunicipio]:
+    """
+    Mesmo cálculo de ProgressoQuestionarios.calcular_progresso_municipio,
+    para todos os municípios de uma vez e sem gravar nada: reaproveita a
+    agregação de entidades e faz uma consulta agrupada nas prioritárias UF
+    e uma leitura da tabela de progresso (campos por prioridade).
+
+    Esperados = prefeitura (1 MRS + 1 MAP) + P1 da lista UF + P2 identificadas.
+    """
+    uf = {
+        municipio: (int(mrs or 0), int(map_ or 0))
+        for municipio, mrs, map_ in db.session.query(
+            EntidadePrioritariaUF.municipio,
+            func.sum(cast(EntidadePrioritariaUF.mrs_obrigatorio, Integer)),
+            func.sum(cast(EntidadePrioritariaUF.map_obrigatorio, Integer))
+        ).group_by(EntidadePrioritariaUF.municipio)
+    }
+    gravados = {
+        linha.municipio: linha
+        for linha in db.session.query(
+            ProgressoQuestionarios.municipio,
+            ProgressoQuestionarios.p1_percentual_conclusao,
+            ProgressoQuestionarios.p2_percentual_conclusao,
+            ProgressoQuestionarios.p3_percentual_conclusao,
+            ProgressoQuestionarios.status_p1
+        ).order_by(ProgressoQuestionarios.id.desc())
+    }
+
+    resultado = {}
+    for municipio in municipios:
+        contagem = entidades_agregadas.get(municipio, Counter())
+
+        def contar(condicao):
+            return sum(n for chave, n in contagem.items() if condicao(*chave))
+
+        uf_mrs, uf_map = uf.get(municipio, (0, 0))
+        total_mrs = 1 + uf_mrs + contar(lambda p, sm, sp, mrs, map_: p == 2 and mrs)
+        total_map = 1 + uf_map + contar(lambda p, sm, sp, mrs, map_: p == 2 and map_)
+        mrs_validados = contar(lambda p, sm, sp, mrs, map_: mrs and sm == 'validado_concluido')
+        map_validados = contar(lambda p, sm, sp, mrs, map_: map_ and sp == 'validado_concluido')
+        percentual_geral = (mrs_validados + map_validados) / (total_mrs + total_map) * 100
+
+        progresso = ProgressoMunicipio(
+            total_mrs_obrigatorios=total_mrs,
+            total_map_obrigatorios=total_map,
+            mrs_concluidos=contar(lambda p, sm, sp, mrs, map_: mrs and sm == 'respondido'),
+            map_concluidos=contar(lambda p, sm, sp, mrs, map_: map_ and sp == 'respondido'),
+            mrs_validados=mrs_validados,
+            map_validados=map_validados,
+            percentual_mrs=mrs_validados / total_mrs * 100,
+            percentual_map=map_validados / total_map * 100,
+            percentual_geral=percentual_geral,
+            status_geral=('concluido' if percentual_geral == 100
+                          else 'em_andamento' if percentual_geral > 0 else 'nao_iniciado')
+        )
+        gravado = gravados.get(municipio)
+        if gravado:
+            progresso.p1_percentual_conclusao = gravado.p1_percentual_conclusao or 0.0
+            progresso.p2_percentual_conclusao = gravado.p2_percentual_conclusao or 0.0
+            progresso.p3_percentual_conclusao = gravado.p3_percentual_conclusao or 0.0
+            progresso.status_p1 = gravado.status_p1 or 'nao_iniciado'
+        resultado[municipio] = progresso
+    return resultado
+
+
+def checklists_por_visita(visita_ids) -> Dict[int, Checklist]:
+    """Carrega de uma vez os checklists das visitas informadas"""
+    ids = [i for i in visita_ids if i is not None]
+    if not ids:
+        return {}
+    return {c.visita_id: c for c in Checklist.query.filter(Checklist.visita_id.in_(ids)).all()}
+
+
+def _maior(a, b):
+    if a is None:
+        return b
+    return a if b is None or a >= b else b
+
+
+def _menor(a, b):
+    if a is None:
+        return b
+    return a if b is None or a <= b else b
+
+
+# ===== SNAPSHOTS =====
+
+class ProgressoSnapshot:
+    """
+    Cache de payloads pré-serializados por nome.
+
+    Cada snapshot guarda (chave, bytes, etag, criado_em). A chave combina a
+    versão dos dados com a data atual, pois o payload contém contagens de
+    dias. Apenas uma thread reconstrói um snapshot; as demais aguardam e
+    reutilizam. A versão é um contador deste processo: commits feitos em
+    outros workers não passam pelos eventos daqui, e o TTL limita o tempo
+    de defasagem nesses casos.
+    """
+
+    TTL_SEGURANCA = 60
+
+    def __init__(self):
+        self._snapshots: Dict[str, Tuple[Tuple, bytes, str, float]] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self.metrics = {'hits': 0, 'rebuilds': 0, 'not_modified': 0}
+
+    def _lock(self, nome: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(nome, threading.Lock())
+
+    @staticmethod
+    def _chave_atual() -> Tuple:
+        return (versao_dados(), date.today().isoformat())
+
+    def _valido(self, snapshot, chave) -> bool:
+        return bool(snapshot) and snapshot[0] == chave and time.time() - snapshot[3] < self.TTL_SEGURANCA
+
+    def obter(self, nome: str, construtor: Callable[[], Dict]) -> Tuple[bytes, str]:
+        """Retorna (bytes JSON, ETag) do snapshot, reconstruindo se estiver desatualizado"""
+        chave = self._chave_atual()
+        atual = self._snapshots.get(nome)
+        if self._valido(atual, chave):
+            self.metrics['hits'] += 1
+            return atual[1], atual[2]
+
+        with self._lock(nome):
+            # Outra thread pode ter reconstruído enquanto aguardávamos
+            chave = self._chave_atual()
+            atual = self._snapshots.get(nome)
+            if self._valido(atual, chave):
+                self.metrics['hits'] += 1
+                return atual[1], atual[2]
+
+            inicio = datetime.now()
+            payload = construtor()
+            corpo = json.dumps(payload, separators=(',', ':'), default=str).encode('utf-8')
+            etag = hashlib.sha1(corpo).hexdigest()[:20]
+
+            # Descarta se os dados mudaram durante a construção (a próxima requisição reconstrói)
+            if self._chave_atual() == chave:
+                self._snapshots[nome] = (chave, corpo, etag, time.time())
+            self.metrics['rebuilds'] += 1
+            logger.info(f"🗺️ Snapshot '{nome}' reconstruído em "
+                        f"{(datetime.now() - inicio).total_seconds() * 1000:.0f}ms ({len(corpo)} bytes)")
+            return corpo, etag
+
+    def responder(self, nome: str, construtor: Callable[[], Dict]) -> Response:
+        """Resposta Flask com ETag; 304 quando o cliente já tem a versão atual"""
+        corpo, etag = self.obter(nome, construtor)
+
+        if request.if_none_match.contains(etag):
+            self.metrics['not_modified'] += 1
+            response = Response(status=304)
+        else:
+            response = Response(corpo, mimetype='application/json')
+
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Data-Version'] = str(versao_dados())
+        return response
+
+    def invalidar(self, nome: str = None):
+        """Remove um snapshot (ou todos)"""
+        if nome:
+            self._snapshots.pop(nome, None)
+        else:
+            self._snapshots.clear()
+
+    def get_metrics(self) -> Dict:
+        return {
+            **self.metrics,
+            'versao_dados': versao_dados(),
+            'snapshots': {nome: {'bytes': len(s[1]), 'etag': s[2]} for nome, s in self._snapshots.items()}
+        }
+
+
+# Instância global do serviço
+progresso_snapshot = ProgressoSnapshot()
@@ -7,7 +7,7 @@ import json
 import pickle
 import time
 import os
-from typing import Any, Optional, Dict, List
+from typing import Any, Optional, Dict, List, Tuple
 from datetime import datetime, timedelta
 import logging
 
@@ -51,6 +51,8 @@ class RedisCache:
         self.redis_url = redis_url or os.getenv('REDIS_URL', 'redis://localhost:6379/0')
         self.default_ttl = default_ttl
         self.redis_client = None
+        self.is_real_redis = False  # False quando usando simulador ou fallback local
+        self._gcra_script = None
         self.fallback_cache = {}  # Cache local como fallback
         self.metrics = {
             'hits': 0,
@@ -86,6 +88,7 @@ class RedisCache:
             
             # Testar conexão
             self.redis_client.ping()
+            self.is_real_redis = True
             logger.info("✅ Conectado ao Redis real com sucesso")
             return True
             
@@ -349,6 +352,47 @@ class RedisCache:
             logger.error(f"Erro ao obter lock para '{key}': {e}")
             return self.get(key), None
     
+    # Script GCRA atômico: um float (TAT) por chave, expira sozinho quando ocioso
+    GCRA_LUA = """
+        local tat = tonumber(redis.call('GET', KEYS[1]))
+        local now = tonumber(ARGV[1])
+        local interval = tonumber(ARGV[2])
+        local window = tonumber(ARGV[3])
+        if not tat or tat < now then tat = now end
+        local new_tat = tat + interval
+        if new_tat - now > window then return {0, tostring(tat)} end
+        redis.call('SET', KEYS[1], tostring(new_tat), 'PX', math.ceil((new_tat - now) * 1000))
+        return {1, tostring(new_tat)}
+    """
+
+    def gcra_allow(self, key: str, emission_interval: float, window: float,
+                   now: float) -> Optional[Tuple[bool, float]]:
+        """
+        Executa um passo do rate limiter GCRA no Redis (compartilhado entre processos)
+        
+        Args:
+            key: Chave do cliente
+            emission_interval: Segundos entre fichas (window / requests)
+            window: Janela/tolerância de rajada em segundos
+            now: Timestamp atual (time.time())
+            
+        Returns:
+            Tuple: (permitido, TAT gravado); None se Redis real indisponível (usar limitador local)
+        """
+        if not self.is_real_redis:
+            return None
+        
+        try:
+            if self._gcra_script is None:
+                self._gcra_script = self.redis_client.register_script(self.GCRA_LUA)
+            # TAT volta como string: o Redis truncaria um número Lua para inteiro
+            allowed, tat = self._gcra_script(keys=[f"pnsb:{key}"], args=[now, emission_interval, window])
+            return bool(allowed), float(tat)
+        except Exception as e:
+            logger.error(f"Erro no rate limiter Redis para '{key}': {e}")
+            self.metrics['errors'] += 1
+            return None
+    
     def get_metrics(self) -> Dict[str, Any]:
         """
         Retorna métricas de performance do cache
@@ -0,0 +1,325 @@
+"""
+Repositório colunar de pontos de rota (PNSB 2024)
+Entidades e visitas ficam em arrays NumPy paralelos (ids, coordenadas,
+prioridades, durações, máscara de requisitos) reconstruídos só quando um
+commit altera as tabelas de origem. Filtros viram máscaras booleanas e os
+objetos de ponto (RoutePoint, PNSBRoutePoint) só são criados para as linhas
+que o chamador realmente usa.
+"""
+
+import time
+import logging
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from gestao_visitas.db import db
+from gestao_visitas.models.agendamento import Visita
+from gestao_visitas.models.questionarios_obrigatorios import EntidadeIdentificada, EntidadePrioritariaUF
+
+logger = logging.getLogger(__name__)
+
+# Bits da coluna de requisitos
+REQUISITO_MRS = 1
+REQUISITO_MAP = 2
+
+TIPOS_VISITA = ('standard', 'priority')
+
+# ===== VERSÃO DOS DADOS POR TABELA =====
+
+MODELOS_MONITORADOS = (EntidadeIdentificada, EntidadePrioritariaUF, Visita)
+
+_versoes: Counter = Counter()
+_versoes_lock = threading.Lock()
+
+
+def versao_tabelas(tabelas: Iterable[str]) -> Tuple[int, ...]:
+    """Contadores de versão das tabelas (incrementados a cada commit que as altera)"""
+    return tuple(_versoes[tabela] for tabela in tabelas)
+
+
+def invalidar(tabela: str = None):
+    """Força a reconstrução (importações em massa fora do ORM, scripts)"""
+    with _versoes_lock:
+        for nome in ([tabela] if tabela else [m.__tablename__ for m in MODELOS_MONITORADOS]):
+            _versoes[nome] += 1
+
+
+def _marcar_tabelas(session, flush_context):
+    """after_flush: anota quais tabelas monitoradas a transação alterou"""
+    alteradas = session.info.setdefault('pontos_rota_tabelas', set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, MODELOS_MONITORADOS):
+            alteradas.add(obj.__tablename__)
+
+
+def _confirmar_tabelas(session):
+    """after_commit: só invalida quando a transação realmente persistiu"""
+    alteradas = session.info.pop('pontos_rota_tabelas', None)
+    if alteradas:
+        with _versoes_lock:
+            for tabela in alteradas:
+                _versoes[tabela] += 1
+
+
+def _descartar_tabelas(session):
+    session.info.pop('pontos_rota_tabelas', None)
+
+
+event.listen(Session, 'after_flush', _marcar_tabelas)
+event.listen(Session, 'after_commit', _confirmar_tabelas)
+event.listen(Session, 'after_rollback', _descartar_tabelas)
+
+
+# ===== CONJUNTO COLUNAR =====
+
+@dataclass
+class ConjuntoPontos:
+    """Pontos de rota em colunas paralelas; a linha i de cada array é o ponto i"""
+    ids: np.ndarray          # str
+    nomes: np.ndarray        # object
+    lat: np.ndarray          # float64
+    lng: np.ndarray          # float64
+    municipio: np.ndarray    # int16, índice em `municipios`
+    municipios: Tuple[str, ...]
+    prioridade: np.ndarray   # int8
+    duracao: np.ndarray      # int16, minutos
+    requisitos: np.ndarray   # uint8, bits REQUISITO_*
+    tipo_visita: np.ndarray  # int8, índice em TIPOS_VISITA
+    extras: Dict[str, np.ndarray] = field(default_factory=dict)
+    criado_em: float = field(default_factory=time.time)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def mascara(self, municipio: str = None, prioridades: Iterable[int] = None,
+                requisitos: int = 0, data: str = None) -> np.ndarray:
+        """
+        Máscara booleana das linhas que atendem a todos os filtros.
+        `requisitos` exige os bits pedidos (ex.: REQUISITO_MRS | REQUISITO_MAP);
+        `data` (YYYY-MM-DD) filtra a coluna extra 'data', quando existe.
+        """
+        mascara = np.ones(len(self), dtype=bool)
+        if municipio:
+            if municipio not in self.municipios:
+                return np.zeros(len(self), dtype=bool)
+            mascara &= self.municipio == self.municipios.index(municipio)
+        if prioridades is not None:
+            mascara &= np.isin(self.prioridade, list(prioridades))
+        if requisitos:
+            mascara &= (self.requisitos & requisitos) == requisitos
+        if data is not None and 'data' in self.extras:
+            mascara &= self.extras['data'] == np.datetime64(str(data)[:10], 'D')
+        return mascara
+
+    def coordenadas(self, indices: np.ndarray = None) -> np.ndarray:
+        """Array (k, 2) de (lat, lng), pronto para as matrizes de distância"""
+        if indices is None:
+            return np.column_stack([self.lat, self.lng])
+        return np.column_stack([self.lat[indices], self.lng[indices]])
+
+    def estatisticas_por_municipio(self, mascara: np.ndarray = None) -> Dict[str, Dict[str, int]]:
+        """Totais, P1 e requisitos por município sem materializar pontos"""
+        selecionados = np.ones(len(self), dtype=bool) if mascara is None else mascara
+        quantidade = len(self.municipios)
+
+        def contar(condicao):
+            return np.bincount(self.municipio[selecionados & condicao], minlength=quantidade)
+
+        totais = contar(True)
+        p1 = contar(self.prioridade == 1)
+        mrs = contar((self.requisitos & REQUISITO_MRS) > 0)
+        map_ = contar((self.requisitos & REQUISITO_MAP) > 0)
+        return {
+            nome: {
+                'total_points': int(totais[i]),
+                'priority_points': int(p1[i]),
+                'mrs_required': int(mrs[i]),
+                'map_required': int(map_[i])
+            }
+            for i, nome in enumerate(self.municipios) if totais[i]
+        }
+
+    def linha(self, i: int) -> Dict[str, Any]:
+        """Valores Python da linha i"""
+        bits = int(self.requisitos[i])
+        registro = {
+            'id': str(self.ids[i]),
+            'nome': self.nomes[i],
+            'lat': float(self.lat[i]),
+            'lng': float(self.lng[i]),
+            'municipio': self.municipios[self.municipio[i]],
+            'prioridade': int(self.prioridade[i]),
+            'duracao': int(self.duracao[i]),
+            'requisitos': [nome for nome, bit in (('MRS', REQUISITO_MRS), ('MAP', REQUISITO_MAP)) if bits & bit],
+            'tipo_visita': TIPOS_VISITA[self.tipo_visita[i]]
+        }
+        for nome, coluna in self.extras.items():
+            valor = coluna[i]
+            registro[nome] = valor.item() if hasattr(valor, 'item') else valor
+        return registro
+
+    def materializar(self, indices: Iterable[int], fabrica: Callable[[Dict[str, Any]], Any]) -> List[Any]:
+        """
+        Cria os objetos de ponto só para `indices`, na ordem dada (ex.: a
+        ordem final de uma rota). Objetos novos a cada chamada: os
+        otimizadores alteram os pontos (horários, requisitos).
+        """
+        return [fabrica(self.linha(int(i))) for i in indices]
+
+
+def _montar_conjunto(linhas: List[Tuple], extras: Dict[str, np.ndarray] = None) -> ConjuntoPontos:
+    """linhas: (id, nome, lat, lng, municipio, prioridade, duracao, requisitos, tipo_visita)"""
+    if not linhas:
+        vazio = np.array([], dtype=np.int8)
+        return ConjuntoPontos(
+            ids=np.array([], dtype=str), nomes=np.array([], dtype=object),
+            lat=np.array([]), lng=np.array([]), municipio=np.array([], dtype=np.int16),
+            municipios=(), prioridade=vazio, duracao=np.array([], dtype=np.int16),
+            requisitos=np.array([], dtype=np.uint8), tipo_visita=vazio, extras=extras or {}
+        )
+    ids, nomes, lat, lng, municipios, prioridade, duracao, requisitos, tipo = zip(*linhas)
+    nomes_municipios, codigos = np.unique(np.array(municipios, dtype=str), return_inverse=True)
+    nomes_array = np.empty(len(nomes), dtype=object)
+    nomes_array[:] = nomes
+    return ConjuntoPontos(
+        ids=np.array(ids, dtype=str),
+        nomes=nomes_array,
+        lat=np.array(lat, dtype=np.float64),
+        lng=np.array(lng, dtype=np.float64),
+        municipio=codigos.astype(np.int16),
+        municipios=tuple(str(m) for m in nomes_municipios),
+        prioridade=np.array(prioridade, dtype=np.int8),
+        duracao=np.array(duracao, dtype=np.int16),
+        requisitos=np.array(requisitos, dtype=np.uint8),
+        tipo_visita=np.array(tipo, dtype=np.int8),
+        extras=extras or {}
+    )
+
+
+def _bits_requisitos(mrs: bool, map_: bool) -> int:
+    return (REQUISITO_MRS if mrs else 0) | (REQUISITO_MAP if map_ else 0)
+
+
+def _bits_tipo_pesquisa(tipo: Optional[str]) -> int:
+    """'MRS', 'MAP', 'MRS,MAP' ou 'ambos' -> bits de requisito"""
+    texto = (tipo or '').upper()
+    if not texto or 'AMBOS' in texto:
+        return REQUISITO_MRS | REQUISITO_MAP
+    return _bits_requisitos('MRS' in texto, 'MAP' in texto)
+
+
+# ===== REPOSITÓRIO =====
+
+class RepositorioPontosRota:
+    """
+    Conjuntos colunares em memória, um por origem, reconstruídos quando a
+    versão das tabelas muda. Commits de outros processos (workers de jobs)
+    não passam pelos eventos desta sessão; o TTL limita o tempo de
+    defasagem nesses casos.
+    """
+
+    TTL_SEGURANCA = 300
+
+    def __init__(self):
+        self._conjuntos: Dict[str, Tuple[Any, ConjuntoPontos]] = {}
+        self._lock = threading.Lock()
+        self.metricas = {'acertos': 0, 'reconstrucoes': 0, 'ultima_reconstrucao_ms': 0.0}
+
+    def entidades(self) -> ConjuntoPontos:
+        """Entidades identificadas e prioritárias UF geocodificadas"""
+        return self._obter(
+            'entidades',
+            (EntidadeIdentificada.__tablename__, EntidadePrioritariaUF.__tablename__),
+            self._construir_entidades
+        )
+
+    def visitas(self, coordenadas_municipios: Dict[str, Dict[str, float]]) -> ConjuntoPontos:
+        """
+        Visitas agendadas/confirmadas posicionadas na sede do município
+        (coluna extra 'data' para o filtro por dia)
+        """
+        chave = tuple(sorted((nome, c['lat'], c['lng']) for nome, c in coordenadas_municipios.items()))
+        return self._obter(
+            'visitas', (Visita.__tablename__,),
+            lambda: self._construir_visitas(coordenadas_municipios),
+            chave
+        )
+
+    def _obter(self, nome: str, tabelas: Tuple[str, ...], construir: Callable[[], ConjuntoPontos],
+               chave_extra: Any = None) -> ConjuntoPontos:
+        chave = (versao_tabelas(tabelas), chave_extra)
+        atual = self._conjuntos.get(nome)
+        if atual and atual[0] == chave and time.time() - atual[1].criado_em < self.TTL_SEGURANCA:
+            self.metricas['acertos'] += 1
+            return atual[1]
+
+        with self._lock:
+            atual = self._conjuntos.get(nome)
+            if atual and atual[0] == chave and time.time() - atual[1].criado_em < self.TTL_SEGURANCA:
+                self.metricas['acertos'] += 1
+                return atual[1]
+            inicio = time.perf_counter()
+            conjunto = construir()
+            self._conjuntos[nome] = (chave, conjunto)
+            self.metricas['reconstrucoes'] += 1
+            self.metricas['ultima_reconstrucao_ms'] = round((time.perf_counter() - inicio) * 1000, 2)
+            logger.info(f"📍 Conjunto de pontos '{nome}' reconstruído: {len(conjunto)} pontos "
+                        f"em {self.metricas['ultima_reconstrucao_ms']}ms")
+            return conjunto
+
+    def _construir_entidades(self) -> ConjuntoPontos:
+        # Só as colunas usadas: tuplas em vez de objetos ORM completos
+        linhas = []
+        for modelo, tipo in ((EntidadeIdentificada, 'identificada'), (EntidadePrioritariaUF, 'prioritaria')):
+            colunas = [modelo.id, modelo.nome_entidade, modelo.latitude, modelo.longitude,
+                       modelo.municipio, modelo.mrs_obrigatorio, modelo.map_obrigatorio]
+            if modelo is EntidadeIdentificada:
+                colunas.append(modelo.prioridade)
+            consulta = (db.session.query(*colunas)
+                        .filter(modelo.geocodificacao_status == 'sucesso')
+                        .order_by(modelo.id))
+            for id_, nome, lat, lng, municipio, mrs, map_, *prioridade in consulta:
+                if not (lat and lng):
+                    continue
+                bits = _bits_requisitos(mrs, map_)
+                if tipo == 'identificada':
+                    linhas.append((f"identificada_{id_}", nome, lat, lng, municipio,
+                                   prioridade[0] or 2, 90 if bits == REQUISITO_MRS | REQUISITO_MAP else 60,
+                                   bits, TIPOS_VISITA.index('standard')))
+                else:
+                    # Prioritárias UF: sempre P1, mais tempo de visita
+                    linhas.append((f"prioritaria_{id_}", nome, lat, lng, municipio,
+                                   1, 120, bits, TIPOS_VISITA.index('priority')))
+        return _montar_conjunto(linhas)
+
+    def _construir_visitas(self, coordenadas_municipios: Dict[str, Dict[str, float]]) -> ConjuntoPontos:
+        consulta = (db.session.query(Visita.id, Visita.local, Visita.municipio, Visita.tipo_pesquisa, Visita.data)
+                    .filter(Visita.status.in_(['agendada', 'confirmada']))
+                    .order_by(Visita.id))
+        linhas, datas = [], []
+        for id_, local, municipio, tipo_pesquisa, data in consulta:
+            coordenadas = coordenadas_municipios.get(municipio)
+            if not coordenadas:
+                continue
+            linhas.append((str(id_), f"{local or municipio} - {municipio}", coordenadas['lat'],
+                           coordenadas['lng'], municipio, 2, 120, _bits_tipo_pesquisa(tipo_pesquisa),
+                           TIPOS_VISITA.index('standard')))
+            datas.append(data)
+        return _montar_conjunto(linhas, {'data': np.array(datas, dtype='datetime64[D]')})
+
+    def get_metrics(self) -> Dict:
+        return {
+            **self.metricas,
+            'conjuntos': {nome: len(conjunto) for nome, (_, conjunto) in self._conjuntos.items()},
+            'versoes': dict(_versoes)
+        }
+
+
+# Instância global compartilhada pelos otimizadores de rota
+repositorio_pontos_rota = RepositorioPontosRota()
@@ -0,0 +1,693 @@
+"""
+Roteamento offline sobre a malha viária do OpenStreetMap (PNSB 2024)
+Lê um recorte OSM (XML ou PBF) da região de Itajaí, monta um grafo CSR com
+velocidades por classe de via, pré-processa com contraction hierarchies e
+grava o resultado em arquivos .npy abertos por memory-map. Consultas de
+matriz muitos-para-muitos usam buscas ascendentes com buckets, sem rede.
+
+Pré-processamento (uma vez, fora do servidor):
+    python -m gestao_visitas.services.roteador_offline preparar itajai.osm.pbf
+"""
+
+import os
+import bz2
+import gzip
+import json
+import math
+import time
+import heapq
+import shutil
+import logging
+import argparse
+import threading
+import xml.etree.ElementTree as ET
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import osmium
+    OSMIUM_AVAILABLE = True
+except ImportError:
+    OSMIUM_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+VERSAO_FORMATO = 1
+
+# Velocidade (km/h) por classe de via; classes ausentes não entram no grafo
+VELOCIDADES_KMH = {
+    'motorway': 90, 'motorway_link': 50,
+    'trunk': 70, 'trunk_link': 40,
+    'primary': 55, 'primary_link': 35,
+    'secondary': 45, 'secondary_link': 30,
+    'tertiary': 40, 'tertiary_link': 25,
+    'unclassified': 30, 'residential': 25,
+    'living_street': 10, 'service': 15, 'road': 25, 'track': 15,
+}
+
+# Trecho entre o ponto e o nó mais próximo da malha
+VELOCIDADE_ACESSO_KMH = 15
+DISTANCIA_MAX_ACESSO_M = 5000
+
+# Grade do índice espacial (graus; ~1 km)
+TAMANHO_CELULA = 0.01
+
+# Limites da busca de testemunhas na contração
+MAX_ASSENTADOS_TESTEMUNHA = 80
+
+ARQUIVOS = (
+    'coordenadas',
+    'cima_indptr', 'cima_vizinho', 'cima_tempo', 'cima_distancia',
+    'baixo_indptr', 'baixo_vizinho', 'baixo_tempo', 'baixo_distancia',
+    'grade_chaves', 'grade_nos',
+)
+
+Coordenada = Tuple[float, float]
+
+
+class RoteadorOfflineError(Exception):
+    """Recorte OSM inválido ou grafo pré-processado ausente/incompatível"""
+
+
+@dataclass
+class GrafoViario:
+    """Grafo dirigido em lista de arestas (tempo em segundos, distância em metros)"""
+    coordenadas: np.ndarray
+    origem: np.ndarray
+    destino: np.ndarray
+    tempo: np.ndarray
+    distancia: np.ndarray
+
+    @property
+    def total_nos(self) -> int:
+        return len(self.coordenadas)
+
+    def csr(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """(indptr, destino, tempo, distancia) ordenados por origem"""
+        ordem = np.argsort(self.origem, kind='stable')
+        indptr = np.zeros(self.total_nos + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.origem, minlength=self.total_nos), out=indptr[1:])
+        return indptr, self.destino[ordem], self.tempo[ordem], self.distancia[ordem]
+
+
+def _haversine_metros(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(np.radians, (lat1, lng1, lat2, lng2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2 +
+         np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2)
+    return 6371000 * 2 * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+# ===== LEITURA DO OSM =====
+
+def _abrir(caminho: str):
+    if caminho.endswith('.gz'):
+        return gzip.open(caminho, 'rb')
+    if caminho.endswith('.bz2'):
+        return bz2.open(caminho, 'rb')
+    return open(caminho, 'rb')
+
+
+def _ler_osm_xml(caminho: str) -> Tuple[List[Tuple[List[int], Dict]], Dict[int, Coordenada]]:
+    """Duas passadas em streaming: vias primeiro, depois só os nós usados por elas"""
+    vias = []
+    with _abrir(caminho) as arquivo:
+        contexto = ET.iterparse(arquivo, events=('start', 'end'))
+        _, raiz = next(contexto)
+        for evento, elemento in contexto:
+            if evento != 'end':
+                continue
+            if elemento.tag == 'way':
+                tags = {tag.get('k'): tag.get('v') for tag in elemento.iter('tag')}
+                if tags.get('highway') in VELOCIDADES_KMH:
+                    refs = [int(nd.get('ref')) for nd in elemento.iter('nd')]
+                    if len(refs) >= 2:
+                        vias.append((refs, tags))
+                raiz.clear()
+            elif elemento.tag in ('node', 'relation'):
+                raiz.clear()
+
+    usados = {ref for refs, _ in vias for ref in refs}
+    coordenadas = {}
+    with _abrir(caminho) as arquivo:
+        contexto = ET.iterparse(arquivo, events=('start', 'end'))
+        _, raiz = next(contexto)
+        for evento, elemento in contexto:
+            if evento != 'end':
+                continue
+            if elemento.tag == 'node':
+                ref = int(elemento.get('id'))
+                if ref in usados:
+                    coordenadas[ref] = (float(elemento.get('lat')), float(elemento.get('lon')))
+                raiz.clear()
+            elif elemento.tag in ('way', 'relation'):
+                raiz.clear()
+    return vias, coordenadas
+
+
+def _ler_osm_pbf(caminho: str) -> Tuple[List[Tuple[List[int], Dict]], Dict[int, Coordenada]]:
+    if not OSMIUM_AVAILABLE:
+        raise RoteadorOfflineError("Leitura de PBF requer o pacote osmium (pip install osmium)")
+
+    class ColetorVias(osmium.SimpleHandler):
+        def __init__(self):
+            super().__init__()
+            self.vias = []
+            self.coordenadas = {}
+
+        def way(self, via):
+            if via.tags.get('highway') not in VELOCIDADES_KMH:
+                return
+            refs = []
+            for no in via.nodes:
+                if no.location.valid():
+                    refs.append(no.ref)
+                    self.coordenadas[no.ref] = (no.location.lat, no.location.lon)
+            if len(refs) >= 2:
+                self.vias.append((refs, {tag.k: tag.v for tag in via.tags}))
+
+    coletor = ColetorVias()
+    coletor.apply_file(caminho, locations=True)
+    return coletor.vias, coletor.coordenadas
+
+
+def _velocidade_kmh(tags: Dict) -> float:
+    maxspeed = (tags.get('maxspeed') or '').strip().lower()
+    numero = ''.join(c for c in maxspeed.split(';')[0] if c.isdigit() or c == '.')
+    if numero:
+        try:
+            valor = float(numero)
+            if 'mph' in maxspeed:
+                valor *= 1.609
+            # Limite legal acima da média praticada: fica com o perfil da classe se menor
+            return min(valor, VELOCIDADES_KMH[tags['highway']] * 1.5) if valor > 0 else VELOCIDADES_KMH[tags['highway']]
+        except ValueError:
+            pass
+    return VELOCIDADES_KMH[tags['highway']]
+
+
+def _sentido(tags: Dict) -> Optional[int]:
+    """1 = só no sentido da via, -1 = só contrário, 0 = ambos, None = fora do roteamento"""
+    if tags.get('access') in ('no', 'private') or tags.get('motor_vehicle') in ('no', 'private'):
+        return None
+    if tags.get('area') == 'yes':
+        return None
+    oneway = tags.get('oneway')
+    if oneway in ('yes', '1', 'true'):
+        return 1
+    if oneway in ('-1', 'reverse'):
+        return -1
+    if oneway == 'no':
+        return 0
+    if tags.get('highway') in ('motorway', 'motorway_link') or tags.get('junction') in ('roundabout', 'circular'):
+        return 1
+    return 0
+
+
+def construir_grafo(vias: List[Tuple[List[int], Dict]], coordenadas: Dict[int, Coordenada],
+                    bbox: Optional[Tuple[float, float, float, float]] = None) -> GrafoViario:
+    """
+    Grafo entre cruzamentos: nós intermediários das vias são absorvidos nas
+    arestas (distância somada). bbox = (lat_min, lng_min, lat_max, lng_max)
+    descarta trechos fora do recorte. Fica só o maior componente conexo.
+    """
+    def dentro(ref):
+        if ref not in coordenadas:
+            return False
+        if bbox is None:
+            return True
+        lat, lng = coordenadas[ref]
+        return bbox[0] <= lat <= bbox[2] and bbox[1] <= lng <= bbox[3]
+
+    uso = Counter()
+    for refs, _ in vias:
+        uso.update(refs)
+        uso[refs[0]] += 1
+        uso[refs[-1]] += 1
+
+    origens, destinos, tempos, distancias = [], [], [], []
+    for refs, tags in vias:
+        sentido = _sentido(tags)
+        if sentido is None:
+            continue
+        metros_por_segundo = _velocidade_kmh(tags) / 3.6
+
+        # Distâncias de todos os segmentos da via de uma vez
+        validos = [dentro(ref) for ref in refs]
+        pontos = np.array([coordenadas.get(ref, (0.0, 0.0)) for ref in refs])
+        segmentos = _haversine_metros(pontos[:-1, 0], pontos[:-1, 1], pontos[1:, 0], pontos[1:, 1]).tolist()
+
+        inicio, acumulado = None, 0.0
+        for i in range(len(refs) - 1):
+            a, b = refs[i], refs[i + 1]
+            if not (validos[i] and validos[i + 1]):
+                inicio = None
+                continue
+            if inicio is None:
+                inicio, acumulado = a, 0.0
+            acumulado += segmentos[i]
+            ultimo = i + 2 == len(refs) or not validos[i + 2]
+            if uso[b] > 1 or ultimo:
+                if b != inicio:
+                    segundos = acumulado / metros_por_segundo
+                    if sentido >= 0:
+                        origens.append(inicio); destinos.append(b)
+                        tempos.append(segundos); distancias.append(acumulado)
+                    if sentido <= 0:
+                        origens.append(b); destinos.append(inicio)
+                        tempos.append(segundos); distancias.append(acumulado)
+                inicio, acumulado = b, 0.0
+
+    if not origens:
+        raise RoteadorOfflineError("Nenhuma via roteável encontrada no recorte")
+
+    refs_nos = np.unique(np.array(origens + destinos, dtype=np.int64))
+    origem = np.searchsorted(refs_nos, np.array(origens, dtype=np.int64))
+    destino = np.searchsorted(refs_nos, np.array(destinos, dtype=np.int64))
+    tempo = np.array(tempos)
+    distancia = np.array(distancias)
+
+    # Arestas paralelas: fica a mais rápida
+    ordem = np.lexsort((tempo, destino, origem))
+    origem, destino, tempo, distancia = origem[ordem], destino[ordem], tempo[ordem], distancia[ordem]
+    primeira = np.ones(len(origem), dtype=bool)
+    primeira[1:] = (origem[1:] != origem[:-1]) | (destino[1:] != destino[:-1])
+    origem, destino, tempo, distancia = origem[primeira], destino[primeira], tempo[primeira], distancia[primeira]
+
+    # Maior componente (fracamente) conexo, para não ancorar pontos em ilhas
+    pai = list(range(len(refs_nos)))
+
+    def raiz(x):
+        while pai[x] != x:
+            pai[x] = pai[pai[x]]
+            x = pai[x]
+        return x
+
+    for a, b in zip(origem.tolist(), destino.tolist()):
+        ra, rb = raiz(a), raiz(b)
+        if ra != rb:
+            pai[ra] = rb
+    componentes = np.array([raiz(x) for x in range(len(refs_nos))])
+    maior = np.bincount(componentes).argmax()
+    manter = componentes == maior
+    novo_indice = np.cumsum(manter) - 1
+    arestas = manter[origem]
+
+    coords = np.array([coordenadas[int(ref)] for ref in refs_nos[manter]], dtype=np.float64)
+    return GrafoViario(
+        coordenadas=coords,
+        origem=novo_indice[origem[arestas]].astype(np.int32),
+        destino=novo_indice[destino[arestas]].astype(np.int32),
+        tempo=tempo[arestas].astype(np.float32),
+        distancia=distancia[arestas].astype(np.float32)
+    )
+
+
+def carregar_osm(caminho: str, bbox: Optional[Tuple[float, float, float, float]] = None) -> GrafoViario:
+    """Grafo viário a partir de um recorte .osm.pbf ou .osm (opcionalmente .gz/.bz2)"""
+    if caminho.endswith('.pbf'):
+        vias, coordenadas = _ler_osm_pbf(caminho)
+    else:
+        vias, coordenadas = _ler_osm_xml(caminho)
+    logger.info(f"🛣️ {len(vias)} vias e {len(coordenadas)} nós lidos de {os.path.basename(caminho)}")
+    return construir_grafo(vias, coordenadas, bbox)
+
+
+# ===== CONTRACTION HIERARCHIES =====
+
+def contrair(grafo: GrafoViario, max_assentados: int = MAX_ASSENTADOS_TESTEMUNHA) -> Dict[str, np.ndarray]:
+    """
+    Contrai os nós em ordem de prioridade (diferença de arestas + vizinhos já
+    contraídos, com atualização preguiçosa) e retorna os grafos ascendentes em
+    CSR: `cima` (u -> v de nível maior) e `baixo` (v <- u de nível maior,
+    guardado em v para a busca reversa).
+    """
+    n = grafo.total_nos
+    saida: List[Dict[int, Tuple[float, float]]] = [dict() for _ in range(n)]
+    entrada: List[Dict[int, Tuple[float, float]]] = [dict() for _ in range(n)]
+    for u, v, t, d in zip(grafo.origem.tolist(), grafo.destino.tolist(),
+                          grafo.tempo.tolist(), grafo.distancia.tolist()):
+        saida[u][v] = (t, d)
+        entrada[v][u] = (t, d)
+
+    def testemunhas(u: int, evitar: int, limite: float) -> Dict[int, float]:
+        dist = {u: 0.0}
+        fila = [(0.0, u)]
+        assentados = 0
+        while fila:
+            t, x = heapq.heappop(fila)
+            if t > dist[x]:
+                continue
+            if t > limite:
+                break
+            assentados += 1
+            if assentados > max_assentados:
+                break
+            for y, (ty, _) in saida[x].items():
+                if y == evitar:
+                    continue
+                nt = t + ty
+                if nt < dist.get(y, math.inf):
+                    dist[y] = nt
+                    heapq.heappush(fila, (nt, y))
+        return dist
+
+    def atalhos(v: int) -> List[Tuple[int, int, float, float]]:
+        novos = []
+        for u, (tu, du) in entrada[v].items():
+            alvos = [(w, tw, dw) for w, (tw, dw) in saida[v].items() if w != u]
+            if not alvos:
+                continue
+            dist = testemunhas(u, v, tu + max(tw for _, tw, _ in alvos))
+            for w, tw, dw in alvos:
+                if dist.get(w, math.inf) > tu + tw + 1e-6:
+                    novos.append((u, w, tu + tw, du + dw))
+        return novos
+
+    vizinhos_contraidos = [0] * n
+
+    def prioridade(v: int, novos: List) -> int:
+        return len(novos) - len(entrada[v]) - len(saida[v]) + vizinhos_contraidos[v]
+
+    fila = [(prioridade(v, atalhos(v)), v) for v in range(n)]
+    heapq.heapify(fila)
+
+    cima: List[List[Tuple[int, float, float]]] = [[] for _ in range(n)]
+    baixo: List[List[Tuple[int, float, float]]] = [[] for _ in range(n)]
+    contraidos = 0
+    total_atalhos = 0
+    inicio = time.perf_counter()
+
+    while fila:
+        _, v = heapq.heappop(fila)
+        novos = atalhos(v)
+        atual = prioridade(v, novos)
+        if fila and atual > fila[0][0]:
+            heapq.heappush(fila, (atual, v))
+            continue
+
+        for u, (t, d) in entrada[v].items():
+            del saida[u][v]
+            baixo[v].append((u, t, d))
+            vizinhos_contraidos[u] += 1
+        for w, (t, d) in saida[v].items():
+            del entrada[w][v]
+            cima[v].append((w, t, d))
+            vizinhos_contraidos[w] += 1
+        entrada[v], saida[v] = {}, {}
+
+        for u, w, t, d in novos:
+            existente = saida[u].get(w)
+            if existente is None or t < existente[0]:
+                saida[u][w] = (t, d)
+                entrada[w][u] = (t, d)
+        total_atalhos += len(novos)
+
+        contraidos += 1
+        if contraidos % 20000 == 0:
+            logger.info(f"🔧 {contraidos}/{n} nós contraídos, {total_atalhos} atalhos "
+                        f"({time.perf_counter() - inicio:.0f}s)")
+
+    logger.info(f"✅ Contração concluída: {n} nós, {total_atalhos} atalhos em {time.perf_counter() - inicio:.1f}s")
+
+    resultado = {}
+    for nome, listas in (('cima', cima), ('baixo', baixo)):
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum([len(lista) for lista in listas], out=indptr[1:])
+        arestas = [aresta for lista in listas for aresta in lista]
+        resultado[f'{nome}_indptr'] = indptr
+        resultado[f'{nome}_vizinho'] = np.array([a[0] for a in arestas], dtype=np.int32)
+        resultado[f'{nome}_tempo'] = np.array([a[1] for a in arestas], dtype=np.float32)
+        resultado[f'{nome}_distancia'] = np.array([a[2] for a in arestas], dtype=np.float32)
+    return resultado
+
+
+def _chaves_celula(lat, lng) -> np.ndarray:
+    linha = np.floor((np.asarray(lat) + 90) / TAMANHO_CELULA).astype(np.int64)
+    coluna = np.floor((np.asarray(lng) + 180) / TAMANHO_CELULA).astype(np.int64)
+    return linha * 100000 + coluna
+
+
+def preparar(caminho_osm: str, diretorio: str,
+             bbox: Optional[Tuple[float, float, float, float]] = None) -> Dict:
+    """Lê o recorte, contrai e grava o grafo em `diretorio` (substituição atômica)"""
+    inicio = time.perf_counter()
+    grafo = carregar_osm(caminho_osm, bbox)
+    logger.info(f"🛣️ Grafo: {grafo.total_nos} cruzamentos, {len(grafo.origem)} arestas")
+
+    arrays = contrair(grafo)
+    arrays['coordenadas'] = grafo.coordenadas
+    chaves = _chaves_celula(grafo.coordenadas[:, 0], grafo.coordenadas[:, 1])
+    ordem = np.argsort(chaves, kind='stable')
+    arrays['grade_chaves'] = chaves[ordem]
+    arrays['grade_nos'] = ordem.astype(np.int32)
+
+    meta = {
+        'versao': VERSAO_FORMATO,
+        'origem': os.path.basename(caminho_osm),
+        'criado_em': datetime.now().isoformat(),
+        'nos': grafo.total_nos,
+        'arestas': int(len(grafo.origem)),
+        'arestas_ch': int(len(arrays['cima_vizinho']) + len(arrays['baixo_vizinho'])),
+        'bbox': list(bbox) if bbox else None,
+        'velocidades_kmh': VELOCIDADES_KMH,
+        'tempo_preparo_s': round(time.perf_counter() - inicio, 1)
+    }
+
+    temporario = f"{diretorio.rstrip(os.sep)}.tmp"
+    shutil.rmtree(temporario, ignore_errors=True)
+    os.makedirs(temporario)
+    for nome in ARQUIVOS:
+        np.save(os.path.join(temporario, f'{nome}.npy'), arrays[nome])
+    with open(os.path.join(temporario, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    antigo = f"{diretorio.rstrip(os.sep)}.old"
+    shutil.rmtree(antigo, ignore_errors=True)
+    if os.path.exists(diretorio):
+        os.rename(diretorio, antigo)
+    os.rename(temporario, diretorio)
+    shutil.rmtree(antigo, ignore_errors=True)
+    return meta
+
+
+# ===== CONSULTAS =====
+
+class RoteadorOffline:
+    """Consultas sobre o grafo contraído, aberto sob demanda por memory-map"""
+
+    def __init__(self, diretorio: str = None):
+        self.diretorio = diretorio or os.environ.get('PNSB_GRAFO_VIARIO') or self._get_data_directory()
+        self._lock = threading.Lock()
+        self._arrays: Optional[Dict[str, np.ndarray]] = None
+        self.meta: Dict = {}
+        self._tentou_carregar = False
+        self._cache_arestas: Dict[str, Dict[int, List]] = {'cima': {}, 'baixo': {}}
+
+    def _get_data_directory(self) -> str:
+        return os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'instance', 'grafo_viario')
+
+    def carregar(self) -> bool:
+        """Abre os arquivos (memory-map, sem copiar para a memória)"""
+        with self._lock:
+            self._tentou_carregar = True
+            caminho_meta = os.path.join(self.diretorio, 'meta.json')
+            if not os.path.exists(caminho_meta):
+                self._arrays = None
+                return False
+            try:
+                with open(caminho_meta, encoding='utf-8') as f:
+                    meta = json.load(f)
+                if meta.get('versao') != VERSAO_FORMATO:
+                    raise RoteadorOfflineError(f"Versão do grafo {meta.get('versao')} incompatível")
+                # view(np.ndarray): continua mapeado, sem o custo de np.memmap a cada fatia
+                self._arrays = {
+                    nome: np.load(os.path.join(self.diretorio, f'{nome}.npy'), mmap_mode='r').view(np.ndarray)
+                    for nome in ARQUIVOS
+                }
+                self.meta = meta
+                self._cache_arestas = {'cima': {}, 'baixo': {}}
+                logger.info(f"🛣️ Grafo viário offline carregado: {meta['nos']} nós ({meta['origem']})")
+                return True
+            except Exception as e:
+                logger.error(f"❌ Erro ao carregar grafo viário offline: {str(e)}")
+                self._arrays = None
+                return False
+
+    @property
+    def disponivel(self) -> bool:
+        if not self._tentou_carregar:
+            self.carregar()
+        return self._arrays is not None
+
+    def ancorar(self, pontos: Sequence[Coordenada]) -> Tuple[np.ndarray, np.ndarray]:
+        """Nó mais próximo de cada ponto e distância até ele (-1/NaN se longe demais)"""
+        arrays = self._arrays
+        coordenadas, chaves, nos = arrays['coordenadas'], arrays['grade_chaves'], arrays['grade_nos']
+        indices = np.full(len(pontos), -1, dtype=np.int64)
+        distancias = np.full(len(pontos), np.nan)
+
+        for i, (lat, lng) in enumerate(pontos):
+            centro = int(_chaves_celula(lat, lng))
+            # Lado menor da célula (longitude encolhe com a latitude)
+            lado_m = TAMANHO_CELULA * 111000 * math.cos(math.radians(lat))
+            raio_max = int(math.ceil(DISTANCIA_MAX_ACESSO_M / lado_m))
+            for raio in range(raio_max + 1):
+                candidatos = []
+                for dl in range(-raio, raio + 1):
+                    # Faixa contígua de células da linha dl
+                    base = centro + dl * 100000
+                    a, b = np.searchsorted(chaves, [base - raio, base + raio + 1])
+                    if b > a:
+                        candidatos.append(nos[a:b])
+                if not candidatos:
+                    continue
+                candidatos = np.concatenate(candidatos)
+                metros = _haversine_metros(lat, lng, coordenadas[candidatos, 0], coordenadas[candidatos, 1])
+                melhor = int(np.argmin(metros))
+                # Vizinho numa célula ainda não vista pode estar mais perto: um anel a mais
+                if metros[melhor] <= raio * lado_m or raio == raio_max:
+                    if metros[melhor] <= DISTANCIA_MAX_ACESSO_M:
+                        indices[i], distancias[i] = candidatos[melhor], metros[melhor]
+                    break
+        return indices, distancias
+
+    def _arestas(self, prefixo: str, u: int) -> List[Tuple[int, float, float]]:
+        """Arestas ascendentes de u, convertidas uma vez e guardadas (o topo da hierarquia se repete)"""
+        cache = self._cache_arestas[prefixo]
+        arestas = cache.get(u)
+        if arestas is None:
+            arrays = self._arrays
+            a, b = arrays[f'{prefixo}_indptr'][u:u + 2].tolist()
+            arestas = list(zip(arrays[f'{prefixo}_vizinho'][a:b].tolist(),
+                               arrays[f'{prefixo}_tempo'][a:b].tolist(),
+                               arrays[f'{prefixo}_distancia'][a:b].tolist()))
+            cache[u] = arestas
+        return arestas
+
+    def _busca_ascendente(self, no: int, prefixo: str) -> Tuple[List[int], List[float], List[float]]:
+        """
+        Dijkstra só por arestas que sobem na hierarquia; retorna os nós
+        assentados. Stall-on-demand: um nó alcançável mais cedo por um vizinho
+        de nível maior (arestas da direção oposta) não é expandido nem retornado.
+        """
+        oposto = 'baixo' if prefixo == 'cima' else 'cima'
+        melhor = {no: 0.0}
+        fila = [(0.0, 0.0, no)]
+        nos, tempos_saida, distancias_saida = [], [], []
+        assentados = set()
+        while fila:
+            t, d, u = heapq.heappop(fila)
+            if u in assentados:
+                continue
+            assentados.add(u)
+            if any(melhor.get(x, math.inf) + tx < t for x, tx, _ in self._arestas(oposto, u)):
+                continue
+            nos.append(u)
+            tempos_saida.append(t)
+            distancias_saida.append(d)
+            for v, tv, dv in self._arestas(prefixo, u):
+                nt = t + tv
+                if nt < melhor.get(v, math.inf) and v not in assentados:
+                    melhor[v] = nt
+                    heapq.heappush(fila, (nt, d + dv, v))
+        return nos, tempos_saida, distancias_saida
+
+    def matriz(self, origens: Sequence[Coordenada], destinos: Sequence[Coordenada]) -> Dict:
+        """
+        Matriz origens x destinos: 'duracoes' (segundos) e 'distancias'
+        (metros), NaN onde não há rota. Inclui o trecho de acesso do ponto ao
+        nó da malha em VELOCIDADE_ACESSO_KMH.
+        """
+        if not self.disponivel:
+            raise RoteadorOfflineError(f"Grafo viário não encontrado em {self.diretorio}")
+
+        inicio = time.perf_counter()
+        nos_origem, acesso_origem = self.ancorar(origens)
+        nos_destino, acesso_destino = self.ancorar(destinos)
+
+        # Buckets: para cada nó alcançado pela busca reversa, (destino, tempo, distância)
+        entradas_no, entradas_j, entradas_t, entradas_d = [], [], [], []
+        for j, no in enumerate(nos_destino.tolist()):
+            if no < 0:
+                continue
+            nos, tempos, distancias = self._busca_ascendente(no, 'baixo')
+            entradas_no.extend(nos)
+            entradas_j.extend([j] * len(nos))
+            entradas_t.extend(tempos)
+            entradas_d.extend(distancias)
+
+        ordem = np.argsort(np.array(entradas_no, dtype=np.int64), kind='stable')
+        bucket_no = np.array(entradas_no, dtype=np.int64)[ordem]
+        bucket_j = np.array(entradas_j, dtype=np.int64)[ordem]
+        bucket_t = np.array(entradas_t)[ordem]
+        bucket_d = np.array(entradas_d)[ordem]
+        nos_com_bucket, inicio_bucket, tamanho_bucket = np.unique(bucket_no, return_index=True, return_counts=True)
+        faixas = dict(zip(nos_com_bucket.tolist(), zip(inicio_bucket.tolist(), tamanho_bucket.tolist())))
+
+        duracoes = np.full((len(origens), len(destinos)), np.nan)
+        distancias_m = np.full((len(origens), len(destinos)), np.nan)
+        for i, no in enumerate(nos_origem.tolist()):
+            if no < 0:
+                continue
+            inicios, tamanhos, base_t, base_d = [], [], [], []
+            for u, t, d in zip(*self._busca_ascendente(no, 'cima')):
+                faixa = faixas.get(u)
+                if faixa:
+                    inicios.append(faixa[0])
+                    tamanhos.append(faixa[1])
+                    base_t.append(t)
+                    base_d.append(d)
+            if not inicios:
+                continue
+            tamanhos = np.array(tamanhos)
+            deslocamento = np.repeat(np.array(inicios) - np.cumsum(tamanhos) + tamanhos, tamanhos)
+            indices = deslocamento + np.arange(tamanhos.sum())
+            candidatos_t = bucket_t[indices] + np.repeat(base_t, tamanhos)
+            candidatos_d = bucket_d[indices] + np.repeat(base_d, tamanhos)
+            colunas = bucket_j[indices]
+            # Menor tempo por destino (a distância acompanha o caminho escolhido)
+            ordem = np.lexsort((candidatos_t, colunas))
+            colunas, primeiros = np.unique(colunas[ordem], return_index=True)
+            duracoes[i, colunas] = candidatos_t[ordem][primeiros]
+            distancias_m[i, colunas] = candidatos_d[ordem][primeiros]
+
+        velocidade_acesso = VELOCIDADE_ACESSO_KMH / 3.6
+        duracoes += acesso_origem[:, None] / velocidade_acesso + acesso_destino[None, :] / velocidade_acesso
+        distancias_m += acesso_origem[:, None] + acesso_destino[None, :]
+
+        # Mesmo ponto nos dois lados: custo zero
+        origens_arr, destinos_arr = np.asarray(origens, dtype=float), np.asarray(destinos, dtype=float)
+        iguais = np.all(np.isclose(origens_arr[:, None, :], destinos_arr[None, :, :], atol=1e-7), axis=2)
+        duracoes[iguais] = 0.0
+        distancias_m[iguais] = 0.0
+
+        return {
+            'duracoes': duracoes,
+            'distancias': distancias_m,
+            'nao_ancorados': int((nos_origem < 0).sum() + (nos_destino < 0).sum()),
+            'tempo_ms': round((time.perf_counter() - inicio) * 1000, 1)
+        }
+
+
+# Instância global
+roteador_offline = RoteadorOffline()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    parser = argparse.ArgumentParser(description='Roteamento offline sobre a malha do OpenStreetMap')
+    subcomandos = parser.add_subparsers(dest='comando', required=True)
+    preparo = subcomandos.add_parser('preparar', help='Pré-processa um recorte OSM (.osm, .osm.gz, .osm.pbf)')
+    preparo.add_argument('arquivo')
+    preparo.add_argument('--destino', default=None, help='diretório do grafo (padrão: instance/grafo_viario)')
+    preparo.add_argument('--bbox', type=float, nargs=4, metavar=('LAT_MIN', 'LNG_MIN', 'LAT_MAX', 'LNG_MAX'))
+    args = parser.parse_args()
+
+    destino = args.destino or roteador_offline.diretorio
+    resultado = preparar(args.arquivo, destino, tuple(args.bbox) if args.bbox else None)
+    print(f"✅ Grafo gravado em {destino}: {resultado['nos']} nós, "
+          f"{resultado['arestas_ch']} arestas na hierarquia, {resultado['tempo_preparo_s']}s")
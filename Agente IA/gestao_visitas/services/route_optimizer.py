@@ -4,9 +4,10 @@ Algoritmos avançados para otimização multi-stop e planejamento inteligente de
 """
 
 import math
+import time
 import numpy as np
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple, Any
+from typing import Callable, Dict, List, Optional, Tuple, Any
 from flask import current_app
 import logging
 import json
@@ -17,6 +18,14 @@ from gestao_visitas.db import db
 from gestao_visitas.models.agendamento import Visita
 from gestao_visitas.models.questionarios_obrigatorios import EntidadeIdentificada, EntidadePrioritariaUF
 from gestao_visitas.services.offline_maps_service import OfflineMapsService
+from gestao_visitas.services.places_cache import places_cache, CAMPOS_DETALHES
+from gestao_visitas.services.distance_matrix_tiles import distance_matrix_tiler, DistanceMatrixError
+from gestao_visitas.services.vrptw_solver import SolverVRPTW
+from gestao_visitas.services.roteador_offline import roteador_offline, RoteadorOfflineError
+from gestao_visitas.services.optimized_route_cache import optimized_route_cache, faixa_horaria
+from gestao_visitas.services import ga_ilhas
+from gestao_visitas.services.repositorio_pontos_rota import repositorio_pontos_rota
+from gestao_visitas.services.geometria_rotas import geometria_rotas, compactar_passos, normalizar_detalhe
 
 
 @dataclass
@@ -85,6 +94,7 @@ class RouteOptimizer:
         
         # Google Maps integration
         self.google_maps_client = None
+        self.google_maps_api_key = None
         self._init_google_maps()
     
     def _init_google_maps(self):
@@ -104,6 +114,7 @@ class RouteOptimizer:
             
             # Testar inicialização do client
             self.google_maps_client = googlemaps.Client(key=api_key)
+            self.google_maps_api_key = api_key
             
             # Fazer teste básico de conectividade
             try:
@@ -131,8 +142,24 @@ class RouteOptimizer:
                                       target_date: str = None,
                                       start_time: str = "08:00",
                                       end_time: str = "18:00",
-                                      include_business_hours: bool = True) -> Dict[str, Any]:
-        """Otimizar rota usando Google Maps API - Nível 2/3"""
+                                      include_business_hours: bool = True,
+                                      progress_callback: Optional[Callable] = None,
+                                      detail: str = 'full') -> Dict[str, Any]:
+        """
+        Otimizar rota usando Google Maps API - Nível 2/3
+        
+        progress_callback(percentual, mensagem, parcial) recebe o andamento e
+        a melhor ordem parcial; se retornar True a otimização é interrompida.
+        detail ('summary'|'full') define o tamanho das direções detalhadas.
+        """
+        interrompido = []
+
+        def progress(*args, **kwargs) -> bool:
+            """Repassa ao callback e lembra se ele já pediu para parar"""
+            if progress_callback and progress_callback(*args, **kwargs):
+                interrompido.append(True)
+            return bool(interrompido)
+
         try:
             if not self.is_google_maps_available():
                 return {
@@ -146,6 +173,7 @@ class RouteOptimizer:
             
             # NÍVEL 3: Buscar horários reais das entidades
             if include_business_hours:
+                progress(5, 'Buscando horários de atendimento')
                 self.logger.info("🕰️ Buscando horários de atendimento reais...")
                 try:
                     points = self._enrich_points_with_business_hours(points, target_date)
@@ -173,6 +201,8 @@ class RouteOptimizer:
             coords_with_base[self.starting_point['municipality']] = (self.starting_point['lat'], self.starting_point['lng'])
             
             # Obter matriz de distâncias/tempo do Google Maps (agora 4x4)
+            if progress(20, 'Consultando matriz de distâncias'):
+                return self._cancelled_result()
             distance_matrix = self._get_google_distance_matrix(points_with_base, coords_with_base, target_date)
             
             if not distance_matrix:
@@ -182,8 +212,51 @@ class RouteOptimizer:
                     'fallback_to_level1': True
                 }
             
-            # Resolver TSP com dados reais e horários
-            optimized_order = self._solve_tsp_with_google_data(points, distance_matrix, include_business_hours)
+            # Resolver TSP com dados reais e horários; ordens já calculadas
+            # para o mesmo conjunto (ou quase) vêm do cache de rotas
+            progress(30, 'Otimizando ordem das visitas')
+            inicio_calculo = time.perf_counter()
+            contexto = optimized_route_cache.chave_contexto(
+                'google_maps', f'nivel_{nivel}', self.weights,
+                faixa_horaria(start_time, target_date), fim=end_time
+            )
+            chave = optimized_route_cache.impressao_digital(points, contexto)
+            index_by_id = {p.id: i for i, p in enumerate(points)}
+            cached = optimized_route_cache.obter(chave)
+            
+            if cached and sorted(cached['ordem']) == sorted(index_by_id):
+                optimized_order = [index_by_id[pid] for pid in cached['ordem']]
+                cache_status = 'hit'
+                optimized_route_cache.registrar_economia(
+                    cached['tempo_calculo'] - (time.perf_counter() - inicio_calculo)
+                )
+            else:
+                seed = optimized_route_cache.buscar_semelhante(contexto, index_by_id) if len(points) > 8 else None
+                seed_order = None
+                if seed:
+                    seed_order = self._warm_start_order(
+                        points, seed['ordem'],
+                        lambda order: self._calculate_route_score_google(
+                            order, points, distance_matrix, include_business_hours
+                        )
+                    )
+                    optimized_route_cache.registrar_warm_start()
+                optimized_order = self._solve_tsp_with_google_data(
+                    points, distance_matrix, include_business_hours,
+                    progress if progress_callback else None, seed_order
+                )
+                cache_status = 'warm_start' if seed else 'miss'
+            tempo_calculo = time.perf_counter() - inicio_calculo
+            # Cancelado: a ordem é só a melhor parcial do GA e não vai para o cache
+            if progress(90, 'Calculando horários e direções'):
+                return self._cancelled_result([points[i].id for i in optimized_order])
+            if cache_status != 'hit':
+                ordem_ids = [points[i].id for i in optimized_order]
+                optimized_route_cache.gravar(
+                    chave, contexto, ordem_ids,
+                    {'ordem': ordem_ids, 'nivel': nivel, 'cache': cache_status},
+                    tempo_calculo
+                )
             
             # Construir rota otimizada
             optimized_points = [points[i] for i in optimized_order]
@@ -197,7 +270,7 @@ class RouteOptimizer:
             self.logger.info(f"🔍 COMPARAÇÃO DE PONTOS:")
             self.logger.info(f"   optimized_points: {[p.municipality for p in optimized_points]}")
             self.logger.info(f"   route_with_schedule: {[item.get('municipio', item.get('municipality', 'UNKNOWN')) for item in route_with_schedule]}")
-            detailed_directions = self._get_detailed_directions(optimized_points, coords)
+            detailed_directions = self._get_detailed_directions(optimized_points, coords, detail)
             
             # Calcular estatísticas
             self.logger.debug(f"🔍 ANTES DAS STATS: schedule tem {len(route_with_schedule)} itens")
@@ -225,10 +298,11 @@ class RouteOptimizer:
                 'nivel': nivel,
                 'fonte_dados': f'Google Maps API + Places API' if nivel == 3 else 'Google Maps API',
                 'horarios_reais_incluidos': include_business_hours,
+                'cache_rota': cache_status,
                 'timestamp': datetime.now().isoformat()
             }
             
-            self.logger.info(f"✅ Otimização Nível {nivel} concluída com sucesso")
+            self.logger.info(f"✅ Otimização Nível {nivel} concluída com sucesso (cache: {cache_status})")
             return result
             
         except Exception as e:
@@ -239,6 +313,16 @@ class RouteOptimizer:
                 'fallback_to_level1': True
             }
     
+    def _cancelled_result(self, partial_order: List[str] = None) -> Dict[str, Any]:
+        """Resposta de otimização interrompida pelo cancelamento do job"""
+        return {
+            'sucesso': False,
+            'cancelado': True,
+            'erro': 'Otimização cancelada',
+            'ordem_parcial': partial_order,
+            'fallback_to_level1': False
+        }
+    
     def _prepare_coordinates_for_google_maps(self, points: List[RoutePoint]) -> Dict[str, Tuple[float, float]]:
         """Preparar coordenadas para uso com Google Maps, incluindo ponto de partida IBGE"""
         coords = {}
@@ -255,15 +339,16 @@ class RouteOptimizer:
     def _get_google_distance_matrix(self, points: List[RoutePoint], 
                                   coords: Dict[str, Tuple[float, float]], 
                                   target_date: str = None) -> Optional[Dict]:
-        """Obter matriz de distâncias/tempo real do Google Maps"""
+        """Obter matriz de distâncias/tempo real do Google Maps (malha offline como alternativa)"""
         try:
-            if not self.google_maps_client:
-                self.logger.error("❌ Google Maps client não inicializado")
-                return None
-            
             # Preparar origens (incluindo IBGE) e destinos (pontos das visitas)
-            origins = [coords['IBGE_START']] + [coords.get(point.id, (point.lat, point.lng)) for point in points]
-            destinations = [coords.get(point.id, (point.lat, point.lng)) for point in points] + [coords['IBGE_START']]
+            ibge = coords.get('IBGE_START', (self.starting_point['lat'], self.starting_point['lng']))
+            origins = [ibge] + [coords.get(point.id, (point.lat, point.lng)) for point in points]
+            destinations = [coords.get(point.id, (point.lat, point.lng)) for point in points] + [ibge]
+            
+            if not self.google_maps_client:
+                self.logger.warning("⚠️ Google Maps client não inicializado, tentando malha viária offline")
+                return self._get_offline_distance_matrix(origins, destinations, points)
             
             self.logger.info(f"🗺️ Consultando matriz de distâncias: {len(origins)} origens, {len(destinations)} destinos")
             
@@ -271,40 +356,51 @@ class RouteOptimizer:
             departure_time = self._calculate_departure_time(target_date)
             self.logger.info(f"🕐 Horário de partida calculado: {departure_time}")
             
-            # Verificar se há muitos pontos (limite da API: 25x25)
-            if len(origins) > 25 or len(destinations) > 25:
-                self.logger.warning(f"⚠️ Muitos pontos para Distance Matrix API: {len(origins)}x{len(destinations)}")
-                return None
-            
-            # Fazer chamada para Distance Matrix API
-            matrix_result = self.google_maps_client.distance_matrix(
-                origins=origins,
-                destinations=destinations,
-                mode="driving",
-                departure_time=departure_time,
-                traffic_model="best_guess",
-                units="metric"
+            # Matrizes acima do limite da API (25x25, 100 elementos) são
+            # consultadas em blocos paralelos e reaproveitadas do cache
+            matrix_result = distance_matrix_tiler.obter_matriz(
+                origins, destinations, self.google_maps_api_key, departure_time
             )
             
-            self.logger.info(f"📊 Resposta da API: status={matrix_result.get('status', 'UNKNOWN')}")
-            
-            if matrix_result['status'] != 'OK':
-                error_msg = matrix_result.get('error_message', 'Erro desconhecido')
-                self.logger.error(f"❌ Google Maps API erro: {matrix_result['status']} - {error_msg}")
-                return None
+            self.logger.info(
+                f"📊 Matriz obtida: {matrix_result['blocos']} blocos "
+                f"({matrix_result['blocos_cache']} do cache)"
+            )
             
             # Processar resultado
-            processed_matrix = self._process_google_matrix_result(matrix_result, points)
+            processed_matrix = self._process_dense_matrix_result(matrix_result, points)
             self.logger.info("✅ Matriz de distâncias processada com sucesso")
             
             return processed_matrix
             
+        except DistanceMatrixError as e:
+            self.logger.error(f"❌ Google Maps API erro: {str(e)}")
+            return self._get_offline_distance_matrix(origins, destinations, points)
         except Exception as e:
             self.logger.error(f"❌ Erro ao obter matriz do Google Maps: {str(e)}")
             import traceback
             self.logger.error(f"❌ Traceback: {traceback.format_exc()}")
             return None
     
+    def _get_offline_distance_matrix(self, origins: List[Tuple[float, float]],
+                                     destinations: List[Tuple[float, float]],
+                                     points: List[RoutePoint]) -> Optional[Dict]:
+        """Mesma matriz calculada na malha viária local (sem trânsito); None se não houver grafo"""
+        if not roteador_offline.disponivel:
+            return None
+        try:
+            result = roteador_offline.matriz(origins, destinations)
+        except RoteadorOfflineError as e:
+            self.logger.error(f"❌ Erro no roteamento offline: {str(e)}")
+            return None
+        
+        self.logger.info(f"🛣️ Matriz offline {len(origins)}x{len(destinations)} em {result['tempo_ms']} ms")
+        return self._process_dense_matrix_result({
+            'distancias': result['distancias'],
+            'duracoes': result['duracoes'],
+            'duracoes_transito': result['duracoes']
+        }, points)
+    
     def _calculate_departure_time(self, target_date: str = None) -> datetime:
         """Calcular horário de partida para consulta de trânsito"""
         if target_date:
@@ -338,8 +434,8 @@ class RouteOptimizer:
         self.logger.info(f"🕐 Usando horário de partida padrão: {departure_time}")
         return departure_time
     
-    def _process_google_matrix_result(self, matrix_result: Dict, points: List[RoutePoint]) -> Dict:
-        """Processar resultado da Distance Matrix API"""
+    def _process_dense_matrix_result(self, matrix_result: Dict, points: List[RoutePoint]) -> Dict:
+        """Converter a matriz densa (origens = IBGE + pontos, destinos = pontos + IBGE) para o formato por ID"""
         processed = {
             'distances': {},
             'durations': {},
@@ -349,49 +445,32 @@ class RouteOptimizer:
             'ibge_durations': {}
         }
         
-        rows = matrix_result['rows']
+        origin_ids = ['IBGE_START'] + [point.id for point in points]
+        dest_ids = [point.id for point in points] + ['IBGE_START']
         
-        # Lista de IDs incluindo IBGE no início
-        all_ids = ['IBGE_START'] + [point.id for point in points]
+        # Pares sem rota (NaN) recebem valor alto, como no processamento por elemento
+        distances = np.nan_to_num(matrix_result['distancias'], nan=999999).astype(int).tolist()
+        durations = np.nan_to_num(matrix_result['duracoes'], nan=999999).astype(int).tolist()
+        traffic = np.nan_to_num(matrix_result['duracoes_transito'], nan=999999).astype(int).tolist()
         
-        for i, row in enumerate(rows):
-            origin_id = all_ids[i]
-            
-            if origin_id not in processed['distances']:
-                processed['distances'][origin_id] = {}
-                processed['durations'][origin_id] = {}
-                processed['duration_in_traffic'][origin_id] = {}
-            
-            for j, element in enumerate(row['elements']):
-                # Destinos são todos os pontos das visitas + retorno para IBGE
-                dest_ids = [point.id for point in points] + ['IBGE_START']
-                dest_id = dest_ids[j] if j < len(dest_ids) else f'dest_{j}'
-                
-                if element['status'] == 'OK':
-                    processed['distances'][origin_id][dest_id] = element['distance']['value']  # metros
-                    processed['durations'][origin_id][dest_id] = element['duration']['value']  # segundos
-                    
-                    # Tempo com trânsito (se disponível)
-                    if 'duration_in_traffic' in element:
-                        processed['duration_in_traffic'][origin_id][dest_id] = element['duration_in_traffic']['value']
-                    else:
-                        processed['duration_in_traffic'][origin_id][dest_id] = element['duration']['value']
-                        
-                    # Armazenar dados específicos do IBGE para fácil acesso
-                    if origin_id == 'IBGE_START':
-                        processed['ibge_distances'][dest_id] = element['distance']['value']
-                        processed['ibge_durations'][dest_id] = element['duration']['value']
-                else:
-                    # Usar dados padrão se API falhar
-                    processed['distances'][origin_id][dest_id] = 999999  # Distância alta
-                    processed['durations'][origin_id][dest_id] = 999999  # Tempo alto
-                    processed['duration_in_traffic'][origin_id][dest_id] = 999999
+        for i, origin_id in enumerate(origin_ids):
+            processed['distances'][origin_id] = dict(zip(dest_ids, distances[i]))
+            processed['durations'][origin_id] = dict(zip(dest_ids, durations[i]))
+            processed['duration_in_traffic'][origin_id] = dict(zip(dest_ids, traffic[i]))
+        
+        # Armazenar dados específicos do IBGE para fácil acesso
+        for j, dest_id in enumerate(dest_ids):
+            if not np.isnan(matrix_result['distancias'][0, j]):
+                processed['ibge_distances'][dest_id] = distances[0][j]
+                processed['ibge_durations'][dest_id] = durations[0][j]
         
         return processed
     
     def _solve_tsp_with_google_data(self, points: List[RoutePoint], 
                                   distance_matrix: Dict,
-                                  consider_business_hours: bool = False) -> List[int]:
+                                  consider_business_hours: bool = False,
+                                  progress_callback: Optional[Callable] = None,
+                                  seed_order: Optional[List[int]] = None) -> List[int]:
         """Resolver TSP usando dados reais do Google Maps e horários"""
         n = len(points)
         
@@ -402,7 +481,9 @@ class RouteOptimizer:
         if n <= 8:
             return self._brute_force_tsp_google(points, distance_matrix, consider_business_hours)
         else:
-            return self._genetic_algorithm_tsp_google(points, distance_matrix, consider_business_hours)
+            return self._genetic_algorithm_tsp_google(
+                points, distance_matrix, consider_business_hours, progress_callback, seed_order
+            )
     
     def _brute_force_tsp_google(self, points: List[RoutePoint], 
                                distance_matrix: Dict,
@@ -431,15 +512,41 @@ class RouteOptimizer:
     
     def _genetic_algorithm_tsp_google(self, points: List[RoutePoint], 
                                     distance_matrix: Dict,
-                                    consider_business_hours: bool = False) -> List[int]:
-        """Algoritmo genético para TSP com dados do Google Maps e horários"""
+                                    consider_business_hours: bool = False,
+                                    progress_callback: Optional[Callable] = None,
+                                    seed_order: Optional[List[int]] = None) -> List[int]:
+        """
+        Algoritmo genético para TSP com dados do Google Maps e horários
+        
+        seed_order (warm start do cache) entra na população inicial junto com
+        um quarto de variações dela; o restante continua aleatório para manter
+        a diversidade.
+        
+        Rotas com ga_ilhas.MIN_PONTOS ou mais pontos usam o GA em ilhas
+        (vários processos); o laço abaixo fica como alternativa.
+        """
         n = len(points)
+        if ga_ilhas.habilitado(n):
+            try:
+                return self._island_ga_google(
+                    points, distance_matrix, consider_business_hours, progress_callback, seed_order
+                )
+            except Exception as e:
+                self.logger.warning(f"⚠️ GA em ilhas indisponível ({e}); usando GA sequencial")
+        
         population_size = min(50, n * 2)
         generations = 100
         
         # Gerar população inicial
         population = []
-        for _ in range(population_size):
+        if seed_order:
+            population.append(list(seed_order))
+            while len(population) < population_size // 4:
+                route = list(seed_order)
+                i, j = np.random.choice(range(n), 2, replace=False)
+                route[i], route[j] = route[j], route[i]
+                population.append(route)
+        while len(population) < population_size:
             route = list(range(n))
             np.random.shuffle(route)
             population.append(route)
@@ -458,6 +565,21 @@ class RouteOptimizer:
             sorted_indices = sorted(range(len(fitness_scores)), 
                                   key=lambda i: fitness_scores[i], reverse=True)
             
+            if progress_callback:
+                best = population[sorted_indices[0]]
+                stop = progress_callback(
+                    30 + 60 * generation / generations,
+                    'Otimizando ordem das visitas',
+                    {
+                        'order': [points[i].id for i in best],
+                        'score': round(1 / fitness_scores[sorted_indices[0]] - 1, 2),
+                        'generation': generation
+                    }
+                )
+                if stop:
+                    population = [population[i] for i in sorted_indices]
+                    break
+            
             # Manter melhores 50%
             elite_size = population_size // 2
             new_population = [population[i] for i in sorted_indices[:elite_size]]
@@ -488,6 +610,88 @@ class RouteOptimizer:
         
         return best_route
     
+    def _island_ga_google(self, points: List[RoutePoint], 
+                          distance_matrix: Dict,
+                          consider_business_hours: bool = False,
+                          progress_callback: Optional[Callable] = None,
+                          seed_order: Optional[List[int]] = None) -> List[int]:
+        """GA em ilhas com o objetivo de _calculate_route_score_google"""
+        problem = self._island_problem_google(points, distance_matrix, consider_business_hours)
+        
+        def report(fraction, score, order):
+            if progress_callback:
+                return progress_callback(
+                    30 + 60 * fraction,
+                    'Otimizando ordem das visitas',
+                    {'order': [points[i].id for i in order], 'score': round(score, 2)}
+                )
+            return False
+        
+        order, score, stats = ga_ilhas.resolver(problem, ordem_inicial=seed_order, progresso=report)
+        self.logger.info(f"🏝️ GA em ilhas: {stats['ilhas']} ilhas, gerações {stats['geracoes']}, "
+                         f"parada por {stats['motivo_parada']} em {stats['tempo_s']}s, score {score:.2f}")
+        return order
+    
+    def _island_problem_google(self, points: List[RoutePoint], 
+                               distance_matrix: Dict,
+                               consider_business_hours: bool = False) -> 'ga_ilhas.ProblemaRota':
+        """
+        Converte a matriz por ID e os horários de atendimento para os arrays
+        do GA em ilhas, com as mesmas regras de _calculate_route_score_google
+        e _calculate_business_hours_penalty
+        """
+        n = len(points)
+        travel = np.full((n, n), 999.0)  # Penálti alto sem dado, como no score
+        distance = np.full((n, n), 999.0)
+        traffic = distance_matrix.get('duration_in_traffic', {})
+        durations = distance_matrix.get('durations', {})
+        for i, origin in enumerate(points):
+            for j, destination in enumerate(points):
+                if origin.id in traffic and destination.id in traffic[origin.id]:
+                    travel[i, j] = traffic[origin.id][destination.id] / 60
+                elif origin.id in durations and destination.id in durations[origin.id]:
+                    travel[i, j] = durations[origin.id][destination.id] / 60
+                else:
+                    continue
+                distance[i, j] = distance_matrix['distances'][origin.id][destination.id] / 1000
+        
+        mode = np.zeros(n)
+        opening = np.zeros(n)
+        closing = np.zeros(n)
+        for i, point in enumerate(points):
+            business_hours = getattr(point, 'business_hours', None)
+            if not business_hours:
+                continue
+            try:
+                if 'today_open' in business_hours and 'today_close' in business_hours:
+                    if not business_hours.get('is_open_target_day', True):
+                        mode[i] = ga_ilhas.FECHADO
+                        continue
+                    open_time, close_time = business_hours['today_open'], business_hours['today_close']
+                elif 'monday_friday' in business_hours:
+                    open_time = business_hours['monday_friday']['open']
+                    close_time = business_hours['monday_friday']['close']
+                else:
+                    continue
+                opening[i] = self._time_to_minutes(open_time)
+                closing[i] = self._time_to_minutes(close_time)
+                mode[i] = ga_ilhas.JANELA
+            except (KeyError, TypeError, AttributeError):
+                continue
+        
+        return ga_ilhas.ProblemaRota(
+            objetivo=ga_ilhas.OBJETIVO_GOOGLE,
+            distancia=distance,
+            prioridade=[p.priority for p in points],
+            duracao=[p.estimated_duration for p in points],
+            pesos=self.weights,
+            viagem_min=travel,
+            modo_horario=mode,
+            abertura=opening,
+            fechamento=closing,
+            considerar_horarios=consider_business_hours
+        )
+    
     def _calculate_route_score_google(self, route: List[int], 
                                     points: List[RoutePoint], 
                                     distance_matrix: Dict,
@@ -711,7 +915,7 @@ class RouteOptimizer:
         total_travel_time = 0
         total_visit_time = 0
         
-        # VERSÃO CORRIGIDA: Usar apenas estrutura de dicionário (consistente com _process_google_matrix_result)
+        # VERSÃO CORRIGIDA: Usar apenas estrutura de dicionário (consistente com _process_dense_matrix_result)
         if distance_matrix and 'distances' in distance_matrix:
             try:
                 matrix_distances = distance_matrix['distances']
@@ -916,15 +1120,18 @@ class RouteOptimizer:
         """Enriquecer pontos com horários reais usando Google Places API"""
         enriched_points = []
         
-        for point in points:
+        # Busca + detalhes de todos os pontos em paralelo (consultas cacheadas e coalescidas)
+        consultas = places_cache.prefetch(
+            [lambda point=point: self._lookup_place_with_details(point) for point in points]
+        )
+        
+        for point, consulta in zip(points, consultas):
             try:
-                # Buscar informações do local
-                place_info = self._search_place_by_name_and_location(point)
+                if isinstance(consulta, Exception):
+                    raise consulta
+                place_info, place_details = consulta
                 
                 if place_info and 'place_id' in place_info:
-                    # Obter detalhes incluindo horários
-                    place_details = self._get_place_details(place_info['place_id'])
-                    
                     if place_details and 'opening_hours' in place_details:
                         # Adicionar horários ao ponto
                         point.business_hours = self._parse_opening_hours(
@@ -952,6 +1159,13 @@ class RouteOptimizer:
         
         return enriched_points
     
+    def _lookup_place_with_details(self, point: RoutePoint) -> Tuple[Optional[Dict], Optional[Dict]]:
+        """Local encontrado para o ponto e seus detalhes (None quando não encontrado)"""
+        place_info = self._search_place_by_name_and_location(point)
+        if place_info and 'place_id' in place_info:
+            return place_info, self._get_place_details(place_info['place_id'])
+        return place_info, None
+    
     def _search_place_by_name_and_location(self, point: RoutePoint) -> Optional[Dict]:
         """Buscar local no Google Places por nome e localização"""
         try:
@@ -974,19 +1188,28 @@ class RouteOptimizer:
             
             query = ' '.join(query_terms)
             
-            # Buscar usando Places API Text Search
-            places_result = self.google_maps_client.places(
-                query=query,
-                location=(point.lat, point.lng),
-                radius=5000,  # 5km de raio
-                language='pt-BR',
-                region='br'
-            )
-            
-            if places_result['status'] == 'OK' and places_result['results']:
-                # Pegar o primeiro resultado mais relevante
-                best_match = places_result['results'][0]
+            def buscar():
+                # Buscar usando Places API Text Search
+                places_result = self.google_maps_client.places(
+                    query=query,
+                    location=(point.lat, point.lng),
+                    radius=5000,  # 5km de raio
+                    language='pt-BR',
+                    region='br'
+                )
                 
+                if places_result['status'] == 'OK' and places_result['results']:
+                    # Pegar o primeiro resultado mais relevante
+                    return places_result['results'][0]
+                if places_result['status'] != 'ZERO_RESULTS':
+                    raise RuntimeError(f"Places API status {places_result['status']}")
+                return None
+            
+            # A busca depende do viés de localização: grade de ~1 km no tipo da chave
+            tipo = f"{point.visit_type}@{point.lat:.2f},{point.lng:.2f}"
+            best_match = places_cache.buscar(query, tipo, buscar)
+            
+            if best_match:
                 # Verificar distância para garantir que é o local correto
                 place_location = best_match['geometry']['location']
                 distance = self._calculate_distance(
@@ -1012,20 +1235,21 @@ class RouteOptimizer:
     
     def _get_place_details(self, place_id: str) -> Optional[Dict]:
         """Obter detalhes completos do local incluindo horários"""
-        try:
+        def buscar():
             details_result = self.google_maps_client.place(
                 place_id=place_id,
-                fields=[
-                    'name', 'formatted_address', 'opening_hours',
-                    'rating', 'types', 'website', 'formatted_phone_number'
-                ],
+                fields=CAMPOS_DETALHES,
                 language='pt-BR'
             )
             
             if details_result['status'] == 'OK':
                 return details_result['result']
-            
+            if details_result['status'] not in ('NOT_FOUND', 'ZERO_RESULTS'):
+                raise RuntimeError(f"Places API status {details_result['status']}")
             return None
+        
+        try:
+            return places_cache.detalhes(place_id, 'pt-BR', buscar)
             
         except Exception as e:
             self.logger.error(f"❌ Erro ao obter detalhes do local: {str(e)}")
@@ -1269,16 +1493,49 @@ class RouteOptimizer:
             # Ajustar pesos baseado no tipo de otimização
             self._adjust_weights(optimization_type)
             
+            # Rota já otimizada para o mesmo conjunto: devolver sem recalcular.
+            # A rota sempre começa no primeiro ponto, que entra no contexto.
+            inicio_calculo = time.perf_counter()
+            contexto = optimized_route_cache.chave_contexto(
+                'daily', optimization_type, self.weights,
+                inicio=points[0].id,
+                partida=[round(c, 5) for c in start_location] if start_location else None
+            )
+            chave = optimized_route_cache.impressao_digital(points, contexto)
+            cached = optimized_route_cache.obter(chave)
+            if cached:
+                cached_route = self._route_from_cache(cached['resultado'], points)
+                if cached_route:
+                    optimized_route_cache.registrar_economia(
+                        cached['tempo_calculo'] - (time.perf_counter() - inicio_calculo)
+                    )
+                    self.logger.info(f"♻️ Rota diária servida do cache ({len(points)} pontos)")
+                    return cached_route
+            
             # Calcular matriz de distâncias
             distance_matrix = self._calculate_distance_matrix(points, start_location)
             
             # Executar algoritmo de otimização
+            seed = None
             if len(points) <= 8:
                 # Para rotas pequenas, usar força bruta otimizada
                 optimized_order = self._optimize_small_route(points, distance_matrix)
+                algorithm = 'tsp_optimization'
             else:
-                # Para rotas maiores, usar algoritmo genético
-                optimized_order = self._optimize_large_route(points, distance_matrix)
+                # Para rotas maiores, partir da ordem de um conjunto quase igual
+                # já otimizado (inserção mais barata + 2-opt) ou do vizinho mais próximo
+                seed = optimized_route_cache.buscar_semelhante(contexto, [p.id for p in points])
+                if seed:
+                    optimized_order = self._warm_start_order(
+                        points, seed['ordem'],
+                        lambda order: self._calculate_route_score(order, points, distance_matrix),
+                        fixed_start=True
+                    )
+                    optimized_route_cache.registrar_warm_start()
+                    algorithm = 'warm_start_2opt'
+                else:
+                    optimized_order = self._optimize_large_route(points, distance_matrix)
+                    algorithm = 'genetic_algorithm'
             
             # Construir rota otimizada
             optimized_points = [points[i] for i in optimized_order]
@@ -1302,13 +1559,19 @@ class RouteOptimizer:
                 route_type=optimization_type,
                 created_at=datetime.now(),
                 metadata={
-                    'algorithm': 'tsp_optimization' if len(points) <= 8 else 'genetic_algorithm',
+                    'algorithm': algorithm,
                     'points_count': len(points),
                     'optimization_weights': self.weights.copy(),
-                    'constraints_applied': self._get_applied_constraints(points)
+                    'constraints_applied': self._get_applied_constraints(points),
+                    'cache': 'warm_start' if seed else 'miss'
                 }
             )
             
+            optimized_route_cache.gravar(
+                chave, contexto, [p.id for p in optimized_points],
+                self._serialize_route(result), time.perf_counter() - inicio_calculo
+            )
+            
             self.logger.info(f"✅ Rota otimizada: {len(optimized_points)} pontos, "
                            f"{result.total_distance_km}km, {result.total_duration_minutes}min")
             
@@ -1318,16 +1581,95 @@ class RouteOptimizer:
             self.logger.error(f"❌ Erro na otimização de rota: {str(e)}")
             return self._create_fallback_route(points)
     
+    def _serialize_route(self, route: OptimizedRoute) -> Dict[str, Any]:
+        """OptimizedRoute em dict JSON para o cache de rotas"""
+        from dataclasses import asdict
+        data = asdict(route)
+        data['created_at'] = route.created_at.isoformat()
+        return data
+    
+    def _route_from_cache(self, data: Dict[str, Any], points: List[RoutePoint]) -> Optional[OptimizedRoute]:
+        """
+        Reconstrói a OptimizedRoute do cache usando os RoutePoint do chamador
+        (mesmos ids e coordenadas, garantidos pela impressão digital).
+        None se o conjunto não bater.
+        """
+        by_id = {p.id: p for p in points}
+        cached_ids = [p['id'] for p in data.get('points', [])]
+        if sorted(cached_ids) != sorted(by_id):
+            return None
+        return OptimizedRoute(
+            points=[by_id[pid] for pid in cached_ids],
+            total_distance_km=data['total_distance_km'],
+            total_duration_minutes=data['total_duration_minutes'],
+            total_driving_time_minutes=data['total_driving_time_minutes'],
+            optimization_score=data['optimization_score'],
+            route_type=data['route_type'],
+            created_at=datetime.fromisoformat(data['created_at']),
+            metadata={**data.get('metadata', {}), 'cache': 'hit'}
+        )
+    
+    def _warm_start_order(self, points: List[RoutePoint], cached_ids: List[str],
+                          score: Callable[[List[int]], float],
+                          fixed_start: bool = False) -> List[int]:
+        """
+        Ordem inicial a partir de uma rota em cache de um conjunto parecido:
+        mantém a sequência dos pontos que continuam, insere os novos na
+        posição de menor score e refina com 2-opt.
+        """
+        index_by_id = {p.id: i for i, p in enumerate(points)}
+        order = [index_by_id[pid] for pid in cached_ids if pid in index_by_id]
+        if fixed_start:
+            order = [0] + [i for i in order if i != 0]
+        first = 1 if fixed_start else 0
+        
+        kept = set(order)
+        for new_idx in (i for i in range(len(points)) if i not in kept):
+            best_pos = min(
+                range(first, len(order) + 1),
+                key=lambda pos: score(order[:pos] + [new_idx] + order[pos:])
+            )
+            order.insert(best_pos, new_idx)
+        
+        return self._two_opt(order, score, first)
+    
+    def _two_opt(self, order: List[int], score: Callable[[List[int]], float],
+                 first: int = 0, max_passes: int = 5) -> List[int]:
+        """Melhoria 2-opt (inversão de trechos) até não haver ganho"""
+        best_score = score(order)
+        for _ in range(max_passes):
+            improved = False
+            for i in range(first, len(order) - 1):
+                for j in range(i + 1, len(order)):
+                    candidate = order[:i] + order[i:j + 1][::-1] + order[j + 1:]
+                    candidate_score = score(candidate)
+                    if candidate_score < best_score - 1e-9:
+                        order, best_score, improved = candidate, candidate_score, True
+            if not improved:
+                break
+        return order
+    
     def optimize_weekly_plan(self, points: List[RoutePoint], 
                            start_date: datetime,
-                           working_days: int = 5) -> List[OptimizedRoute]:
+                           working_days: int = 5,
+                           time_budget_seconds: float = 5.0,
+                           progress_callback: Optional[Callable] = None) -> List[OptimizedRoute]:
         """
         Otimiza um plano semanal dividindo pontos em múltiplos dias
         
+        Resolve um VRP com janelas de tempo: cada dia sai e volta à base do
+        IBGE, respeita horários de atendimento e a jornada, e P1 vão para os
+        primeiros dias. Pontos que não cabem na semana ficam em
+        metadata['unassigned_point_ids'] de cada rota.
+        
         Args:
             points: Lista de pontos para a semana
             start_date: Data de início da semana
             working_days: Número de dias úteis
+            time_budget_seconds: Tempo máximo de busca do solver
+            progress_callback: recebe (percentual, mensagem, parcial) a cada
+                iteração do solver; retornar True encerra a busca com a melhor
+                solução encontrada
             
         Returns:
             Lista de rotas otimizadas por dia
@@ -1335,39 +1677,106 @@ class RouteOptimizer:
         try:
             self.logger.info(f"📅 Otimizando plano semanal: {len(points)} pontos em {working_days} dias")
             
-            if not points:
+            if not points or working_days <= 0:
                 return []
             
-            # Agrupar pontos por prioridade e proximidade
-            daily_groups = self._distribute_points_across_days(points, working_days)
+            day_start = 8 * 60
+            day_end = day_start + self.max_daily_hours * 60 + self.lunch_break_duration
+            
+            coordinates = [(self.starting_point['lat'], self.starting_point['lng'])] + [(p.lat, p.lng) for p in points]
+            distances_m, travel_minutes, travel_source = self._travel_matrices(coordinates)
+            
+            window_start, window_end = [], []
+            for point in points:
+                opens = self._parse_time_window(point.time_window_start, day_start)
+                closes = self._parse_time_window(point.time_window_end, day_end)
+                window_start.append(opens)
+                # Atendimento precisa terminar antes do fechamento
+                window_end.append(closes - point.estimated_duration)
+            
+            solver = SolverVRPTW(
+                travel_minutes,
+                servico=[p.estimated_duration for p in points],
+                janela_inicio=window_start,
+                janela_fim=window_end,
+                prioritarios=[p.priority == 1 for p in points],
+                dias=working_days,
+                inicio_dia=day_start,
+                fim_dia=day_end,
+                coordenadas=coordinates,
+                semente=0
+            )
             
-            weekly_routes = []
-            current_date = start_date
+            solver_progress = None
+            if progress_callback:
+                progress_callback(5, 'Montando rotas iniciais')
+                
+                def solver_progress(fraction, cost, routes):
+                    return progress_callback(10 + 85 * fraction, 'Otimizando rotas da semana', {
+                        'cost': round(cost, 1),
+                        'days': [[points[k - 1].id for k in route] for route in routes]
+                    })
+            
+            solution = solver.resolver(time_budget_seconds, solver_progress)
             
-            for day_idx, day_points in enumerate(daily_groups):
-                if not day_points:
+            unassigned_ids = [points[k - 1].id for k in solution.nao_alocados]
+            if unassigned_ids:
+                self.logger.warning(f"⚠️ {len(unassigned_ids)} pontos não couberam nos {working_days} dias")
+            
+            weekly_routes = []
+            for day_idx, (order, schedule, return_time) in enumerate(
+                    zip(solution.rotas, solution.horarios, solution.retornos)):
+                if not order:
                     continue
                 
-                # Otimizar rota do dia
-                daily_route = self.optimize_daily_route(
-                    day_points, 
-                    optimization_type="balanced"
-                )
-                
-                # Adicionar metadados do dia
-                daily_route.metadata.update({
-                    'day_of_week': day_idx + 1,
-                    'planned_date': current_date.isoformat(),
-                    'is_part_of_weekly_plan': True
-                })
+                day_points = [points[k - 1] for k in order]
+                path = [0] + order + [0]
+                total_distance = float(sum(distances_m[a][b] for a, b in zip(path, path[1:])))
+                driving_time = int(sum(travel_minutes[a][b] for a, b in zip(path, path[1:])))
+                total_time = int(return_time - day_start)
                 
-                weekly_routes.append(daily_route)
-                current_date += timedelta(days=1)
-            
-            # Aplicar otimizações entre dias
-            weekly_routes = self._optimize_inter_day_transitions(weekly_routes)
+                weekly_routes.append(OptimizedRoute(
+                    points=day_points,
+                    total_distance_km=round(total_distance / 1000, 2),
+                    total_duration_minutes=total_time,
+                    total_driving_time_minutes=driving_time,
+                    optimization_score=self._calculate_optimization_score(
+                        day_points, total_distance, total_time, driving_time
+                    ),
+                    route_type="balanced",
+                    created_at=datetime.now(),
+                    metadata={
+                        'algorithm': 'vrptw_sweep_local_search',
+                        'points_count': len(day_points),
+                        'constraints_applied': self._get_applied_constraints(day_points),
+                        'includes_base_legs': True,
+                        'travel_time_source': travel_source,
+                        'schedule': [
+                            {
+                                'point_id': point.id,
+                                'arrival': self._minutes_to_time(int(round(arrival))),
+                                'start': self._minutes_to_time(int(round(start))),
+                                'departure': self._minutes_to_time(int(round(departure)))
+                            }
+                            for point, (arrival, start, departure) in zip(day_points, schedule)
+                        ],
+                        'return_to_base': self._minutes_to_time(int(round(return_time))),
+                        'day_of_week': day_idx + 1,
+                        'planned_date': (start_date + timedelta(days=day_idx)).isoformat(),
+                        'is_part_of_weekly_plan': True,
+                        'unassigned_point_ids': unassigned_ids,
+                        'solver': {
+                            'cost': round(solution.custo, 1),
+                            'iterations': solution.iteracoes,
+                            'runtime_seconds': round(solution.tempo_execucao, 2)
+                        }
+                    }
+                ))
             
-            self.logger.info(f"✅ Plano semanal otimizado: {len(weekly_routes)} dias")
+            self.logger.info(
+                f"✅ Plano semanal otimizado: {len(weekly_routes)} dias, "
+                f"{round(solution.tempo_viagem)} min de deslocamento, {solution.iteracoes} iterações"
+            )
             
             return weekly_routes
             
@@ -1375,6 +1784,51 @@ class RouteOptimizer:
             self.logger.error(f"❌ Erro na otimização semanal: {str(e)}")
             return []
     
+    def _travel_matrices(self, coordinates: List[Tuple[float, float]]) -> Tuple[np.ndarray, np.ndarray, str]:
+        """
+        Distâncias (metros) e tempos de deslocamento (minutos, com buffer).
+        Usa a malha viária offline quando o grafo existe; pares sem rota e a
+        ausência do grafo caem na estimativa haversine (~30 km/h).
+        """
+        haversine_m = self._haversine_matrix_meters(coordinates)
+        # ~30 km/h em área urbana (2 min/km) com buffer para imprevistos
+        haversine_minutes = haversine_m / 1000 * 2 * self.travel_buffer_factor
+        
+        if roteador_offline.disponivel:
+            try:
+                result = roteador_offline.matriz(coordinates, coordinates)
+                road_minutes = result['duracoes'] / 60 * self.travel_buffer_factor
+                missing = np.isnan(road_minutes)
+                distances_m = np.where(missing, haversine_m, result['distancias'])
+                travel_minutes = np.where(missing, haversine_minutes, road_minutes)
+                self.logger.info(
+                    f"🛣️ Tempos pela malha viária offline em {result['tempo_ms']} ms "
+                    f"({int(missing.sum())} pares estimados por haversine)"
+                )
+                return distances_m, travel_minutes, 'offline_road_network'
+            except RoteadorOfflineError as e:
+                self.logger.warning(f"⚠️ Roteamento offline indisponível: {str(e)}")
+        
+        return haversine_m, haversine_minutes, 'haversine'
+    
+    def _haversine_matrix_meters(self, coordinates: List[Tuple[float, float]]) -> np.ndarray:
+        """Matriz de distâncias haversine (metros) calculada de uma vez com NumPy"""
+        coords = np.radians(np.asarray(coordinates, dtype=float))
+        lat, lng = coords[:, 0][:, None], coords[:, 1][:, None]
+        a = (np.sin((lat.T - lat) / 2) ** 2 +
+             np.cos(lat) * np.cos(lat.T) * np.sin((lng.T - lng) / 2) ** 2)
+        return 6371000 * 2 * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+    
+    def _parse_time_window(self, time_str: Optional[str], default: int) -> int:
+        """Horário 'HH:MM' em minutos; padrão se ausente ou inválido"""
+        if not time_str:
+            return default
+        try:
+            hour, minute = map(int, time_str.split(':')[:2])
+            return hour * 60 + minute
+        except (ValueError, AttributeError):
+            return default
+    
     def suggest_optimal_start_time(self, route: OptimizedRoute, 
                                  target_end_time: str = "17:00") -> Dict[str, str]:
         """
@@ -1513,6 +1967,9 @@ class RouteOptimizer:
         """
         Carrega entidades do banco como pontos de rota
         
+        As entidades vêm do repositório colunar (reconstruído só quando as
+        tabelas mudam); apenas as linhas do filtro viram RoutePoint.
+        
         Args:
             municipality: Filtrar por município específico
             
@@ -1520,59 +1977,9 @@ class RouteOptimizer:
             Lista de pontos de rota
         """
         try:
-            points = []
-            
-            # Carregar entidades identificadas
-            query_identificadas = EntidadeIdentificada.query.filter_by(geocodificacao_status='sucesso')
-            if municipality:
-                query_identificadas = query_identificadas.filter_by(municipio=municipality)
-            
-            for entity in query_identificadas.all():
-                if entity.latitude and entity.longitude:
-                    requirements = []
-                    if entity.mrs_obrigatorio:
-                        requirements.append('MRS')
-                    if entity.map_obrigatorio:
-                        requirements.append('MAP')
-                    
-                    point = RoutePoint(
-                        id=f"identificada_{entity.id}",
-                        name=entity.nome_entidade,
-                        lat=entity.latitude,
-                        lng=entity.longitude,
-                        municipality=entity.municipio,
-                        priority=entity.prioridade or 2,
-                        estimated_duration=90 if len(requirements) > 1 else 60,
-                        visit_type="standard",
-                        requirements=requirements
-                    )
-                    points.append(point)
-            
-            # Carregar entidades prioritárias
-            query_prioritarias = EntidadePrioritariaUF.query.filter_by(geocodificacao_status='sucesso')
-            if municipality:
-                query_prioritarias = query_prioritarias.filter_by(municipio=municipality)
-            
-            for entity in query_prioritarias.all():
-                if entity.latitude and entity.longitude:
-                    requirements = []
-                    if entity.mrs_obrigatorio:
-                        requirements.append('MRS')
-                    if entity.map_obrigatorio:
-                        requirements.append('MAP')
-                    
-                    point = RoutePoint(
-                        id=f"prioritaria_{entity.id}",
-                        name=entity.nome_entidade,
-                        lat=entity.latitude,
-                        lng=entity.longitude,
-                        municipality=entity.municipio,
-                        priority=1,  # Sempre P1
-                        estimated_duration=120,  # Mais tempo para P1
-                        visit_type="priority",
-                        requirements=requirements
-                    )
-                    points.append(point)
+            entities = repositorio_pontos_rota.entidades()
+            indices = np.flatnonzero(entities.mascara(municipio=municipality))
+            points = entities.materializar(indices, self._route_point_from_row)
             
             self.logger.info(f"📍 Carregadas {len(points)} entidades como pontos de rota")
             return points
@@ -1581,6 +1988,21 @@ class RouteOptimizer:
             self.logger.error(f"❌ Erro ao carregar entidades: {str(e)}")
             return []
     
+    @staticmethod
+    def _route_point_from_row(row: Dict[str, Any]) -> RoutePoint:
+        """RoutePoint a partir de uma linha do repositório de pontos"""
+        return RoutePoint(
+            id=row['id'],
+            name=row['nome'],
+            lat=row['lat'],
+            lng=row['lng'],
+            municipality=row['municipio'],
+            priority=row['prioridade'],
+            estimated_duration=row['duracao'],
+            visit_type=row['tipo_visita'],
+            requirements=row['requisitos']
+        )
+    
     def optimize_with_google_maps(self, points: List[RoutePoint], 
                                  target_date: str = None) -> OptimizedRoute:
         """
@@ -2067,9 +2489,17 @@ class RouteOptimizer:
             return 0.0, 0
     
     def _get_detailed_directions(self, points: List[RoutePoint], 
-                               coords: Dict[str, Tuple[float, float]]) -> List[Dict]:
-        """Obter direções detalhadas do Google Maps incluindo viagem inicial e retorno"""
+                               coords: Dict[str, Tuple[float, float]],
+                               detail: str = 'full') -> List[Dict]:
+        """
+        Obter direções detalhadas do Google Maps incluindo viagem inicial e retorno
+        
+        Cada trecho leva a polyline simplificada para o nível de detalhe
+        ('summary': visão do dia; 'full': nível de rua) e só as instruções
+        dos passos.
+        """
         try:
+            detail = normalizar_detalhe(detail)
             if not self.google_maps_client or len(points) < 1:
                 return []
             
@@ -2096,7 +2526,8 @@ class RouteOptimizer:
                         'to': points[0].municipality,
                         'distance': leg['distance']['text'],
                         'duration': leg['duration']['text'],
-                        'steps': [step['html_instructions'] for step in leg['steps'][:3]],
+                        'steps': compactar_passos(leg['steps'], detail, limite=3),
+                        'polyline': geometria_rotas.simplificar(route['overview_polyline']['points'], detail)['polyline'],
                         'trip_type': 'initial'
                     })
             
@@ -2121,7 +2552,8 @@ class RouteOptimizer:
                         'to': points[i + 1].municipality,
                         'distance': leg['distance']['text'],
                         'duration': leg['duration']['text'],
-                        'steps': [step['html_instructions'] for step in leg['steps'][:3]],
+                        'steps': compactar_passos(leg['steps'], detail, limite=3),
+                        'polyline': geometria_rotas.simplificar(route['overview_polyline']['points'], detail)['polyline'],
                         'trip_type': 'between_points'
                     })
             
@@ -2145,7 +2577,8 @@ class RouteOptimizer:
                         'to': self.starting_point['name'],
                         'distance': leg['distance']['text'],
                         'duration': leg['duration']['text'],
-                        'steps': [step['html_instructions'] for step in leg['steps'][:3]],
+                        'steps': compactar_passos(leg['steps'], detail, limite=3),
+                        'polyline': geometria_rotas.simplificar(route['overview_polyline']['points'], detail)['polyline'],
                         'trip_type': 'return'
                     })
             
@@ -2316,6 +2749,25 @@ class RouteOptimizer:
                 visited[next_point] = True
                 current = next_point
         
+        # Rotas grandes: refinar o vizinho mais próximo com o GA em ilhas
+        if ga_ilhas.habilitado(n):
+            try:
+                problem = ga_ilhas.ProblemaRota(
+                    objetivo=ga_ilhas.OBJETIVO_DIARIA,
+                    distancia=distance_matrix,
+                    prioridade=[p.priority for p in points],
+                    duracao=[p.estimated_duration for p in points],
+                    pesos=self.weights,
+                    inicio_fixo=True
+                )
+                island_order, island_score, stats = ga_ilhas.resolver(problem, ordem_inicial=order)
+                if island_score < self._calculate_route_score(order, points, distance_matrix):
+                    order = island_order
+                self.logger.info(f"🏝️ GA em ilhas: {stats['ilhas']} ilhas, parada por "
+                                 f"{stats['motivo_parada']} em {stats['tempo_s']}s")
+            except Exception as e:
+                self.logger.warning(f"⚠️ GA em ilhas indisponível ({e}); mantendo vizinho mais próximo")
+        
         return order
     
     def _calculate_route_score(self, order: List[int], points: List[RoutePoint], 
@@ -2411,98 +2863,6 @@ class RouteOptimizer:
         except Exception:
             return 50.0  # Score neutro em caso de erro
     
-    def _distribute_points_across_days(self, points: List[RoutePoint], 
-                                     working_days: int) -> List[List[RoutePoint]]:
-        """Distribui pontos de forma inteligente entre os dias"""
-        if not points:
-            return []
-        
-        # Separar por prioridade
-        p1_points = [p for p in points if p.priority == 1]
-        other_points = [p for p in points if p.priority != 1]
-        
-        # Distribuir P1 primeiro (uma por dia se possível)
-        daily_groups = [[] for _ in range(working_days)]
-        
-        for i, p1_point in enumerate(p1_points):
-            day_idx = i % working_days
-            daily_groups[day_idx].append(p1_point)
-        
-        # Distribuir outros pontos por proximidade geográfica
-        remaining_points = other_points.copy()
-        
-        for day_idx in range(working_days):
-            target_points_per_day = (len(points) // working_days) + (1 if day_idx < len(points) % working_days else 0)
-            current_day_points = len(daily_groups[day_idx])
-            
-            while current_day_points < target_points_per_day and remaining_points:
-                if daily_groups[day_idx]:
-                    # Encontrar ponto mais próximo aos já alocados no dia
-                    last_point = daily_groups[day_idx][-1]
-                    closest_point = min(remaining_points, 
-                                      key=lambda p: self._calculate_haversine_distance(
-                                          last_point.lat, last_point.lng, p.lat, p.lng))
-                else:
-                    # Se não há pontos no dia, pegar qualquer um
-                    closest_point = remaining_points[0]
-                
-                daily_groups[day_idx].append(closest_point)
-                remaining_points.remove(closest_point)
-                current_day_points += 1
-        
-        # Adicionar pontos restantes
-        for point in remaining_points:
-            # Adicionar ao dia com menos pontos
-            min_day = min(range(working_days), key=lambda i: len(daily_groups[i]))
-            daily_groups[min_day].append(point)
-        
-        return daily_groups
-    
-    def _optimize_inter_day_transitions(self, weekly_routes: List[OptimizedRoute]) -> List[OptimizedRoute]:
-        """Otimiza transições entre dias consecutivos"""
-        if len(weekly_routes) <= 1:
-            return weekly_routes
-        
-        optimized_routes = []
-        
-        for i, route in enumerate(weekly_routes):
-            optimized_route = route
-            
-            # Para dias após o primeiro, considerar posição final do dia anterior
-            if i > 0:
-                prev_route = optimized_routes[i - 1]
-                if prev_route.points:
-                    last_point_prev_day = prev_route.points[-1]
-                    
-                    # Reorganizar início do dia atual para começar próximo ao fim do anterior
-                    current_points = route.points.copy()
-                    if current_points:
-                        # Encontrar melhor ponto de início
-                        best_start_idx = 0
-                        min_distance = float('inf')
-                        
-                        for j, point in enumerate(current_points):
-                            distance = self._calculate_haversine_distance(
-                                last_point_prev_day.lat, last_point_prev_day.lng,
-                                point.lat, point.lng
-                            )
-                            if distance < min_distance:
-                                min_distance = distance
-                                best_start_idx = j
-                        
-                        # Reordenar se necessário
-                        if best_start_idx != 0:
-                            reordered_points = (current_points[best_start_idx:] + 
-                                              current_points[:best_start_idx])
-                            
-                            # Recriar rota com nova ordem
-                            optimized_route = self.optimize_daily_route(reordered_points)
-                            optimized_route.metadata.update(route.metadata)
-            
-            optimized_routes.append(optimized_route)
-        
-        return optimized_routes
-    
     def _calculate_point_schedule(self, route: OptimizedRoute, 
                                 start_hour: int, start_min: int) -> List[Dict[str, str]]:
         """Calcula horário estimado para cada ponto da rota"""
@@ -2691,4 +3051,77 @@ class RouteOptimizer:
             potential['estimated_savings']['time_minutes'] = int(route.total_driving_time_minutes * 0.2)
             potential['estimated_savings']['distance_km'] = round(route.total_distance_km * 0.15, 1)
         
-        return potential
\ No newline at end of file
+        return potential
+
+
+# Coordenadas de referência dos municípios usadas por /api/otimizar-rotas
+MUNICIPALITY_COORDINATES = {
+    'Balneário Camboriú': (-26.9906, -48.6349),
+    'Balneário Piçarras': (-26.7574, -48.6717),
+    'Bombinhas': (-27.1433, -48.4884),
+    'Camboriú': (-27.0248, -48.6583),
+    'Itajaí': (-26.9076, -48.6619),
+    'Itapema': (-27.0890, -48.6114),
+    'Luiz Alves': (-26.7169, -48.9357),
+    'Navegantes': (-26.8968, -48.6565),
+    'Penha': (-26.7711, -48.6506),
+    'Porto Belo': (-27.1588, -48.5552),
+    'Ilhota': (-26.8984, -48.8269)
+}
+
+
+def optimize_visits_payload(data: Dict, progress_callback: Optional[Callable] = None) -> Tuple[Dict, int]:
+    """
+    Otimização Nível 2/3 a partir do corpo de /api/otimizar-rotas (lista de
+    visitas); usada pela rota síncrona e pelos jobs. Retorna (payload, status HTTP).
+    """
+    if not data or 'visitas' not in data:
+        return {'error': 'Dados de visitas são obrigatórios', 'sucesso': False}, 400
+    
+    visitas = data['visitas']
+    optimizer = RouteOptimizer()
+    optimizer.logger.info(
+        f"🔧 Otimizando {len(visitas)} visitas. Google Maps disponível: {optimizer.is_google_maps_available()}"
+    )
+    
+    # Converter visitas para RoutePoint
+    pontos_rota = []
+    for visita in visitas:
+        municipio = visita.get('municipio', '')
+        lat, lng = MUNICIPALITY_COORDINATES.get(municipio, (-26.9, -48.6))  # Fallback para centro da região
+        
+        ponto = RoutePoint(
+            id=str(visita.get('id', f"ponto_{len(pontos_rota)}")),
+            name=f"{municipio} - {visita.get('local', 'Entidade')}",
+            lat=lat,
+            lng=lng,
+            municipality=municipio,
+            priority={'p1': 1, 'p2': 2, 'p3': 3}.get(visita.get('prioridade', 'p3'), 3),
+            estimated_duration=visita.get('duracao_estimada', 90),
+            visit_type=visita.get('tipo_informante', 'standard'),
+            time_window_start=visita.get('hora_inicio'),
+            time_window_end=visita.get('hora_fim')
+        )
+        
+        # Adicionar informações adicionais para busca no Google Places
+        if 'local' in visita:
+            ponto.entity_name = visita['local']
+        if 'tipo_informante' in visita:
+            ponto.entity_type = visita['tipo_informante']
+        
+        pontos_rota.append(ponto)
+    
+    resultado = optimizer.optimize_route_with_google_maps(
+        pontos_rota,
+        target_date=data.get('data_jornada'),
+        start_time=data.get('horario_inicio', '08:00'),
+        end_time=data.get('horario_fim', '18:00'),
+        include_business_hours=data.get('incluir_horarios_reais', True),  # Nível 3
+        progress_callback=progress_callback,
+        detail=data.get('detail', 'full')
+    )
+    
+    if not resultado.get('sucesso', False):
+        optimizer.logger.warning(f"⚠️ Otimização sem sucesso: {resultado.get('erro', 'Desconhecido')}")
+    
+    return resultado, 200
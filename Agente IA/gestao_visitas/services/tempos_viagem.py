@@ -0,0 +1,498 @@
+"""
+Tempos de viagem entre municípios (PNSB 2024)
+Matriz município x município x hora do dia persistida em SQLite e
+compartilhada pelo otimizador PNSB, pelo detector de conflitos e pelo
+agendamento avançado. A base vem das rotas em cache, do roteador offline
+ou da tabela de referência da equipe; durações observadas refinam a
+matriz em segundo plano
+"""
+
+import os
+import math
+import time
+import sqlite3
+import logging
+import threading
+from datetime import datetime, time as dtime
+from typing import Dict, List, NamedTuple, Optional, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Centros usados como origem/destino da matriz (os mesmos do otimizador PNSB)
+COORDENADAS_MUNICIPIOS = {
+    'Balneário Camboriú': (-26.9906, -48.6349),
+    'Balneário Piçarras': (-26.7574, -48.6717),
+    'Bombinhas': (-27.1433, -48.4884),
+    'Camboriú': (-27.0248, -48.6583),
+    'Itajaí': (-26.9076, -48.6619),
+    'Itapema': (-27.0890, -48.6114),
+    'Luiz Alves': (-26.7169, -48.9357),
+    'Navegantes': (-26.8968, -48.6565),
+    'Penha': (-26.7711, -48.6506),
+    'Porto Belo': (-27.1588, -48.5552),
+    'Ilhota': (-26.8984, -48.8269)
+}
+APELIDOS = {'Piçarras': 'Balneário Piçarras'}
+
+# Tempos observados pela equipe em campo (minutos, valem nos dois sentidos);
+# usados quando não há rotas em cache nem grafo viário para o par
+TEMPOS_REFERENCIA = {
+    ('Itajaí', 'Navegantes'): 15,
+    ('Itajaí', 'Balneário Camboriú'): 25,
+    ('Itajaí', 'Camboriú'): 30,
+    ('Itajaí', 'Penha'): 20,
+    ('Itajaí', 'Balneário Piçarras'): 25,
+    ('Itajaí', 'Bombinhas'): 45,
+    ('Itajaí', 'Porto Belo'): 35,
+    ('Itajaí', 'Itapema'): 35,
+    ('Itajaí', 'Luiz Alves'): 40,
+    ('Itajaí', 'Ilhota'): 35,
+    ('Navegantes', 'Balneário Camboriú'): 30,
+    ('Navegantes', 'Penha'): 10,
+    ('Navegantes', 'Balneário Piçarras'): 15,
+    ('Penha', 'Balneário Piçarras'): 10,
+    ('Balneário Camboriú', 'Camboriú'): 15,
+    ('Balneário Camboriú', 'Itapema'): 20,
+    ('Itapema', 'Porto Belo'): 15,
+    ('Porto Belo', 'Bombinhas'): 20,
+    ('Camboriú', 'Luiz Alves'): 25,
+    ('Ilhota', 'Luiz Alves'): 20
+}
+
+# Multiplicador da duração típica por hora de partida (picos da BR-101 e
+# dos acessos a Itajaí/Balneário Camboriú no início da manhã e fim da tarde)
+PERFIL_TRANSITO = [
+    0.85, 0.85, 0.85, 0.85, 0.85, 0.9,   # 00h-05h
+    0.95, 1.2, 1.25, 1.1, 1.0, 1.05,     # 06h-11h
+    1.1, 1.05, 1.0, 1.0, 1.1, 1.3,       # 12h-17h
+    1.25, 1.05, 0.9, 0.9, 0.85, 0.85     # 18h-23h
+]
+COLUNA_TIPICA = 24  # hora não informada
+
+FONTES = ('rotas_cache', 'roteador_offline', 'referencia', 'haversine')
+VELOCIDADE_ESTIMATIVA_KMH = 45
+MINIMO_ENTRE_MUNICIPIOS = 15  # minutos, para a estimativa por linha reta
+RAIO_MUNICIPIO_KM = 12  # rota em cache conta para o município mais próximo neste raio
+
+
+class _Estado(NamedTuple):
+    indice: Dict[str, int]
+    matriz: np.ndarray  # (n, n, 25) minutos; coluna 24 = típico
+    versao: int
+
+
+def normalizar_municipio(nome: str) -> str:
+    nome = (nome or '').split(',')[0].strip()
+    return APELIDOS.get(nome, nome)
+
+
+def _coluna_hora(horario: Union[int, dtime, datetime, None]) -> int:
+    if horario is None:
+        return COLUNA_TIPICA
+    if isinstance(horario, (datetime, dtime)):
+        return horario.hour
+    return int(horario) % 24
+
+
+def _haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 6371 * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+class TemposViagemService:
+    """
+    Matriz de tempos de viagem entre municípios.
+
+    Nada é calculado na importação: a matriz é lida do SQLite na primeira
+    consulta (e construída nesse momento se o banco estiver vazio). As
+    consultas são indexação numa matriz numpy em memória. Observações
+    novas são gravadas na hora e incorporadas por uma thread que recalcula
+    a matriz, grava e troca o estado em memória de uma vez; a mesma thread
+    recarrega a matriz quando outro processo a atualiza.
+    """
+
+    PESO_BASE = 3  # a base vale por 3 observações na média
+    JANELA_OBSERVACOES_DIAS = 90
+    ATRASO_AGRUPAMENTO_S = 2.0  # junta observações que chegam em sequência
+    INTERVALO_VERIFICACAO_S = 60.0
+
+    def __init__(self, db_path: str = None, rotas_db_path: str = None):
+        self.db_path = db_path or os.path.join(self._get_cache_directory(), 'tempos_viagem.db')
+        # Mesmo arquivo do OfflineMapsService (rotas pré-calculadas)
+        self.rotas_db_path = rotas_db_path or os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), '..', 'offline_maps_cache', 'routes_cache.db'
+        )
+        self._estado: Optional[_Estado] = None
+        self._lock = threading.Lock()
+        self._pendente = threading.Event()
+        self._atualizador: Optional[threading.Thread] = None
+        self.metrics = {
+            'consultas': 0, 'fora_da_matriz': 0, 'observacoes': 0, 'observacoes_repetidas': 0,
+            'recalculos': 0, 'recarregamentos': 0
+        }
+        self._initialize_database()
+
+    def _get_cache_directory(self) -> str:
+        """Cria e retorna diretório para caches locais"""
+        base_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cache_local')
+        os.makedirs(base_dir, exist_ok=True)
+        return base_dir
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def _initialize_database(self):
+        try:
+            with self._connect() as conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS base (
+                        origem TEXT NOT NULL,
+                        destino TEXT NOT NULL,
+                        minutos REAL NOT NULL,
+                        fonte TEXT NOT NULL,
+                        amostras INTEGER NOT NULL DEFAULT 1,
+                        PRIMARY KEY (origem, destino)
+                    )
+                ''')
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS observacoes (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        origem TEXT NOT NULL,
+                        destino TEXT NOT NULL,
+                        hora INTEGER NOT NULL,
+                        minutos REAL NOT NULL,
+                        fonte TEXT NOT NULL,
+                        registrado_em REAL NOT NULL
+                    )
+                ''')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_observacoes_par ON observacoes (origem, destino, hora)')
+                # Matriz final por hora (0-23) e típica (24), pronta para carregar
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS matriz (
+                        origem TEXT NOT NULL,
+                        destino TEXT NOT NULL,
+                        hora INTEGER NOT NULL,
+                        minutos REAL NOT NULL,
+                        amostras INTEGER NOT NULL DEFAULT 0,
+                        PRIMARY KEY (origem, destino, hora)
+                    )
+                ''')
+                conn.execute('CREATE TABLE IF NOT EXISTS meta (chave TEXT PRIMARY KEY, valor TEXT NOT NULL)')
+        except Exception as e:
+            logger.error(f"❌ Erro ao inicializar banco de tempos de viagem: {str(e)}")
+
+    # ------------------------------------------------------------------
+    # Consultas
+    # ------------------------------------------------------------------
+
+    def minutos(self, origem: str, destino: str,
+                horario: Union[int, dtime, datetime, None] = None) -> Optional[int]:
+        """
+        Minutos de viagem de `origem` a `destino` partindo na hora de
+        `horario` (típico se None); None para município fora da matriz
+        """
+        estado = self._estado or self._carregar()
+        self.metrics['consultas'] += 1
+        i = estado.indice.get(normalizar_municipio(origem))
+        j = estado.indice.get(normalizar_municipio(destino))
+        if i is None or j is None:
+            self.metrics['fora_da_matriz'] += 1
+            return None
+        return int(round(float(estado.matriz[i, j, _coluna_hora(horario)])))
+
+    def matriz_minutos(self, municipios: List[str] = None,
+                       horario: Union[int, dtime, datetime, None] = None) -> Dict[str, Dict[str, int]]:
+        """Matriz em dicionários {origem: {destino: minutos}}"""
+        estado = self._estado or self._carregar()
+        coluna = _coluna_hora(horario)
+        nomes = [m for m in (municipios or list(estado.indice)) if normalizar_municipio(m) in estado.indice]
+        return {
+            a: {b: int(round(float(estado.matriz[estado.indice[normalizar_municipio(a)],
+                                                 estado.indice[normalizar_municipio(b)], coluna])))
+                for b in nomes}
+            for a in nomes
+        }
+
+    # ------------------------------------------------------------------
+    # Observações
+    # ------------------------------------------------------------------
+
+    def registrar_observacao(self, origem: str, destino: str, minutos: float,
+                             quando: Union[dtime, datetime, None] = None, fonte: str = 'observado'):
+        """
+        Grava uma duração observada; a matriz é recalculada em segundo plano.
+        Guarda no máximo uma observação por (origem, destino, fonte, dia, hora):
+        a mesma rota consultada a cada visualização de página não deve pesar
+        mais que a base na média.
+        """
+        origem, destino = normalizar_municipio(origem), normalizar_municipio(destino)
+        if origem == destino or origem not in COORDENADAS_MUNICIPIOS or destino not in COORDENADAS_MUNICIPIOS:
+            return
+        if not minutos or minutos <= 0:
+            return
+        agora = datetime.now()
+        hora = _coluna_hora(quando or agora)
+        inicio_dia = datetime.combine(agora.date(), dtime.min).timestamp()
+        try:
+            with self._connect() as conn:
+                cursor = conn.execute(
+                    '''INSERT INTO observacoes (origem, destino, hora, minutos, fonte, registrado_em)
+                       SELECT ?, ?, ?, ?, ?, ?
+                       WHERE NOT EXISTS (
+                           SELECT 1 FROM observacoes
+                           WHERE origem = ? AND destino = ? AND hora = ? AND fonte = ? AND registrado_em >= ?
+                       )''',
+                    (origem, destino, hora, float(minutos), fonte, agora.timestamp(),
+                     origem, destino, hora, fonte, inicio_dia)
+                )
+            if cursor.rowcount == 0:
+                self.metrics['observacoes_repetidas'] += 1
+                return
+            self.metrics['observacoes'] += 1
+            self._pendente.set()
+            self._iniciar_atualizador()
+        except Exception as e:
+            logger.error(f"Erro ao registrar tempo de viagem observado: {str(e)}")
+
+    def _iniciar_atualizador(self):
+        with self._lock:
+            if self._atualizador is None or not self._atualizador.is_alive():
+                self._atualizador = threading.Thread(
+                    target=self._loop_atualizador, name='pnsb-tempos-viagem', daemon=True
+                )
+                self._atualizador.start()
+
+    def _loop_atualizador(self):
+        while True:
+            if self._pendente.wait(self.INTERVALO_VERIFICACAO_S):
+                time.sleep(self.ATRASO_AGRUPAMENTO_S)
+                self._pendente.clear()
+                try:
+                    self.recalcular()
+                except Exception as e:
+                    logger.error(f"❌ Erro ao recalcular tempos de viagem: {str(e)}")
+            elif self._estado is not None and self._versao_persistida() != self._estado.versao:
+                # Outro processo recalculou a matriz
+                self._carregar(forcar=True)
+                self.metrics['recarregamentos'] += 1
+
+    # ------------------------------------------------------------------
+    # Construção e recálculo
+    # ------------------------------------------------------------------
+
+    def construir(self) -> Dict[str, int]:
+        """
+        Monta a base (tempo típico por par) das fontes disponíveis, na
+        ordem: rotas em cache, roteador offline, referência, linha reta.
+        Retorna quantos pares vieram de cada fonte.
+        """
+        nomes = list(COORDENADAS_MUNICIPIOS)
+        base: Dict[tuple, tuple] = {}
+
+        for (origem, destino), (minutos, amostras) in self._base_rotas_cache().items():
+            base[(origem, destino)] = (minutos, 'rotas_cache', amostras)
+
+        for (origem, destino), minutos in self._base_roteador().items():
+            base.setdefault((origem, destino), (minutos, 'roteador_offline', 1))
+
+        for (a, b), minutos in TEMPOS_REFERENCIA.items():
+            base.setdefault((a, b), (float(minutos), 'referencia', 1))
+            base.setdefault((b, a), (float(minutos), 'referencia', 1))
+
+        for origem in nomes:
+            for destino in nomes:
+                if origem == destino:
+                    continue
+                # Sentido oposto conhecido vale mais que a linha reta
+                if (origem, destino) not in base and (destino, origem) in base:
+                    minutos, fonte, amostras = base[(destino, origem)]
+                    base[(origem, destino)] = (minutos, fonte, amostras)
+                if (origem, destino) not in base:
+                    distancia = _haversine_km(*COORDENADAS_MUNICIPIOS[origem], *COORDENADAS_MUNICIPIOS[destino])
+                    minutos = max(distancia / VELOCIDADE_ESTIMATIVA_KMH * 60, MINIMO_ENTRE_MUNICIPIOS)
+                    base[(origem, destino)] = (minutos, 'haversine', 0)
+
+        with self._connect() as conn:
+            conn.execute('DELETE FROM base')
+            conn.executemany(
+                'INSERT INTO base (origem, destino, minutos, fonte, amostras) VALUES (?, ?, ?, ?, ?)',
+                [(o, d, m, f, a) for (o, d), (m, f, a) in base.items()]
+            )
+        self.recalcular()
+
+        fontes = {fonte: 0 for fonte in FONTES}
+        for _, fonte, _ in base.values():
+            fontes[fonte] += 1
+        logger.info(f"🕐 Matriz de tempos de viagem construída: {fontes}")
+        return fontes
+
+    def _base_rotas_cache(self) -> Dict[tuple, tuple]:
+        """Mediana das rotas em cache por par de municípios mais próximos"""
+        if not os.path.exists(self.rotas_db_path):
+            return {}
+        try:
+            with sqlite3.connect(self.rotas_db_path, timeout=5) as conn:
+                linhas = conn.execute(
+                    '''SELECT origin_lat, origin_lng, dest_lat, dest_lng, duration_seconds FROM cached_routes
+                       WHERE expires_at > datetime('now') AND duration_seconds > 0'''
+                ).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Rotas em cache indisponíveis para a matriz de tempos: {str(e)}")
+            return {}
+        if not linhas:
+            return {}
+
+        nomes = list(COORDENADAS_MUNICIPIOS)
+        centros = np.radians(np.array(list(COORDENADAS_MUNICIPIOS.values())))
+        dados = np.array(linhas, dtype=float)
+
+        def mais_proximo(lat, lng):
+            lat, lng = np.radians(lat)[:, None], np.radians(lng)[:, None]
+            a = (np.sin((centros[:, 0] - lat) / 2) ** 2
+                 + np.cos(lat) * np.cos(centros[:, 0]) * np.sin((centros[:, 1] - lng) / 2) ** 2)
+            distancias = 6371 * 2 * np.arcsin(np.sqrt(a))
+            indice = distancias.argmin(axis=1)
+            return np.where(distancias.min(axis=1) <= RAIO_MUNICIPIO_KM, indice, -1)
+
+        origens, destinos = mais_proximo(dados[:, 0], dados[:, 1]), mais_proximo(dados[:, 2], dados[:, 3])
+        validos = (origens >= 0) & (destinos >= 0) & (origens != destinos)
+        resultado = {}
+        pares = origens[validos] * len(nomes) + destinos[validos]
+        minutos = dados[validos, 4] / 60
+        for par in np.unique(pares):
+            amostra = minutos[pares == par]
+            resultado[(nomes[par // len(nomes)], nomes[par % len(nomes)])] = (float(np.median(amostra)), len(amostra))
+        return resultado
+
+    def _base_roteador(self) -> Dict[tuple, float]:
+        """Tempos centro a centro pelo grafo viário offline, se preparado"""
+        try:
+            from gestao_visitas.services.roteador_offline import roteador_offline
+            if not roteador_offline.disponivel:
+                return {}
+            centros = list(COORDENADAS_MUNICIPIOS.values())
+            duracoes = roteador_offline.matriz(centros, centros)['duracoes']
+        except Exception as e:
+            logger.warning(f"⚠️ Roteador offline indisponível para a matriz de tempos: {str(e)}")
+            return {}
+        nomes = list(COORDENADAS_MUNICIPIOS)
+        return {
+            (nomes[i], nomes[j]): float(duracoes[i, j]) / 60
+            for i in range(len(nomes)) for j in range(len(nomes))
+            if i != j and np.isfinite(duracoes[i, j])
+        }
+
+    def recalcular(self):
+        """
+        Matriz final = base x perfil da hora, ponderada com as observações
+        da mesma hora nos últimos JANELA_OBSERVACOES_DIAS (a base pesa
+        PESO_BASE observações). A coluna típica usa todas as observações.
+        """
+        with self._connect() as conn:
+            base = conn.execute('SELECT origem, destino, minutos FROM base').fetchall()
+            observacoes = conn.execute(
+                '''SELECT origem, destino, hora, SUM(minutos), COUNT(*) FROM observacoes
+                   WHERE registrado_em >= ? GROUP BY origem, destino, hora''',
+                (time.time() - self.JANELA_OBSERVACOES_DIAS * 86400,)
+            ).fetchall()
+
+        perfil = np.array(PERFIL_TRANSITO + [1.0])
+        celulas = {}
+        for origem, destino, minutos in base:
+            valores = minutos * perfil
+            celulas[(origem, destino)] = [valores * self.PESO_BASE, np.full(25, float(self.PESO_BASE)), np.zeros(25)]
+        for origem, destino, hora, soma, quantidade in observacoes:
+            celula = celulas.get((origem, destino))
+            if celula is None:
+                continue
+            for coluna in (hora, COLUNA_TIPICA):
+                celula[0][coluna] += soma
+                celula[1][coluna] += quantidade
+                celula[2][coluna] += quantidade
+
+        linhas = [
+            (origem, destino, hora, float(soma[hora] / peso[hora]), int(amostras[hora]))
+            for (origem, destino), (soma, peso, amostras) in celulas.items()
+            for hora in range(25)
+        ]
+        with self._connect() as conn:
+            conn.execute('DELETE FROM matriz')
+            conn.executemany(
+                'INSERT INTO matriz (origem, destino, hora, minutos, amostras) VALUES (?, ?, ?, ?, ?)', linhas
+            )
+            conn.execute(
+                '''INSERT INTO meta (chave, valor) VALUES ('versao', '1')
+                   ON CONFLICT(chave) DO UPDATE SET valor = CAST(valor AS INTEGER) + 1'''
+            )
+            conn.execute("INSERT OR REPLACE INTO meta (chave, valor) VALUES ('atualizado_em', ?)",
+                         (datetime.now().isoformat(),))
+        self.metrics['recalculos'] += 1
+        self._carregar(forcar=True)
+
+    # ------------------------------------------------------------------
+    # Carga
+    # ------------------------------------------------------------------
+
+    def _versao_persistida(self) -> int:
+        try:
+            with self._connect() as conn:
+                linha = conn.execute("SELECT valor FROM meta WHERE chave = 'versao'").fetchone()
+            return int(linha[0]) if linha else 0
+        except Exception:
+            return 0
+
+    def _carregar(self, forcar: bool = False) -> _Estado:
+        """Lê a matriz do SQLite (construindo-a se o banco estiver vazio)"""
+        try:
+            with self._lock:
+                if self._estado is not None and not forcar:
+                    return self._estado
+                with self._connect() as conn:
+                    linhas = conn.execute('SELECT origem, destino, hora, minutos FROM matriz').fetchall()
+                if linhas:
+                    nomes = sorted({linha[0] for linha in linhas} | {linha[1] for linha in linhas})
+                    indice = {nome: i for i, nome in enumerate(nomes)}
+                    matriz = np.zeros((len(nomes), len(nomes), 25), dtype=np.float32)
+                    for origem, destino, hora, minutos in linhas:
+                        matriz[indice[origem], indice[destino], hora] = minutos
+                    self._estado = _Estado(indice, matriz, self._versao_persistida())
+            if not linhas:
+                # Banco vazio: primeira execução neste ambiente
+                logger.info("🕐 Matriz de tempos de viagem vazia; construindo a partir das fontes locais")
+                self.construir()
+            self._iniciar_atualizador()
+            return self._estado
+        except Exception as e:
+            # Sem matriz as consultas devolvem None e cada chamador usa seu padrão
+            logger.error(f"❌ Erro ao carregar tempos de viagem: {str(e)}")
+            return self._estado or _Estado({}, np.zeros((0, 0, 25), dtype=np.float32), 0)
+
+    def get_metrics(self) -> Dict:
+        estado = self._estado
+        fontes = {}
+        try:
+            with self._connect() as conn:
+                fontes = dict(conn.execute('SELECT fonte, COUNT(*) FROM base GROUP BY fonte').fetchall())
+                observacoes = conn.execute('SELECT COUNT(*) FROM observacoes').fetchone()[0]
+                atualizado = conn.execute("SELECT valor FROM meta WHERE chave = 'atualizado_em'").fetchone()
+        except Exception as e:
+            logger.error(f"Erro ao ler métricas de tempos de viagem: {str(e)}")
+            observacoes, atualizado = 0, None
+        return {
+            **self.metrics,
+            'carregada': estado is not None,
+            'municipios': len(estado.indice) if estado else 0,
+            'versao': estado.versao if estado else None,
+            'fontes_base': fontes,
+            'observacoes_armazenadas': observacoes,
+            'atualizado_em': atualizado[0] if atualizado else None
+        }
+
+
+# Instância global (singleton do processo)
+tempos_viagem = TemposViagemService()
@@ -0,0 +1,484 @@
+"""
+Roteamento multi-dia com janelas de tempo (VRPTW) - PNSB 2024
+Cada dia é uma rota que sai da base e volta a ela. Semeadura por varredura
+angular, busca local com relocate, swap e 2-opt* entre rotas (deltas O(1)
+sobre a matriz de tempos) e ruína-e-reconstrução até esgotar o orçamento de tempo
+"""
+
+import math
+import time
+import random
+import logging
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EPS = 1e-6
+
+
+@dataclass
+class ResultadoVRPTW:
+    """Solução: rotas com índices de paradas (1..n; 0 é a base)"""
+    rotas: List[List[int]]
+    nao_alocados: List[int]
+    custo: float
+    tempo_viagem: float
+    horarios: List[List[Tuple[float, float, float]]] = field(default_factory=list)  # (chegada, início, saída)
+    retornos: List[float] = field(default_factory=list)
+    iteracoes: int = 0
+    tempo_execucao: float = 0.0
+
+
+class SolverVRPTW:
+    """
+    VRPTW com um veículo por dia.
+
+    - tempos: matriz (n+1)x(n+1) em minutos; índice 0 é a base
+    - servico, janela_inicio, janela_fim: por parada (minutos desde 0h);
+      janela_fim é o último horário de início do atendimento
+    - prioritarios: paradas P1, alocadas antes das demais e empurradas para
+      os primeiros dias (custo `peso_dia_p1` por dia de atraso)
+    - restrições rígidas: janelas e retorno à base até `fim_dia`; o que não
+      cabe fica em `nao_alocados` com penalidade
+    """
+
+    def __init__(self, tempos: np.ndarray, servico: Sequence[float],
+                 janela_inicio: Sequence[float], janela_fim: Sequence[float],
+                 prioritarios: Sequence[bool], dias: int,
+                 inicio_dia: float = 480, fim_dia: float = 1080,
+                 coordenadas: Optional[Sequence[Tuple[float, float]]] = None,
+                 peso_dia_p1: float = 15.0, penalidade_nao_alocado: float = 10000.0,
+                 semente: Optional[int] = None):
+        self.T = np.asarray(tempos, dtype=float).tolist()
+        self.n = len(self.T) - 1
+        self.S = [0.0] + [float(s) for s in servico]
+        self.A = [inicio_dia] + [float(a) for a in janela_inicio]
+        self.B = [fim_dia] + [float(b) for b in janela_fim]
+        self.P1 = [False] + [bool(p) for p in prioritarios]
+        self.dias = dias
+        self.inicio_dia = inicio_dia
+        self.fim_dia = fim_dia
+        self.coordenadas = coordenadas
+        self.peso_dia_p1 = peso_dia_p1
+        self.penalidade = penalidade_nao_alocado
+        self.simetrica = bool(np.allclose(tempos, np.asarray(tempos).T))
+        self.random = random.Random(semente)
+
+        self.rotas: List[List[int]] = [[] for _ in range(dias)]
+        self.nao_alocados: List[int] = []
+        self._dep: List[List[float]] = [[] for _ in range(dias)]
+        self._lat: List[List[float]] = [[] for _ in range(dias)]
+        self._p1_sufixo: List[List[int]] = [[0] for _ in range(dias)]
+
+    # ===== ESTADO DAS ROTAS =====
+
+    def _recalcular(self, r: int):
+        """Saídas (para frente), início mais tardio (para trás) e P1 por sufixo"""
+        T, A, B, S = self.T, self.A, self.B, self.S
+        rota = self.rotas[r]
+
+        dep = []
+        t, anterior = self.inicio_dia, 0
+        for k in rota:
+            t = max(t + T[anterior][k], A[k]) + S[k]
+            dep.append(t)
+            anterior = k
+
+        lat = [0.0] * len(rota)
+        limite, seguinte = self.fim_dia, 0
+        for p in range(len(rota) - 1, -1, -1):
+            k = rota[p]
+            limite = min(B[k], limite - S[k] - T[k][seguinte])
+            lat[p] = limite
+            seguinte = k
+
+        p1 = [0] * (len(rota) + 1)
+        for p in range(len(rota) - 1, -1, -1):
+            p1[p] = p1[p + 1] + self.P1[rota[p]]
+
+        self._dep[r], self._lat[r], self._p1_sufixo[r] = dep, lat, p1
+
+    def _saida_antes(self, r: int, p: int) -> float:
+        return self._dep[r][p - 1] if p > 0 else self.inicio_dia
+
+    def _limite_em(self, r: int, p: int) -> float:
+        return self._lat[r][p] if p < len(self.rotas[r]) else self.fim_dia
+
+    def _no(self, r: int, p: int) -> int:
+        rota = self.rotas[r]
+        return rota[p] if 0 <= p < len(rota) else 0
+
+    def _viavel_rota(self, rota: List[int]) -> bool:
+        T, A, B, S = self.T, self.A, self.B, self.S
+        t, anterior = self.inicio_dia, 0
+        for k in rota:
+            inicio = max(t + T[anterior][k], A[k])
+            if inicio > B[k] + EPS:
+                return False
+            t = inicio + S[k]
+            anterior = k
+        return t + T[anterior][0] <= self.fim_dia + EPS
+
+    def _custo_viagem(self, rota: List[int]) -> float:
+        T = self.T
+        caminho = [0] + rota + [0]
+        return sum(T[a][b] for a, b in zip(caminho, caminho[1:]))
+
+    def custo_total(self) -> float:
+        custo = sum(self._custo_viagem(rota) for rota in self.rotas)
+        custo += self.peso_dia_p1 * sum(d * sum(self.P1[k] for k in rota) for d, rota in enumerate(self.rotas))
+        custo += sum(self.penalidade * (10 if self.P1[k] else 1) for k in self.nao_alocados)
+        return custo
+
+    # ===== INSERÇÃO =====
+
+    def _custo_insercao(self, u: int, r: int, p: int) -> Optional[float]:
+        """Delta de viagem ao inserir u na posição p da rota r (None se inviável); O(1)"""
+        T, rota = self.T, self.rotas[r]
+        if p > 0:
+            anterior, saida = rota[p - 1], self._dep[r][p - 1]
+        else:
+            anterior, saida = 0, self.inicio_dia
+        if p < len(rota):
+            seguinte, limite = rota[p], self._lat[r][p]
+        else:
+            seguinte, limite = 0, self.fim_dia
+        inicio = saida + T[anterior][u]
+        if inicio < self.A[u]:
+            inicio = self.A[u]
+        if inicio > self.B[u] + EPS or inicio + self.S[u] + T[u][seguinte] > limite + EPS:
+            return None
+        return T[anterior][u] + T[u][seguinte] - T[anterior][seguinte]
+
+    def _melhor_insercao(self, u: int, rotas: Sequence[int] = None) -> Optional[Tuple[float, int, int]]:
+        melhor = None
+        for r in (range(self.dias) if rotas is None else rotas):
+            extra = self.peso_dia_p1 * r if self.P1[u] else 0.0
+            for p in range(len(self.rotas[r]) + 1):
+                delta = self._custo_insercao(u, r, p)
+                if delta is not None and (melhor is None or delta + extra < melhor[0]):
+                    melhor = (delta + extra, r, p)
+        return melhor
+
+    def _inserir_gulosamente(self, candidatos: List[int]) -> List[int]:
+        """Inserção mais barata, P1 primeiro; retorna o que não coube"""
+        sobras = []
+        for u in sorted(candidatos, key=lambda k: not self.P1[k]):
+            melhor = self._melhor_insercao(u)
+            if melhor is None:
+                sobras.append(u)
+                continue
+            _, r, p = melhor
+            self.rotas[r].insert(p, u)
+            self._recalcular(r)
+        return sobras
+
+    # ===== SEMEADURA =====
+
+    def _ordem_varredura(self) -> List[int]:
+        """Paradas em ordem angular em torno da base, começando na maior lacuna"""
+        nos = list(range(1, self.n + 1))
+        if not self.coordenadas:
+            return nos
+        base_lat, base_lng = self.coordenadas[0]
+        angulos = {
+            k: math.atan2(self.coordenadas[k][0] - base_lat, self.coordenadas[k][1] - base_lng)
+            for k in nos
+        }
+        nos.sort(key=angulos.get)
+        if len(nos) < 2:
+            return nos
+        lacunas = [
+            (angulos[nos[(i + 1) % len(nos)]] - angulos[nos[i]]) % (2 * math.pi)
+            for i in range(len(nos))
+        ]
+        inicio = (lacunas.index(max(lacunas)) + 1) % len(nos)
+        return nos[inicio:] + nos[:inicio]
+
+    def semear(self):
+        """Varredura: enche um dia por vez na ordem angular (P1 reservados primeiro)"""
+        self.rotas = [[] for _ in range(self.dias)]
+        for r in range(self.dias):
+            self._recalcular(r)
+
+        ordem = self._ordem_varredura()
+        p1 = [k for k in ordem if self.P1[k]]
+        # P1 distribuídos pelos primeiros dias em que couberem
+        sobras = self._inserir_gulosamente(p1)
+
+        r = 0
+        for u in (k for k in ordem if not self.P1[k]):
+            while r < self.dias:
+                melhor = self._melhor_insercao(u, [r])
+                if melhor is not None:
+                    _, _, p = melhor
+                    self.rotas[r].insert(p, u)
+                    self._recalcular(r)
+                    break
+                r += 1
+            else:
+                sobras.append(u)
+
+        self.nao_alocados = self._inserir_gulosamente(sobras)
+
+    # ===== MOVIMENTOS =====
+
+    def _relocate(self, prazo: float) -> bool:
+        """Move uma parada para outra rota (O(1) por avaliação) ou outra posição da mesma"""
+        T = self.T
+        for r1 in range(self.dias):
+            for p in range(len(self.rotas[r1])):
+                if time.perf_counter() > prazo:
+                    return False
+                u = self.rotas[r1][p]
+                anterior, seguinte = self._no(r1, p - 1), self._no(r1, p + 1)
+                # Remoção continua viável? (desigualdade triangular pode não valer)
+                if self._saida_antes(r1, p) + T[anterior][seguinte] > self._limite_em(r1, p + 1) + EPS:
+                    continue
+                ganho = T[anterior][u] + T[u][seguinte] - T[anterior][seguinte]
+
+                for r2 in range(self.dias):
+                    if r2 == r1:
+                        continue
+                    extra = self.peso_dia_p1 * (r2 - r1) if self.P1[u] else 0.0
+                    for q in range(len(self.rotas[r2]) + 1):
+                        delta = self._custo_insercao(u, r2, q)
+                        if delta is not None and delta + extra - ganho < -EPS:
+                            del self.rotas[r1][p]
+                            self.rotas[r2].insert(q, u)
+                            self._recalcular(r1)
+                            self._recalcular(r2)
+                            return True
+
+                # Mesma rota: delta O(1), viabilidade conferida só se melhorar
+                rota = self.rotas[r1]
+                for q in range(len(rota) + 1):
+                    if q in (p, p + 1):
+                        continue
+                    a, b = self._no(r1, q - 1), self._no(r1, q)
+                    delta = T[a][u] + T[u][b] - T[a][b] - ganho
+                    if delta < -EPS:
+                        nova = rota[:p] + rota[p + 1:]
+                        nova.insert(q if q < p else q - 1, u)
+                        if self._viavel_rota(nova):
+                            self.rotas[r1] = nova
+                            self._recalcular(r1)
+                            return True
+        return False
+
+    def _troca_viavel(self, r: int, p: int, v: int) -> Optional[float]:
+        """Delta ao substituir a parada na posição p da rota r por v (None se inviável)"""
+        T = self.T
+        u = self.rotas[r][p]
+        anterior, seguinte = self._no(r, p - 1), self._no(r, p + 1)
+        inicio = max(self._saida_antes(r, p) + T[anterior][v], self.A[v])
+        if inicio > self.B[v] + EPS:
+            return None
+        if inicio + self.S[v] + T[v][seguinte] > self._limite_em(r, p + 1) + EPS:
+            return None
+        return T[anterior][v] + T[v][seguinte] - T[anterior][u] - T[u][seguinte]
+
+    def _swap(self, prazo: float) -> bool:
+        """Troca paradas entre duas rotas"""
+        for r1 in range(self.dias):
+            for r2 in range(r1 + 1, self.dias):
+                if time.perf_counter() > prazo:
+                    return False
+                for p, u in enumerate(self.rotas[r1]):
+                    for q, v in enumerate(self.rotas[r2]):
+                        d1 = self._troca_viavel(r1, p, v)
+                        if d1 is None:
+                            continue
+                        d2 = self._troca_viavel(r2, q, u)
+                        if d2 is None:
+                            continue
+                        extra = self.peso_dia_p1 * (self.P1[u] - self.P1[v]) * (r2 - r1)
+                        if d1 + d2 + extra < -EPS:
+                            self.rotas[r1][p], self.rotas[r2][q] = v, u
+                            self._recalcular(r1)
+                            self._recalcular(r2)
+                            return True
+        return False
+
+    def _two_opt_estrela(self, prazo: float) -> bool:
+        """Troca os finais de duas rotas (A[:i] + B[j:], B[:j] + A[i:])"""
+        T = self.T
+        for r1 in range(self.dias):
+            for r2 in range(r1 + 1, self.dias):
+                if time.perf_counter() > prazo:
+                    return False
+                n1, n2 = len(self.rotas[r1]), len(self.rotas[r2])
+                for i in range(n1 + 1):
+                    x1, y1 = self._no(r1, i - 1), self._no(r1, i)
+                    saida1 = self._saida_antes(r1, i)
+                    for j in range(n2 + 1):
+                        if (i == n1 and j == n2) or (i == 0 and j == 0):
+                            continue
+                        x2, y2 = self._no(r2, j - 1), self._no(r2, j)
+                        delta = T[x1][y2] + T[x2][y1] - T[x1][y1] - T[x2][y2]
+                        c1, c2 = self._p1_sufixo[r1][i], self._p1_sufixo[r2][j]
+                        delta += self.peso_dia_p1 * (c1 - c2) * (r2 - r1)
+                        if delta >= -EPS:
+                            continue
+                        if saida1 + T[x1][y2] > self._limite_em(r2, j) + EPS:
+                            continue
+                        if self._saida_antes(r2, j) + T[x2][y1] > self._limite_em(r1, i) + EPS:
+                            continue
+                        rota1, rota2 = self.rotas[r1], self.rotas[r2]
+                        self.rotas[r1] = rota1[:i] + rota2[j:]
+                        self.rotas[r2] = rota2[:j] + rota1[i:]
+                        self._recalcular(r1)
+                        self._recalcular(r2)
+                        return True
+        return False
+
+    def _two_opt(self, prazo: float) -> bool:
+        """Inverte um trecho dentro da rota (só com matriz simétrica)"""
+        if not self.simetrica:
+            return False
+        T = self.T
+        for r in range(self.dias):
+            if time.perf_counter() > prazo:
+                return False
+            rota = self.rotas[r]
+            caminho = [0] + rota + [0]
+            for i in range(1, len(caminho) - 2):
+                for j in range(i + 1, len(caminho) - 1):
+                    delta = (T[caminho[i - 1]][caminho[j]] + T[caminho[i]][caminho[j + 1]] -
+                             T[caminho[i - 1]][caminho[i]] - T[caminho[j]][caminho[j + 1]])
+                    if delta < -EPS:
+                        nova = rota[:i - 1] + rota[i - 1:j][::-1] + rota[j:]
+                        if self._viavel_rota(nova):
+                            self.rotas[r] = nova
+                            self._recalcular(r)
+                            return True
+        return False
+
+    def _alocar_pendentes(self) -> bool:
+        """Insere não alocados; P1 sem lugar substitui uma parada comum"""
+        if not self.nao_alocados:
+            return False
+        antes = len(self.nao_alocados)
+        self.nao_alocados = self._inserir_gulosamente(self.nao_alocados)
+        melhorou = len(self.nao_alocados) < antes
+
+        for u in [k for k in self.nao_alocados if self.P1[k]]:
+            melhor = None
+            for r in range(self.dias):
+                for p, v in enumerate(self.rotas[r]):
+                    if self.P1[v]:
+                        continue
+                    delta = self._troca_viavel(r, p, u)
+                    if delta is not None and (melhor is None or delta < melhor[0]):
+                        melhor = (delta, r, p, v)
+            if melhor is not None:
+                _, r, p, v = melhor
+                self.rotas[r][p] = u
+                self._recalcular(r)
+                self.nao_alocados.remove(u)
+                self.nao_alocados.append(v)
+                melhorou = True
+        return melhorou
+
+    def busca_local(self, prazo: float) -> int:
+        """Aplica movimentos de melhoria até não haver ganho ou acabar o tempo"""
+        movimentos = 0
+        while time.perf_counter() < prazo:
+            # Pendentes por último: só vale tentar depois que as rotas encolheram
+            if (self._two_opt(prazo) or self._relocate(prazo) or self._swap(prazo)
+                    or self._two_opt_estrela(prazo) or self._alocar_pendentes()):
+                movimentos += 1
+                continue
+            break
+        return movimentos
+
+    # ===== PERTURBAÇÃO =====
+
+    def _arruinar(self, quantidade: int):
+        """Remove uma parada aleatória e as mais próximas dela (ruína relacionada)"""
+        alocados = [k for rota in self.rotas for k in rota]
+        if not alocados:
+            return
+        semente = self.random.choice(alocados)
+        proximos = sorted(alocados, key=lambda k: self.T[semente][k] + self.T[k][semente])
+        removidos = set(proximos[:quantidade])
+        for r in range(self.dias):
+            if any(k in removidos for k in self.rotas[r]):
+                self.rotas[r] = [k for k in self.rotas[r] if k not in removidos]
+                self._recalcular(r)
+        candidatos = list(removidos) + self.nao_alocados
+        self.random.shuffle(candidatos)
+        self.nao_alocados = self._inserir_gulosamente(candidatos)
+
+    def _estado(self):
+        return [list(rota) for rota in self.rotas], list(self.nao_alocados)
+
+    def _restaurar(self, estado):
+        self.rotas = [list(rota) for rota in estado[0]]
+        self.nao_alocados = list(estado[1])
+        for r in range(self.dias):
+            self._recalcular(r)
+
+    def resolver(self, limite_segundos: float = 5.0,
+                 progresso: Optional[Callable[[float, float, List[List[int]]], bool]] = None) -> ResultadoVRPTW:
+        """
+        Varredura + busca local + ruína-e-reconstrução dentro do orçamento de tempo.
+        `progresso(fração do orçamento, melhor custo, melhores rotas)` é chamado
+        a cada iteração; se retornar True a busca para com a melhor solução.
+        """
+        inicio = time.perf_counter()
+        prazo = inicio + max(limite_segundos, 0.05)
+
+        self.semear()
+        self.busca_local(prazo)
+        melhor_custo = atual_custo = self.custo_total()
+        melhor = self._estado()
+
+        iteracoes = 0
+        while time.perf_counter() < prazo and self.n > 1:
+            if progresso and progresso((time.perf_counter() - inicio) / (prazo - inicio), melhor_custo, melhor[0]):
+                break
+            iteracoes += 1
+            anterior = self._estado()
+            self._arruinar(self.random.randint(2, max(2, min(15, self.n // 5))))
+            self.busca_local(prazo)
+            custo = self.custo_total()
+
+            if custo < melhor_custo - EPS:
+                melhor_custo, melhor = custo, self._estado()
+            # Aceita pioras pequenas para sair de ótimos locais
+            if custo < atual_custo * 1.01:
+                atual_custo = custo
+            else:
+                self._restaurar(anterior)
+
+        self._restaurar(melhor)
+        return self._resultado(iteracoes, time.perf_counter() - inicio)
+
+    def _resultado(self, iteracoes: int, duracao: float) -> ResultadoVRPTW:
+        T, A, S = self.T, self.A, self.S
+        horarios, retornos = [], []
+        for rota in self.rotas:
+            t, anterior, paradas = self.inicio_dia, 0, []
+            for k in rota:
+                chegada = t + T[anterior][k]
+                inicio = max(chegada, A[k])
+                t = inicio + S[k]
+                paradas.append((chegada, inicio, t))
+                anterior = k
+            horarios.append(paradas)
+            retornos.append(t + T[anterior][0] if rota else self.inicio_dia)
+
+        return ResultadoVRPTW(
+            rotas=[list(rota) for rota in self.rotas],
+            nao_alocados=sorted(self.nao_alocados),
+            custo=self.custo_total(),
+            tempo_viagem=sum(self._custo_viagem(rota) for rota in self.rotas),
+            horarios=horarios,
+            retornos=retornos,
+            iteracoes=iteracoes,
+            tempo_execucao=duracao
+        )
@@ -0,0 +1,133 @@
+"""
+Cache persistente de previsões do tempo (PNSB 2024)
+Previsões por (município, data, fonte) em SQLite, compartilhadas entre
+processos e instâncias do WeatherService
+"""
+
+import os
+import json
+import time
+import sqlite3
+import logging
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class WeatherCache:
+    """
+    Cache em disco das previsões já processadas.
+
+    A validade depende da fonte: previsões da API são renovadas a cada
+    atualização do modelo (3h); simulações valem meio dia para que a mesma
+    visita não mude de classificação a cada consulta.
+    """
+
+    TTL_PADRAO = 3 * 3600
+    TTL_POR_FONTE = {
+        'openweathermap': 3 * 3600,
+        'simulacao': 12 * 3600
+    }
+
+    def __init__(self, db_path: str = None):
+        self.db_path = db_path or os.path.join(self._get_cache_directory(), 'weather_cache.db')
+        self.metrics = {'hits': 0, 'misses': 0, 'gravacoes': 0}
+        self._initialize_database()
+
+    def _get_cache_directory(self) -> str:
+        """Cria e retorna diretório para caches locais"""
+        base_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cache_local')
+        os.makedirs(base_dir, exist_ok=True)
+        return base_dir
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def _initialize_database(self):
+        try:
+            with self._connect() as conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS previsoes (
+                        municipio TEXT NOT NULL,
+                        data TEXT NOT NULL,
+                        fonte TEXT NOT NULL,
+                        dados TEXT NOT NULL,
+                        criado_em REAL NOT NULL,
+                        PRIMARY KEY (municipio, data, fonte)
+                    )
+                ''')
+        except Exception as e:
+            logger.error(f"❌ Erro ao inicializar cache de clima: {str(e)}")
+
+    def _ttl(self, fonte: str) -> int:
+        return self.TTL_POR_FONTE.get(fonte, self.TTL_PADRAO)
+
+    def obter(self, municipio: str, datas: Iterable[date], fonte: str) -> Dict[date, Dict]:
+        """Previsões válidas em cache para as datas pedidas (uma consulta)"""
+        datas = list(datas)
+        if not datas:
+            return {}
+        limite = time.time() - self._ttl(fonte)
+        try:
+            with self._connect() as conn:
+                linhas = conn.execute(
+                    f'''SELECT data, dados FROM previsoes
+                        WHERE municipio = ? AND fonte = ? AND criado_em >= ?
+                          AND data IN ({", ".join("?" * len(datas))})''',
+                    [municipio, fonte, limite, *(d.isoformat() for d in datas)]
+                ).fetchall()
+        except Exception as e:
+            logger.error(f"Erro ao ler cache de clima: {str(e)}")
+            return {}
+
+        encontrados = {date.fromisoformat(data): json.loads(dados) for data, dados in linhas}
+        self.metrics['hits'] += len(encontrados)
+        self.metrics['misses'] += len(datas) - len(encontrados)
+        return encontrados
+
+    def gravar(self, municipio: str, fonte: str, previsoes: Dict[date, Dict]):
+        """Grava (substituindo) as previsões de várias datas numa transação"""
+        if not previsoes:
+            return
+        agora = time.time()
+        try:
+            with self._connect() as conn:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO previsoes (municipio, data, fonte, dados, criado_em) VALUES (?, ?, ?, ?, ?)',
+                    [(municipio, d.isoformat(), fonte, json.dumps(dados, ensure_ascii=False), agora)
+                     for d, dados in previsoes.items()]
+                )
+            self.metrics['gravacoes'] += len(previsoes)
+        except Exception as e:
+            logger.error(f"Erro ao gravar cache de clima: {str(e)}")
+
+    def limpar_expirados(self) -> int:
+        """Remove entradas vencidas de todas as fontes"""
+        agora = time.time()
+        try:
+            with self._connect() as conn:
+                removidos = 0
+                fontes = [linha[0] for linha in conn.execute('SELECT DISTINCT fonte FROM previsoes')]
+                for fonte in fontes:
+                    removidos += conn.execute(
+                        'DELETE FROM previsoes WHERE fonte = ? AND criado_em < ?',
+                        (fonte, agora - self._ttl(fonte))
+                    ).rowcount
+                return removidos
+        except Exception as e:
+            logger.error(f"Erro ao limpar cache de clima: {str(e)}")
+            return 0
+
+    def get_metrics(self) -> Dict:
+        consultas = self.metrics['hits'] + self.metrics['misses']
+        return {
+            **self.metrics,
+            'hit_rate': round(self.metrics['hits'] / consultas * 100, 2) if consultas else 0.0
+        }
+
+
+# Instância global compartilhada pelos serviços de clima
+weather_cache = WeatherCache()
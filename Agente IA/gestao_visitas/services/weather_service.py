@@ -8,10 +8,12 @@ from typing import Dict, List, Optional, Any, Tuple
 import requests
 import json
 import logging
-from dataclasses import dataclass
+from collections import defaultdict
+from dataclasses import dataclass, asdict
 from enum import Enum
 from ..models.agendamento import Visita
 from ..db import db
+from .weather_cache import weather_cache
 
 class CondicaoClimatica(Enum):
     ENSOLARADO = "ensolarado"
@@ -48,6 +50,70 @@ class PrevisaoTempo:
     fonte_dados: str
     timestamp_atualizacao: datetime
 
+def _previsao_para_dict(previsao: PrevisaoTempo) -> Dict:
+    """Forma serializável (JSON) de uma previsão"""
+    dados = asdict(previsao)
+    dados['condicao'] = previsao.condicao.value
+    for campo in ('data', 'nascer_sol', 'por_sol', 'timestamp_atualizacao'):
+        dados[campo] = dados[campo].isoformat()
+    return dados
+
+def _previsao_de_dict(dados: Dict) -> PrevisaoTempo:
+    dados = dict(dados)
+    dados['data'] = date.fromisoformat(dados['data'])
+    dados['nascer_sol'] = time.fromisoformat(dados['nascer_sol'])
+    dados['por_sol'] = time.fromisoformat(dados['por_sol'])
+    dados['timestamp_atualizacao'] = datetime.fromisoformat(dados['timestamp_atualizacao'])
+    dados['condicao'] = CondicaoClimatica(dados['condicao'])
+    return PrevisaoTempo(**dados)
+
+# Normais climatológicas mensais aproximadas para o litoral de Santa Catarina
+TEMPERATURAS_MEDIAS_MES = {
+    1: (20, 28), 2: (20, 28), 3: (19, 27), 4: (16, 24),
+    5: (13, 21), 6: (11, 19), 7: (11, 19), 8: (12, 20),
+    9: (14, 22), 10: (16, 24), 11: (18, 26), 12: (19, 27)
+}
+CHANCE_CHUVA_MES = {
+    1: 45, 2: 40, 3: 35, 4: 25, 5: 20, 6: 15,
+    7: 15, 8: 20, 9: 30, 10: 35, 11: 40, 12: 45
+}
+
+def _montar_climatologia() -> Dict[int, Dict]:
+    """Tabela mês -> campos da previsão climatológica (calculada uma vez na importação)"""
+    tabela = {}
+    for mes in range(1, 13):
+        temp_min, temp_max = TEMPERATURAS_MEDIAS_MES[mes]
+        chance_chuva = CHANCE_CHUVA_MES[mes]
+        
+        # Determinar condição baseada na chance de chuva
+        if chance_chuva > 60:
+            condicao = CondicaoClimatica.CHUVA_MODERADA
+        elif chance_chuva > 40:
+            condicao = CondicaoClimatica.PARCIALMENTE_NUBLADO
+        else:
+            condicao = CondicaoClimatica.ENSOLARADO
+        
+        tabela[mes] = {
+            'temperatura_min': temp_min,
+            'temperatura_max': temp_max,
+            'condicao': condicao,
+            'chance_chuva': chance_chuva,
+            'velocidade_vento': 15.0,
+            'umidade': 70,
+            'pressao': 1013.25,
+            'nascer_sol': time(6, 30),
+            'por_sol': time(18, 30),
+            'indice_uv': 6,
+            'visibilidade': 10.0,
+            'fonte_dados': 'climatologia_historica'
+        }
+    return tabela
+
+CLIMATOLOGIA_MENSAL = _montar_climatologia()
+
+# Horizonte da previsão de 5 dias da API (hoje + 5)
+HORIZONTE_PREVISAO_DIAS = 5
+
 @dataclass
 class RecomendacaoClimatica:
     impacto_visita: ImpactoVisita
@@ -106,57 +172,99 @@ class WeatherService:
         """Obter previsão do tempo para um município e data específicos"""
         
         try:
-            # Verificar cache
+            return self.obter_previsoes_municipio(municipio, [data_visita]).get(data_visita)
+            
+        except Exception as e:
+            self.logger.error(f"❌ Erro ao obter previsão para {municipio}: {str(e)}")
+            return self._gerar_previsao_simulada(municipio, data_visita)
+    
+    def obter_previsoes_municipio(self, municipio: str, datas: List[date]) -> Dict[date, PrevisaoTempo]:
+        """
+        Previsões de várias datas de um município com no máximo uma chamada
+        de previsão de 5 dias (mais o clima atual, só se hoje não vier nela).
+        
+        Ordem: cache em memória -> cache em disco (municipio, data, fonte) ->
+        API em lote; datas fora do horizonte usam a tabela climatológica.
+        """
+        hoje = date.today()
+        previsoes: Dict[date, PrevisaoTempo] = {}
+        pendentes = []
+        
+        # Cache em memória da instância
+        for data_visita in sorted(set(datas)):
             cache_key = f"{municipio}_{data_visita.isoformat()}"
             if self._cache_valido(cache_key):
-                return self.cache_previsoes[cache_key]['dados']
-            
-            if not self.api_key:
-                # Retornar dados simulados se não tiver API key
-                return self._gerar_previsao_simulada(municipio, data_visita)
-            
-            # Obter coordenadas
+                previsoes[data_visita] = self.cache_previsoes[cache_key]['dados']
+            else:
+                pendentes.append(data_visita)
+        
+        if not pendentes:
+            return previsoes
+        
+        fonte = 'openweathermap' if self.api_key else 'simulacao'
+        if self.api_key:
+            # Fora do horizonte da API: consulta à tabela climatológica
+            janela = [d for d in pendentes if 0 <= (d - hoje).days <= HORIZONTE_PREVISAO_DIAS]
+            for data_visita in pendentes:
+                if data_visita not in janela:
+                    previsoes[data_visita] = self._obter_previsao_climatologica(municipio, data_visita)
+            pendentes = janela
+        
+        # Cache em disco compartilhado
+        for data_visita, dados in weather_cache.obter(municipio, pendentes, fonte).items():
+            previsoes[data_visita] = self._guardar_memoria(municipio, _previsao_de_dict(dados))
+        pendentes = [d for d in pendentes if d not in previsoes]
+        
+        if not pendentes:
+            return previsoes
+        
+        novas: Dict[date, PrevisaoTempo] = {}
+        if not self.api_key:
+            # Simulação também é cacheada para manter a análise estável
+            novas = {d: self._gerar_previsao_simulada(municipio, d) for d in pendentes}
+        else:
             coords = self.coordenadas_municipios.get(municipio)
             if not coords:
                 self.logger.warning(f"Coordenadas não encontradas para {municipio}")
-                return None
-            
-            lat, lon = coords
-            
-            # Calcular dias de diferença
-            dias_diferenca = (data_visita - date.today()).days
-            
-            if dias_diferenca == 0:
-                # Clima atual
-                previsao = self._obter_clima_atual(lat, lon, municipio)
-            elif dias_diferenca <= 5:
-                # Previsão de 5 dias
-                previsao = self._obter_previsao_5_dias(lat, lon, municipio, data_visita)
             else:
-                # Previsão histórica/climatológica
-                previsao = self._obter_previsao_climatologica(municipio, data_visita)
-            
-            # Salvar no cache
-            if previsao:
-                self.cache_previsoes[cache_key] = {
-                    'dados': previsao,
-                    'timestamp': datetime.now()
-                }
-            
-            return previsao
-            
-        except Exception as e:
-            self.logger.error(f"❌ Erro ao obter previsão para {municipio}: {str(e)}")
-            return self._gerar_previsao_simulada(municipio, data_visita)
+                lat, lon = coords
+                # Uma chamada cobre todos os dias do horizonte (e fica no cache)
+                novas = self._obter_previsao_5_dias_lote(lat, lon, municipio)
+                if hoje in pendentes and hoje not in novas:
+                    atual = self._obter_clima_atual(lat, lon, municipio)
+                    if atual:
+                        novas[hoje] = atual
+        
+        # Falha da API não vai para o disco: a próxima análise tenta de novo
+        gravar_disco = bool(novas)
+        for data_visita in pendentes:
+            if data_visita not in novas:
+                # API sem dados para o dia: climatologia (cacheada para não repetir a chamada)
+                novas[data_visita] = self._obter_previsao_climatologica(municipio, data_visita)
+            previsoes[data_visita] = self._guardar_memoria(municipio, novas[data_visita])
+        
+        if gravar_disco:
+            weather_cache.gravar(municipio, fonte, {d: _previsao_para_dict(p) for d, p in novas.items()})
+        
+        return previsoes
+    
+    def _guardar_memoria(self, municipio: str, previsao: PrevisaoTempo) -> PrevisaoTempo:
+        self.cache_previsoes[f"{municipio}_{previsao.data.isoformat()}"] = {
+            'dados': previsao,
+            'timestamp': datetime.now()
+        }
+        return previsao
     
     def analisar_impacto_visita(self, municipio: str, data_visita: date,
                                hora_inicio: time, hora_fim: time,
-                               tipo_atividade: str = 'visita_tecnica') -> RecomendacaoClimatica:
-        """Analisar impacto climático em uma visita"""
+                               tipo_atividade: str = 'visita_tecnica',
+                               previsao: Optional[PrevisaoTempo] = None) -> RecomendacaoClimatica:
+        """Analisar impacto climático em uma visita (previsão pode vir pré-carregada)"""
         
         try:
             # Obter previsão
-            previsao = self.obter_previsao_dia(municipio, data_visita)
+            if previsao is None:
+                previsao = self.obter_previsao_dia(municipio, data_visita)
             
             if not previsao:
                 return self._gerar_recomendacao_padrao()
@@ -205,16 +313,13 @@ class WeatherService:
     def obter_previsao_semana(self, municipio: str, data_inicio: date) -> Dict[date, PrevisaoTempo]:
         """Obter previsão para uma semana"""
         
-        previsoes = {}
-        
-        for i in range(7):
-            data_atual = data_inicio + timedelta(days=i)
-            previsao = self.obter_previsao_dia(municipio, data_atual)
-            
-            if previsao:
-                previsoes[data_atual] = previsao
+        datas = [data_inicio + timedelta(days=i) for i in range(7)]
         
-        return previsoes
+        try:
+            return self.obter_previsoes_municipio(municipio, datas)
+        except Exception as e:
+            self.logger.error(f"❌ Erro ao obter previsão semanal para {municipio}: {str(e)}")
+            return {d: self._gerar_previsao_simulada(municipio, d) for d in datas}
     
     def analisar_semana_visitas(self, visitas_semana: List[Visita]) -> Dict[str, Any]:
         """Analisar impacto climático de uma semana de visitas"""
@@ -236,12 +341,26 @@ class WeatherService:
         
         scores_totais = []
         
+        # Uma busca em lote por município (no máximo uma chamada de API cada)
+        datas_por_municipio = defaultdict(set)
+        for visita in visitas_semana:
+            datas_por_municipio[visita.municipio].add(visita.data)
+        
+        previsoes_municipio = {}
+        for municipio, datas in datas_por_municipio.items():
+            try:
+                previsoes_municipio[municipio] = self.obter_previsoes_municipio(municipio, list(datas))
+            except Exception as e:
+                self.logger.error(f"❌ Erro ao obter previsões para {municipio}: {str(e)}")
+                previsoes_municipio[municipio] = {}
+        
         for visita in visitas_semana:
             recomendacao = self.analisar_impacto_visita(
                 visita.municipio,
                 visita.data,
                 visita.hora_inicio,
-                visita.hora_fim
+                visita.hora_fim,
+                previsao=previsoes_municipio[visita.municipio].get(visita.data)
             )
             
             # Contar por impacto
@@ -305,6 +424,11 @@ class WeatherService:
     def _obter_previsao_5_dias(self, lat: float, lon: float, municipio: str, data_alvo: date) -> Optional[PrevisaoTempo]:
         """Obter previsão de 5 dias via API"""
         
+        return self._obter_previsao_5_dias_lote(lat, lon, municipio).get(data_alvo)
+    
+    def _obter_previsao_5_dias_lote(self, lat: float, lon: float, municipio: str) -> Dict[date, PrevisaoTempo]:
+        """Uma chamada à previsão de 5 dias, consolidada em uma previsão por dia"""
+        
         try:
             url = self.base_urls['forecast']
             params = {
@@ -317,69 +441,45 @@ class WeatherService:
             
             response = requests.get(url, params=params, timeout=10)
             
-            if response.status_code == 200:
-                data = response.json()
-                
-                # Encontrar dados para a data específica
-                for item in data['list']:
-                    item_date = datetime.fromtimestamp(item['dt']).date()
-                    if item_date == data_alvo:
-                        return self._processar_dados_api_forecast(item, municipio, data_alvo)
-                
-                return None
-            else:
-                return None
+            if response.status_code != 200:
+                self.logger.warning(f"API de previsão retornou status {response.status_code}")
+                return {}
+            
+            data = response.json()
+            cidade = data.get('city', {})
+            
+            # Itens de 3 em 3 horas agrupados por dia
+            itens_por_dia = defaultdict(list)
+            for item in data['list']:
+                itens_por_dia[datetime.fromtimestamp(item['dt']).date()].append(item)
+            
+            previsoes = {}
+            for dia, itens in itens_por_dia.items():
+                # Condições do horário mais próximo do meio-dia; extremos do dia inteiro
+                base = min(itens, key=lambda i: abs(datetime.fromtimestamp(i['dt']).hour - 12))
+                previsao = self._processar_dados_api_forecast(base, municipio, dia, cidade)
+                previsao.temperatura_min = min(i['main']['temp_min'] for i in itens)
+                previsao.temperatura_max = max(i['main']['temp_max'] for i in itens)
+                chances = [i['pop'] for i in itens if 'pop' in i]
+                if chances:
+                    previsao.chance_chuva = round(max(chances) * 100)
+                previsoes[dia] = previsao
+            
+            return previsoes
                 
         except Exception as e:
             self.logger.error(f"Erro na API de previsão: {str(e)}")
-            return None
+            return {}
     
     def _obter_previsao_climatologica(self, municipio: str, data_visita: date) -> PrevisaoTempo:
         """Gerar previsão baseada em dados climatológicos históricos"""
         
-        # Dados climatológicos médios para Santa Catarina
-        mes = data_visita.month
-        
-        # Temperaturas médias por mês (aproximadas para SC)
-        temperaturas_medias = {
-            1: (20, 28), 2: (20, 28), 3: (19, 27), 4: (16, 24),
-            5: (13, 21), 6: (11, 19), 7: (11, 19), 8: (12, 20),
-            9: (14, 22), 10: (16, 24), 11: (18, 26), 12: (19, 27)
-        }
-        
-        # Chance de chuva por mês
-        chance_chuva_mes = {
-            1: 45, 2: 40, 3: 35, 4: 25, 5: 20, 6: 15,
-            7: 15, 8: 20, 9: 30, 10: 35, 11: 40, 12: 45
-        }
-        
-        temp_min, temp_max = temperaturas_medias.get(mes, (15, 25))
-        chance_chuva = chance_chuva_mes.get(mes, 30)
-        
-        # Determinar condição baseada na chance de chuva
-        if chance_chuva > 60:
-            condicao = CondicaoClimatica.CHUVA_MODERADA
-        elif chance_chuva > 40:
-            condicao = CondicaoClimatica.PARCIALMENTE_NUBLADO
-        else:
-            condicao = CondicaoClimatica.ENSOLARADO
-        
+        # Consulta à tabela mensal pré-calculada (CLIMATOLOGIA_MENSAL)
         return PrevisaoTempo(
             data=data_visita,
             municipio=municipio,
-            temperatura_min=temp_min,
-            temperatura_max=temp_max,
-            condicao=condicao,
-            chance_chuva=chance_chuva,
-            velocidade_vento=15.0,
-            umidade=70,
-            pressao=1013.25,
-            nascer_sol=time(6, 30),
-            por_sol=time(18, 30),
-            indice_uv=6,
-            visibilidade=10.0,
-            fonte_dados='climatologia_historica',
-            timestamp_atualizacao=datetime.now()
+            timestamp_atualizacao=datetime.now(),
+            **CLIMATOLOGIA_MENSAL[data_visita.month]
         )
     
     def _gerar_previsao_simulada(self, municipio: str, data_visita: date) -> PrevisaoTempo:
@@ -695,17 +795,19 @@ class WeatherService:
             velocidade_vento=data['wind']['speed'] * 3.6,  # m/s para km/h
             umidade=data['main']['humidity'],
             pressao=data['main']['pressure'],
-            nascer_sol=datetime.fromtimestamp(data['sys']['sunrise']).time(),
-            por_sol=datetime.fromtimestamp(data['sys']['sunset']).time(),
+            nascer_sol=datetime.fromtimestamp(data['sys']['sunrise']).time() if data.get('sys', {}).get('sunrise') else time(6, 30),
+            por_sol=datetime.fromtimestamp(data['sys']['sunset']).time() if data.get('sys', {}).get('sunset') else time(18, 30),
             indice_uv=data.get('uvi', 5),
             visibilidade=data.get('visibility', 10000) / 1000,  # metros para km
             fonte_dados='openweathermap',
             timestamp_atualizacao=datetime.now()
         )
     
-    def _processar_dados_api_forecast(self, data: Dict, municipio: str, data_visita: date) -> PrevisaoTempo:
+    def _processar_dados_api_forecast(self, data: Dict, municipio: str, data_visita: date,
+                                      cidade: Optional[Dict] = None) -> PrevisaoTempo:
         """Processar dados de previsão da API"""
         
-        # Similar ao _processar_dados_api mas para dados de forecast
-        # Implementação simplificada
-        return self._processar_dados_api(data, municipio, data_visita)
\ No newline at end of file
+        # Itens da previsão não trazem nascer/pôr do sol: vêm do bloco 'city'
+        cidade = cidade or {}
+        item = dict(data, sys={'sunrise': cidade.get('sunrise'), 'sunset': cidade.get('sunset')})
+        return self._processar_dados_api(item, municipio, data_visita)
\ No newline at end of file
@@ -0,0 +1,160 @@
+// Delta Sync - Sistema PNSB 2024
+// Mantém cópia local (IndexedDB) de visitas e entidades baixando apenas as alterações
+class DeltaSyncManager {
+    constructor() {
+        this.dbName = 'pnsb-offline';
+        this.dbVersion = 1;
+        this.stores = ['visitas', 'entidades_identificadas'];
+        this.db = null;
+        this.sincronizando = false;
+    }
+
+    async abrirBanco() {
+        if (this.db) return this.db;
+
+        this.db = await new Promise((resolve, reject) => {
+            const request = indexedDB.open(this.dbName, this.dbVersion);
+
+            request.onupgradeneeded = (event) => {
+                const db = event.target.result;
+                this.stores.forEach(store => {
+                    if (!db.objectStoreNames.contains(store)) {
+                        const objectStore = db.createObjectStore(store, { keyPath: 'id' });
+                        objectStore.createIndex('municipio', 'municipio', { unique: false });
+                    }
+                });
+                if (!db.objectStoreNames.contains('meta')) {
+                    db.createObjectStore('meta', { keyPath: 'chave' });
+                }
+            };
+
+            request.onsuccess = () => resolve(request.result);
+            request.onerror = () => reject(request.error);
+        });
+
+        return this.db;
+    }
+
+    async obterVersaoLocal() {
+        const db = await this.abrirBanco();
+        return new Promise((resolve, reject) => {
+            const request = db.transaction('meta', 'readonly').objectStore('meta').get('versao');
+            request.onsuccess = () => resolve(request.result ? request.result.valor : 0);
+            request.onerror = () => reject(request.error);
+        });
+    }
+
+    // Aplica um lote de linhas NDJSON numa única transação (atômico por lote).
+    // Com `limpar`, a cópia local é descartada na mesma transação
+    async aplicarLote(linhas, limpar = false) {
+        const db = await this.abrirBanco();
+        let trailer = null;
+
+        await new Promise((resolve, reject) => {
+            const tx = db.transaction([...this.stores, 'meta'], 'readwrite');
+
+            if (limpar) {
+                [...this.stores, 'meta'].forEach(store => tx.objectStore(store).clear());
+            }
+
+            for (const linha of linhas) {
+                if (linha.op === 'fim') {
+                    trailer = linha;
+                    continue;
+                }
+                if (!this.stores.includes(linha.tb)) continue;
+
+                const store = tx.objectStore(linha.tb);
+                if (linha.op === 'u') {
+                    // Registro completo: substitui a versão local
+                    store.put({ ...linha.d, row_version: linha.v });
+                } else if (linha.op === 'd') {
+                    store.delete(linha.id);
+                }
+            }
+
+            // Cursor avança junto com os dados, na mesma transação
+            if (trailer) {
+                tx.objectStore('meta').put({ chave: 'versao', valor: trailer.v });
+                tx.objectStore('meta').put({ chave: 'sincronizado_em', valor: new Date().toISOString() });
+            }
+
+            tx.oncomplete = () => resolve();
+            tx.onerror = () => reject(tx.error);
+            tx.onabort = () => reject(tx.error);
+        });
+
+        return trailer;
+    }
+
+    async sincronizar() {
+        if (this.sincronizando || !navigator.onLine || !('indexedDB' in window)) {
+            return { sucesso: false, aplicados: 0 };
+        }
+
+        this.sincronizando = true;
+        let aplicados = 0;
+
+        try {
+            let versao = await this.obterVersaoLocal();
+            let mais = true;
+
+            while (mais) {
+                const response = await fetch(`/api/sync?since=${versao}`, {
+                    headers: { 'Accept': 'application/x-ndjson' },
+                    cache: 'no-store'
+                });
+
+                // 204: nada novo desde a versão local
+                if (response.status === 204) break;
+                if (!response.ok) throw new Error(`HTTP ${response.status}`);
+
+                const texto = await response.text();
+                const linhas = texto.split('\n').filter(Boolean).map(l => JSON.parse(l));
+                // Servidor atrás do cursor local (banco restaurado): recomeçar do zero
+                const reiniciar = response.headers.get('X-Sync-Reset') === '1';
+                const trailer = await this.aplicarLote(linhas, reiniciar);
+
+                // Sem trailer o lote veio truncado: não avançar o cursor
+                if (!trailer) throw new Error('Resposta de sincronização incompleta');
+
+                aplicados += trailer.n;
+                versao = trailer.v;
+                mais = trailer.mais;
+            }
+
+            console.log(`🔄 Delta sync concluído: ${aplicados} alterações (versão ${versao})`);
+            return { sucesso: true, aplicados, versao };
+
+        } catch (error) {
+            console.error('Erro no delta sync:', error);
+            return { sucesso: false, aplicados, erro: error.message };
+        } finally {
+            this.sincronizando = false;
+        }
+    }
+
+    async obterRegistros(store, municipio = null) {
+        const db = await this.abrirBanco();
+        return new Promise((resolve, reject) => {
+            const objectStore = db.transaction(store, 'readonly').objectStore(store);
+            const request = municipio
+                ? objectStore.index('municipio').getAll(municipio)
+                : objectStore.getAll();
+            request.onsuccess = () => resolve(request.result);
+            request.onerror = () => reject(request.error);
+        });
+    }
+
+    async resetar() {
+        const db = await this.abrirBanco();
+        await new Promise((resolve, reject) => {
+            const tx = db.transaction([...this.stores, 'meta'], 'readwrite');
+            [...this.stores, 'meta'].forEach(store => tx.objectStore(store).clear());
+            tx.oncomplete = () => resolve();
+            tx.onerror = () => reject(tx.error);
+        });
+    }
+}
+
+window.deltaSync = new DeltaSyncManager();
@@ -36,6 +36,11 @@ class PWAManager {
         // Configurar push notifications
         await this.setupPushNotifications();
         
+        // Atualizar cópia offline (delta sync)
+        if (window.deltaSync) {
+            window.deltaSync.sincronizar();
+        }
+        
         console.log('PWA Manager initialized successfully');
     }
 
@@ -443,6 +448,11 @@ class PWAManager {
         // Sincronizar dados salvos offline
         this.registerBackgroundSync('background-sync-visitas');
         this.registerBackgroundSync('background-sync-checklist');
+
+        // Baixar apenas as alterações desde a última sincronização
+        if (window.deltaSync) {
+            window.deltaSync.sincronizar();
+        }
     }
 
     adjustLayoutForOrientation() {
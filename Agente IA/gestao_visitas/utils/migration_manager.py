@@ -5,10 +5,32 @@ Garante que não haja perda de dados durante mudanças de schema
 
 import os
 import json
+import gzip
+import base64
 import shutil
+import sqlite3
 from datetime import datetime
 from sqlalchemy import create_engine, text, inspect
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Iterator, Tuple
+
+# Formato de exportação em streaming (NDJSON compactado com gzip)
+FORMATO_NDJSON = 'pnsb-ndjson'
+VERSAO_FORMATO_NDJSON = 1
+TAMANHO_LOTE = 5000
+
+def _valor_json(valor):
+    """Valores que o JSON não representa diretamente (BLOBs)"""
+    if isinstance(valor, (bytes, bytearray, memoryview)):
+        return {'$b64': base64.b64encode(bytes(valor)).decode('ascii')}
+    raise TypeError(f"Tipo não serializável: {type(valor).__name__}")
+
+def _valor_sqlite(valor):
+    if isinstance(valor, dict) and '$b64' in valor:
+        return base64.b64decode(valor['$b64'])
+    return valor
+
+def _quote(nome: str) -> str:
+    return '"' + nome.replace('"', '""') + '"'
 
 class MigrationManager:
     """Gerenciador de migrações e backups do banco de dados"""
@@ -121,7 +143,10 @@ class MigrationManager:
             return ""
     
     def import_data_from_json(self, json_path: str) -> bool:
-        """Importa dados de um arquivo JSON"""
+        """Importa dados de um arquivo JSON (exportações .ndjson.gz usam o modo streaming)"""
+        
+        if json_path.endswith('.ndjson.gz'):
+            return self.import_data_stream(json_path)
         
         try:
             with open(json_path, 'r', encoding='utf-8') as f:
@@ -130,41 +155,233 @@ class MigrationManager:
             print(f"📥 Importando dados de: {os.path.basename(json_path)}")
             print(f"📅 Exportado em: {data_export['export_info']['created_at']}")
             
-            with self.engine.connect() as conn:
-                trans = conn.begin()
+            tabelas = [t['name'] for t in data_export['export_info']['tables']]
+            secoes = (
+                (table_name, table_data['columns'],
+                 ([row[col] for col in table_data['columns']] for row in table_data['rows']))
+                for table_name, table_data in data_export['data'].items()
+            )
+            return self._carregar_secoes(tabelas, secoes)
+                    
+        except Exception as e:
+            print(f"❌ Erro ao ler arquivo JSON: {e}")
+            return False
+    
+    def export_data_stream(self) -> str:
+        """
+        Exporta todos os dados em NDJSON compactado (backup lógico em streaming).
+        
+        Linha 1: cabeçalho com versão do schema e contagem por tabela. Depois,
+        por tabela: {"table", "columns"}, uma linha por registro (lista de
+        valores na ordem das colunas) e {"end", "rows"}. Os registros são lidos
+        em lotes de uma transação de leitura, então a memória não cresce com os dados.
+        """
+        
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        export_filename = f"data_export_{timestamp}.ndjson.gz"
+        export_path = os.path.join(self.backup_dir, export_filename)
+        temp_path = export_path + '.tmp'
+        
+        try:
+            schema_version = self._get_schema_version()
+            conn = sqlite3.connect(self.db_path, isolation_level=None)
+            try:
+                # Transação de leitura: contagens e linhas do mesmo snapshot
+                conn.execute('BEGIN')
+                tabelas = [
+                    linha[0] for linha in conn.execute(
+                        "SELECT name FROM sqlite_master WHERE type = 'table' "
+                        "AND name NOT LIKE 'sqlite_%' ORDER BY name"
+                    )
+                ]
+                contagens = {
+                    t: conn.execute(f"SELECT COUNT(*) FROM {_quote(t)}").fetchone()[0] for t in tabelas
+                }
                 
-                try:
-                    # Limpar tabelas existentes
-                    for table_info in data_export['export_info']['tables']:
-                        table_name = table_info['name']
-                        conn.execute(text(f"DELETE FROM {table_name}"))
+                cabecalho = {
+                    'format': FORMATO_NDJSON,
+                    'format_version': VERSAO_FORMATO_NDJSON,
+                    'created_at': datetime.now().isoformat(),
+                    'schema_version': schema_version,
+                    'tables': [{'name': t, 'row_count': contagens[t]} for t in tabelas]
+                }
+                
+                with gzip.open(temp_path, 'wt', encoding='utf-8', compresslevel=6) as f:
+                    f.write(json.dumps(cabecalho, ensure_ascii=False) + '\n')
                     
-                    # Importar dados
-                    for table_name, table_data in data_export['data'].items():
-                        if table_data['count'] == 0:
-                            continue
-                            
-                        columns = table_data['columns']
-                        placeholders = ', '.join(['?' for _ in columns])
+                    for table_name in tabelas:
+                        cursor = conn.execute(f"SELECT * FROM {_quote(table_name)}")
+                        columns = [c[0] for c in cursor.description]
+                        f.write(json.dumps({'table': table_name, 'columns': columns}, ensure_ascii=False) + '\n')
                         
-                        insert_sql = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders})"
+                        total = 0
+                        while True:
+                            lote = cursor.fetchmany(TAMANHO_LOTE)
+                            if not lote:
+                                break
+                            f.write(''.join(
+                                json.dumps(row, ensure_ascii=False, default=_valor_json) + '\n' for row in lote
+                            ))
+                            total += len(lote)
                         
-                        for row in table_data['rows']:
-                            values = [row[col] for col in columns]
-                            conn.execute(text(insert_sql), values)
+                        f.write(json.dumps({'end': table_name, 'rows': total}) + '\n')
+                
+                conn.execute('COMMIT')
+            finally:
+                conn.close()
+            
+            os.replace(temp_path, export_path)
+            print(f"✅ Dados exportados para: {export_filename}")
+            print(f"📊 Registros: {sum(contagens.values())} em {len(tabelas)} tabelas")
+            return export_path
+            
+        except Exception as e:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            print(f"❌ Erro ao exportar dados: {e}")
+            return ""
+    
+    def import_data_stream(self, export_path: str) -> bool:
+        """Importa uma exportação .ndjson.gz lendo uma tabela/lote por vez"""
+        
+        try:
+            with gzip.open(export_path, 'rt', encoding='utf-8') as f:
+                cabecalho = json.loads(f.readline())
+                if cabecalho.get('format') != FORMATO_NDJSON:
+                    print(f"❌ Formato desconhecido: {cabecalho.get('format')}")
+                    return False
+                if cabecalho.get('format_version', 0) > VERSAO_FORMATO_NDJSON:
+                    print(f"❌ Versão do formato não suportada: {cabecalho['format_version']}")
+                    return False
+                
+                print(f"📥 Importando dados de: {os.path.basename(export_path)}")
+                print(f"📅 Exportado em: {cabecalho['created_at']}")
+                if cabecalho.get('schema_version') != self._get_schema_version():
+                    print("⚠️ Schema atual difere do exportado; colunas inexistentes serão ignoradas")
+                
+                esperados = {t['name']: t['row_count'] for t in cabecalho['tables']}
+                return self._carregar_secoes(list(esperados), self._ler_secoes_ndjson(f), esperados)
+                
+        except Exception as e:
+            print(f"❌ Erro ao ler exportação: {e}")
+            return False
+    
+    def _ler_secoes_ndjson(self, f) -> Iterator[Tuple[str, List[str], Iterator[list]]]:
+        """(tabela, colunas, linhas) de cada seção; as linhas são lidas sob demanda"""
+        
+        for linha in f:
+            marcador = json.loads(linha)
+            table_name, columns = marcador['table'], marcador['columns']
+            fim = {}
+            
+            def registros():
+                for linha_registro in f:
+                    valores = json.loads(linha_registro)
+                    if isinstance(valores, dict):
+                        fim.update(valores)
+                        return
+                    yield [_valor_sqlite(v) for v in valores]
+                raise ValueError(f"Exportação truncada na tabela {table_name}")
+            
+            yield table_name, columns, registros()
+            if fim.get('end') != table_name:
+                raise ValueError(f"Seção da tabela {table_name} não foi lida até o fim")
+    
+    def _carregar_secoes(self, tabelas: List[str], secoes, esperados: Dict[str, int] = None) -> bool:
+        """
+        Substitui o conteúdo das tabelas numa única transação: índices
+        secundários removidos e recriados no fim, inserção com executemany em
+        lotes e chaves estrangeiras verificadas uma vez, após a carga.
+        """
+        
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        fk_anterior = conn.execute('PRAGMA foreign_keys').fetchone()[0]
+        inicio = datetime.now()
+        try:
+            # Só pode ser alterado fora de transação
+            conn.execute('PRAGMA foreign_keys = OFF')
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                existentes = {
+                    linha[0] for linha in conn.execute(
+                        "SELECT name FROM sqlite_master WHERE type = 'table'"
+                    )
+                }
+                tabelas = [t for t in tabelas if t in existentes]
+                
+                indices = []
+                for table_name in tabelas:
+                    indices += conn.execute(
+                        "SELECT name, sql FROM sqlite_master WHERE type = 'index' "
+                        "AND tbl_name = ? AND sql IS NOT NULL", (table_name,)
+                    ).fetchall()
+                for nome, _ in indices:
+                    conn.execute(f"DROP INDEX {_quote(nome)}")
+                
+                # Limpar tabelas existentes
+                for table_name in tabelas:
+                    conn.execute(f"DELETE FROM {_quote(table_name)}")
+                
+                totais = {}
+                for table_name, columns, registros in secoes:
+                    if table_name not in existentes:
+                        for _ in registros:
+                            pass
+                        print(f"⚠️ Tabela {table_name} não existe; ignorada")
+                        continue
                     
-                    trans.commit()
-                    print("✅ Dados importados com sucesso")
-                    return True
+                    # Colunas removidas do schema desde a exportação são descartadas
+                    atuais = {c[1] for c in conn.execute(f"PRAGMA table_info({_quote(table_name)})")}
+                    posicoes = [i for i, c in enumerate(columns) if c in atuais]
+                    nomes = ', '.join(_quote(columns[i]) for i in posicoes)
+                    insert_sql = (
+                        f"INSERT INTO {_quote(table_name)} ({nomes}) "
+                        f"VALUES ({', '.join('?' * len(posicoes))})"
+                    )
+                    if len(posicoes) == len(columns):
+                        valores = registros
+                    else:
+                        valores = ([r[i] for i in posicoes] for r in registros)
                     
-                except Exception as e:
-                    trans.rollback()
-                    print(f"❌ Erro na importação: {e}")
-                    return False
+                    total, lote = 0, []
+                    for valor in valores:
+                        lote.append(valor)
+                        if len(lote) >= TAMANHO_LOTE:
+                            conn.executemany(insert_sql, lote)
+                            total += len(lote)
+                            lote = []
+                    if lote:
+                        conn.executemany(insert_sql, lote)
+                        total += len(lote)
+                    totais[table_name] = total
                     
+                    if esperados is not None and esperados.get(table_name) != total:
+                        raise ValueError(
+                            f"Tabela {table_name}: {total} registros lidos, {esperados.get(table_name)} esperados"
+                        )
+                
+                for _, sql in indices:
+                    conn.execute(sql)
+                
+                violacoes = conn.execute('PRAGMA foreign_key_check').fetchall()
+                if violacoes:
+                    print(f"⚠️ {len(violacoes)} referências de chave estrangeira sem registro correspondente")
+                
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            
+            duracao = (datetime.now() - inicio).total_seconds()
+            print(f"✅ Dados importados com sucesso: {sum(totais.values())} registros em {duracao:.1f}s")
+            return True
+            
         except Exception as e:
-            print(f"❌ Erro ao ler arquivo JSON: {e}")
+            print(f"❌ Erro na importação: {e}")
             return False
+        finally:
+            conn.execute(f'PRAGMA foreign_keys = {"ON" if fk_anterior else "OFF"}')
+            conn.close()
     
     def list_backups(self) -> List[Dict[str, Any]]:
         """Lista todos os backups disponíveis"""
@@ -322,8 +539,8 @@ if __name__ == "__main__":
     # Criar backup do estado atual
     backup_path = manager.create_backup("Backup inicial - sistema de migração implementado")
     
-    # Exportar dados para JSON
-    json_path = manager.export_data_to_json()
+    # Exportar dados (NDJSON compactado, em streaming)
+    json_path = manager.export_data_stream()
     
     # Listar backups
     list_available_backups()
@@ -10,7 +10,11 @@ import base64
 from datetime import datetime, timedelta
 from werkzeug.security import generate_password_hash, check_password_hash
 from typing import Optional, Dict, Any
+from collections import OrderedDict
+import math
 import re
+import threading
+import time
 
 class SecurityManager:
     """Gerenciador de segurança para o sistema PNSB"""
@@ -170,58 +174,122 @@ class InputValidator:
         ]
         return status in status_validos if status else False
 
+class GCRALimiter:
+    """
+    Limitador GCRA (Generic Cell Rate Algorithm) com memória O(1) por cliente.
+
+    Guarda apenas um float por chave (TAT - theoretical arrival time) num mapa
+    LRU limitado. Equivale a um token bucket com capacidade `requests` que
+    recarrega uma ficha a cada `window / requests` segundos. Com backend
+    Redis o TAT autoritativo fica no Redis; o mapa local guarda o último TAT
+    devolvido por ele, usado por `remaining` e `retry_after`.
+    """
+
+    def __init__(self, requests: int, window: float, max_keys: int = 10000,
+                 backend=None, namespace: str = 'default'):
+        self.requests = requests
+        self.window = float(window)
+        self.emission_interval = self.window / requests
+        self.max_keys = max_keys
+        self.backend = backend  # RedisCache opcional (compartilhado entre processos)
+        self.namespace = namespace
+        self._tats = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_tat(self, key: str, now: float) -> float:
+        tat = self._tats.get(key)
+        return now if tat is None or tat < now else tat
+
+    def _store_tat(self, key: str, tat: float):
+        tats = self._tats
+        tats[key] = tat
+        tats.move_to_end(key)
+        if len(tats) > self.max_keys:
+            tats.popitem(last=False)
+
+    def allow(self, key: str, now: float = None) -> bool:
+        """Consome uma ficha se disponível; retorna False se o limite estourou"""
+        now = time.time() if now is None else now
+
+        if self.backend is not None:
+            result = self.backend.gcra_allow(
+                f"ratelimit:{self.namespace}:{key}", self.emission_interval, self.window, now
+            )
+            if result is not None:
+                allowed, tat = result
+                with self._lock:
+                    self._store_tat(key, tat)
+                return allowed
+
+        with self._lock:
+            new_tat = self._get_tat(key, now) + self.emission_interval
+            if new_tat - now > self.window:
+                return False
+            self._store_tat(key, new_tat)
+            return True
+
+    def remaining(self, key: str, now: float = None) -> int:
+        """Fichas ainda disponíveis para a chave"""
+        now = time.time() if now is None else now
+        tat = self._tats.get(key)
+        if tat is None or tat <= now:
+            return self.requests
+        return max(0, int((self.window - (tat - now)) / self.emission_interval))
+
+    def retry_after(self, key: str, now: float = None) -> float:
+        """Segundos até a próxima ficha ficar disponível (0 se já disponível)"""
+        now = time.time() if now is None else now
+        tat = self._tats.get(key)
+        if tat is None:
+            return 0.0
+        return max(0.0, tat + self.emission_interval - self.window - now)
+
+    def reset(self, key: str = None):
+        with self._lock:
+            if key is None:
+                self._tats.clear()
+            else:
+                self._tats.pop(key, None)
+
+
 class RateLimitEnhanced:
-    """Rate limiter avançado com diferentes níveis"""
+    """Rate limiter avançado com diferentes níveis (GCRA, O(1) por cliente)"""
     
-    def __init__(self):
+    def __init__(self, max_keys: int = 10000, backend=None):
         self.limits = {
             'api_general': {'requests': 100, 'window': 3600},  # 100/hora
             'api_critical': {'requests': 20, 'window': 3600},  # 20/hora para operações críticas
             'login_attempts': {'requests': 5, 'window': 900},  # 5 tentativas/15min
             'file_upload': {'requests': 10, 'window': 3600}    # 10 uploads/hora
         }
-        self.counters = {}
+        self.limiters = {
+            endpoint_type: GCRALimiter(
+                config['requests'], config['window'], max_keys=max_keys,
+                backend=backend, namespace=endpoint_type
+            )
+            for endpoint_type, config in self.limits.items()
+        }
     
     def is_allowed(self, client_ip: str, endpoint_type: str = 'api_general') -> bool:
         """Verifica se requisição é permitida"""
-        if endpoint_type not in self.limits:
+        limiter = self.limiters.get(endpoint_type)
+        if limiter is None:
             return True
-        
-        limit_config = self.limits[endpoint_type]
-        key = f"{client_ip}:{endpoint_type}"
-        
-        now = datetime.now()
-        window_start = now - timedelta(seconds=limit_config['window'])
-        
-        # Limpar registros antigos
-        if key in self.counters:
-            self.counters[key] = [
-                timestamp for timestamp in self.counters[key] 
-                if timestamp > window_start
-            ]
-        else:
-            self.counters[key] = []
-        
-        # Verificar limite
-        if len(self.counters[key]) >= limit_config['requests']:
-            return False
-        
-        # Adicionar nova requisição
-        self.counters[key].append(now)
-        return True
+        return limiter.allow(client_ip)
     
     def get_remaining_requests(self, client_ip: str, endpoint_type: str = 'api_general') -> int:
         """Retorna número de requisições restantes"""
-        if endpoint_type not in self.limits:
+        limiter = self.limiters.get(endpoint_type)
+        if limiter is None:
             return 999
-        
-        limit_config = self.limits[endpoint_type]
-        key = f"{client_ip}:{endpoint_type}"
-        
-        if key not in self.counters:
-            return limit_config['requests']
-        
-        return max(0, limit_config['requests'] - len(self.counters[key]))
+        return limiter.remaining(client_ip)
+    
+    def get_retry_after(self, client_ip: str, endpoint_type: str = 'api_general') -> int:
+        """Retorna segundos até nova requisição ser permitida"""
+        limiter = self.limiters.get(endpoint_type)
+        if limiter is None:
+            return 0
+        return int(math.ceil(limiter.retry_after(client_ip)))
 
 # Instâncias globais
 security_manager = SecurityManager()
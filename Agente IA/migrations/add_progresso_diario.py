@@ -0,0 +1,44 @@
+"""
+Migração do ledger diário de progresso
+Cria a tabela progresso_diario e registra o retrato atual de todos os municípios
+"""
+
+from datetime import date
+
+from gestao_visitas.db import db
+from gestao_visitas.models.progresso_diario import ProgressoDiario
+from sqlalchemy import inspect
+import logging
+
+logger = logging.getLogger(__name__)
+
+def migrate_progresso_diario():
+    """
+    Garante a tabela do ledger e uma linha de hoje por município, para que
+    as métricas tenham um ponto de partida antes da primeira alteração
+    """
+    try:
+        inspector = inspect(db.engine)
+
+        if not inspector.has_table(ProgressoDiario.__tablename__):
+            db.create_all()
+            logger.info("Tabela 'progresso_diario' criada com sucesso")
+
+        existe_hoje = db.session.query(ProgressoDiario.id).filter(
+            ProgressoDiario.dia == date.today()
+        ).first()
+        if not existe_hoje:
+            registrados = ProgressoDiario.registrar(db.session.connection())
+            logger.info(f"Ledger de progresso: {registrados} municípios registrados para hoje")
+
+        db.session.commit()
+        return True
+
+    except Exception as e:
+        logger.error(f"Erro na migração do ledger de progresso: {str(e)}")
+        db.session.rollback()
+        return False
+
+if __name__ == '__main__':
+    # Executar migração
+    migrate_progresso_diario()
@@ -0,0 +1,67 @@
+"""
+Migração para sincronização incremental (delta sync)
+Adiciona row_version em visitas/entidades_identificadas e popula o change-log
+"""
+
+from gestao_visitas.db import db
+from gestao_visitas.models.sync import SyncChangeLog, MODELOS_VERSIONADOS
+from sqlalchemy import inspect, text
+import logging
+
+logger = logging.getLogger(__name__)
+
+def migrate_sync_row_version():
+    """
+    Garante a coluna row_version e registra no change-log os registros
+    existentes, para que a primeira sincronização (since=0) traga tudo
+    """
+    try:
+        inspector = inspect(db.engine)
+
+        # Criar tabela sync_changelog se não existir
+        if not inspector.has_table(SyncChangeLog.__tablename__):
+            db.create_all()
+            logger.info("Tabela 'sync_changelog' criada com sucesso")
+
+        for tabela in MODELOS_VERSIONADOS:
+            colunas = {coluna['name'] for coluna in inspector.get_columns(tabela)}
+            if 'row_version' not in colunas:
+                db.session.execute(text(
+                    f"ALTER TABLE {tabela} ADD COLUMN row_version INTEGER NOT NULL DEFAULT 0"
+                ))
+                db.session.execute(text(
+                    f"CREATE INDEX IF NOT EXISTS ix_{tabela}_row_version ON {tabela} (row_version)"
+                ))
+                logger.info(f"Coluna 'row_version' adicionada em '{tabela}'")
+
+            # Backfill: registros ainda sem versão entram no change-log
+            db.session.execute(text(f"""
+                INSERT INTO sync_changelog (tabela, registro_id, operacao, alterado_em)
+                SELECT '{tabela}', id, 'upsert', CURRENT_TIMESTAMP FROM {tabela}
+                WHERE row_version = 0 AND id NOT IN (
+                    SELECT registro_id FROM sync_changelog WHERE tabela = '{tabela}'
+                )
+                ORDER BY id
+            """))
+            db.session.execute(text(f"""
+                UPDATE {tabela} SET row_version = (
+                    SELECT versao FROM sync_changelog
+                    WHERE sync_changelog.tabela = '{tabela}'
+                      AND sync_changelog.registro_id = {tabela}.id
+                )
+                WHERE row_version = 0 AND id IN (
+                    SELECT registro_id FROM sync_changelog WHERE tabela = '{tabela}'
+                )
+            """))
+
+        db.session.commit()
+        return True
+
+    except Exception as e:
+        logger.error(f"Erro na migração de sincronização incremental: {str(e)}")
+        db.session.rollback()
+        return False
+
+if __name__ == '__main__':
+    # Executar migração
+    migrate_sync_row_version()
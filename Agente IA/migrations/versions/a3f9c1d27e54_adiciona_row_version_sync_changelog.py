@@ -0,0 +1,52 @@
+"""Adiciona row_version e change-log para sincronização incremental
+
+Revision ID: a3f9c1d27e54
+Revises: 2cdecf79399c
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3f9c1d27e54'
+down_revision = '2cdecf79399c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # ### Change-log com versão monotônica (AUTOINCREMENT não reutiliza ids) ###
+    op.create_table(
+        'sync_changelog',
+        sa.Column('versao', sa.Integer(), nullable=False),
+        sa.Column('tabela', sa.String(length=50), nullable=False),
+        sa.Column('registro_id', sa.Integer(), nullable=False),
+        sa.Column('operacao', sa.String(length=10), nullable=False),
+        sa.Column('alterado_em', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('versao'),
+        sa.UniqueConstraint('tabela', 'registro_id', name='uq_sync_changelog_registro'),
+        sqlite_autoincrement=True
+    )
+
+    # ### Adicionar row_version aos modelos versionados ###
+    with op.batch_alter_table('visitas', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('row_version', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.create_index('ix_visitas_row_version', ['row_version'])
+
+    with op.batch_alter_table('entidades_identificadas', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('row_version', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.create_index('ix_entidades_identificadas_row_version', ['row_version'])
+
+
+def downgrade():
+    with op.batch_alter_table('entidades_identificadas', schema=None) as batch_op:
+        batch_op.drop_index('ix_entidades_identificadas_row_version')
+        batch_op.drop_column('row_version')
+
+    with op.batch_alter_table('visitas', schema=None) as batch_op:
+        batch_op.drop_index('ix_visitas_row_version')
+        batch_op.drop_column('row_version')
+
+    op.drop_table('sync_changelog')
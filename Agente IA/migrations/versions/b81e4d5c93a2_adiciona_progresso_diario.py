@@ -0,0 +1,44 @@
+"""Adiciona ledger diário de progresso por município
+
+Revision ID: b81e4d5c93a2
+Revises: a3f9c1d27e54
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b81e4d5c93a2'
+down_revision = 'a3f9c1d27e54'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # ### Contadores acumulados por (dia, município) ###
+    op.create_table(
+        'progresso_diario',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('dia', sa.Date(), nullable=False),
+        sa.Column('municipio', sa.String(length=100), nullable=False),
+        sa.Column('visitas_finalizadas', sa.Integer(), nullable=False),
+        sa.Column('p1p2_concluidas', sa.Integer(), nullable=False),
+        sa.Column('questionarios_concluidos', sa.Integer(), nullable=False),
+        sa.Column('total_visitas', sa.Integer(), nullable=False),
+        sa.Column('total_p1p2', sa.Integer(), nullable=False),
+        sa.Column('total_questionarios', sa.Integer(), nullable=False),
+        sa.Column('atualizado_em', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('dia', 'municipio', name='uq_progresso_diario_dia_municipio')
+    )
+    with op.batch_alter_table('progresso_diario', schema=None) as batch_op:
+        batch_op.create_index('ix_progresso_diario_dia', ['dia'])
+
+
+def downgrade():
+    with op.batch_alter_table('progresso_diario', schema=None) as batch_op:
+        batch_op.drop_index('ix_progresso_diario_dia')
+
+    op.drop_table('progresso_diario')
@@ -86,6 +86,11 @@ self.addEventListener('fetch', event => {
         return;
     }
 
+    // Delta sync: nunca servir do cache (o cursor local controla a consistência)
+    if (url.pathname.startsWith('/api/sync')) {
+        return;
+    }
+
     // Network First para APIs
     if (isApiRequest(url)) {
         event.respondWith(networkFirst(request));
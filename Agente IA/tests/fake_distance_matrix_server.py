@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SERVIDOR FALSO DA DISTANCE MATRIX API - PNSB 2024
+================================================
+
+Servidor HTTP local que responde no formato da Distance Matrix API, para
+testes e benchmarks do DistanceMatrixTiler sem gastar quota do Google.
+
+- Distâncias: haversine × 1,3 (fator de sinuosidade das estradas)
+- Durações: 40 km/h; com trânsito, +30% entre 7h-9h e 17h-19h
+- Aplica os limites reais (25 origens, 25 destinos, 100 elementos)
+- Pode simular latência e falhas transitórias (HTTP 500 / OVER_QUERY_LIMIT)
+
+Uso em benchmark:
+    python tests/fake_distance_matrix_server.py --porta 8765 --latencia 0.2
+    DISTANCE_MATRIX_URL=http://127.0.0.1:8765/maps/api/distancematrix/json ...
+"""
+
+import argparse
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+CAMINHO = '/maps/api/distancematrix/json'
+
+
+def _haversine_metros(origem, destino):
+    lat1, lng1, lat2, lng2 = map(math.radians, (*origem, *destino))
+    a = (math.sin((lat2 - lat1) / 2) ** 2 +
+         math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2)
+    return 6371000 * 2 * math.asin(math.sqrt(a))
+
+
+def _coordenadas(texto):
+    return [tuple(float(v) for v in par.split(',')) for par in texto.split('|') if par]
+
+
+class FakeDistanceMatrixServer(ThreadingHTTPServer):
+    """Servidor com contadores e falhas programáveis"""
+
+    daemon_threads = True
+
+    def __init__(self, porta=0, latencia=0.0, falhas_iniciais=0, status_falha='OVER_QUERY_LIMIT'):
+        super().__init__(('127.0.0.1', porta), _Handler)
+        self.latencia = latencia
+        self.falhas_restantes = falhas_iniciais
+        self.status_falha = status_falha
+        self.requisicoes = 0
+        self.elementos = 0
+        self.max_simultaneas = 0
+        self._simultaneas = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}{CAMINHO}"
+
+    def responder(self, params):
+        with self._lock:
+            self.requisicoes += 1
+            self._simultaneas += 1
+            self.max_simultaneas = max(self.max_simultaneas, self._simultaneas)
+            falhar = self.falhas_restantes > 0
+            if falhar:
+                self.falhas_restantes -= 1
+        try:
+            if self.latencia:
+                time.sleep(self.latencia)
+            if falhar:
+                if self.status_falha == 'HTTP_500':
+                    return 500, {'error': 'erro simulado'}
+                return 200, {'status': self.status_falha, 'rows': []}
+            return 200, self._matriz(params)
+        finally:
+            with self._lock:
+                self._simultaneas -= 1
+
+    def _matriz(self, params):
+        origens = _coordenadas(params.get('origins', [''])[0])
+        destinos = _coordenadas(params.get('destinations', [''])[0])
+        if not origens or not destinos:
+            return {'status': 'INVALID_REQUEST', 'rows': []}
+        if len(origens) > 25 or len(destinos) > 25:
+            return {'status': 'MAX_DIMENSIONS_EXCEEDED', 'rows': []}
+        if len(origens) * len(destinos) > 100:
+            return {'status': 'MAX_ELEMENTS_EXCEEDED', 'rows': []}
+
+        partida = params.get('departure_time', [None])[0]
+        hora = datetime.fromtimestamp(int(partida)).hour if partida else 12
+        fator_transito = 1.3 if hora in (7, 8, 17, 18) else 1.0
+
+        with self._lock:
+            self.elementos += len(origens) * len(destinos)
+
+        linhas = []
+        for origem in origens:
+            elementos = []
+            for destino in destinos:
+                metros = round(_haversine_metros(origem, destino) * 1.3)
+                segundos = round(metros / (40 / 3.6))
+                elementos.append({
+                    'status': 'OK',
+                    'distance': {'value': metros, 'text': f"{metros / 1000:.1f} km"},
+                    'duration': {'value': segundos, 'text': f"{segundos // 60} min"},
+                    'duration_in_traffic': {
+                        'value': round(segundos * fator_transito),
+                        'text': f"{round(segundos * fator_transito) // 60} min"
+                    }
+                })
+            linhas.append({'elements': elementos})
+
+        return {
+            'status': 'OK',
+            'origin_addresses': [f"{lat},{lng}" for lat, lng in origens],
+            'destination_addresses': [f"{lat},{lng}" for lat, lng in destinos],
+            'rows': linhas
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != CAMINHO:
+            self.send_error(404)
+            return
+        status_http, corpo = self.server.responder(parse_qs(url.query))
+        dados = json.dumps(corpo).encode()
+        self.send_response(status_http)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def servidor_fake(**opcoes):
+    """Sobe o servidor numa thread e o encerra ao sair do bloco"""
+    servidor = FakeDistanceMatrixServer(**opcoes)
+    thread = threading.Thread(target=servidor.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield servidor
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Distance Matrix API falsa para testes')
+    parser.add_argument('--porta', type=int, default=8765)
+    parser.add_argument('--latencia', type=float, default=0.0, help='segundos por requisição')
+    args = parser.parse_args()
+
+    servidor = FakeDistanceMatrixServer(porta=args.porta, latencia=args.latencia)
+    print(f"🗺️ Distance Matrix falsa em {servidor.url}")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n📊 {servidor.requisicoes} requisições, {servidor.elementos} elementos")
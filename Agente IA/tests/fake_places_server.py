@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SERVIDOR FALSO DA GOOGLE PLACES API - PNSB 2024
+==============================================
+
+Servidor HTTP local que responde no formato da Places API (busca textual e
+detalhes), para testes e benchmarks do PlacesCache sem gastar quota do Google.
+
+- Busca: place_id determinístico por consulta; "inexistente" na consulta
+  devolve ZERO_RESULTS
+- Detalhes: horários (weekday_text) no idioma do parâmetro language
+  (pt-BR ou inglês, o padrão da API); place_id desconhecido devolve NOT_FOUND
+- Conta requisições por endpoint e por idioma (coalescência, cache negativo)
+- Pode simular latência e falhas transitórias (HTTP 500 / OVER_QUERY_LIMIT)
+
+Uso em benchmark:
+    python tests/fake_places_server.py --porta 8766 --latencia 0.2
+    GOOGLE_PLACES_URL=http://127.0.0.1:8766/maps/api/place ...
+"""
+
+import argparse
+import hashlib
+import json
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+CAMINHO = '/maps/api/place'
+
+DIAS = {
+    'pt-BR': ['segunda-feira', 'terça-feira', 'quarta-feira', 'quinta-feira',
+              'sexta-feira', 'sábado', 'domingo'],
+    'en': ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'],
+}
+FECHADO = {'pt-BR': 'Fechado', 'en': 'Closed'}
+
+
+def _place_id(consulta):
+    return 'fake_' + hashlib.sha1(consulta.strip().lower().encode('utf-8')).hexdigest()[:16]
+
+
+class FakePlacesServer(ThreadingHTTPServer):
+    """Servidor com contadores e falhas programáveis"""
+
+    daemon_threads = True
+
+    def __init__(self, porta=0, latencia=0.0, falhas_iniciais=0, status_falha='OVER_QUERY_LIMIT'):
+        super().__init__(('127.0.0.1', porta), _Handler)
+        self.latencia = latencia
+        self.falhas_restantes = falhas_iniciais
+        self.status_falha = status_falha
+        self.requisicoes = Counter()          # endpoint -> total
+        self.requisicoes_idioma = Counter()   # idioma dos detalhes -> total
+        self.max_simultaneas = 0
+        self._simultaneas = 0
+        self._locais = {}
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}{CAMINHO}"
+
+    def responder(self, endpoint, params):
+        with self._lock:
+            self.requisicoes[endpoint] += 1
+            self._simultaneas += 1
+            self.max_simultaneas = max(self.max_simultaneas, self._simultaneas)
+            falhar = self.falhas_restantes > 0
+            if falhar:
+                self.falhas_restantes -= 1
+        try:
+            if self.latencia:
+                time.sleep(self.latencia)
+            if falhar:
+                if self.status_falha == 'HTTP_500':
+                    return 500, {'error': 'erro simulado'}
+                return 200, {'status': self.status_falha, 'results': []}
+            if endpoint == 'textsearch':
+                return 200, self._busca(params)
+            return 200, self._detalhes(params)
+        finally:
+            with self._lock:
+                self._simultaneas -= 1
+
+    def _busca(self, params):
+        consulta = params.get('query', [''])[0]
+        if not consulta:
+            return {'status': 'INVALID_REQUEST', 'results': []}
+        if 'inexistente' in consulta.lower():
+            return {'status': 'ZERO_RESULTS', 'results': []}
+
+        place_id = _place_id(consulta)
+        with self._lock:
+            self._locais[place_id] = consulta
+        return {
+            'status': 'OK',
+            'results': [{
+                'place_id': place_id,
+                'name': consulta,
+                'formatted_address': f"{consulta}, SC, Brasil",
+                'geometry': {'location': {'lat': -26.9, 'lng': -48.66}},
+                'business_status': 'OPERATIONAL',
+                'types': [params.get('type', ['establishment'])[0]]
+            }]
+        }
+
+    def _detalhes(self, params):
+        place_id = params.get('place_id', [''])[0]
+        with self._lock:
+            consulta = self._locais.get(place_id)
+        if consulta is None:
+            return {'status': 'NOT_FOUND'}
+
+        idioma = 'pt-BR' if params.get('language', [''])[0].lower().startswith('pt') else 'en'
+        with self._lock:
+            self.requisicoes_idioma[idioma] += 1
+
+        # Segunda a sexta 08:00-17:00; fim de semana fechado
+        periodos = [{'open': {'day': dia, 'time': '0800'}, 'close': {'day': dia, 'time': '1700'}}
+                    for dia in range(1, 6)]
+        dias = DIAS[idioma]
+        weekday_text = [f"{dia}: 08:00 – 17:00" for dia in dias[:5]]
+        weekday_text += [f"{dia}: {FECHADO[idioma]}" for dia in dias[5:]]
+        return {
+            'status': 'OK',
+            'result': {
+                'place_id': place_id,
+                'name': consulta,
+                'formatted_address': f"{consulta}, SC, Brasil",
+                'geometry': {'location': {'lat': -26.9, 'lng': -48.66}},
+                'business_status': 'OPERATIONAL',
+                'opening_hours': {'open_now': True, 'periods': periodos, 'weekday_text': weekday_text}
+            }
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        endpoint = url.path[len(CAMINHO) + 1:].split('/')[0] if url.path.startswith(CAMINHO + '/') else None
+        if endpoint not in ('textsearch', 'details'):
+            self.send_error(404)
+            return
+        status_http, corpo = self.server.responder(endpoint, parse_qs(url.query))
+        dados = json.dumps(corpo, ensure_ascii=False).encode('utf-8')
+        self.send_response(status_http)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def servidor_fake(**opcoes):
+    """Sobe o servidor numa thread e o encerra ao sair do bloco"""
+    servidor = FakePlacesServer(**opcoes)
+    thread = threading.Thread(target=servidor.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield servidor
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Google Places API falsa para testes')
+    parser.add_argument('--porta', type=int, default=8766)
+    parser.add_argument('--latencia', type=float, default=0.0, help='segundos por requisição')
+    args = parser.parse_args()
+
+    servidor = FakePlacesServer(porta=args.porta, latencia=args.latencia)
+    print(f"📍 Places API falsa em {servidor.url}")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n📊 Requisições: {dict(servidor.requisicoes)} | detalhes por idioma: {dict(servidor.requisicoes_idioma)}")